@@ -23,6 +23,7 @@ Fecha: 2026-01-12
 import os
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_process_init
 
 # Configurar Django settings
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cantina_project.settings')
@@ -59,12 +60,33 @@ app.conf.beat_schedule = {
         'options': {'expires': 3600}
     },
     
+    # Bandeja de salida (emails/WhatsApp) - Cada minuto, para reintentos
+    'procesar-bandeja-salida': {
+        'task': 'procesar_bandeja_salida',
+        'schedule': 60.0,
+        'options': {'expires': 55}
+    },
+    
+    # Reenvíos a SIFEN de documentos rechazados - Cada minuto
+    'reintentar-envios-set': {
+        'task': 'reintentar_envios_set',
+        'schedule': 60.0,
+        'options': {'expires': 55}
+    },
+    
     # Limpieza de notificaciones antiguas - Semanal (Domingos 02:00)
     'limpieza-notificaciones-semanal': {
         'task': 'limpieza_notificaciones_antiguas',
         'schedule': crontab(day_of_week=0, hour=2, minute=0),
         'options': {'expires': 7200}
     },
+    
+    # Purga del feed de saldos en tiempo real - Diario a las 03:00
+    'purgar-feed-saldos-diario': {
+        'task': 'purgar_feed_saldos',
+        'schedule': crontab(hour=3, minute=0),
+        'options': {'expires': 3600}
+    },
 }
 
 # Configuración adicional
@@ -82,6 +104,16 @@ app.conf.update(
 )
 
 
+@worker_process_init.connect
+def precargar_datos_referencia(**kwargs):
+    """Precarga los datos de referencia del POS en cada proceso del worker"""
+    try:
+        from gestion.cache_referencia import CacheReferencia
+        CacheReferencia.precargar()
+    except Exception as e:
+        print(f"⚠️ No se pudieron precargar los datos de referencia del POS: {e}")
+
+
 @app.task(bind=True)
 def debug_task(self):
     """Tarea de debug para probar Celery"""
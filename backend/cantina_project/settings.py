@@ -533,6 +533,8 @@ WHATSAPP_PROVIDER = config('WHATSAPP_PROVIDER', default='whatsapp-web-js')
 # WhatsApp Web JS (servidor local Node.js - GRATIS)
 # ⚠️ NO OFICIAL - Solo usar con número secundario
 WHATSAPP_SERVER_URL = config('WHATSAPP_SERVER_URL', default='http://localhost:3000')
+# Destinatarios por request a /send-bulk en los envíos masivos
+WHATSAPP_TAMANO_LOTE = config('WHATSAPP_TAMANO_LOTE', default=25, cast=int)
 
 # WhatsApp Business API (Meta - Oficial, pago ~$0.006/msg)
 WHATSAPP_ACCESS_TOKEN = config('WHATSAPP_ACCESS_TOKEN', default='')
@@ -561,70 +563,55 @@ SILENCED_SYSTEM_CHECKS = ['django_recaptcha.recaptcha_test_key_error']
 # CONFIGURACIÓN DE CACHE
 # =============================================================================
 
-# =============================================================================
-# CONFIGURACIÓN DE CACHE (REDIS)
-# =============================================================================
+# El cache debe ser compartido entre los workers de gunicorn: los contadores
+# de versión (cache_referencia, indice_productos), el rate limiting y la
+# invalidación por generación (cache_compartido) dependen de eso.
+# LocMem es por proceso y sólo sirve para desarrollo con un único worker.
+#
+#   CACHE_BACKEND=sqlite  Archivo SQLite compartido en el mismo servidor (default),
+#                         en backend/cache/; CACHE_LOCATION=/ruta/al/archivo para moverlo.
+#                         No va en /tmp: con PrivateTmp (deployment/*.service) cada
+#                         servicio de systemd vería su propio archivo.
+#   CACHE_BACKEND=redis   Redis (recomendado con varios servidores), CACHE_LOCATION=redis://...
+#   CACHE_BACKEND=db      Tabla de la base de datos (requiere: manage.py createcachetable; incr no atómico)
+#   CACHE_BACKEND=locmem  Memoria del proceso
+#
+# No se ofrece FileBasedCache: su incr() no es atómico entre procesos (rate limiting).
+CACHE_BACKEND = config('CACHE_BACKEND', default='sqlite')
+
+_CACHE_BACKENDS = {
+    'sqlite': (
+        'gestion.cache_sqlite.SQLiteCache',
+        os.path.join(BASE_DIR, 'cache', 'cantina-cache.sqlite3'),
+    ),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+    'db': ('django.core.cache.backends.db.DatabaseCache', 'cantina_cache'),
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'cantina-cache'),
+}
+_cache_clase, _cache_ubicacion = _CACHE_BACKENDS[CACHE_BACKEND]
 
-# TEMPORAL: Usando LocMem cache para evitar problemas de compatibilidad con Redis
-# Para producción: instalar Redis y configurar correctamente
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'cantina-cache',
+        'BACKEND': _cache_clase,
+        'LOCATION': config('CACHE_LOCATION', default=_cache_ubicacion),
         'TIMEOUT': 300,  # 5 minutos
+        'KEY_PREFIX': 'cantina',
     }
 }
-
-# Comentado temporalmente - problema de compatibilidad redis-py
-# try:
-#     import redis
-#     # Redis está disponible
-#     CACHES = {
-#         'default': {
-#             'BACKEND': 'django.core.cache.backends.redis.RedisCache',
-#             'LOCATION': 'redis://127.0.0.1:6379/1',
-#             'OPTIONS': {
-#                 'CLIENT_CLASS': 'django_redis.client.DefaultClient',
-#                 'CONNECTION_POOL_KWARGS': {
-#                     'max_connections': 50,
-#                     'retry_on_timeout': True,
-#                 },
-#                 'SOCKET_CONNECT_TIMEOUT': 5,
-#                 'SOCKET_TIMEOUT': 5,
-#                 'IGNORE_EXCEPTIONS': True,  # No fallar si Redis no está disponible
-#             },
-#             'KEY_PREFIX': 'cantina',
-#             'TIMEOUT': 300,  # 5 minutos por defecto
-#         },
-#         # Cache separado para sesiones
-#         'sessions': {
-#             'BACKEND': 'django.core.cache.backends.redis.RedisCache',
-#             'LOCATION': 'redis://127.0.0.1:6379/2',
-#             'OPTIONS': {
-#                 'CLIENT_CLASS': 'django_redis.client.DefaultClient',
-#             },
-#             'KEY_PREFIX': 'session',
-#             'TIMEOUT': 86400,  # 24 horas
-#         },
-#     }
-#     
-#     # Usar Redis para sesiones
-#     SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
-#     SESSION_CACHE_ALIAS = 'sessions'
-#     
-# except ImportError:
-#     # Redis no disponible, usar LocMem como fallback
-#     CACHES = {
-#         'default': {
-#             'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-#             'LOCATION': 'unique-snowflake',
-#         }
-#     }
+if CACHE_BACKEND != 'redis':
+    # El default (300) hace que sqlite/db/locmem descarten claves demasiado pronto
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': 20000}
 
 # Cache timeout en segundos (5 minutos para dashboard)
 CACHE_MIDDLEWARE_SECONDS = 300
 CACHE_MIDDLEWARE_KEY_PREFIX = 'cantinatita'
 
+# Stream SSE del dashboard de saldos (/pos/saldos/tiempo-real/stream/).
+# Cada pestaña abierta retiene un worker durante toda la conexión: habilitar
+# sólo con un worker_class async en gunicorn. Con workers sync el dashboard
+# consulta la API con ?desde=<cursor>.
+SALDOS_STREAM_HABILITADO = config('SALDOS_STREAM_HABILITADO', default=False, cast=bool)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -647,6 +634,28 @@ EKUATIA_BASE_URL = config('EKUATIA_BASE_URL', default='https://sifen.set.gov.py/
 EKUATIA_CERT_PATH = config('EKUATIA_CERT_PATH', default='')
 EKUATIA_KEY_PATH = config('EKUATIA_KEY_PATH', default='')
 
+# Reenvío de documentos rechazados (reintentos_set)
+SET_API_URL = config('SET_API_URL', default='https://sifen.set.gov.py/dte/rest')
+# Envíos simultáneos a SIFEN; el ritmo se reduce solo ante 429/503
+SET_REINTENTOS_CONCURRENCIA = config('SET_REINTENTOS_CONCURRENCIA', default=4, cast=int)
+
+# =============================================================================
+# CONFIGURACIÓN DE BACKUPS (backup_database)
+# =============================================================================
+# Hilos que comprimen la salida de mysqldump en paralelo
+BACKUP_HILOS_COMPRESION = config('BACKUP_HILOS_COMPRESION', default=4, cast=int)
+BACKUP_MYSQLDUMP_BIN = config('BACKUP_MYSQLDUMP_BIN', default='mysqldump')
+BACKUP_MYSQL_BIN = config('BACKUP_MYSQL_BIN', default='mysql')
+
+# =============================================================================
+# CONFIGURACIÓN DE AUDITORÍA (auditoria_diferida)
+# =============================================================================
+# False: cada evento se inserta en el request, como antes
+AUDITORIA_DIFERIDA = config('AUDITORIA_DIFERIDA', default=True, cast=bool)
+# Eventos por bulk_create y espera máxima antes de escribirlos
+AUDITORIA_LOTE = config('AUDITORIA_LOTE', default=100, cast=int)
+AUDITORIA_INTERVALO_SEGUNDOS = config('AUDITORIA_INTERVALO_SEGUNDOS', default=2, cast=float)
+
 # =============================================================================
 # CONFIGURACIÓN DE IMPRESORA TÉRMICA
 # =============================================================================
@@ -794,6 +803,19 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'America/Asuncion'
 
+# Difundir notificaciones del sistema (ventas, recargas) en un worker Celery.
+# Si está en False se difunden en el mismo proceso después del commit.
+NOTIFICACIONES_ASINCRONAS = config('NOTIFICACIONES_ASINCRONAS', default=False, cast=bool)
+
+# Bandeja de salida (emails y WhatsApp de alertas de saldo).
+# Si está en True la entrega la hace un worker Celery; si no, un hilo del proceso.
+MENSAJERIA_ASINCRONA = config('MENSAJERIA_ASINCRONA', default=False, cast=bool)
+# Envíos simultáneos por canal (conexiones SMTP / requests al whatsapp-server)
+MENSAJERIA_CONCURRENCIA = {
+    'EMAIL': config('MENSAJERIA_CONCURRENCIA_EMAIL', default=2, cast=int),
+    'WHATSAPP': config('MENSAJERIA_CONCURRENCIA_WHATSAPP', default=4, cast=int),
+}
+
 
 # =============================================================================
 # CONFIGURACIÓN DE EMAILS PARA GERENCIA
@@ -0,0 +1,233 @@
+"""
+Motor de alertas de stock por umbral
+=====================================
+
+Los signals de Producto hacían en cada save un SELECT del producto anterior
+y, por cada usuario staff, un get_or_create de su configuración y un
+NotificacionSistema mensaje__icontains (LIKE sin índice) para no repetir
+la alerta. Además miraban campos que Producto no tiene (stock, nombre),
+así que el stock real (StockUnico) nunca generaba alertas.
+
+MotorAlertasStock se alimenta de los cambios de StockUnico:
+
+- Los signals y el descuento en lote de la venta sólo marcan los productos
+  tocados; la evaluación se hace una vez al confirmar la transacción.
+- EstadoAlertaStock guarda por producto el último umbral cruzado (normal,
+  bajo, agotado) y cuándo se alertó: una alerta sale al empeorar el nivel
+  y no se repite para el mismo nivel dentro de la ventana.
+- Los productos que cruzan un umbral en la misma evaluación se agrupan en
+  una sola notificación por nivel (DifusorNotificaciones, notif_stock).
+- Si un producto se agota o vuelve a tener stock se invalida el conjunto
+  de productos disponibles de CatalogoSeguro. Sin EstadoAlertaStock (stock
+  normal o producto nuevo) la disponibilidad anterior no se conoce: se
+  compara con el conjunto cacheado.
+"""
+
+import logging
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List
+
+from django.db import transaction
+from django.utils import timezone
+
+from .catalogo_seguro import CatalogoSeguro
+from .models import EstadoAlertaStock, StockUnico
+from .notificaciones_difusion import DifusorNotificaciones, evento_notificacion
+
+logger = logging.getLogger(__name__)
+
+NORMAL = EstadoAlertaStock.NIVEL_NORMAL
+BAJO = EstadoAlertaStock.NIVEL_BAJO
+AGOTADO = EstadoAlertaStock.NIVEL_AGOTADO
+
+
+class MotorAlertasStock:
+    """Detecta cruces de umbral de stock y los notifica una vez por ventana"""
+
+    VENTANA = timedelta(hours=1)
+    # Stock bajo con prioridad alta por debajo de estas unidades
+    UMBRAL_PRIORIDAD_ALTA = Decimal('5')
+    # Productos nombrados en el mensaje de una alerta agrupada
+    MAX_NOMBRES = 5
+
+    _pendientes = threading.local()
+
+    @staticmethod
+    def nivel(cantidad: Decimal, stock_minimo: Decimal) -> int:
+        """Nivel de alerta de una cantidad de stock"""
+        if cantidad <= 0:
+            return AGOTADO
+        if cantidad <= (stock_minimo or 0):
+            return BAJO
+        return NORMAL
+
+    # =========================================================================
+    # MARCADO DE PRODUCTOS
+    # =========================================================================
+
+    @staticmethod
+    def marcar(ids_productos: Iterable[int]):
+        """
+        Marca productos cuyo stock cambió para evaluarlos al confirmar la transacción
+
+        Todas las marcas de una transacción se evalúan juntas en el primer
+        callback; los siguientes encuentran el conjunto vacío.
+        """
+        pendientes = MotorAlertasStock._conjunto_pendiente()
+        pendientes.update(ids_productos)
+        transaction.on_commit(MotorAlertasStock._vaciar)
+
+    @staticmethod
+    def _conjunto_pendiente() -> set:
+        pendientes = getattr(MotorAlertasStock._pendientes, 'ids', None)
+        if pendientes is None:
+            pendientes = MotorAlertasStock._pendientes.ids = set()
+        return pendientes
+
+    @staticmethod
+    def _vaciar():
+        pendientes = MotorAlertasStock._conjunto_pendiente()
+        if not pendientes:
+            return
+        ids = list(pendientes)
+        pendientes.clear()
+        try:
+            MotorAlertasStock.evaluar(ids)
+        except Exception as e:
+            # Una alerta nunca debe afectar la operación que movió el stock
+            logger.error(f"Error evaluando alertas de stock: {e}")
+
+    # =========================================================================
+    # EVALUACIÓN
+    # =========================================================================
+
+    @staticmethod
+    def evaluar(ids_productos: Iterable[int], ahora=None) -> Dict[int, List[Dict]]:
+        """
+        Evalúa el stock actual de los productos y emite las alertas nuevas
+
+        Returns:
+            {nivel: [productos alertados]} (sólo niveles con alertas)
+        """
+        ids_productos = list(ids_productos)
+        if not ids_productos:
+            return {}
+        ahora = ahora or timezone.now()
+
+        with transaction.atomic():
+            stocks = StockUnico.objects.filter(
+                id_producto_id__in=ids_productos
+            ).values_list(
+                'id_producto_id', 'cantidad',
+                'id_producto__stock_minimo', 'id_producto__descripcion'
+            )
+            estados = {
+                estado.id_producto_id: estado
+                for estado in EstadoAlertaStock.objects.select_for_update().filter(
+                    id_producto_id__in=ids_productos
+                )
+            }
+
+            alertas: Dict[int, List[Dict]] = {}
+            nuevos, modificados = [], []
+            cambio_disponibilidad = False
+            # {id_producto: disponible} de los productos sin estado previo
+            sin_estado: Dict[int, bool] = {}
+            for id_producto, cantidad, stock_minimo, descripcion in stocks:
+                nivel = MotorAlertasStock.nivel(cantidad, stock_minimo)
+                estado = estados.get(id_producto)
+                if estado is None:
+                    sin_estado[id_producto] = nivel != AGOTADO
+                elif (estado.nivel == AGOTADO) != (nivel == AGOTADO):
+                    cambio_disponibilidad = True
+                if estado is None:
+                    if nivel == NORMAL:
+                        continue
+                    estado = EstadoAlertaStock(id_producto_id=id_producto)
+                    nuevos.append(estado)
+                elif estado.nivel == nivel:
+                    continue
+                else:
+                    modificados.append(estado)
+
+                if MotorAlertasStock._debe_alertar(estado, nivel, ahora):
+                    estado.nivel_alertado = nivel
+                    estado.fecha_alerta = ahora
+                    alertas.setdefault(nivel, []).append({
+                        'id_producto': id_producto,
+                        'descripcion': descripcion,
+                        'cantidad': cantidad,
+                    })
+                estado.nivel = nivel
+
+            if nuevos:
+                EstadoAlertaStock.objects.bulk_create(nuevos, ignore_conflicts=True)
+            if modificados:
+                EstadoAlertaStock.objects.bulk_update(
+                    modificados, ['nivel', 'nivel_alertado', 'fecha_alerta']
+                )
+
+            for nivel, productos in alertas.items():
+                DifusorNotificaciones.encolar(MotorAlertasStock.evento(nivel, productos))
+
+        if sin_estado and not cambio_disponibilidad:
+            disponibles = CatalogoSeguro.con_stock()
+            cambio_disponibilidad = any(
+                (id_producto in disponibles) != disponible for id_producto, disponible in sin_estado.items()
+            )
+
+        if cambio_disponibilidad:
+            # Un producto se agotó o volvió a tener stock
+            CatalogoSeguro.invalidar_stock()
+
+        return alertas
+
+    @staticmethod
+    def _debe_alertar(estado: EstadoAlertaStock, nivel: int, ahora) -> bool:
+        """Sólo al empeorar, y no si ese nivel ya se alertó dentro de la ventana"""
+        if nivel <= estado.nivel:
+            return False
+        if estado.fecha_alerta is None or estado.nivel_alertado < nivel:
+            return True
+        return ahora - estado.fecha_alerta >= MotorAlertasStock.VENTANA
+
+    @staticmethod
+    def evento(nivel: int, productos: List[Dict]) -> Dict:
+        """Notificación de uno o varios productos que cruzaron el mismo umbral"""
+        nombres = ', '.join(f'"{p["descripcion"]}"' for p in productos[:MotorAlertasStock.MAX_NOMBRES])
+        restantes = len(productos) - MotorAlertasStock.MAX_NOMBRES
+        if restantes > 0:
+            nombres += f' y {restantes} más'
+
+        if nivel == AGOTADO:
+            if len(productos) == 1:
+                mensaje = f'El producto {nombres} se ha AGOTADO'
+            else:
+                mensaje = f'{len(productos)} productos se han AGOTADO: {nombres}'
+            return evento_notificacion(
+                titulo='🚨 Producto Agotado',
+                mensaje=mensaje,
+                tipo='stock',
+                prioridad='critica',
+                preferencia='notif_stock',
+                icono='fa-times-circle',
+                url='/gestion/productos/'
+            )
+
+        minimo = min(p['cantidad'] for p in productos)
+        if len(productos) == 1:
+            mensaje = f'El producto {nombres} tiene solo {minimo.normalize():f} unidades disponibles'
+        else:
+            mensaje = f'{len(productos)} productos con stock bajo: {nombres}'
+        return evento_notificacion(
+            titulo='⚠️ Stock Bajo',
+            mensaje=mensaje,
+            tipo='stock',
+            prioridad='alta' if minimo <= MotorAlertasStock.UMBRAL_PRIORIDAD_ALTA else 'media',
+            preferencia='notif_stock',
+            icono='fa-exclamation-triangle',
+            url='/gestion/productos/'
+        )
+
@@ -25,6 +25,8 @@ from .models import (
     Cliente
 )
 from .cache_reportes import get_reporte_cacheado, get_datos_dashboard_cacheados
+from .facturacion_almuerzos import FacturadorAlmuerzos, FORMAS_COBRO
+from .checkin_almuerzo import RegistradorAlmuerzos, AlmuerzoDuplicadoError, TipoAlmuerzoNoConfiguradoError
 
 
 # =============================================================================
@@ -108,8 +110,6 @@ def pos_almuerzo(request):
     
     if request.method == "POST":
         codigo_barra = request.POST.get('codigo_barra', '').strip()
-        hoy = timezone.localdate()
-        ahora = timezone.localtime().time()
         
         if not codigo_barra:
             context['error'] = "❌ Código de barras vacío"
@@ -128,91 +128,33 @@ def pos_almuerzo(request):
         
         hijo = tarjeta.id_hijo
         
-        # 2. Verificar si ya tiene almuerzo hoy
-        ya_tiene = RegistroConsumoAlmuerzo.objects.filter(
-            id_hijo=hijo,
-            fecha_consumo=hoy
-        ).exists()
-        
-        if ya_tiene:
+        # 2. Registrar almuerzo (NO descuenta saldo de tarjeta). Duplicados,
+        # tipo predeterminado y cuenta mensual se resuelven en memoria
+        try:
+            resultado = RegistradorAlmuerzos.registrar(tarjeta)
+        except AlmuerzoDuplicadoError:
             context['warning'] = f"⚠️ {hijo.nombre_completo} ya tiene almuerzo registrado hoy"
             context['hijo'] = hijo
             context['tarjeta'] = tarjeta
             return render(request, 'pos/almuerzo.html', context)
-        
-        # 3. Buscar tipo de almuerzo predeterminado (primer activo ordenado por ID)
-        tipo_almuerzo = TipoAlmuerzo.objects.filter(activo=True).order_by('id_tipo_almuerzo').first()
-        if not tipo_almuerzo:
+        except TipoAlmuerzoNoConfiguradoError:
             context['error'] = "❌ No hay tipo de almuerzo configurado"
             return render(request, 'pos/almuerzo.html', context)
+        except Exception as e:
+            context['error'] = f"❌ Error al registrar: {str(e)}"
+            return render(request, 'pos/almuerzo.html', context)
         
-        # 4. Verificar si tiene pago mensual activo, sino crear cuenta a crédito
-        mes_actual = hoy.month
-        anio_actual = hoy.year
-        
-        cuenta_mensual, created = CuentaAlmuerzoMensual.objects.get_or_create(
-            id_hijo=hijo,
-            mes=mes_actual,
-            anio=anio_actual,
-            defaults={
-                'forma_cobro': 'CREDITO_MENSUAL',
-                'estado': 'PENDIENTE',
-                'cantidad_almuerzos': 0,
-                'monto_total': Decimal('0.00'),
-                'monto_pagado': Decimal('0.00'),
-                'fecha_generacion': hoy
-            }
-        )
-        
-        if created:
+        if resultado['cuenta_creada']:
             context['info'] = f"✓ Cuenta mensual creada en modo CRÉDITO para {hijo.nombre_completo}"
         
-        # 5. Registrar almuerzo (NO descuenta saldo de tarjeta)
-        try:
-            with transaction.atomic():
-                registro = RegistroConsumoAlmuerzo.objects.create(
-                    id_hijo=hijo,
-                    nro_tarjeta=tarjeta,
-                    id_tipo_almuerzo=tipo_almuerzo,
-                    fecha_consumo=hoy,
-                    costo_almuerzo=tipo_almuerzo.precio_unitario,
-                    marcado_en_cuenta=True,  # Se marca en cuenta mensual
-                    id_suscripcion=None,  # Esporádico
-                    hora_registro=ahora
-                )
-                
-                # Actualizar totales de la cuenta mensual
-                cuenta_mensual.cantidad_almuerzos = RegistroConsumoAlmuerzo.objects.filter(
-                    id_hijo=hijo,
-                    fecha_consumo__month=mes_actual,
-                    fecha_consumo__year=anio_actual,
-                    marcado_en_cuenta=True
-                ).count()
-                
-                cuenta_mensual.monto_total = RegistroConsumoAlmuerzo.objects.filter(
-                    id_hijo=hijo,
-                    fecha_consumo__month=mes_actual,
-                    fecha_consumo__year=anio_actual,
-                    marcado_en_cuenta=True
-                ).aggregate(total=Sum('costo_almuerzo'))['total'] or Decimal('0.00')
-                
-                cuenta_mensual.save()
-                
-                context['ok'] = True
-                context['hijo'] = hijo
-                context['tarjeta'] = tarjeta
-                context['registro'] = registro
-                context['tipo_almuerzo'] = tipo_almuerzo
-                context['cuenta_mensual'] = cuenta_mensual
-                context['registro_id'] = registro.id_registro_consumo  # Para abrir el ticket
-                
-                # Actualizar lista de últimos registros
-                context['ultimos_registros'] = RegistroConsumoAlmuerzo.objects.select_related(
-                    'id_hijo', 'id_tipo_almuerzo'
-                ).order_by('-fecha_consumo', '-hora_registro')[:10]
-                
-        except Exception as e:
-            context['error'] = f"❌ Error al registrar: {str(e)}"
+        registro = resultado['registro']
+        context['ok'] = True
+        context['hijo'] = hijo
+        context['tarjeta'] = tarjeta
+        context['registro'] = registro
+        context['tipo_almuerzo'] = resultado['tipo_almuerzo']
+        context['id_cuenta'] = resultado['id_cuenta']
+        context['registro_id'] = registro.id_registro_consumo  # Para abrir el ticket
     
     return render(request, 'pos/almuerzo.html', context)
 
@@ -225,8 +167,6 @@ def pos_almuerzo_api(request):
     Útil para integraciones con lectores de código de barras externos
     """
     codigo_barra = request.POST.get('codigo_barra', '').strip()
-    hoy = timezone.localdate()
-    ahora = timezone.localtime().time()
     
     if not codigo_barra:
         return JsonResponse({
@@ -247,61 +187,38 @@ def pos_almuerzo_api(request):
     
     hijo = tarjeta.id_hijo
     
-    # Verificar duplicado
-    ya_tiene = RegistroConsumoAlmuerzo.objects.filter(
-        id_hijo=hijo,
-        fecha_consumo=hoy
-    ).exists()
-    
-    if ya_tiene:
+    try:
+        resultado = RegistradorAlmuerzos.registrar(tarjeta, marcar_en_cuenta=False)
+    except AlmuerzoDuplicadoError as e:
         return JsonResponse({
             'success': False,
-            'warning': f'{hijo.nombre_completo} ya tiene almuerzo registrado hoy'
+            'warning': str(e)
         }, status=409)
-    
-    try:
-        tipo_almuerzo = TipoAlmuerzo.objects.filter(activo=True).first()
-        if not tipo_almuerzo:
-            return JsonResponse({
-                'success': False,
-                'error': 'No hay tipo de almuerzo configurado'
-            }, status=500)
-    except Exception as e:
+    except TipoAlmuerzoNoConfiguradoError as e:
         return JsonResponse({
             'success': False,
             'error': str(e)
         }, status=500)
-    
-    try:
-        with transaction.atomic():
-            registro = RegistroConsumoAlmuerzo.objects.create(
-                id_hijo=hijo,
-                nro_tarjeta=tarjeta,
-                id_tipo_almuerzo=tipo_almuerzo,
-                fecha_consumo=hoy,
-                costo_almuerzo=tipo_almuerzo.precio_unitario,
-                marcado_en_cuenta=False,
-                id_suscripcion=None,
-                hora_registro=ahora
-            )
-            
-            return JsonResponse({
-                'success': True,
-                'registro': {
-                    'id': registro.id_registro_consumo,
-                    'estudiante': hijo.nombre_completo,
-                    'tarjeta': tarjeta.nro_tarjeta,
-                    'tipo_almuerzo': tipo_almuerzo.nombre,
-                    'costo': float(tipo_almuerzo.precio_unitario),
-                    'fecha': hoy.isoformat(),
-                    'hora': ahora.strftime('%H:%M:%S')
-                }
-            })
     except Exception as e:
         return JsonResponse({
             'success': False,
             'error': f'Error al registrar: {str(e)}'
         }, status=500)
+    
+    registro = resultado['registro']
+    tipo_almuerzo = resultado['tipo_almuerzo']
+    return JsonResponse({
+        'success': True,
+        'registro': {
+            'id': registro.id_registro_consumo,
+            'estudiante': hijo.nombre_completo,
+            'tarjeta': tarjeta.nro_tarjeta,
+            'tipo_almuerzo': tipo_almuerzo.nombre,
+            'costo': float(tipo_almuerzo.precio_unitario),
+            'fecha': registro.fecha_consumo.isoformat(),
+            'hora': registro.hora_registro.strftime('%H:%M:%S')
+        }
+    })
 
 
 @acceso_cajero
@@ -326,7 +243,7 @@ def anular_ultimo_almuerzo(request):
         )
         
         hijo_nombre = registro.id_hijo.nombre_completo
-        registro.delete()
+        RegistradorAlmuerzos.anular(registro)
         
         return JsonResponse({
             'success': True,
@@ -389,24 +306,17 @@ def generar_cuentas_mes(request):
     POST: Procesa la generación de cuentas
     """
     if request.method == "GET":
-        # Mostrar formulario de confirmación
+        # Mostrar formulario de confirmación con la vista previa (sin escribir)
         anio = int(request.GET.get('anio', timezone.now().year))
         mes = int(request.GET.get('mes', timezone.now().month))
         
-        # Obtener consumos pendientes de facturar
-        consumos_pendientes = RegistroConsumoAlmuerzo.objects.filter(
-            fecha_consumo__year=anio,
-            fecha_consumo__month=mes,
-            marcado_en_cuenta=False
-        ).values('id_hijo').annotate(
-            cantidad=Count('id_registro_consumo'),
-            total=Sum('costo_almuerzo')
-        ).count()
+        previsualizacion = FacturadorAlmuerzos.previsualizar(anio, mes)
         
         context = {
             'anio': anio,
             'mes': mes,
-            'consumos_pendientes': consumos_pendientes
+            'consumos_pendientes': previsualizacion['hijos'],
+            'previsualizacion': previsualizacion,
         }
         return render(request, 'pos/almuerzo_generar_cuentas.html', context)
     
@@ -419,60 +329,20 @@ def generar_cuentas_mes(request):
     mes = int(mes_str)
     forma_cobro = request.POST.get('forma_cobro', 'CREDITO_MENSUAL')
     
-    if forma_cobro not in ['CONTADO_ANTICIPADO', 'CREDITO_MENSUAL']:
+    if forma_cobro not in FORMAS_COBRO:
         messages.error(request, 'Forma de cobro inválida')
         return redirect('pos:cuentas_mensuales')
     
     try:
-        with transaction.atomic():
-            # Agrupar consumos del mes por hijo
-            consumos_mes = RegistroConsumoAlmuerzo.objects.filter(
-                fecha_consumo__year=anio,
-                fecha_consumo__month=mes,
-                marcado_en_cuenta=False,
-                costo_almuerzo__isnull=False
-            ).values('id_hijo').annotate(
-                cantidad=Count('id_registro_consumo'),
-                total=Sum('costo_almuerzo')
-            )
-            
-            cuentas_creadas = 0
-            cuentas_actualizadas = 0
-            
-            for consumo in consumos_mes:
-                hijo = Hijo.objects.get(id_hijo=consumo['id_hijo'])
-                
-                # Crear o actualizar cuenta
-                cuenta, created = CuentaAlmuerzoMensual.objects.update_or_create(
-                    id_hijo=hijo,
-                    anio=anio,
-                    mes=mes,
-                    defaults={
-                        'cantidad_almuerzos': consumo['cantidad'],
-                        'monto_total': consumo['total'],
-                        'forma_cobro': forma_cobro,
-                        'fecha_generacion': timezone.now().date()
-                    }
-                )
-                
-                if created:
-                    cuentas_creadas += 1
-                else:
-                    cuentas_actualizadas += 1
-            
-            # Marcar consumos como facturados
-            RegistroConsumoAlmuerzo.objects.filter(
-                fecha_consumo__year=anio,
-                fecha_consumo__month=mes,
-                marcado_en_cuenta=False
-            ).update(marcado_en_cuenta=True)
-            
-            messages.success(request, f'✅ Se generaron {cuentas_creadas} cuentas nuevas y se actualizaron {cuentas_actualizadas} para {mes}/{anio}')
-            return redirect('pos:cuentas_mensuales')
-            
+        resultado = FacturadorAlmuerzos.facturar(anio, mes, forma_cobro)
+        messages.success(
+            request,
+            f"✅ Se generaron {resultado['cuentas_creadas']} cuentas nuevas y se actualizaron "
+            f"{resultado['cuentas_actualizadas']} para {mes}/{anio}"
+        )
     except Exception as e:
         messages.error(request, f'Error al generar cuentas: {str(e)}')
-        return redirect('pos:cuentas_mensuales')
+    return redirect('pos:cuentas_mensuales')
 
 
 @acceso_cajero
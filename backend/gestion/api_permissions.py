@@ -5,6 +5,17 @@ Control de acceso basado en roles de empleados
 
 from rest_framework import permissions
 
+from .permisos import obtener_rol_empleado
+
+
+def rol_contiene(user, *fragmentos):
+    """Verifica si el rol del empleado (cacheado en CacheRoles) contiene alguno de los fragmentos"""
+    rol = obtener_rol_empleado(user)
+    if not rol:
+        return False
+    rol = rol.upper()
+    return any(fragmento in rol for fragmento in fragmentos)
+
 
 class IsAdministrador(permissions.BasePermission):
     """
@@ -19,12 +30,7 @@ class IsAdministrador(permissions.BasePermission):
             return True
         
         # Verificar rol en modelo Empleado
-        try:
-            from .models import Empleado
-            empleado = Empleado.objects.get(usuario=request.user.username)
-            return empleado.id_rol and 'ADMIN' in empleado.id_rol.nombre_rol.upper()
-        except:
-            return False
+        return rol_contiene(request.user, 'ADMIN')
 
 
 class IsGerente(permissions.BasePermission):
@@ -38,16 +44,7 @@ class IsGerente(permissions.BasePermission):
         if request.user.is_superuser:
             return True
         
-        try:
-            from .models import Empleado
-            empleado = Empleado.objects.get(usuario=request.user.username)
-            if empleado.id_rol:
-                rol = empleado.id_rol.nombre_rol.upper()
-                return 'ADMIN' in rol or 'GERENTE' in rol
-        except:
-            return False
-        
-        return False
+        return rol_contiene(request.user, 'ADMIN', 'GERENTE')
 
 
 class IsCajero(permissions.BasePermission):
@@ -61,16 +58,7 @@ class IsCajero(permissions.BasePermission):
         if request.user.is_superuser:
             return True
         
-        try:
-            from .models import Empleado
-            empleado = Empleado.objects.get(usuario=request.user.username)
-            if empleado.id_rol:
-                rol = empleado.id_rol.nombre_rol.upper()
-                return 'ADMIN' in rol or 'GERENTE' in rol or 'CAJERO' in rol
-        except:
-            return False
-        
-        return False
+        return rol_contiene(request.user, 'ADMIN', 'GERENTE', 'CAJERO')
 
 
 class IsOwnerOrReadOnly(permissions.BasePermission):
@@ -112,16 +100,7 @@ class CanManageVentas(permissions.BasePermission):
         if request.user.is_superuser:
             return True
         
-        try:
-            from .models import Empleado
-            empleado = Empleado.objects.get(usuario=request.user.username)
-            if empleado.id_rol:
-                rol = empleado.id_rol.nombre_rol.upper()
-                return 'ADMIN' in rol or 'GERENTE' in rol or 'CAJERO' in rol
-        except:
-            return False
-        
-        return False
+        return rol_contiene(request.user, 'ADMIN', 'GERENTE', 'CAJERO')
 
 
 class CanManageStock(permissions.BasePermission):
@@ -140,16 +119,7 @@ class CanManageStock(permissions.BasePermission):
         if request.user.is_superuser:
             return True
         
-        try:
-            from .models import Empleado
-            empleado = Empleado.objects.get(usuario=request.user.username)
-            if empleado.id_rol:
-                rol = empleado.id_rol.nombre_rol.upper()
-                return 'ADMIN' in rol or 'GERENTE' in rol
-        except:
-            return False
-        
-        return False
+        return rol_contiene(request.user, 'ADMIN', 'GERENTE')
 
 
 class CanManageEmpleados(permissions.BasePermission):
@@ -162,14 +132,7 @@ class CanManageEmpleados(permissions.BasePermission):
             if request.user.is_superuser:
                 return True
             
-            try:
-                from .models import Empleado
-                empleado = Empleado.objects.get(usuario=request.user.username)
-                if empleado.id_rol:
-                    rol = empleado.id_rol.nombre_rol.upper()
-                    return 'ADMIN' in rol or 'GERENTE' in rol
-            except:
-                return False
+            return rol_contiene(request.user, 'ADMIN', 'GERENTE')
         
         # Modificaciones solo admin
         return IsAdministrador().has_permission(request, view)
@@ -10,6 +10,7 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response as DRFResponse
 from django_filters.rest_framework import DjangoFilterBackend
+from django.utils.decorators import method_decorator
 from django.db.models import Q, Sum, Count, Avg, F
 from datetime import datetime, timedelta
 from drf_yasg.utils import swagger_auto_schema
@@ -37,6 +38,7 @@ from .serializers import (
 )
 
 from .pagination import StandardPagination, LargePagination, SmallPagination, ReportPagination
+from .ratelimit_utils import ratelimit_recarga
 from rest_framework_simplejwt.views import TokenObtainPairView
 
 
@@ -392,6 +394,7 @@ class TarjetaViewSet(viewsets.ModelViewSet):
         }
     )
     @action(detail=True, methods=['post'])
+    @method_decorator(ratelimit_recarga)
     def recargar(self, request, nro_tarjeta=None):
         """Recargar saldo en una tarjeta"""
         tarjeta = self.get_object()
@@ -0,0 +1,289 @@
+"""
+Auditoría con escritura diferida
+=================================
+
+registrar_auditoria insertaba una fila en auditoria_operaciones dentro del
+request (también dentro de procesar_venta para las ventas con
+restricciones) y antes consultaba ipapi.co para geolocalizar la IP, con
+hasta 2 s de timeout.
+
+BufferAuditoria guarda los eventos en memoria del proceso y un worker los
+inserta con bulk_create:
+
+- Al llegar a AUDITORIA_LOTE eventos se despierta el worker; si no, los
+  escribe cada AUDITORIA_INTERVALO_SEGUNDOS. Al terminar el proceso
+  (atexit) se vacía lo pendiente
+- Los eventos se encolan con transaction.on_commit: si la venta se revierte
+  su auditoría no se escribe, igual que cuando la fila se insertaba en la
+  misma transacción
+- Se insertan en el orden en que se registraron (un solo vaciado a la vez)
+- La geolocalización se resuelve al escribir el lote, una vez por IP
+- Si el lote no se puede insertar se reintenta fila por fila: las filas
+  que fallan con la base respondiendo se descartan (con log); si no entra
+  ninguna (base caída) vuelven al frente del buffer, hasta MAX_REINTENTOS
+  vaciados
+- Con más de MAX_PENDIENTES_FACTOR x lote eventos sin escribir (worker
+  atascado) quien registra vacía el buffer él mismo; por encima de
+  MAX_BUFFER_FACTOR x lote los eventos nuevos se descartan (con log)
+
+Las operaciones de OPERACIONES_CRITICAS (o durable=True) se siguen
+insertando en el momento, dentro de la transacción de quien llama.
+"""
+
+import atexit
+import logging
+import threading
+from collections import deque
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .models import AuditoriaOperacion
+
+logger = logging.getLogger(__name__)
+
+# Pagos, acreditaciones y credenciales: se escriben siempre en el momento
+OPERACIONES_CRITICAS = frozenset({
+    'APROBAR_PAGO_TRANSFERENCIA',
+    'RECHAZAR_PAGO_TRANSFERENCIA',
+    'VALIDAR_CARGA_SALDO',
+    'VALIDAR_PAGO_TRANSFERENCIA',
+    'CARGA_SALDO_CONFIRMADO',
+    'CARGA_SALDO_TIGO_CONFIRMADO',
+    'PAGO_DEUDAS_CONFIRMADO',
+    'PAGO_DEUDAS_TIGO_CONFIRMADO',
+    'CAMBIO_CONTRASENA_EMPLEADO',
+    'CAMBIO_PASSWORD',
+    'RESET_PASSWORD',
+})
+
+MAX_PENDIENTES_FACTOR = 10
+MAX_BUFFER_FACTOR = 50
+MAX_REINTENTOS = 3
+
+
+def diferida() -> bool:
+    """Escritura diferida habilitada (settings.AUDITORIA_DIFERIDA)"""
+    return getattr(settings, 'AUDITORIA_DIFERIDA', True)
+
+
+def tamano_lote() -> int:
+    return max(1, int(getattr(settings, 'AUDITORIA_LOTE', 100)))
+
+
+def intervalo() -> float:
+    return float(getattr(settings, 'AUDITORIA_INTERVALO_SEGUNDOS', 2))
+
+
+def _geolocalizar(eventos: List[AuditoriaOperacion]):
+    """Completa ciudad y país, consultando una vez por IP"""
+    from .seguridad_utils import obtener_geolocalizacion_ip
+
+    ubicaciones = {}
+    for evento in eventos:
+        if evento.ip_address not in ubicaciones:
+            try:
+                ubicaciones[evento.ip_address] = obtener_geolocalizacion_ip(evento.ip_address)
+            except Exception:
+                # Sin ubicación antes que perder (o reintentar sin fin) el lote
+                ubicaciones[evento.ip_address] = (None, None)
+        evento.ciudad, evento.pais = ubicaciones[evento.ip_address]
+
+
+def _describir(evento: AuditoriaOperacion) -> str:
+    return f"{evento.operacion} {evento.tabla_afectada}#{evento.id_registro} ({evento.usuario})"
+
+
+class BufferAuditoria:
+    """Eventos de auditoría pendientes de escribir en este proceso"""
+
+    # (evento, geolocalizar, intentos) en orden de registro
+    _pendientes: deque = deque()
+    _lock = threading.Lock()
+    # Un vaciado a la vez: conserva el orden entre el worker y atexit
+    _escritura = threading.Lock()
+
+    @staticmethod
+    def registrar(evento: AuditoriaOperacion, durable: Optional[bool] = None, geolocalizar: bool = False):
+        """
+        Registra un evento de auditoría
+
+        Args:
+            evento: AuditoriaOperacion sin guardar
+            durable: Insertar ya (None: según OPERACIONES_CRITICAS)
+            geolocalizar: Completar ciudad/país desde ip_address
+        """
+        if durable is None:
+            durable = evento.operacion in OPERACIONES_CRITICAS
+
+        if durable or not diferida():
+            if geolocalizar:
+                _geolocalizar([evento])
+            evento.save()
+            return
+
+        transaction.on_commit(lambda: BufferAuditoria._encolar(evento, geolocalizar))
+
+    @staticmethod
+    def _encolar(evento: AuditoriaOperacion, geolocalizar: bool):
+        with BufferAuditoria._lock:
+            pendientes = len(BufferAuditoria._pendientes)
+            lleno = pendientes >= tamano_lote() * MAX_BUFFER_FACTOR
+            if not lleno:
+                BufferAuditoria._pendientes.append((evento, geolocalizar, 0))
+                pendientes += 1
+
+        if lleno:
+            # Base caída por mucho tiempo: acotar la memoria del proceso
+            logger.error(f"Buffer de auditoría lleno, evento descartado: {_describir(evento)}")
+            return
+
+        if pendientes >= tamano_lote() * MAX_PENDIENTES_FACTOR:
+            # El worker no da abasto (o la base está caída): frenar a quien registra
+            BufferAuditoria.vaciar()
+        else:
+            despertar_worker(urgente=pendientes >= tamano_lote())
+
+    @staticmethod
+    def _tomar_lote() -> List[Tuple[AuditoriaOperacion, bool, int]]:
+        with BufferAuditoria._lock:
+            cantidad = min(tamano_lote(), len(BufferAuditoria._pendientes))
+            return [BufferAuditoria._pendientes.popleft() for _ in range(cantidad)]
+
+    @staticmethod
+    def _devolver(lote: List[Tuple[AuditoriaOperacion, bool, int]]):
+        with BufferAuditoria._lock:
+            BufferAuditoria._pendientes.extendleft(reversed(lote))
+
+    @staticmethod
+    def vaciar() -> int:
+        """
+        Escribe todos los eventos pendientes, en lotes y en orden
+
+        Returns:
+            Cantidad de eventos insertados
+        """
+        total = 0
+        with BufferAuditoria._escritura:
+            while True:
+                lote = BufferAuditoria._tomar_lote()
+                if not lote:
+                    return total
+                _geolocalizar([evento for evento, geolocalizar, _ in lote if geolocalizar])
+                try:
+                    # Savepoint propio: un lote fallido no deja inservible la transacción de quien vacía
+                    with transaction.atomic():
+                        AuditoriaOperacion.objects.bulk_create([evento for evento, _, _ in lote])
+                    total += len(lote)
+                    continue
+                except Exception as e:
+                    logger.warning(f"No se pudo escribir el lote de auditoría ({len(lote)} eventos), fila por fila: {e}")
+
+                escritos, fallidos = BufferAuditoria._escribir_de_a_uno(lote)
+                total += escritos
+                if not fallidos:
+                    continue
+                if escritos:
+                    # La base responde: esas filas no van a entrar nunca
+                    for evento, _, _, error in fallidos:
+                        logger.error(f"Evento de auditoría descartado ({error}): {_describir(evento)}")
+                    continue
+
+                # No entró ninguna (base caída): vuelven al frente sin volver a geolocalizar
+                reintentos = []
+                for evento, _, intentos, error in fallidos:
+                    if intentos + 1 < MAX_REINTENTOS:
+                        reintentos.append((evento, False, intentos + 1))
+                    else:
+                        logger.error(f"Evento de auditoría descartado tras {MAX_REINTENTOS} intentos ({error}): "
+                                     f"{_describir(evento)}")
+                if reintentos:
+                    BufferAuditoria._devolver(reintentos)
+                    logger.error(f"No se pudo escribir la auditoría ({len(reintentos)} eventos, se reintenta)")
+                return total
+
+    @staticmethod
+    def _escribir_de_a_uno(lote: List[Tuple[AuditoriaOperacion, bool, int]]):
+        """
+        Inserta los eventos de a uno, cada uno en su savepoint
+
+        Returns:
+            (insertados, [(evento, geolocalizar, intentos, error)] de los que fallaron)
+        """
+        escritos = 0
+        fallidos = []
+        for evento, geolocalizar, intentos in lote:
+            try:
+                with transaction.atomic():
+                    AuditoriaOperacion.objects.bulk_create([evento])
+                escritos += 1
+            except Exception as e:
+                fallidos.append((evento, geolocalizar, intentos, e))
+        return escritos, fallidos
+
+    @staticmethod
+    def pendientes() -> int:
+        with BufferAuditoria._lock:
+            return len(BufferAuditoria._pendientes)
+
+    @staticmethod
+    def limpiar_local():
+        """Descarta los eventos pendientes de este proceso (tests, shell)"""
+        with BufferAuditoria._lock:
+            BufferAuditoria._pendientes.clear()
+
+
+# =============================================================================
+# WORKER
+# =============================================================================
+
+class WorkerAuditoria(threading.Thread):
+    """Hilo que escribe el buffer cuando se llena o cada intervalo"""
+
+    def __init__(self):
+        super().__init__(name='auditoria-diferida', daemon=True)
+        self.evento = threading.Event()
+
+    def run(self):
+        while True:
+            self.evento.wait(intervalo())
+            self.evento.clear()
+            if not BufferAuditoria.pendientes():
+                continue
+            try:
+                close_old_connections()
+                BufferAuditoria.vaciar()
+            except Exception as e:
+                logger.error(f"Worker de auditoría: {e}")
+            finally:
+                close_old_connections()
+
+
+_worker: Optional[WorkerAuditoria] = None
+_worker_lock = threading.Lock()
+
+
+def despertar_worker(urgente: bool = False):
+    """Asegura que el worker esté corriendo; urgente: escribir sin esperar el intervalo"""
+    global _worker
+
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = WorkerAuditoria()
+            _worker.start()
+    if urgente:
+        _worker.evento.set()
+
+
+def _vaciar_al_salir():
+    if not BufferAuditoria.pendientes():
+        return
+    try:
+        escritos = BufferAuditoria.vaciar()
+        logger.info(f"Auditoría: {escritos} eventos escritos al terminar el proceso")
+    except Exception as e:
+        logger.error(f"Auditoría: no se pudo vaciar el buffer al terminar: {e}")
+
+
+atexit.register(_vaciar_al_salir)
@@ -0,0 +1,352 @@
+"""
+Bandeja de salida de mensajes (emails y WhatsApp)
+==================================================
+
+verificar_saldo_y_notificar enviaba el email (SMTP) y el WhatsApp (HTTP con
+timeout de 30 s) dentro de la transacción de la venta, con la fila de la
+tarjeta bloqueada por select_for_update: el cajero esperaba a servidores
+externos y las demás ventas de esa tarjeta también.
+
+Ahora la venta o recarga sólo inserta filas en mensajes_salientes, en la
+misma transacción (si la venta se revierte, el mensaje desaparece). Al
+confirmar se despierta un worker que entrega fuera del request:
+
+- Reclama lotes por canal con un UPDATE condicional (marca de lote), así
+  dos workers nunca envían el mismo mensaje
+- Divide el lote entre N envíos simultáneos por canal
+  (settings.MENSAJERIA_CONCURRENCIA); cada uno reutiliza una sola conexión
+  SMTP o un único /send-bulk sobre la sesión compartida del whatsapp-server
+- Reintenta con backoff exponencial y marca ERROR al agotar los intentos
+"""
+
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import MensajeSaliente, NotificacionSaldo
+from .whatsapp_client import ENTREGA_INCIERTA
+
+logger = logging.getLogger(__name__)
+
+EMAIL = MensajeSaliente.CANAL_EMAIL
+WHATSAPP = MensajeSaliente.CANAL_WHATSAPP
+
+TAMANO_LOTE = 50
+BACKOFF_BASE_SEGUNDOS = 30
+BACKOFF_MAX_SEGUNDOS = 1800
+MENSAJE_COLGADO_MINUTOS = 10
+INTERVALO_WORKER_SEGUNDOS = 60
+
+# Campo de NotificacionSaldo que se marca al entregar por cada canal
+# (enviada_sms se usa para WhatsApp desde antes de la bandeja)
+_CAMPO_NOTIFICACION = {EMAIL: 'enviada_email', WHATSAPP: 'enviada_sms'}
+
+# Errores con los que el mensaje pudo haberse entregado: pasan a ERROR sin
+# reintento, para no mandarlo dos veces
+ERRORES_SIN_REINTENTO = frozenset({ENTREGA_INCIERTA})
+
+
+def concurrencia(canal: str) -> int:
+    """Envíos simultáneos permitidos para el canal"""
+    limites = getattr(settings, 'MENSAJERIA_CONCURRENCIA', {})
+    return max(1, int(limites.get(canal, 1)))
+
+
+# =============================================================================
+# REMITENTES
+# =============================================================================
+
+class RemitenteEmail:
+    """Envía un grupo de emails por una única conexión SMTP"""
+
+    def enviar_lote(self, mensajes: List[MensajeSaliente]) -> Dict[int, Optional[str]]:
+        """
+        Returns:
+            {id_mensaje: None si se envió, o el error}
+        """
+        resultados = {}
+        conexion = get_connection(fail_silently=False)
+        try:
+            conexion.open()
+        except Exception as e:
+            return {mensaje.id_mensaje: f'SMTP no disponible: {e}' for mensaje in mensajes}
+
+        try:
+            for mensaje in mensajes:
+                try:
+                    EmailMessage(
+                        subject=mensaje.asunto or '',
+                        body=mensaje.cuerpo,
+                        from_email=settings.DEFAULT_FROM_EMAIL,
+                        to=[mensaje.destinatario],
+                        connection=conexion,
+                    ).send()
+                    resultados[mensaje.id_mensaje] = None
+                except Exception as e:
+                    resultados[mensaje.id_mensaje] = str(e)
+        finally:
+            conexion.close()
+        return resultados
+
+
+class RemitenteWhatsApp:
+    """Envía un grupo de mensajes por /send-bulk con el cliente compartido del whatsapp-server"""
+
+    def __init__(self, despachador=None):
+        from .whatsapp_client import DespachadorWhatsApp
+
+        # Los grupos ya se reparten en paralelo en BandejaSalida._enviar
+        self.despachador = despachador or DespachadorWhatsApp(concurrencia=1)
+
+    def enviar_lote(self, mensajes: List[MensajeSaliente]) -> Dict[int, Optional[str]]:
+        resultados = self.despachador.enviar([
+            {'phone': mensaje.destinatario, 'message': mensaje.cuerpo} for mensaje in mensajes
+        ])
+        return {
+            mensaje.id_mensaje: resultado['error']
+            for mensaje, resultado in zip(mensajes, resultados)
+        }
+
+
+REMITENTES = {
+    EMAIL: RemitenteEmail,
+    WHATSAPP: RemitenteWhatsApp,
+}
+
+
+# =============================================================================
+# BANDEJA
+# =============================================================================
+
+class BandejaSalida:
+    """Outbox persistente de mensajes (tabla mensajes_salientes)"""
+
+    @staticmethod
+    def encolar(canal: str, destinatario: str, cuerpo: str, asunto: Optional[str] = None,
+                notificacion: Optional[NotificacionSaldo] = None) -> MensajeSaliente:
+        """
+        Encola un mensaje en la transacción actual; se entrega después del commit
+
+        Args:
+            canal: EMAIL o WHATSAPP
+            destinatario: Email o número de teléfono
+            notificacion: NotificacionSaldo a marcar como enviada al entregar
+        """
+        mensaje = MensajeSaliente.objects.create(
+            canal=canal,
+            destinatario=destinatario,
+            asunto=asunto,
+            cuerpo=cuerpo,
+            id_notificacion_saldo=notificacion,
+        )
+        transaction.on_commit(despertar_worker)
+        return mensaje
+
+    @staticmethod
+    def encolar_varios(mensajes: List[MensajeSaliente], tamano_lote: int = 500) -> int:
+        """
+        Encola muchos mensajes con bulk_create (barridos nocturnos, campañas)
+
+        Args:
+            mensajes: MensajeSaliente sin guardar (canal, destinatario, cuerpo...)
+
+        Returns:
+            Cantidad de mensajes encolados
+        """
+        if not mensajes:
+            return 0
+        MensajeSaliente.objects.bulk_create(mensajes, batch_size=tamano_lote)
+        transaction.on_commit(despertar_worker)
+        return len(mensajes)
+
+    @staticmethod
+    def reclamar_lote(canal: str, limite: int = TAMANO_LOTE) -> List[MensajeSaliente]:
+        """
+        Toma hasta `limite` mensajes pendientes del canal
+
+        El paso PENDIENTE -> ENVIANDO es un UPDATE condicional con una marca de
+        lote propia: cada worker recibe sólo los mensajes que él actualizó.
+        """
+        ahora = timezone.now()
+        ids = list(
+            MensajeSaliente.objects.filter(
+                canal=canal,
+                estado='PENDIENTE',
+                fecha_proximo_intento__lte=ahora,
+            ).order_by('id_mensaje').values_list('id_mensaje', flat=True)[:limite]
+        )
+        if not ids:
+            return []
+
+        lote = uuid.uuid4().hex
+        MensajeSaliente.objects.filter(
+            id_mensaje__in=ids,
+            estado='PENDIENTE',
+        ).update(
+            estado='ENVIANDO',
+            lote=lote,
+            # Marca de reclamo: permite detectar mensajes colgados
+            fecha_proximo_intento=ahora,
+        )
+        return list(MensajeSaliente.objects.filter(lote=lote, estado='ENVIANDO').order_by('id_mensaje'))
+
+    @staticmethod
+    def procesar_pendientes(canales: Optional[Iterable[str]] = None, remitentes: Optional[Dict] = None,
+                            limite: int = TAMANO_LOTE) -> Dict[str, int]:
+        """
+        Entrega un lote de cada canal
+
+        Args:
+            canales: Canales a procesar (default: todos)
+            remitentes: {canal: remitente con enviar_lote()} (tests)
+            limite: Máximo de mensajes por canal en esta pasada
+
+        Returns:
+            Dict con contadores {'enviados', 'reintentos', 'errores'}
+        """
+        resultado = {'enviados': 0, 'reintentos': 0, 'errores': 0}
+        BandejaSalida.recuperar_colgados()
+
+        for canal in canales or REMITENTES:
+            mensajes = BandejaSalida.reclamar_lote(canal, limite)
+            if not mensajes:
+                continue
+            remitente = (remitentes or {}).get(canal) or REMITENTES[canal]()
+            errores = BandejaSalida._enviar(canal, remitente, mensajes)
+            for clave, cantidad in BandejaSalida._registrar(canal, mensajes, errores).items():
+                resultado[clave] += cantidad
+
+        return resultado
+
+    @staticmethod
+    def _enviar(canal: str, remitente, mensajes: List[MensajeSaliente]) -> Dict[int, Optional[str]]:
+        """Reparte el lote entre los envíos simultáneos permitidos para el canal"""
+        partes = concurrencia(canal)
+        grupos = [mensajes[i::partes] for i in range(partes) if mensajes[i::partes]]
+
+        def enviar(grupo):
+            try:
+                return remitente.enviar_lote(grupo)
+            except Exception as e:
+                return {mensaje.id_mensaje: str(e) for mensaje in grupo}
+
+        errores = {}
+        if len(grupos) == 1:
+            errores.update(enviar(grupos[0]))
+        else:
+            with ThreadPoolExecutor(max_workers=len(grupos), thread_name_prefix=f'bandeja-{canal}') as pool:
+                for parcial in pool.map(enviar, grupos):
+                    errores.update(parcial)
+        return errores
+
+    @staticmethod
+    def _registrar(canal: str, mensajes: List[MensajeSaliente], errores: Dict[int, Optional[str]]) -> Dict[str, int]:
+        """Guarda el resultado del lote con un bulk_update"""
+        ahora = timezone.now()
+        contadores = {'enviados': 0, 'reintentos': 0, 'errores': 0}
+        notificaciones = []
+
+        for mensaje in mensajes:
+            mensaje.intentos += 1
+            error = errores.get(mensaje.id_mensaje, 'Sin respuesta del remitente')
+            if error is None:
+                mensaje.estado = 'ENVIADO'
+                mensaje.fecha_envio = ahora
+                mensaje.ultimo_error = None
+                contadores['enviados'] += 1
+                if mensaje.id_notificacion_saldo_id:
+                    notificaciones.append(mensaje.id_notificacion_saldo_id)
+            elif error in ERRORES_SIN_REINTENTO or mensaje.intentos >= mensaje.max_intentos:
+                mensaje.estado = 'ERROR'
+                mensaje.ultimo_error = error
+                contadores['errores'] += 1
+            else:
+                espera = min(BACKOFF_BASE_SEGUNDOS * 2 ** (mensaje.intentos - 1), BACKOFF_MAX_SEGUNDOS)
+                mensaje.estado = 'PENDIENTE'
+                mensaje.ultimo_error = error
+                mensaje.fecha_proximo_intento = ahora + timedelta(seconds=espera)
+                contadores['reintentos'] += 1
+
+        MensajeSaliente.objects.bulk_update(
+            mensajes, ['estado', 'intentos', 'ultimo_error', 'fecha_envio', 'fecha_proximo_intento']
+        )
+        if notificaciones:
+            NotificacionSaldo.objects.filter(id_notificacion__in=notificaciones).update(
+                **{_CAMPO_NOTIFICACION[canal]: True, 'fecha_envio': ahora}
+            )
+        return contadores
+
+    @staticmethod
+    def recuperar_colgados() -> int:
+        """Devuelve a PENDIENTE los mensajes que quedaron ENVIANDO tras una caída del worker"""
+        limite = timezone.now() - timedelta(minutes=MENSAJE_COLGADO_MINUTOS)
+        return MensajeSaliente.objects.filter(
+            estado='ENVIANDO',
+            fecha_proximo_intento__lt=limite,
+        ).update(estado='PENDIENTE', fecha_proximo_intento=timezone.now())
+
+    @staticmethod
+    def estado_bandeja() -> Dict[str, Dict[str, int]]:
+        """Conteos por canal y estado"""
+        estado: Dict[str, Dict[str, int]] = {}
+        for fila in MensajeSaliente.objects.values('canal', 'estado').annotate(total=Count('id_mensaje')):
+            estado.setdefault(fila['canal'], {})[fila['estado']] = fila['total']
+        return estado
+
+
+# =============================================================================
+# WORKER
+# =============================================================================
+
+class WorkerBandejaSalida(threading.Thread):
+    """Hilo que drena la bandeja cuando se le avisa (o cada intervalo, para reintentos)"""
+
+    def __init__(self):
+        super().__init__(name='bandeja-salida', daemon=True)
+        self.evento = threading.Event()
+
+    def run(self):
+        while True:
+            self.evento.wait(INTERVALO_WORKER_SEGUNDOS)
+            self.evento.clear()
+            try:
+                close_old_connections()
+                # Vaciar la bandeja: un lote por canal en cada vuelta
+                while sum(BandejaSalida.procesar_pendientes().values()):
+                    pass
+            except Exception as e:
+                logger.error(f"Worker de bandeja de salida: {e}")
+            finally:
+                close_old_connections()
+
+
+_worker: Optional[WorkerBandejaSalida] = None
+_worker_lock = threading.Lock()
+
+
+def despertar_worker():
+    """Avisa que hay mensajes nuevos (tarea Celery o hilo del proceso)"""
+    global _worker
+
+    if getattr(settings, 'MENSAJERIA_ASINCRONA', False):
+        try:
+            from .tasks import tarea_procesar_bandeja_salida
+            tarea_procesar_bandeja_salida.delay()
+            return
+        except Exception as e:
+            logger.warning(f"No se pudo encolar la bandeja en Celery, se usa el worker local: {e}")
+
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = WorkerBandejaSalida()
+            _worker.start()
+    _worker.evento.set()
@@ -0,0 +1,142 @@
+"""
+Espacios de cache con invalidación por generación
+==================================================
+
+ReporteCache.invalidar_tipo dependía de delete_pattern (sólo django-redis)
+y en LocMem no hacía nada; cache_utils.invalidate_cache terminaba en
+cache.clear(), que borraba también rate limits y contadores de versión.
+
+Un EspacioCache agrupa claves bajo un contador de generación guardado en
+el cache compartido. Cada clave real incluye la generación vigente:
+
+    productos:<generación>:<clave>
+
+Invalidar el espacio es un único incr del contador, O(1) sin importar
+cuántas claves tenga: las claves viejas quedan inalcanzables y expiran
+solas. Como el contador vive en el backend compartido (settings.CACHES),
+todos los workers ven la invalidación en la siguiente lectura.
+
+Un espacio puede tener un padre ('reporte' -> 'reporte:ventas'): invalidar
+el padre invalida todos sus hijos.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+
+class EspacioCache:
+    """Conjunto de claves de cache invalidables en bloque"""
+
+    PREFIJO_GENERACION = 'gen'
+
+    def __init__(self, nombre: str, padre: Optional['EspacioCache'] = None, alias: str = 'default'):
+        self.nombre = nombre
+        self.padre = padre
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @property
+    def clave_generacion(self) -> str:
+        return f'{self.PREFIJO_GENERACION}:{self.nombre}'
+
+    def _cadena(self) -> List['EspacioCache']:
+        """Espacios desde la raíz hasta este"""
+        cadena = []
+        espacio = self
+        while espacio is not None:
+            cadena.append(espacio)
+            espacio = espacio.padre
+        return list(reversed(cadena))
+
+    @staticmethod
+    def _generacion_inicial() -> int:
+        # Basada en el reloj: si el contador se pierde (expulsión, reinicio de
+        # Redis) nunca se reutiliza una generación con claves viejas vivas
+        return time.time_ns()
+
+    def generaciones(self) -> Dict[str, int]:
+        """Generación vigente de este espacio y sus padres (una lectura)"""
+        cadena = self._cadena()
+        claves = [espacio.clave_generacion for espacio in cadena]
+        valores = self.cache.get_many(claves)
+        for clave in claves:
+            if clave not in valores:
+                self.cache.add(clave, self._generacion_inicial(), None)
+                valores[clave] = self.cache.get(clave, self._generacion_inicial())
+        return valores
+
+    def clave(self, clave: str) -> str:
+        """Clave real en el cache para la generación vigente"""
+        generaciones = self.generaciones()
+        sufijo = ':'.join(
+            str(generaciones[espacio.clave_generacion]) for espacio in self._cadena()
+        )
+        return f'{self.nombre}:{sufijo}:{clave}'
+
+    # =========================================================================
+    # OPERACIONES
+    # =========================================================================
+
+    def get(self, clave: str, default: Any = None) -> Any:
+        return self.cache.get(self.clave(clave), default)
+
+    def set(self, clave: str, valor: Any, timeout=DEFAULT_TIMEOUT):
+        self.cache.set(self.clave(clave), valor, timeout)
+
+    def delete(self, clave: str):
+        self.cache.delete(self.clave(clave))
+
+    def get_or_set(self, clave: str, cargar: Callable[[], Any], timeout=DEFAULT_TIMEOUT) -> Any:
+        """Valor cacheado o el resultado de cargar() (que se guarda si no es None)"""
+        clave_real = self.clave(clave)
+        valor = self.cache.get(clave_real)
+        if valor is None:
+            valor = cargar()
+            if valor is not None:
+                self.cache.set(clave_real, valor, timeout)
+        return valor
+
+    def invalidar(self):
+        """Invalida todas las claves del espacio (y de sus hijos) en todos los workers"""
+        try:
+            self.cache.incr(self.clave_generacion)
+        except ValueError:
+            # Contador inexistente: cualquier generación nueva deja huérfanas las claves viejas
+            self.cache.set(self.clave_generacion, self._generacion_inicial(), None)
+
+    def __repr__(self):
+        return f'EspacioCache({self.nombre!r})'
+
+
+_espacios: Dict[str, EspacioCache] = {}
+_lock = threading.RLock()
+
+
+def espacio_cache(nombre: str, padre: Optional[str] = None) -> EspacioCache:
+    """
+    Espacio de cache compartido por nombre (se crea la primera vez)
+
+    Args:
+        nombre: Nombre completo del espacio ('productos', 'reporte:ventas')
+        padre: Nombre del espacio padre, si lo tiene
+
+    Ejemplo:
+        productos = espacio_cache('productos')
+        productos.set(f'categoria:{id}', datos, 300)
+        productos.invalidar()
+    """
+    espacio = _espacios.get(nombre)
+    if espacio is None:
+        with _lock:
+            espacio = _espacios.get(nombre)
+            if espacio is None:
+                espacio = EspacioCache(nombre, espacio_cache(padre) if padre else None)
+                _espacios[nombre] = espacio
+    return espacio
@@ -0,0 +1,339 @@
+"""
+Cache en memoria de datos de referencia del POS
+================================================
+
+procesar_venta consultaba en cada venta datos que casi nunca cambian:
+la lista de precios activa, el tipo de cliente por defecto, el cliente
+genérico '0000000', el empleado 'SISTEMA', el timbrado activo y cada
+medio de pago (dos veces por pago: registro y ticket). La grilla de
+productos consultaba además un PreciosPorLista por producto (MapaPrecios).
+
+CacheReferencia los mantiene en memoria del proceso. La invalidación es
+versionada: los signals (signals.py) incrementan un contador compartido
+en el cache de Django al confirmar la transacción, y cada proceso descarta
+su copia local cuando detecta que la versión cambió. Así un cambio hecho
+desde el admin de un worker se ve en todos los demás.
+
+Las instancias devueltas son compartidas entre requests: usarlas sólo
+para lectura o como FK, nunca modificarlas ni guardarlas.
+"""
+
+import threading
+from decimal import Decimal
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import (
+    Cliente, DatosEmpresa, Empleado, ListaPrecios, MediosPago, PreciosPorLista, Producto,
+    TipoCliente, TipoRolGeneral, Timbrados
+)
+
+
+RUC_CLIENTE_GENERICO = '0000000'
+USUARIO_SISTEMA = 'SISTEMA'
+
+# Marca para distinguir "no cacheado" de "cacheado como None"
+_AUSENTE = object()
+
+
+class _SinCachear:
+    """Valor devuelto por un cargador que no debe quedar en el cache"""
+
+    __slots__ = ('valor',)
+
+    def __init__(self, valor):
+        self.valor = valor
+
+
+class AlmacenVersionado:
+    """
+    Diccionario en memoria del proceso invalidado por una versión compartida
+
+    La versión vive en el cache de Django (clave_version); cada proceso
+    compara su versión local antes de leer y descarta sus datos si cambió.
+    """
+
+    def __init__(self, clave_version: str):
+        self.clave_version = clave_version
+        self._datos: Dict[Any, Any] = {}
+        self._version_local: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _version_compartida(self) -> int:
+        """Versión vigente en el cache compartido (la crea si no existe)"""
+        version = cache.get(self.clave_version)
+        if version is None:
+            cache.add(self.clave_version, 1, None)
+            version = cache.get(self.clave_version, 1)
+        return version
+
+    def obtener(self, clave, cargar: Callable[[], Any]) -> Any:
+        """Devuelve el valor cacheado o lo carga desde la base de datos"""
+        version = self._version_compartida()
+        if version != self._version_local:
+            with self._lock:
+                self._datos = {}
+                self._version_local = version
+
+        valor = self._datos.get(clave, _AUSENTE)
+        if valor is _AUSENTE:
+            valor = cargar()
+            if isinstance(valor, _SinCachear):
+                return valor.valor
+            with self._lock:
+                if self._version_local == version:
+                    self._datos[clave] = valor
+        return valor
+
+    def descartar(self, condicion: Callable[[Any], bool]):
+        """Quita de la copia de este proceso las claves que cumplen la condición"""
+        with self._lock:
+            self._datos = {clave: valor for clave, valor in self._datos.items() if not condicion(clave)}
+
+    def invalidar(self):
+        """
+        Descarta los datos en todos los procesos
+
+        La copia local se limpia de inmediato; la versión compartida se
+        incrementa al confirmar la transacción para que ningún proceso
+        recargue datos todavía no confirmados.
+        """
+        self.limpiar_local()
+        transaction.on_commit(self._incrementar_version)
+
+    def _incrementar_version(self):
+        try:
+            cache.incr(self.clave_version)
+        except ValueError:
+            cache.set(self.clave_version, 1, None)
+
+    def limpiar_local(self):
+        """Limpia sólo la copia de este proceso (tests, shell)"""
+        with self._lock:
+            self._datos = {}
+            self._version_local = None
+
+
+class CacheReferencia:
+    """Datos de referencia del POS servidos desde memoria del proceso"""
+
+    CLAVE_VERSION = 'pos:referencia:version'
+
+    _almacen = AlmacenVersionado(CLAVE_VERSION)
+
+    @staticmethod
+    def _obtener(clave: str, cargar: Callable[[], Any]) -> Any:
+        return CacheReferencia._almacen.obtener(clave, cargar)
+
+    @staticmethod
+    def invalidar():
+        """Descarta los datos de referencia en todos los procesos"""
+        CacheReferencia._almacen.invalidar()
+
+    @staticmethod
+    def limpiar_local():
+        """Limpia sólo la copia de este proceso (tests, shell)"""
+        CacheReferencia._almacen.limpiar_local()
+
+    @staticmethod
+    def precargar() -> Dict[str, bool]:
+        """
+        Carga los datos de referencia al iniciar un worker
+
+        Returns:
+            Dict con qué datos quedaron disponibles
+        """
+        return {
+            'lista_precios': CacheReferencia.lista_precios_default() is not None,
+            'tipo_cliente': CacheReferencia.tipo_cliente_default() is not None,
+            'medios_pago': bool(CacheReferencia.medios_pago()),
+            'timbrado': CacheReferencia.timbrado_activo() is not None,
+            'cliente_generico': CacheReferencia.cliente_generico() is not None,
+            'empleado_sistema': CacheReferencia.empleado_sistema() is not None,
+        }
+
+    # =========================================================================
+    # CONSULTAS
+    # =========================================================================
+
+    @staticmethod
+    def lista_precios_default() -> Optional[ListaPrecios]:
+        """Lista de precios activa por defecto"""
+        return CacheReferencia._obtener(
+            'lista_precios_default',
+            lambda: ListaPrecios.objects.filter(activo=True).first()
+        )
+
+    @staticmethod
+    def tipo_cliente_default() -> Optional[TipoCliente]:
+        """Tipo de cliente por defecto"""
+        return CacheReferencia._obtener(
+            'tipo_cliente_default',
+            lambda: TipoCliente.objects.first()
+        )
+
+    @staticmethod
+    def timbrado_activo() -> Optional[Timbrados]:
+        """Timbrado activo para facturación"""
+        return CacheReferencia._obtener(
+            'timbrado_activo',
+            lambda: Timbrados.objects.filter(activo=True).first()
+        )
+
+    @staticmethod
+    def datos_empresa() -> Optional[DatosEmpresa]:
+        """Datos de la empresa emisora (facturación electrónica)"""
+        return CacheReferencia._obtener(
+            'datos_empresa',
+            lambda: DatosEmpresa.objects.first()
+        )
+
+    @staticmethod
+    def medios_pago() -> Dict[int, MediosPago]:
+        """Todos los medios de pago indexados por id"""
+        return CacheReferencia._obtener(
+            'medios_pago',
+            lambda: MediosPago.objects.in_bulk()
+        )
+
+    @staticmethod
+    def medio_pago(id_medio_pago) -> Optional[MediosPago]:
+        """Medio de pago por id (None si no existe)"""
+        try:
+            return CacheReferencia.medios_pago().get(int(id_medio_pago))
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def cliente_generico() -> Optional[Cliente]:
+        """
+        Cliente genérico '0000000' (se crea si no existe)
+
+        Returns:
+            Cliente o None si no hay lista de precios o tipo de cliente
+        """
+        def cargar():
+            lista = CacheReferencia.lista_precios_default()
+            tipo = CacheReferencia.tipo_cliente_default()
+            if not lista or not tipo:
+                return None
+
+            cliente, created = Cliente.objects.get_or_create(
+                ruc_ci=RUC_CLIENTE_GENERICO,
+                defaults={
+                    'nombres': 'CLIENTE',
+                    'apellidos': 'GENERICO',
+                    'id_lista': lista,
+                    'id_tipo_cliente': tipo,
+                    'direccion': 'N/A',
+                    'ciudad': 'N/A',
+                    'telefono': '0',
+                    'email': 'generico@sistema.local',
+                    'limite_credito': 0,
+                    'activo': True
+                }
+            )
+            # Recién creado en esta transacción: no cachear hasta que se confirme
+            return _SinCachear(cliente) if created else cliente
+
+        return CacheReferencia._obtener('cliente_generico', cargar)
+
+    @staticmethod
+    def empleado_sistema() -> Empleado:
+        """Empleado 'SISTEMA' usado cuando el usuario no es empleado (se crea si no existe)"""
+        def cargar():
+            rol_generico, _ = TipoRolGeneral.objects.get_or_create(
+                nombre_rol='SISTEMA',
+                defaults={'descripcion': 'Rol del sistema'}
+            )
+            empleado, created = Empleado.objects.get_or_create(
+                usuario=USUARIO_SISTEMA,
+                defaults={
+                    'id_rol': rol_generico,
+                    'nombre': 'SISTEMA',
+                    'apellido': 'POS',
+                    'contrasena_hash': 'N/A',
+                    'direccion': 'N/A',
+                    'ciudad': 'N/A',
+                    'telefono': '0',
+                    'email': 'sistema@pos.local',
+                    'activo': True
+                }
+            )
+            return _SinCachear(empleado) if created else empleado
+
+        return CacheReferencia._obtener('empleado_sistema', cargar)
+
+
+class MapaPrecios:
+    """
+    Precios por lista y marca "por kilo" de los productos, en memoria
+
+    Reemplaza el PreciosPorLista.objects.get por producto de la grilla
+    del POS: cada lista se carga con una sola query y se invalida cuando
+    cambia un PreciosPorLista (signals.py). Los productos por kilo se
+    calculan una vez al cargar, no en cada request.
+    """
+
+    CLAVE_VERSION = 'pos:precios:version'
+
+    _almacen = AlmacenVersionado(CLAVE_VERSION)
+
+    @staticmethod
+    def precios(id_lista: int) -> Dict[int, Decimal]:
+        """{id_producto: precio_venta} de una lista de precios"""
+        return MapaPrecios._almacen.obtener(
+            ('lista', id_lista),
+            lambda: dict(
+                PreciosPorLista.objects.filter(
+                    id_lista_precios_id=id_lista
+                ).values_list('id_producto_id', 'precio_venta')
+            )
+        )
+
+    @staticmethod
+    def productos_por_kilo() -> FrozenSet[int]:
+        """Ids de los productos que se venden por kilo"""
+        return MapaPrecios._almacen.obtener(
+            'por_kilo',
+            lambda: frozenset(
+                id_producto
+                for id_producto, descripcion in Producto.objects.values_list('id_producto', 'descripcion')
+                if 'KILO' in (descripcion or '').upper()
+            )
+        )
+
+    @staticmethod
+    def anotar(productos: Iterable[Producto], lista: Optional[ListaPrecios] = None) -> List[Producto]:
+        """
+        Agrega precio_actual y es_por_kilo a cada producto
+
+        Args:
+            productos: Productos (o queryset) a mostrar en la grilla
+            lista: Lista de precios (None = lista activa por defecto)
+
+        Returns:
+            Lista de productos anotados
+        """
+        if lista is None:
+            lista = CacheReferencia.lista_precios_default()
+        precios = MapaPrecios.precios(lista.pk) if lista else {}
+        por_kilo = MapaPrecios.productos_por_kilo()
+
+        productos = list(productos)
+        for producto in productos:
+            producto.precio_actual = precios.get(producto.id_producto, 0)
+            producto.es_por_kilo = producto.id_producto in por_kilo
+        return productos
+
+    @staticmethod
+    def invalidar():
+        """Descarta los precios cacheados en todos los procesos"""
+        MapaPrecios._almacen.invalidar()
+
+    @staticmethod
+    def limpiar_local():
+        """Limpia sólo la copia de este proceso (tests, shell)"""
+        MapaPrecios._almacen.limpiar_local()
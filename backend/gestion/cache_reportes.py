@@ -2,16 +2,25 @@
 Sistema de Cache para Reportes
 ===============================
 Cachea reportes generados para mejorar performance
-Usa Django cache framework con Redis/LocMem
+Usa Django cache framework (backend compartido, ver settings.CACHES)
+
+La invalidación por tipo usa espacios con contador de generación
+(cache_compartido): no depende de delete_pattern ni de limpiar todo el cache.
 """
 
-from django.core.cache import cache
+from django.core.cache import cache, caches
 from django.utils.encoding import force_str
 from functools import wraps
 import hashlib
 import json
 from datetime import datetime
 
+from .cache_compartido import espacio_cache
+
+
+ESPACIO_REPORTES = 'reporte'
+ESPACIO_DASHBOARD = 'dashboard'
+
 
 class ReporteCache:
     """Gestor de cache para reportes"""
@@ -26,6 +35,11 @@ class ReporteCache:
     TIMEOUT_DASHBOARD = 60  # 1 minuto
     TIMEOUT_ALMUERZOS = 300  # 5 minutos
     
+    @staticmethod
+    def espacio(tipo_reporte):
+        """Espacio de cache de un tipo de reporte (hijo del espacio 'reporte')"""
+        return espacio_cache(f"{ESPACIO_REPORTES}:{tipo_reporte}", padre=ESPACIO_REPORTES)
+    
     @staticmethod
     def generar_cache_key(tipo_reporte, **params):
         """
@@ -44,8 +58,8 @@ class ReporteCache:
         # Crear hash de los parámetros
         params_hash = hashlib.md5(params_str.encode()).hexdigest()
         
-        # Formato: reporte:tipo:hash
-        return f"reporte:{tipo_reporte}:{params_hash}"
+        # Formato: reporte:tipo:generaciones:hash
+        return ReporteCache.espacio(tipo_reporte).clave(params_hash)
     
     @staticmethod
     def get_reporte(tipo_reporte, **params):
@@ -88,24 +102,14 @@ class ReporteCache:
     def invalidar_tipo(tipo_reporte):
         """
         Invalida todos los reportes de un tipo específico
-        Usa patrón de clave para buscar y eliminar
+        Incrementa la generación del tipo: O(1) y visible en todos los workers
         """
-        pattern = f"reporte:{tipo_reporte}:*"
-        # Nota: Esto requiere Redis. Para LocMem, solo podemos invalidar específicos
-        try:
-            cache.delete_pattern(pattern)
-        except AttributeError:
-            # LocMem no soporta delete_pattern
-            pass
+        ReporteCache.espacio(tipo_reporte).invalidar()
     
     @staticmethod
     def invalidar_todos():
-        """Invalida todos los reportes del cache"""
-        try:
-            cache.delete_pattern("reporte:*")
-        except AttributeError:
-            # LocMem no soporta delete_pattern
-            pass
+        """Invalida todos los reportes del cache (generación del espacio 'reporte')"""
+        espacio_cache(ESPACIO_REPORTES).invalidar()
 
 
 def cache_reporte(tipo_reporte, timeout=None):
@@ -231,7 +235,8 @@ def get_datos_dashboard_cacheados():
     Returns:
         dict con estadísticas del dashboard
     """
-    cache_key = "dashboard:estadisticas:principal"
+    dashboard = espacio_cache(ESPACIO_DASHBOARD)
+    cache_key = dashboard.clave("estadisticas:principal")
     
     # Intentar obtener del cache
     datos = cache.get(cache_key)
@@ -267,8 +272,8 @@ def get_datos_dashboard_cacheados():
 
 
 def invalidar_cache_dashboard():
-    """Invalida el cache del dashboard"""
-    cache.delete("dashboard:estadisticas:principal")
+    """Invalida todo el cache del dashboard (estadísticas y datos por usuario)"""
+    espacio_cache(ESPACIO_DASHBOARD).invalidar()
 
 
 # =============================================================================
@@ -282,21 +287,23 @@ def get_stats_cache():
     Returns:
         dict con estadísticas o None si no están disponibles
     """
+    backend = caches['default']
     try:
         # Esto funciona con Redis
         from django.core.cache.backends.redis import RedisCache
-        if isinstance(cache, RedisCache):
-            stats = cache._cache.info('stats')
+        if isinstance(backend, RedisCache):
+            stats = backend._cache.get_client().info('stats')
             return {
                 'tipo': 'Redis',
                 'hits': stats.get('keyspace_hits', 0),
                 'misses': stats.get('keyspace_misses', 0),
                 'memoria_usada': stats.get('used_memory_human', 'N/A')
             }
-    except:
+    except Exception:
         pass
     
+    tipo = type(backend).__name__
     return {
-        'tipo': 'LocMem',
-        'info': 'Estadísticas no disponibles en LocMem'
+        'tipo': tipo,
+        'info': f'Estadísticas no disponibles en {tipo}'
     }
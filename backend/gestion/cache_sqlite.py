@@ -0,0 +1,181 @@
+"""
+Backend de cache compartido en un archivo SQLite
+=================================================
+
+Cache de Django para un servidor con varios workers de gunicorn sin Redis.
+A diferencia de FileBasedCache, add() e incr() son atómicos entre procesos
+(INSERT OR IGNORE y BEGIN IMMEDIATE), que es lo que necesitan el rate
+limiting y los contadores de generación/versión.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'gestion.cache_sqlite.SQLiteCache',
+            'LOCATION': '/var/lib/cantinatita/cantina-cache.sqlite3',
+        }
+    }
+
+Cada proceso (y cada hilo) abre su propia conexión; el archivo usa WAL
+para que las lecturas no esperen a las escrituras.
+"""
+
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+class SQLiteCache(BaseCache):
+    """Cache de Django sobre un archivo SQLite compartido por los workers"""
+
+    # Probabilidad de limpiar claves vencidas en cada set
+    PROBABILIDAD_CULL = 0.01
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.ruta = location
+        self._local = threading.local()
+
+    # =========================================================================
+    # CONEXIÓN
+    # =========================================================================
+
+    def _conexion(self) -> sqlite3.Connection:
+        conexion = getattr(self._local, 'conexion', None)
+        # Tras un fork (gunicorn, celery) la conexión heredada no se reutiliza
+        if conexion is None or self._local.pid != os.getpid():
+            directorio = os.path.dirname(self.ruta)
+            if directorio:
+                os.makedirs(directorio, exist_ok=True)
+            conexion = sqlite3.connect(self.ruta, timeout=10, isolation_level=None, check_same_thread=False)
+            conexion.execute('PRAGMA journal_mode=WAL')
+            conexion.execute('PRAGMA synchronous=NORMAL')
+            conexion.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'clave TEXT PRIMARY KEY, valor BLOB NOT NULL, expira REAL)'
+            )
+            self._local.conexion = conexion
+            self._local.pid = os.getpid()
+        return conexion
+
+    @staticmethod
+    def _vigente(expira, ahora=None) -> bool:
+        return expira is None or expira > (ahora or time.time())
+
+    # =========================================================================
+    # API DE DJANGO
+    # =========================================================================
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        conexion = self._conexion()
+        expira = self.get_backend_timeout(timeout)
+        with _transaccion(conexion):
+            conexion.execute('DELETE FROM cache WHERE clave = ? AND expira <= ?', (key, time.time()))
+            cursor = conexion.execute(
+                'INSERT OR IGNORE INTO cache (clave, valor, expira) VALUES (?, ?, ?)',
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expira)
+            )
+        return cursor.rowcount == 1
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        fila = self._conexion().execute(
+            'SELECT valor, expira FROM cache WHERE clave = ?', (key,)
+        ).fetchone()
+        if fila is None or not self._vigente(fila[1]):
+            return default
+        return pickle.loads(fila[0])
+
+    def get_many(self, keys, version=None):
+        claves = {self.make_and_validate_key(key, version=version): key for key in keys}
+        if not claves:
+            return {}
+        marcadores = ','.join('?' * len(claves))
+        ahora = time.time()
+        filas = self._conexion().execute(
+            f'SELECT clave, valor, expira FROM cache WHERE clave IN ({marcadores})', list(claves)
+        ).fetchall()
+        return {
+            claves[clave]: pickle.loads(valor)
+            for clave, valor, expira in filas if self._vigente(expira, ahora)
+        }
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._conexion().execute(
+            'INSERT OR REPLACE INTO cache (clave, valor, expira) VALUES (?, ?, ?)',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self.get_backend_timeout(timeout))
+        )
+        if random.random() < self.PROBABILIDAD_CULL:
+            self._cull()
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._conexion().execute(
+            'UPDATE cache SET expira = ? WHERE clave = ? AND (expira IS NULL OR expira > ?)',
+            (self.get_backend_timeout(timeout), key, time.time())
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._conexion().execute('DELETE FROM cache WHERE clave = ?', (key,))
+        return cursor.rowcount == 1
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        fila = self._conexion().execute('SELECT expira FROM cache WHERE clave = ?', (key,)).fetchone()
+        return fila is not None and self._vigente(fila[0])
+
+    def incr(self, key, delta=1, version=None):
+        """Incremento atómico entre procesos (ValueError si la clave no existe)"""
+        key = self.make_and_validate_key(key, version=version)
+        conexion = self._conexion()
+        with _transaccion(conexion):
+            fila = conexion.execute('SELECT valor, expira FROM cache WHERE clave = ?', (key,)).fetchone()
+            if fila is None or not self._vigente(fila[1]):
+                raise ValueError(f"Key '{key}' not found")
+            nuevo = pickle.loads(fila[0]) + delta
+            conexion.execute(
+                'UPDATE cache SET valor = ? WHERE clave = ?',
+                (pickle.dumps(nuevo, pickle.HIGHEST_PROTOCOL), key)
+            )
+        return nuevo
+
+    def clear(self):
+        self._conexion().execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # La conexión se mantiene abierta entre requests del mismo hilo
+        pass
+
+    def _cull(self):
+        """Borra las claves vencidas y, si sobran, las más próximas a vencer"""
+        conexion = self._conexion()
+        conexion.execute('DELETE FROM cache WHERE expira <= ?', (time.time(),))
+        total = conexion.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if total > self._max_entries and self._cull_frequency:
+            conexion.execute(
+                'DELETE FROM cache WHERE clave IN ('
+                'SELECT clave FROM cache WHERE expira IS NOT NULL ORDER BY expira LIMIT ?)',
+                (total // self._cull_frequency,)
+            )
+
+
+class _transaccion:
+    """BEGIN IMMEDIATE ... COMMIT: toma el lock de escritura antes de leer"""
+
+    def __init__(self, conexion: sqlite3.Connection):
+        self.conexion = conexion
+
+    def __enter__(self):
+        self.conexion.execute('BEGIN IMMEDIATE')
+        return self.conexion
+
+    def __exit__(self, tipo, valor, traza):
+        self.conexion.execute('COMMIT' if tipo is None else 'ROLLBACK')
+        return False
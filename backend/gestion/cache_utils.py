@@ -7,6 +7,8 @@ from functools import wraps
 import hashlib
 import json
 
+from .cache_compartido import espacio_cache
+
 
 def cache_result(timeout=None, key_prefix='', vary_on=None):
     """
@@ -25,8 +27,10 @@ def cache_result(timeout=None, key_prefix='', vary_on=None):
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            # Generar clave de cache
+            # Generar clave de cache (dentro del espacio del prefijo, invalidable en bloque)
             cache_key = _generate_cache_key(func.__name__, key_prefix, args, kwargs, vary_on)
+            if key_prefix:
+                cache_key = espacio_cache(key_prefix).clave(cache_key)
             
             # Intentar obtener del cache
             result = cache.get(cache_key)
@@ -76,26 +80,17 @@ def _generate_cache_key(func_name, prefix, args, kwargs, vary_on):
 
 def invalidate_cache(key_prefix='', **filters):
     """
-    Invalidar cache con un prefijo o filtros específicos
+    Invalidar cache con un prefijo
+    
+    Incrementa la generación del espacio del prefijo: todas sus claves dejan
+    de ser visibles en todos los workers con una sola operación. Los filtros
+    se aceptan por compatibilidad; se invalida el prefijo completo.
     
     Ejemplo:
-        invalidate_cache(key_prefix='productos', categoria_id=5)
+        invalidate_cache(key_prefix='productos')
     """
-    # Esta es una implementación simple
-    # Para producción, considera usar django-redis con pattern matching
     if key_prefix:
-        # Intento de invalidación por prefijo
-        # Nota: Requiere django-redis o similar para pattern matching
-        try:
-            from django_redis import get_redis_connection
-            conn = get_redis_connection("default")
-            pattern = f"*{key_prefix}*"
-            keys = conn.keys(pattern)
-            if keys:
-                conn.delete(*keys)
-        except:
-            # Fallback: limpiar todo el cache
-            cache.clear()
+        espacio_cache(key_prefix).invalidar()
 
 
 class CacheManager:
@@ -106,26 +101,27 @@ class CacheManager:
     @staticmethod
     def get_dashboard_data(user_id):
         """Obtener datos del dashboard desde cache"""
-        cache_key = f'dashboard:user:{user_id}'
-        return cache.get(cache_key)
+        return espacio_cache('dashboard').get(f'user:{user_id}')
     
     @staticmethod
     def set_dashboard_data(user_id, data, timeout=60):
         """Guardar datos del dashboard en cache"""
-        cache_key = f'dashboard:user:{user_id}'
-        cache.set(cache_key, data, timeout)
+        espacio_cache('dashboard').set(f'user:{user_id}', data, timeout)
+    
+    @staticmethod
+    def invalidate_dashboard():
+        """Invalidar cache del dashboard de todos los usuarios"""
+        invalidate_cache(key_prefix='dashboard')
     
     @staticmethod
     def get_productos_by_categoria(categoria_id):
         """Obtener productos por categoría desde cache"""
-        cache_key = f'productos:categoria:{categoria_id}'
-        return cache.get(cache_key)
+        return espacio_cache('productos').get(f'categoria:{categoria_id}')
     
     @staticmethod
     def set_productos_by_categoria(categoria_id, productos, timeout=300):
         """Guardar productos en cache"""
-        cache_key = f'productos:categoria:{categoria_id}'
-        cache.set(cache_key, productos, timeout)
+        espacio_cache('productos').set(f'categoria:{categoria_id}', productos, timeout)
     
     @staticmethod
     def invalidate_productos():
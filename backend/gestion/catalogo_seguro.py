@@ -0,0 +1,140 @@
+"""
+Catálogo de productos seguros por conjunto de restricciones
+============================================================
+
+sugerir_productos_seguros recorría en cada request hasta 100 productos,
+los analizaba contra cada restricción del hijo y consultaba el precio de
+cada producto que pasaba el filtro; obtener_detalles_restriccion volvía a
+analizar 50 productos por llamada.
+
+CatalogoSeguro materializa en memoria del proceso, por firma del conjunto
+de restricciones, la lista ordenada de productos activos sin conflicto
+(MatrizConflictos.filtrar_seguros). La firma sólo depende de los tipos de
+restricción y del puntaje de sus observaciones, así que todos los hijos con
+las mismas restricciones comparten el catálogo, y un cambio en las
+restricciones de un hijo simplemente lo lleva a otra firma.
+
+- El precio sale de MapaPrecios (lista por defecto del POS)
+- Los productos con stock se cachean aparte como un conjunto de ids; sólo
+  se invalida cuando un producto se agota o vuelve a tener stock
+  (MotorAlertasStock detecta el cruce)
+- Los catálogos se invalidan al guardar o eliminar un Producto o una
+  Categoria (signals.py)
+
+Con eso una recomendación recorre el catálogo hasta juntar `limite`
+productos, sin analizar restricciones ni consultar precios.
+"""
+
+from decimal import Decimal
+from typing import Dict, FrozenSet, Iterable, List, Tuple
+
+from .cache_referencia import AlmacenVersionado, CacheReferencia, MapaPrecios
+from .models import Producto, StockUnico
+from .restricciones_matcher import MatrizConflictos
+
+
+class CatalogoSeguro:
+    """Productos seguros por firma de restricciones, con stock y precio"""
+
+    CLAVE_VERSION = 'pos:catalogo_seguro:version'
+    CLAVE_VERSION_STOCK = 'pos:catalogo_seguro:stock:version'
+
+    _catalogos = AlmacenVersionado(CLAVE_VERSION)
+    _stock = AlmacenVersionado(CLAVE_VERSION_STOCK)
+
+    @staticmethod
+    def firma(restricciones: Iterable) -> Tuple:
+        """
+        Firma de un conjunto de restricciones
+
+        Dos conjuntos con la misma firma tienen los mismos productos seguros:
+        cuentan el tipo y lo que suman sus observaciones, no el texto.
+        """
+        return (MatrizConflictos.version(),) + tuple(sorted({
+            (restriccion.tipo_restriccion, MatrizConflictos.evaluar_observaciones(restriccion)[0])
+            for restriccion in restricciones
+        }))
+
+    @staticmethod
+    def productos(restricciones: Iterable) -> Tuple[Tuple[int, str], ...]:
+        """(id_producto, descripcion) de los productos activos seguros, ordenados por descripción"""
+        restricciones = list(restricciones)
+        return CatalogoSeguro._catalogos.obtener(
+            CatalogoSeguro.firma(restricciones),
+            lambda: tuple(
+                MatrizConflictos.filtrar_seguros(
+                    Producto.objects.filter(activo=True), restricciones
+                ).order_by('descripcion', 'id_producto').values_list('id_producto', 'descripcion')
+            )
+        )
+
+    @staticmethod
+    def con_stock() -> FrozenSet[int]:
+        """Ids de los productos con stock disponible"""
+        return CatalogoSeguro._stock.obtener(
+            'disponibles',
+            lambda: frozenset(
+                StockUnico.objects.filter(cantidad__gt=0).values_list('id_producto_id', flat=True)
+            )
+        )
+
+    @staticmethod
+    def recomendar(restricciones: Iterable, limite: int = 10, solo_stock: bool = True) -> List[Dict]:
+        """
+        Primeros `limite` productos seguros para el conjunto de restricciones
+
+        Returns:
+            [{'id', 'descripcion', 'precio_venta', 'stock_actual'}]
+        """
+        disponibles = CatalogoSeguro.con_stock() if solo_stock else None
+
+        elegidos = []
+        for id_producto, descripcion in CatalogoSeguro.productos(restricciones):
+            if len(elegidos) >= limite:
+                break
+            if disponibles is not None and id_producto not in disponibles:
+                continue
+            elegidos.append((id_producto, descripcion))
+
+        if not elegidos:
+            return []
+
+        lista = CacheReferencia.lista_precios_default()
+        precios = MapaPrecios.precios(lista.pk) if lista else {}
+        # La cantidad exacta se lee al momento: una consulta por página
+        cantidades = dict(
+            StockUnico.objects.filter(
+                id_producto_id__in=[id_producto for id_producto, _ in elegidos]
+            ).values_list('id_producto_id', 'cantidad')
+        )
+
+        return [
+            {
+                'id': id_producto,
+                'descripcion': descripcion,
+                'precio_venta': int(precios.get(id_producto, 0)),
+                'stock_actual': float(cantidades.get(id_producto, Decimal('0'))),
+            }
+            for id_producto, descripcion in elegidos
+        ]
+
+    @staticmethod
+    def productos_con_alerta(restriccion) -> int:
+        """Cantidad de productos activos en conflicto con una restricción"""
+        return len(CatalogoSeguro.productos([])) - len(CatalogoSeguro.productos([restriccion]))
+
+    @staticmethod
+    def invalidar():
+        """Descarta los catálogos en todos los procesos (cambió el catálogo de productos)"""
+        CatalogoSeguro._catalogos.invalidar()
+
+    @staticmethod
+    def invalidar_stock():
+        """Descarta el conjunto de productos con stock en todos los procesos"""
+        CatalogoSeguro._stock.invalidar()
+
+    @staticmethod
+    def limpiar_local():
+        """Limpia sólo la copia de este proceso (tests, shell)"""
+        CatalogoSeguro._catalogos.limpiar_local()
+        CatalogoSeguro._stock.limpiar_local()
@@ -0,0 +1,260 @@
+"""
+Registro rápido de almuerzos en el POS
+=======================================
+
+pos_almuerzo hacía por cada pasada de tarjeta: exists() del consumo del
+día, la consulta del tipo de almuerzo predeterminado, get_or_create de la
+cuenta mensual y dos agregados sobre todo el mes para recalcular la
+cuenta. En la hora del almuerzo pasan cientos de alumnos en minutos.
+
+RegistradorAlmuerzos mantiene en memoria del proceso:
+
+- El conjunto de hijos que ya almorzaron hoy (una consulta al empezar el
+  día o al invalidarse); un duplicado se rechaza sin ir a la base
+- El tipo de almuerzo predeterminado
+- Los ids de las cuentas mensuales del mes
+
+Al cargar un día o un mes nuevo se descartan los anteriores.
+
+La garantía de un almuerzo por día la da la restricción única
+uk_consumo_dia (id_hijo, fecha_consumo): se inserta directamente y un
+IntegrityError de esa restricción se informa como duplicado (p. ej. si el
+alumno pasó por otra caja atendida por otro worker); cualquier otro se
+propaga. La cuenta mensual se actualiza con
+un UPDATE incremental, así que una pasada son dos escrituras.
+
+La invalidación es versionada como en cache_referencia: anular un
+registro o modificar tipos de almuerzo o cuentas (signals.py) descarta la
+copia de todos los procesos.
+"""
+
+import logging
+import threading
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Optional, Set
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .cache_referencia import AlmacenVersionado
+from .models import CuentaAlmuerzoMensual, RegistroConsumoAlmuerzo, Tarjeta, TipoAlmuerzo
+
+logger = logging.getLogger(__name__)
+
+
+class AlmuerzoDuplicadoError(Exception):
+    """El hijo ya tiene un almuerzo registrado en el día"""
+    pass
+
+
+class TipoAlmuerzoNoConfiguradoError(Exception):
+    """No hay ningún tipo de almuerzo activo"""
+    pass
+
+
+class RegistradorAlmuerzos:
+    """Registro de almuerzos con duplicados, tipo y cuentas resueltos en memoria"""
+
+    CLAVE_VERSION = 'almuerzo:checkin:version'
+
+    _almacen = AlmacenVersionado(CLAVE_VERSION)
+    # Protege los conjuntos y diccionarios devueltos por el almacén
+    _lock = threading.Lock()
+
+    @staticmethod
+    def invalidar():
+        """Descarta los datos cacheados en todos los procesos"""
+        RegistradorAlmuerzos._almacen.invalidar()
+
+    @staticmethod
+    def limpiar_local():
+        """Limpia sólo la copia de este proceso (tests, shell)"""
+        RegistradorAlmuerzos._almacen.limpiar_local()
+
+    # =========================================================================
+    # DATOS EN MEMORIA
+    # =========================================================================
+
+    @staticmethod
+    def servidos(dia: date) -> Set[int]:
+        """Ids de los hijos con almuerzo registrado en el día"""
+        def cargar():
+            RegistradorAlmuerzos._almacen.descartar(
+                lambda clave: isinstance(clave, tuple) and clave[0] == 'servidos' and clave[1] < dia
+            )
+            return set(
+                RegistroConsumoAlmuerzo.objects.filter(fecha_consumo=dia).values_list('id_hijo', flat=True)
+            )
+        return RegistradorAlmuerzos._almacen.obtener(('servidos', dia), cargar)
+
+    @staticmethod
+    def tipo_default() -> Optional[TipoAlmuerzo]:
+        """Tipo de almuerzo predeterminado (primer activo por id)"""
+        return RegistradorAlmuerzos._almacen.obtener(
+            'tipo_default',
+            lambda: TipoAlmuerzo.objects.filter(activo=True).order_by('id_tipo_almuerzo').first()
+        )
+
+    @staticmethod
+    def cuentas(anio: int, mes: int) -> Dict[int, int]:
+        """{id_hijo: id_cuenta} de las cuentas mensuales del mes"""
+        def cargar():
+            RegistradorAlmuerzos._almacen.descartar(
+                lambda clave: isinstance(clave, tuple) and clave[0] == 'cuentas' and clave[1:] < (anio, mes)
+            )
+            return dict(
+                CuentaAlmuerzoMensual.objects.filter(anio=anio, mes=mes).values_list('id_hijo', 'id_cuenta')
+            )
+        return RegistradorAlmuerzos._almacen.obtener(('cuentas', anio, mes), cargar)
+
+    @staticmethod
+    def ya_almorzo(id_hijo: int, dia: date) -> bool:
+        return id_hijo in RegistradorAlmuerzos.servidos(dia)
+
+    # =========================================================================
+    # REGISTRO
+    # =========================================================================
+
+    @staticmethod
+    def registrar(tarjeta: Tarjeta, marcar_en_cuenta: bool = True) -> Dict:
+        """
+        Registra el almuerzo del día del hijo de la tarjeta (NO descuenta saldo)
+
+        Args:
+            tarjeta: Tarjeta activa con id_hijo cargado
+            marcar_en_cuenta: Sumar el almuerzo a la cuenta mensual (crédito)
+
+        Raises:
+            AlmuerzoDuplicadoError: Ya almorzó hoy
+            TipoAlmuerzoNoConfiguradoError: No hay tipo de almuerzo activo
+
+        Returns:
+            Dict con registro, tipo_almuerzo, id_cuenta y cuenta_creada
+        """
+        hijo = tarjeta.id_hijo
+        ahora = timezone.localtime()
+        hoy = ahora.date()
+
+        servidos = RegistradorAlmuerzos.servidos(hoy)
+        if hijo.pk in servidos:
+            raise AlmuerzoDuplicadoError(f'{hijo.nombre_completo} ya tiene almuerzo registrado hoy')
+
+        tipo_almuerzo = RegistradorAlmuerzos.tipo_default()
+        if tipo_almuerzo is None:
+            raise TipoAlmuerzoNoConfiguradoError('No hay tipo de almuerzo configurado')
+
+        resultado = {'tipo_almuerzo': tipo_almuerzo, 'id_cuenta': None, 'cuenta_creada': False}
+        try:
+            with transaction.atomic():
+                resultado['registro'] = RegistroConsumoAlmuerzo.objects.create(
+                    id_hijo=hijo,
+                    nro_tarjeta=tarjeta,
+                    id_tipo_almuerzo=tipo_almuerzo,
+                    fecha_consumo=hoy,
+                    costo_almuerzo=tipo_almuerzo.precio_unitario,
+                    marcado_en_cuenta=marcar_en_cuenta,
+                    id_suscripcion=None,  # Esporádico
+                    hora_registro=ahora.time()
+                )
+                if marcar_en_cuenta:
+                    resultado['id_cuenta'], resultado['cuenta_creada'] = RegistradorAlmuerzos._sumar_a_cuenta(
+                        hijo.pk, hoy, tipo_almuerzo.precio_unitario
+                    )
+        except IntegrityError as e:
+            if not RegistradorAlmuerzos._es_duplicado(e, hijo.pk, hoy):
+                raise
+            # Registrado por otra caja/worker entre la carga del conjunto y el INSERT
+            with RegistradorAlmuerzos._lock:
+                servidos.add(hijo.pk)
+            raise AlmuerzoDuplicadoError(f'{hijo.nombre_completo} ya tiene almuerzo registrado hoy')
+
+        def confirmar():
+            with RegistradorAlmuerzos._lock:
+                servidos.add(hijo.pk)
+        transaction.on_commit(confirmar)
+        return resultado
+
+    @staticmethod
+    def _es_duplicado(error: IntegrityError, id_hijo: int, dia: date) -> bool:
+        """
+        El IntegrityError viene de uk_consumo_dia
+
+        MySQL nombra la restricción en el mensaje; si no (SQLite), se
+        confirma que el registro del día existe.
+        """
+        if 'uk_consumo_dia' in str(error):
+            return True
+        return RegistroConsumoAlmuerzo.objects.filter(id_hijo_id=id_hijo, fecha_consumo=dia).exists()
+
+    @staticmethod
+    def anular(registro: RegistroConsumoAlmuerzo):
+        """
+        Elimina el registro y descuenta el almuerzo de la cuenta mensual
+
+        Antes la cuenta se recalculaba completa en cada pasada y corregía
+        sola una anulación; con el UPDATE incremental hay que restarlo.
+        """
+        with transaction.atomic():
+            if registro.marcado_en_cuenta and registro.costo_almuerzo is not None:
+                CuentaAlmuerzoMensual.objects.filter(
+                    id_hijo_id=registro.id_hijo_id,
+                    anio=registro.fecha_consumo.year,
+                    mes=registro.fecha_consumo.month,
+                ).update(
+                    cantidad_almuerzos=F('cantidad_almuerzos') - 1,
+                    monto_total=F('monto_total') - registro.costo_almuerzo,
+                    fecha_actualizacion=timezone.now(),
+                )
+            # post_delete (signals.py) invalida el conjunto de servidos
+            registro.delete()
+
+    @staticmethod
+    def _sumar_a_cuenta(id_hijo: int, hoy: date, costo: Decimal):
+        """
+        Suma un almuerzo a la cuenta mensual del hijo (la crea a crédito si no existe)
+
+        Returns:
+            Tupla (id_cuenta, creada)
+        """
+        cuentas = RegistradorAlmuerzos.cuentas(hoy.year, hoy.month)
+        id_cuenta = cuentas.get(id_hijo)
+        if id_cuenta is not None:
+            actualizadas = CuentaAlmuerzoMensual.objects.filter(pk=id_cuenta).update(
+                cantidad_almuerzos=F('cantidad_almuerzos') + 1,
+                monto_total=F('monto_total') + costo,
+                fecha_actualizacion=timezone.now(),
+            )
+            if actualizadas:
+                return id_cuenta, False
+            # La cuenta se eliminó desde otro proceso
+            with RegistradorAlmuerzos._lock:
+                cuentas.pop(id_hijo, None)
+
+        cuenta, creada = CuentaAlmuerzoMensual.objects.get_or_create(
+            id_hijo_id=id_hijo,
+            mes=hoy.month,
+            anio=hoy.year,
+            defaults={
+                'forma_cobro': 'CREDITO_MENSUAL',
+                'estado': 'PENDIENTE',
+                'cantidad_almuerzos': 1,
+                'monto_total': costo,
+                'monto_pagado': Decimal('0.00'),
+                'fecha_generacion': hoy
+            }
+        )
+        if not creada:
+            CuentaAlmuerzoMensual.objects.filter(pk=cuenta.pk).update(
+                cantidad_almuerzos=F('cantidad_almuerzos') + 1,
+                monto_total=F('monto_total') + costo,
+                fecha_actualizacion=timezone.now(),
+            )
+
+        def recordar():
+            with RegistradorAlmuerzos._lock:
+                cuentas[id_hijo] = cuenta.pk
+        # Una cuenta creada en esta transacción sólo se cachea si se confirma
+        transaction.on_commit(recordar)
+        return cuenta.pk, creada
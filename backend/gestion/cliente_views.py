@@ -4,7 +4,7 @@ Vistas para gestión de clientes y portal web de clientes
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse, HttpResponseRedirect, HttpResponse
+from django.http import JsonResponse, HttpResponseRedirect, HttpResponse, Http404
 from django.db import transaction
 from django.utils import timezone
 from django.views.decorators.http import require_http_methods
@@ -28,6 +28,7 @@ from .models import (
     TiposPago, Empleado
 )
 from pos.models import Venta as Ventas, DetalleVenta
+from .resumen_familia import ResumenFamilia
 from .seguridad_utils import (
     registrar_intento_login, verificar_rate_limit, registrar_auditoria,
     generar_token_recuperacion, verificar_token_recuperacion, marcar_token_usado,
@@ -46,10 +47,11 @@ from .seguridad_utils import (
 def registrar_auditoria_sistema(operacion, descripcion, tabla_afectada=None, id_registro=None):
     """Registrar auditoría para operaciones del sistema (sin request)"""
     from .models import AuditoriaOperacion
+    from .auditoria_diferida import BufferAuditoria
     from django.utils import timezone
     
     try:
-        AuditoriaOperacion.objects.create(
+        BufferAuditoria.registrar(AuditoriaOperacion(
             usuario='SISTEMA',
             tipo_usuario='CLIENTE_WEB',
             operacion=operacion,
@@ -60,7 +62,7 @@ def registrar_auditoria_sistema(operacion, descripcion, tabla_afectada=None, id_
             ip_address='WEBHOOK',
             user_agent='MetrePay Webhook',
             resultado='EXITOSO'
-        )
+        ))
     except Exception as e:
         print(f"Error registrando auditoría del sistema: {e}")
 
@@ -559,88 +561,20 @@ def portal_dashboard_view(request):
         )
         return redirect('/clientes/login/')
     
-    cliente = get_object_or_404(Cliente, pk=cliente_id)
-    
-    # Obtener hijos
-    hijos = Hijo.objects.filter(id_cliente_responsable=cliente)
-    
-    # Calcular saldos totales
-    saldo_total = Tarjeta.objects.filter(
-        id_hijo__id_cliente_responsable=cliente
-    ).aggregate(total=Sum('saldo_actual'))['total'] or Decimal('0')
-    
-    # Consumos recientes (últimos 30 días)
-    fecha_desde = timezone.now() - timedelta(days=30)
-    consumos_recientes = Ventas.objects.filter(
-        id_hijo__id_cliente_responsable=cliente,
-        fecha__gte=fecha_desde
-    ).select_related('id_hijo').order_by('-fecha')[:10]
-    
-    # Almuerzos del mes actual
-    mes_actual = timezone.now().month
-    anio_actual = timezone.now().year
-    
-    almuerzos_mes = RegistroConsumoAlmuerzo.objects.filter(
-        id_hijo__id_cliente_responsable=cliente,
-        fecha_consumo__month=mes_actual,
-        fecha_consumo__year=anio_actual
-    ).count()
-    
-    # Recargas del mes actual
-    recargas_mes = CargasSaldo.objects.filter(
-        id_cliente_origen=cliente,
-        fecha_carga__month=mes_actual,
-        fecha_carga__year=anio_actual,
-        estado='APROBADA'
-    ).aggregate(total=Sum('monto'))['total'] or Decimal('0')
-    
-    # Estadísticas adicionales
-    total_hijos = hijos.count()
-    
-    # Últimas 5 transacciones
-    ultimas_transacciones = []
-    
-    # Agregar ventas/consumos recientes
-    for venta in consumos_recientes[:5]:
-        ultimas_transacciones.append({
-            'tipo': 'consumo',
-            'descripcion': f'Consumo de {venta.id_hijo.nombres if venta.id_hijo else "N/A"}',
-            'monto': -venta.monto_total,  # Negativo porque es un gasto
-            'fecha': venta.fecha,
-            'hijo': venta.id_hijo.nombres if venta.id_hijo else 'N/A'
-        })
-    
-    # Agregar recargas recientes
-    recargas_recientes = CargasSaldo.objects.filter(
-        id_cliente_origen=cliente,
-        estado='APROBADA'
-    ).order_by('-fecha_carga')[:5]
-    
-    for recarga in recargas_recientes:
-        ultimas_transacciones.append({
-            'tipo': 'recarga',
-            'descripcion': f'Recarga para {recarga.nro_tarjeta.id_hijo.nombres}',
-            'monto': recarga.monto,  # Positivo porque es un ingreso
-            'fecha': recarga.fecha_carga,
-            'hijo': recarga.nro_tarjeta.id_hijo.nombres
-        })
-    
-    # Ordenar por fecha descendente y tomar las 10 más recientes
-    ultimas_transacciones = sorted(
-        ultimas_transacciones, 
-        key=lambda x: x['fecha'], 
-        reverse=True
-    )[:10]
+    # Resumen cacheado por cliente: la visita habitual no consulta la base
+    resumen = ResumenFamilia.obtener(cliente_id)
+    if resumen is None:
+        raise Http404('Cliente no encontrado')
     
     context = {
-        'cliente': cliente,
-        'hijos': hijos,
-        'saldo_total': saldo_total,
-        'consumos_recientes': consumos_recientes,
-        'almuerzos_mes': almuerzos_mes,
-        'recargas_mes': recargas_mes,
-        'total_hijos': total_hijos,
-        'ultimas_transacciones': ultimas_transacciones,
+        'cliente': resumen['cliente'],
+        'hijos': resumen['hijos'],
+        'saldo_total': resumen['saldo_total'],
+        'consumos_recientes': resumen['consumos_recientes'],
+        'almuerzos_mes': resumen['almuerzos_mes'],
+        'recargas_mes': resumen['recargas_mes'],
+        'total_hijos': resumen['total_hijos'],
+        'ultimas_transacciones': resumen['ultimas_transacciones'],
     }
     
     return render(request, 'portal/dashboard.html', context)
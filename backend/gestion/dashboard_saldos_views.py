@@ -4,19 +4,70 @@ Vistas para dashboard de saldos en tiempo real
 Este módulo contiene vistas para monitorear saldos de tarjetas
 en tiempo real con actualización automática.
 
+La primera consulta trae la foto completa y un cursor; las siguientes
+piden ?desde=<cursor> y reciben sólo las tarjetas que cambiaron
+(FeedSaldos). El stream SSE entrega lo mismo sin polling, pero sólo
+está habilitado con SALDOS_STREAM_HABILITADO (requiere workers async).
+
 Autor: CantiTita
 Fecha: 2026-01-12
 """
 
+import json
+import time
+
+from django.conf import settings
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
-from decimal import Decimal
 
-from gestion.models import Tarjeta, Hijo
+from gestion.feed_saldos import FeedSaldos
 from gestion.permisos import acceso_cajero
 
+# Stream SSE: cada cuánto se buscan cambios y cuánto dura una conexión
+# (el navegador reconecta solo, con Last-Event-ID)
+INTERVALO_STREAM = 2
+DURACION_STREAM = 55
+INTERVALO_PING = 15
+
+
+def _cursor_solicitado(request):
+    """Cursor de ?desde= o del encabezado Last-Event-ID (None si no hay o no es válido)"""
+    valor = request.GET.get('desde') or request.headers.get('Last-Event-ID')
+    try:
+        cursor = int(valor)
+    except (TypeError, ValueError):
+        return None
+    return cursor if cursor >= 0 else None
+
+
+def datos_saldos(cursor=None):
+    """
+    Foto completa o cambios desde el cursor
+
+    Sin cursor, o con uno anterior a los cambios conservados, devuelve
+    todas las tarjetas activas (completo=True).
+    """
+    if cursor is None or not FeedSaldos.cursor_vigente(cursor):
+        tarjetas, nuevo_cursor = FeedSaldos.foto()
+        return {
+            'success': True,
+            'completo': True,
+            'cursor': nuevo_cursor,
+            'tarjetas': tarjetas,
+            'estadisticas': FeedSaldos.estadisticas(),
+        }
+
+    cambios, nuevo_cursor, hay_mas = FeedSaldos.cambios_desde(cursor)
+    return {
+        'success': True,
+        'completo': False,
+        'cursor': nuevo_cursor,
+        'cambios': cambios,
+        'hay_mas': hay_mas,
+        'estadisticas': FeedSaldos.estadisticas(),
+    }
+
 
 @login_required
 @acceso_cajero
@@ -28,7 +79,7 @@ def dashboard_saldos_tiempo_real(request):
         'titulo': 'Dashboard de Saldos - Tiempo Real',
         'fecha_actualizacion': 'Al cargar la página'
     }
-    
+
     return render(request, 'dashboard/saldos_tiempo_real.html', context)
 
 
@@ -37,71 +88,57 @@ def dashboard_saldos_tiempo_real(request):
 def api_saldos_tiempo_real(request):
     """
     API JSON para obtener saldos actualizados en tiempo real
+
+    GET ?desde=<cursor>: sólo las tarjetas que cambiaron después del cursor.
+    Sin parámetro: todas las tarjetas activas, de saldo más bajo a más alto.
     """
     try:
-        # Obtener todas las tarjetas activas
-        tarjetas = Tarjeta.objects.filter(
-            estado='Activa'
-        ).select_related('id_hijo').all()
-        
-        # Preparar datos
-        tarjetas_data = []
-        
-        # Contadores
-        count_negativos = 0
-        count_bajos = 0
-        count_ok = 0
-        
-        for tarjeta in tarjetas:
-            saldo = float(tarjeta.saldo or 0)
-            limite_saldo_bajo = float(tarjeta.limite_saldo_bajo or 50000)
-            
-            # Determinar estado
-            if saldo < 0:
-                estado = 'negativo'
-                count_negativos += 1
-            elif saldo < limite_saldo_bajo:
-                estado = 'bajo'
-                count_bajos += 1
-            else:
-                estado = 'ok'
-                count_ok += 1
-            
-            # Datos de la tarjeta
-            tarjeta_info = {
-                'nro_tarjeta': tarjeta.nro_tarjeta,
-                'estudiante': tarjeta.id_hijo.nombre_completo if tarjeta.id_hijo else 'Sin asignar',
-                'grado': tarjeta.id_hijo.grado if tarjeta.id_hijo else '',
-                'seccion': tarjeta.id_hijo.seccion if tarjeta.id_hijo else '',
-                'saldo': saldo,
-                'saldo_formateado': f'{saldo:,.0f}',
-                'limite_saldo_bajo': limite_saldo_bajo,
-                'estado': estado,
-                'permite_saldo_negativo': tarjeta.permite_saldo_negativo,
-                'limite_credito': float(tarjeta.limite_credito or 0) if tarjeta.limite_credito else 0
-            }
-            
-            tarjetas_data.append(tarjeta_info)
-        
-        # Ordenar por saldo ascendente (más críticos primero)
-        tarjetas_data.sort(key=lambda x: x['saldo'])
-        
-        # Estadísticas
-        estadisticas = {
-            'total': len(tarjetas_data),
-            'negativos': count_negativos,
-            'bajos': count_bajos,
-            'ok': count_ok
-        }
-        
-        return JsonResponse({
-            'success': True,
-            'tarjetas': tarjetas_data,
-            'estadisticas': estadisticas
-        })
-        
+        return JsonResponse(datos_saldos(_cursor_solicitado(request)))
+
     except Exception as e:
         return JsonResponse({
             'success': False,
             'mensaje': f'Error al obtener saldos: {str(e)}'
         })
+
+
+def _eventos_saldos(cursor):
+    """Eventos SSE: foto o cambios al conectar, luego cambios a medida que llegan"""
+    yield f'retry: {INTERVALO_STREAM * 1000}\n\n'
+    inicio = ultimo_envio = time.monotonic()
+    primero = True
+    while True:
+        datos = datos_saldos(cursor)
+        if primero or datos['completo'] or datos['cambios']:
+            cursor = datos['cursor']
+            ultimo_envio = time.monotonic()
+            yield f'id: {cursor}\nevent: saldos\ndata: {json.dumps(datos)}\n\n'
+        elif time.monotonic() - ultimo_envio >= INTERVALO_PING:
+            ultimo_envio = time.monotonic()
+            yield ': ping\n\n'
+        primero = False
+
+        if time.monotonic() - inicio >= DURACION_STREAM:
+            return
+        if not datos.get('hay_mas'):
+            time.sleep(INTERVALO_STREAM)
+
+
+@login_required
+@acceso_cajero
+def stream_saldos_tiempo_real(request):
+    """
+    Server-Sent Events con los cambios de saldo
+
+    Cada conexión ocupa un worker hasta DURACION_STREAM segundos; con
+    workers sync de gunicorn está deshabilitado (404) y el dashboard usa
+    la API con ?desde=. EventSource reconecta y sigue desde Last-Event-ID.
+    """
+    if not getattr(settings, 'SALDOS_STREAM_HABILITADO', False):
+        raise Http404('Stream de saldos deshabilitado')
+    respuesta = StreamingHttpResponse(
+        _eventos_saldos(_cursor_solicitado(request)), content_type='text/event-stream'
+    )
+    respuesta['Cache-Control'] = 'no-cache'
+    respuesta['X-Accel-Buffering'] = 'no'
+    return respuesta
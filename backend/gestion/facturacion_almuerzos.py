@@ -0,0 +1,245 @@
+"""
+Facturación mensual de almuerzos
+=================================
+
+generar_cuentas_mes recorría el agregado por hijo y, por cada uno, hacía
+Hijo.objects.get y update_or_create de la cuenta (2-3 consultas por hijo).
+Además, el UPDATE final marcaba todos los consumos del mes sin costo
+incluido y los que entraran entre el agregado y el UPDATE, aunque no se
+hubieran facturado.
+
+FacturadorAlmuerzos trabaja por conjuntos:
+
+- Una consulta agregada por hijo sobre un rango de fechas del mes
+  (índice idx_rca_marcado), acotada al mayor id pendiente al empezar
+- Upsert en bloque de CuentaAlmuerzoMensual: INSERT ... ON DUPLICATE KEY
+  UPDATE en MySQL; en otros motores bulk_create + bulk_update
+- Un solo UPDATE marca exactamente los consumos facturados; si otro proceso
+  los tocó en el medio, la facturación se revierte
+- Los consumos nuevos se suman a la cuenta existente del mes (una segunda
+  pasada no pisa lo ya facturado) y el estado se recalcula con lo pagado
+
+previsualizar() hace el mismo cálculo sin escribir (vista GET y --dry-run
+del comando facturar_almuerzos).
+"""
+
+import logging
+from datetime import date
+from decimal import Decimal
+from typing import Dict, List
+
+from django.db import connection, transaction
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from .models import CuentaAlmuerzoMensual, RegistroConsumoAlmuerzo
+
+logger = logging.getLogger(__name__)
+
+FORMAS_COBRO = ('CONTADO_ANTICIPADO', 'CREDITO_MENSUAL')
+
+# Cuentas por sentencia en el upsert
+TAMANO_LOTE_CUENTAS = 500
+
+
+class FacturacionConcurrenteError(Exception):
+    """Los consumos a facturar cambiaron durante la facturación"""
+    pass
+
+
+def rango_mes(anio: int, mes: int):
+    """Primer día del mes y primer día del mes siguiente"""
+    desde = date(anio, mes, 1)
+    hasta = date(anio + 1, 1, 1) if mes == 12 else date(anio, mes + 1, 1)
+    return desde, hasta
+
+
+def estado_cuenta(monto_total, monto_pagado) -> str:
+    """Estado de la cuenta según lo pagado"""
+    if monto_pagado >= monto_total:
+        return 'PAGADO'
+    if monto_pagado > 0:
+        return 'PARCIAL'
+    return 'PENDIENTE'
+
+
+class FacturadorAlmuerzos:
+    """Genera las cuentas mensuales de almuerzo de todos los hijos en bloque"""
+
+    @staticmethod
+    def consumos_pendientes(anio: int, mes: int):
+        """Consumos del mes con costo y sin facturar"""
+        desde, hasta = rango_mes(anio, mes)
+        return RegistroConsumoAlmuerzo.objects.filter(
+            marcado_en_cuenta=False,
+            fecha_consumo__gte=desde,
+            fecha_consumo__lt=hasta,
+            costo_almuerzo__isnull=False,
+        )
+
+    @staticmethod
+    def _agregado(anio: int, mes: int):
+        """
+        Consumos por hijo acotados al mayor id pendiente
+
+        Returns:
+            Tupla (tope, [{'id_hijo', 'cantidad', 'total'}]); tope None si no hay
+        """
+        pendientes = FacturadorAlmuerzos.consumos_pendientes(anio, mes)
+        tope = pendientes.aggregate(tope=Max('id_registro_consumo'))['tope']
+        if tope is None:
+            return None, []
+        filas = list(
+            pendientes.filter(id_registro_consumo__lte=tope)
+            .values('id_hijo')
+            .annotate(cantidad=Count('id_registro_consumo'), total=Sum('costo_almuerzo'))
+            .order_by('id_hijo')
+        )
+        return tope, filas
+
+    @staticmethod
+    def previsualizar(anio: int, mes: int) -> Dict:
+        """
+        Lo que facturaría facturar() sin escribir nada
+
+        Returns:
+            Dict con hijos, cuentas_nuevas, cuentas_existentes, almuerzos,
+            monto_total y detalle por hijo
+        """
+        _, filas = FacturadorAlmuerzos._agregado(anio, mes)
+        existentes = set(
+            CuentaAlmuerzoMensual.objects.filter(
+                anio=anio, mes=mes, id_hijo__in=[fila['id_hijo'] for fila in filas]
+            ).values_list('id_hijo', flat=True)
+        ) if filas else set()
+        return {
+            'hijos': len(filas),
+            'cuentas_nuevas': sum(1 for fila in filas if fila['id_hijo'] not in existentes),
+            'cuentas_existentes': len(existentes),
+            'almuerzos': sum(fila['cantidad'] for fila in filas),
+            'monto_total': sum((fila['total'] for fila in filas), Decimal('0')),
+            'detalle': filas,
+        }
+
+    @staticmethod
+    def facturar(anio: int, mes: int, forma_cobro: str = 'CREDITO_MENSUAL') -> Dict[str, int]:
+        """
+        Genera o actualiza las cuentas del mes y marca los consumos facturados
+
+        Raises:
+            ValueError: Forma de cobro inválida
+            FacturacionConcurrenteError: Otro proceso facturó o modificó
+                consumos del mes durante la operación (se revierte todo)
+
+        Returns:
+            Dict con cuentas_creadas, cuentas_actualizadas y consumos_facturados
+        """
+        if forma_cobro not in FORMAS_COBRO:
+            raise ValueError('Forma de cobro inválida')
+
+        with transaction.atomic():
+            tope, filas = FacturadorAlmuerzos._agregado(anio, mes)
+            if not filas:
+                return {'cuentas_creadas': 0, 'cuentas_actualizadas': 0, 'consumos_facturados': 0}
+
+            if connection.vendor == 'mysql':
+                creadas = FacturadorAlmuerzos._upsert_mysql(anio, mes, forma_cobro, filas)
+            else:
+                creadas = FacturadorAlmuerzos._upsert_orm(anio, mes, forma_cobro, filas)
+
+            esperados = sum(fila['cantidad'] for fila in filas)
+            marcados = FacturadorAlmuerzos.consumos_pendientes(anio, mes).filter(
+                id_registro_consumo__lte=tope
+            ).update(marcado_en_cuenta=True)
+            if marcados != esperados:
+                raise FacturacionConcurrenteError(
+                    f'Se esperaban {esperados} consumos pendientes y se marcaron {marcados}; '
+                    f'reintente la facturación de {mes}/{anio}'
+                )
+
+        resultado = {
+            'cuentas_creadas': creadas,
+            'cuentas_actualizadas': len(filas) - creadas,
+            'consumos_facturados': esperados,
+        }
+        logger.info(f"Facturación de almuerzos {mes}/{anio}: {resultado}")
+        return resultado
+
+    @staticmethod
+    def _upsert_mysql(anio: int, mes: int, forma_cobro: str, filas: List[Dict]) -> int:
+        """INSERT ... ON DUPLICATE KEY UPDATE sobre uk_cuenta_mes (id_hijo, anio, mes)"""
+        tabla = CuentaAlmuerzoMensual._meta.db_table
+        hoy = connection.ops.adapt_datefield_value(timezone.localdate())
+        ahora = connection.ops.adapt_datetimefield_value(timezone.now())
+        creadas = 0
+
+        for i in range(0, len(filas), TAMANO_LOTE_CUENTAS):
+            lote = filas[i:i + TAMANO_LOTE_CUENTAS]
+            valores = ', '.join(['(%s, %s, %s, %s, %s, %s, 0, %s, %s, %s)'] * len(lote))
+            parametros = []
+            for fila in lote:
+                parametros += [
+                    fila['id_hijo'], anio, mes, fila['cantidad'], fila['total'],
+                    forma_cobro, 'PENDIENTE', hoy, ahora,
+                ]
+            # En MySQL las asignaciones se evalúan en orden: el estado ve el
+            # monto_total ya actualizado
+            sql = (
+                f'INSERT INTO {tabla} (id_hijo, anio, mes, cantidad_almuerzos, monto_total, '
+                f'forma_cobro, monto_pagado, estado, fecha_generacion, fecha_actualizacion) '
+                f'VALUES {valores} '
+                f'ON DUPLICATE KEY UPDATE '
+                f'cantidad_almuerzos = cantidad_almuerzos + VALUES(cantidad_almuerzos), '
+                f'monto_total = monto_total + VALUES(monto_total), '
+                f'forma_cobro = VALUES(forma_cobro), '
+                f'fecha_generacion = VALUES(fecha_generacion), '
+                f"estado = IF(monto_pagado >= monto_total, 'PAGADO', "
+                f"IF(monto_pagado > 0, 'PARCIAL', 'PENDIENTE')), "
+                f'fecha_actualizacion = VALUES(fecha_actualizacion)'
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(sql, parametros)
+                # MySQL cuenta 1 por fila insertada y 2 por fila actualizada
+                creadas += 2 * len(lote) - cursor.rowcount
+        return creadas
+
+    @staticmethod
+    def _upsert_orm(anio: int, mes: int, forma_cobro: str, filas: List[Dict]) -> int:
+        """Alternativa portable: bloquea las existentes, bulk_update y bulk_create"""
+        por_hijo = {fila['id_hijo']: fila for fila in filas}
+        hoy = timezone.localdate()
+        ahora = timezone.now()
+        existentes = list(
+            CuentaAlmuerzoMensual.objects.select_for_update().filter(
+                anio=anio, mes=mes, id_hijo__in=list(por_hijo)
+            )
+        )
+
+        for cuenta in existentes:
+            fila = por_hijo.pop(cuenta.id_hijo_id)
+            cuenta.cantidad_almuerzos += fila['cantidad']
+            cuenta.monto_total += fila['total']
+            cuenta.forma_cobro = forma_cobro
+            cuenta.fecha_generacion = hoy
+            cuenta.estado = estado_cuenta(cuenta.monto_total, cuenta.monto_pagado)
+            # bulk_update no aplica auto_now
+            cuenta.fecha_actualizacion = ahora
+        CuentaAlmuerzoMensual.objects.bulk_update(
+            existentes,
+            ['cantidad_almuerzos', 'monto_total', 'forma_cobro', 'fecha_generacion', 'estado', 'fecha_actualizacion'],
+            batch_size=TAMANO_LOTE_CUENTAS,
+        )
+
+        CuentaAlmuerzoMensual.objects.bulk_create([
+            CuentaAlmuerzoMensual(
+                id_hijo_id=id_hijo,
+                anio=anio,
+                mes=mes,
+                cantidad_almuerzos=fila['cantidad'],
+                monto_total=fila['total'],
+                forma_cobro=forma_cobro,
+                fecha_generacion=hoy,
+            )
+            for id_hijo, fila in por_hijo.items()
+        ], batch_size=TAMANO_LOTE_CUENTAS)
+        return len(por_hijo)
@@ -3,8 +3,9 @@ Facturación Electrónica Paraguay - SET/Ekuatia Integration
 ===========================================================
 
 Generación y gestión de facturas electrónicas conforme a normas SET:
-- Generación de XML según estructura SET
-- Cálculo de CDC (Código de Control Criptográfico)
+- Generación de XML según estructura SET (escritura incremental con XMLGenerator)
+- Cálculo de CDC (Código de Control Criptográfico) desde los valores en memoria
+- Generación en lote para la facturación de fin de día (GeneradorLoteFacturas)
 - Integración con API Ekuatia
 - Validaciones de cumplimiento fiscal
 """
@@ -13,22 +14,279 @@ import hashlib
 import hmac
 from datetime import datetime
 from decimal import Decimal
-from typing import Dict, Optional, List, Tuple
+from io import BytesIO
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, Optional, List, Tuple
 import json
-from xml.etree import ElementTree as ET
-from xml.dom import minidom
+from xml.sax.saxutils import XMLGenerator
+from xml.sax.xmlreader import AttributesImpl
 
+from django.db.models import F
 from django.utils import timezone
 from django.conf import settings
 import requests
 
 from pos.models import Venta as Ventas, DetalleVenta
 from .models import (
-    DatosFacturacionElect, Timbrados,
+    DatosFacturacionElect, DocumentosTributarios, Timbrados,
     DatosEmpresa, Cliente, Producto
 )
 
 
+NS_SET = 'http://www.set.gov.py/dte/ns/v1.0'
+
+# Ventas por consulta en la generación en lote
+TAMANO_LOTE_XML = 500
+
+
+def calcular_cdc(ruc: str, tipo_doc: str, nro_timbrado, nro_secuencial: str,
+                 cantidad_lineas: int, monto_total: int, fecha: str) -> str:
+    """
+    Calcula CDC (Código de Control Criptográfico) según RES. 19-SET
+
+    CDC = SHA256(RUC_CEDULA + TIPO_DOC + NRO_TIMBRADO + NRO_SECUENCIAL +
+                 CANTIDAD_LINEAS + MONTO_TOTAL + FECHA)
+
+    Returns:
+        CDC en hexadecimal, 44 caracteres (largo de datos_facturacion_elect.cdc)
+    """
+    datos_cdc = f"{ruc}{tipo_doc}{nro_timbrado}{nro_secuencial}{cantidad_lineas}{monto_total}{fecha}"
+    return hashlib.sha256(datos_cdc.encode('utf-8')).hexdigest()[:44].upper()
+
+
+def cdc_documento(documento: Dict) -> str:
+    """CDC de un documento armado por datos_documento() o GeneradorLoteFacturas"""
+    return calcular_cdc(
+        documento['emisor']['ruc'],
+        documento['tipo_doc'],
+        documento['timbrado']['nro_timbrado'],
+        documento['timbrado']['nro_secuencial'],
+        len(documento['items']),
+        documento['monto_total'],
+        documento['fecha'].strftime('%Y-%m-%d'),
+    )
+
+
+def datos_emisor() -> Dict:
+    """
+    Datos del emisor, desde CacheReferencia (sin consultas por factura)
+
+    Raises:
+        ValueError: Empresa no configurada
+    """
+    from .cache_referencia import CacheReferencia
+
+    empresa = CacheReferencia.datos_empresa()
+    if empresa is None:
+        raise ValueError("Datos de la empresa no configurados")
+    return {
+        'ruc': empresa.ruc,
+        'razon_social': empresa.razon_social,
+        'telefono': empresa.telefono or '',
+        'email': empresa.email or '',
+        'direccion': empresa.direccion.split(',')[0] if empresa.direccion else '',
+    }
+
+
+def documentos_tributarios(ids: List[int]) -> Dict[int, DocumentosTributarios]:
+    """
+    Documentos tributarios de las ventas (Venta.nro_factura_venta guarda
+    su id_documento) con timbrado y punto de expedición, en una consulta
+    """
+    return DocumentosTributarios.objects.select_related('nro_timbrado__id_punto').in_bulk(
+        [id_documento for id_documento in ids if id_documento]
+    )
+
+
+def datos_timbrado(id_venta: int, documento: Optional[DocumentosTributarios]) -> Dict:
+    """
+    Numeración fiscal con la que se emitió la venta (la asignada por
+    AsignadorSecuencial), no la del timbrado activo al generar el XML
+
+    Raises:
+        ValueError: La venta no tiene documento tributario
+    """
+    if documento is None:
+        raise ValueError(f"La venta {id_venta} no tiene documento tributario")
+    timbrado = documento.nro_timbrado
+    return {
+        'nro_timbrado': timbrado.nro_timbrado,
+        'vencimiento_timbrado': timbrado.fecha_fin.strftime('%Y-%m-%d'),
+        'establecimiento': timbrado.id_punto.codigo_establecimiento,
+        'punto_expedicion': timbrado.id_punto.codigo_punto_expedicion,
+        'nro_secuencial': str(documento.nro_secuencial).zfill(7),
+    }
+
+
+class EscritorXMLFactura:
+    """
+    Escribe el XML de una factura elemento por elemento sobre un stream
+
+    Usa xml.sax.saxutils.XMLGenerator: no arma el documento en memoria ni lo
+    vuelve a parsear para formatearlo, y escapa los textos (& < > en
+    descripciones y razones sociales).
+    """
+
+    def __init__(self, salida: BinaryIO):
+        self._xml = XMLGenerator(salida, encoding='UTF-8', short_empty_elements=True)
+        self._nivel = 0
+
+    def _sangria(self):
+        self._xml.ignorableWhitespace('\n' + '  ' * self._nivel)
+
+    def _abrir(self, nombre: str, atributos: Optional[Dict[str, str]] = None):
+        if self._nivel:
+            self._sangria()
+        self._xml.startElement(nombre, AttributesImpl(atributos or {}))
+        self._nivel += 1
+
+    def _cerrar(self, nombre: str):
+        self._nivel -= 1
+        self._sangria()
+        self._xml.endElement(nombre)
+
+    def _hoja(self, nombre: str, valor=''):
+        self._sangria()
+        self._xml.startElement(nombre, AttributesImpl({}))
+        if valor != '' and valor is not None:
+            self._xml.characters(str(valor))
+        self._xml.endElement(nombre)
+
+    def escribir(self, documento: Dict):
+        """
+        Escribe el documento completo
+
+        Args:
+            documento: Dict de datos_documento() / GeneradorLoteFacturas
+        """
+        self._xml.startDocument()
+        self._abrir('rFact', {
+            'xmlns': NS_SET,
+            'xmlns:xsi': 'http://www.w3.org/2001/XMLSchema-instance',
+            'xsi:schemaLocation': f'{NS_SET} rFact.xsd',
+            'version': GeneradorXMLFactura.VERSION_SET,
+        })
+        self._abrir('dEmisin')
+        self._escribir_identidad(documento)
+        self._escribir_emisor(documento['emisor'])
+        self._escribir_receptor(documento['receptor'])
+        self._abrir('Items')
+        for idx, item in enumerate(documento['items'], 1):
+            self._escribir_item(idx, item)
+        self._cerrar('Items')
+        self._escribir_totales(documento['monto_total'])
+        self._cerrar('dEmisin')
+        self._cerrar('rFact')
+        self._xml.ignorableWhitespace('\n')
+        self._xml.endDocument()
+
+    def _escribir_identidad(self, documento: Dict):
+        """Elemento <Ide> (Identidad del documento)"""
+        timbrado = documento['timbrado']
+        self._abrir('Ide')
+        self._hoja('RUC', documento['emisor']['ruc'])
+        self._hoja('TipoDoc', documento['tipo_doc'])
+        self._hoja('NroTimbrado', timbrado['nro_timbrado'])
+        self._hoja('Establecimiento', timbrado['establecimiento'])
+        self._hoja('PuntoExpedicion', timbrado['punto_expedicion'])
+        self._hoja('NroSecuencial', timbrado['nro_secuencial'])
+        self._hoja('FchEmis', documento['fecha'].strftime('%Y-%m-%d'))
+        self._hoja('HraEmis', documento['fecha'].strftime('%H:%M:%S'))
+        self._hoja('FchVencTimbrado', timbrado['vencimiento_timbrado'])
+        self._hoja('SisFact', 1)
+        self._hoja('IndPresVenta', 1)
+        self._hoja('TipoContribuyente', 1)
+        self._hoja('TipoEmision', 1)
+        self._hoja('TipoReg', 2)
+        self._hoja('PtoEmision', 1)
+        self._hoja('CodMoneda', 'PYG')
+        self._hoja('CantLinItem', len(documento['items']))
+        self._cerrar('Ide')
+
+    def _escribir_emisor(self, emisor: Dict):
+        """Elemento <Emit> (Datos del Emisor)"""
+        self._abrir('Emit')
+        self._hoja('RUC', emisor['ruc'])
+        self._hoja('RzSoc', emisor['razon_social'])
+        self._hoja('NomFantasia', emisor['razon_social'])
+        self._hoja('Telf', emisor['telefono'])
+        self._hoja('Email', emisor['email'])
+        self._hoja('Web')
+        self._abrir('Dir')
+        self._hoja('Asentamiento', emisor['direccion'])
+        self._hoja('nDpto', 11)
+        self._hoja('nCiud', 1101)
+        self._cerrar('Dir')
+        self._abrir('ActEcon')
+        self._hoja('IdActEcon', 4723)
+        self._hoja('dDes', 'Comercio al por menor en tiendas de autoservicio')
+        self._cerrar('ActEcon')
+        self._cerrar('Emit')
+
+    def _escribir_receptor(self, receptor: Dict):
+        """Elemento <Receptor> (Datos del Cliente)"""
+        # Para clientes sin RUC usar 'S/RUC'
+        ruc = receptor['ruc'] or 'S/RUC'
+        self._abrir('Receptor')
+        self._abrir('IdRec')
+        self._hoja('RUC', ruc)
+        self._hoja('DV', GeneradorXMLFactura._calcular_digito_verificador(ruc))
+        self._cerrar('IdRec')
+        self._hoja('RzSoc', receptor['nombre'])
+        self._hoja('Telf', receptor['telefono'] or '')
+        self._hoja('Email', receptor['email'] or '')
+        self._abrir('Dir')
+        self._hoja('Asentamiento', receptor['direccion'] or 'Asunción')
+        self._hoja('nDpto', 11)
+        self._hoja('nCiud', 1101)
+        self._cerrar('Dir')
+        self._cerrar('Receptor')
+
+    def _escribir_item(self, idx: int, item: Dict):
+        """Elemento <Item> (Línea de detalle)"""
+        subtotal = int(item['subtotal'])
+        monto_iva = int(Decimal(subtotal) * Decimal('0.10'))
+        monto_sin_iva = subtotal - monto_iva
+
+        self._abrir('Item')
+        self._hoja('NroLinItem', idx)
+        self._hoja('dSc', (item['descripcion'] or '')[:100])
+        self._hoja('Cantidad', int(item['cantidad']))
+        self._hoja('uMed', 7)
+        self._hoja('Precio', int(item['precio_unitario']))
+        self._hoja('dTotMnt', subtotal)
+        self._hoja('dTotDesc', 0)
+        self._abrir('Impuesto')
+        self._abrir('ImpItem')
+        self._hoja('dAcreo', 0)
+        self._hoja('dTasaIVA', 10)
+        self._hoja('dBasGrav', monto_sin_iva)
+        self._hoja('dCantIVA', monto_iva)
+        self._cerrar('ImpItem')
+        self._cerrar('Impuesto')
+        for vacio in ('dCodTrib', 'dDDocAso', 'dDNroAso', 'dDTipRec'):
+            self._hoja(vacio)
+        self._cerrar('Item')
+
+    def _escribir_totales(self, monto_total: int):
+        """Elemento <Totales>"""
+        monto_sin_iva = int(monto_total / Decimal('1.1'))
+        monto_iva = monto_total - monto_sin_iva
+
+        self._abrir('Totales')
+        self._hoja('dTotLinItem', monto_total)
+        self._hoja('dTotDesc', 0)
+        self._hoja('dTotAntici', 0)
+        self._hoja('dTotGrav', monto_sin_iva)
+        self._hoja('dTotExent', 0)
+        self._hoja('dTotIVA', monto_iva)
+        self._hoja('dTotTrib', 0)
+        self._hoja('dTotMnt', monto_total)
+        self._hoja('cMonedaRes', 'PYG')
+        self._hoja('dTipCambio', 1)
+        self._cerrar('Totales')
+
+
 class GeneradorXMLFactura:
     """
     Generador de XML de facturas electrónicas según formato SET Paraguay
@@ -62,216 +320,53 @@ class GeneradorXMLFactura:
             venta: Instancia de Ventas
         """
         self.venta = venta
-        self.empresa = DatosEmpresa.objects.first()
         self.cliente = venta.id_cliente
-        self.detalles = venta.detalles.all()
-        self.timestamp = timezone.now().isoformat()
-        
-    def generar_cdc(self, xml_string: str) -> str:
-        """
-        Calcula CDC (Código de Control Criptográfico) según RES. 19-SET
-        
-        CDC = SHA256(RUC_CEDULA + TIPO_DOC + NRO_TIMBRADO + NRO_SECUENCIAL + 
-                     CANTIDAD_LINEAS + MONTO_TOTAL + FECHA)
-        
-        Args:
-            xml_string: XML de la factura
-            
-        Returns:
-            CDC en formato hexadecimal (44 caracteres)
-        """
-        try:
-            # Extraer datos del XML
-            root = ET.fromstring(xml_string)
-            
-            # Namespaces
-            ns = {'factura': 'http://www.set.gov.py/dte/ns/v1.0'}
-            
-            # Obtener elementos necesarios
-            ide = root.find('.//factura:Ide', ns)
-            ruc = ide.findtext('factura:RUC', '', ns)
-            tipo_doc = ide.findtext('factura:TipoDoc', '', ns)
-            nro_timbrado = ide.findtext('factura:NroTimbrado', '', ns)
-            nro_secuencial = ide.findtext('factura:NroSecuencial', '', ns)
-            
-            # Cantidad de líneas
-            detalles = root.findall('.//factura:Item', ns)
-            cantidad_lineas = str(len(detalles))
-            
-            # Monto total
-            totales = root.find('.//factura:Totales', ns)
-            monto_total = totales.findtext('factura:MontTotal', '', ns)
-            
-            # Fecha
-            fecha = ide.findtext('factura:FchEmis', '', ns)
-            
-            # Concatenar datos para CDC
-            datos_cdc = f"{ruc}{tipo_doc}{nro_timbrado}{nro_secuencial}{cantidad_lineas}{monto_total}{fecha}"
-            
-            # Calcular SHA256
-            cdc = hashlib.sha256(datos_cdc.encode('utf-8')).hexdigest()
-            
-            return cdc.upper()
-            
-        except Exception as e:
-            raise ValueError(f"Error al calcular CDC: {str(e)}")
-    
-    def _generar_elemento_identidad(self) -> str:
-        """
-        Genera elemento <Ide> (Identidad del documento)
-        
-        Returns:
-            XML del elemento
-        """
-        hoy = timezone.now().strftime('%Y-%m-%d')
-        
-        xml = f"""
-        <Ide>
-            <RUC>{self.empresa.ruc}</RUC>
-            <TipoDoc>1</TipoDoc>
-            <NroTimbrado>{self.venta.id_timbrado_id}</NroTimbrado>
-            <NroSecuencial>{str(self.venta.nro_factura_venta).zfill(7)}</NroSecuencial>
-            <FchEmis>{hoy}</FchEmis>
-            <HraEmis>{timezone.now().strftime('%H:%M:%S')}</HraEmis>
-            <FchVencTimbrado>2025-12-31</FchVencTimbrado>
-            <SisFact>1</SisFact>
-            <IndPresVenta>1</IndPresVenta>
-            <TipoContribuyente>1</TipoContribuyente>
-            <TipoEmision>1</TipoEmision>
-            <TipoReg>2</TipoReg>
-            <PtoEmision>1</PtoEmision>
-            <CodMoneda>PYG</CodMoneda>
-            <CantLinItem>{self.detalles.count()}</CantLinItem>
-        </Ide>
-        """
-        return xml.strip()
-    
-    def _generar_elemento_emisor(self) -> str:
-        """
-        Genera elemento <Emit> (Datos del Emisor)
-        
-        Returns:
-            XML del elemento
-        """
-        xml = f"""
-        <Emit>
-            <RUC>{self.empresa.ruc}</RUC>
-            <RzSoc>{self.empresa.razon_social}</RzSoc>
-            <NomFantasia>{self.empresa.nombre_fantasia}</NomFantasia>
-            <Telf>{self.empresa.telefono or ''}</Telf>
-            <Email>{self.empresa.email or ''}</Email>
-            <Web>{self.empresa.sitio_web or ''}</Web>
-            <Dir>
-                <Asentamiento>{self.empresa.direccion.split(',')[0] if self.empresa.direccion else ''}</Asentamiento>
-                <nDpto>11</nDpto>
-                <nCiud>1101</nCiud>
-            </Dir>
-            <ActEcon>
-                <IdActEcon>4723</IdActEcon>
-                <dDes>Comercio al por menor en tiendas de autoservicio</dDes>
-            </ActEcon>
-        </Emit>
-        """
-        return xml.strip()
+        self.documento = self.datos_documento()
     
-    def _generar_elemento_receptor(self) -> str:
+    def datos_documento(self) -> Dict:
         """
-        Genera elemento <Receptor> (Datos del Cliente)
-        
-        Returns:
-            XML del elemento
-        """
-        # Para clientes sin RUC usar 'S/RUC'
-        ruc_cliente = self.cliente.ci_ruc if self.cliente.ci_ruc else 'S/RUC'
-        
-        xml = f"""
-        <Receptor>
-            <IdRec>
-                <RUC>{ruc_cliente}</RUC>
-                <DV>{self._calcular_digito_verificador(ruc_cliente) if ruc_cliente != 'S/RUC' else ''}</DV>
-            </IdRec>
-            <RzSoc>{self.cliente.nombre_completo}</RzSoc>
-            <Telf>{self.cliente.telefono or ''}</Telf>
-            <Email>{self.cliente.email or ''}</Email>
-            <Dir>
-                <Asentamiento>{self.cliente.direccion or 'Asunción'}</Asentamiento>
-                <nDpto>11</nDpto>
-                <nCiud>1101</nCiud>
-            </Dir>
-        </Receptor>
+        Valores del documento en memoria (emisor cacheado, una consulta
+        para el documento tributario y otra para los ítems con su producto)
         """
-        return xml.strip()
+        nro_factura = self.venta.nro_factura_venta
+        timbrado = datos_timbrado(
+            self.venta.id_venta, documentos_tributarios([nro_factura]).get(nro_factura)
+        )
+        items = list(
+            self.venta.detalles.order_by('id_detalle').values(
+                'cantidad', 'precio_unitario',
+                subtotal=F('subtotal_total'),
+                descripcion=F('id_producto__descripcion'),
+            )
+        )
+        return {
+            'id_venta': self.venta.id_venta,
+            'tipo_doc': '1',
+            'fecha': timezone.localtime(self.venta.fecha),
+            'monto_total': int(self.venta.monto_total),
+            'emisor': datos_emisor(),
+            'timbrado': timbrado,
+            'receptor': {
+                'ruc': self.cliente.ruc_ci,
+                'nombre': self.cliente.nombre_completo,
+                'telefono': self.cliente.telefono,
+                'email': self.cliente.email,
+                'direccion': self.cliente.direccion,
+            },
+            'items': items,
+        }
     
-    def _generar_items(self) -> str:
+    def generar_cdc(self, xml_string: Optional[str] = None) -> str:
         """
-        Genera elementos <Item> (Líneas de detalle)
-        
-        Returns:
-            XML de items
-        """
-        items_xml = ""
-        
-        for idx, detalle in enumerate(self.detalles, 1):
-            producto = detalle.id_producto
-            
-            # Calcular IVA
-            monto_iva = int(Decimal(detalle.subtotal_total) * Decimal('0.10'))
-            monto_sin_iva = int(Decimal(detalle.subtotal_total) - monto_iva)
-            
-            item_xml = f"""
-            <Item>
-                <NroLinItem>{idx}</NroLinItem>
-                <dSc>{producto.descripcion[:100]}</dSc>
-                <Cantidad>{int(detalle.cantidad)}</Cantidad>
-                <uMed>7</uMed>
-                <Precio>{int(detalle.precio_unitario)}</Precio>
-                <dTotMnt>{int(detalle.subtotal_total)}</dTotMnt>
-                <dTotDesc>0</dTotDesc>
-                <Impuesto>
-                    <ImpItem>
-                        <dAcreo>0</dAcreo>
-                        <dTasaIVA>10</dTasaIVA>
-                        <dBasGrav>{monto_sin_iva}</dBasGrav>
-                        <dCantIVA>{monto_iva}</dCantIVA>
-                    </ImpItem>
-                </Impuesto>
-                <dCodTrib></dCodTrib>
-                <dDDocAso></dDDocAso>
-                <dDNroAso></dDNroAso>
-                <dDTipRec></dDTipRec>
-            </Item>
-            """
-            items_xml += item_xml
+        Calcula CDC (Código de Control Criptográfico) según RES. 19-SET
         
-        return items_xml.strip()
-    
-    def _generar_totales(self) -> str:
-        """
-        Genera elemento <Totales>
+        Se calcula con los valores en memoria; xml_string se acepta por
+        compatibilidad y no se vuelve a parsear.
         
         Returns:
-            XML del elemento
-        """
-        # Calcular totales
-        monto_total = int(self.venta.monto_total)
-        monto_sin_iva = int(monto_total / Decimal('1.1'))
-        monto_iva = monto_total - monto_sin_iva
-        
-        xml = f"""
-        <Totales>
-            <dTotLinItem>{monto_total}</dTotLinItem>
-            <dTotDesc>0</dTotDesc>
-            <dTotAntici>0</dTotAntici>
-            <dTotGrav>{monto_sin_iva}</dTotGrav>
-            <dTotExent>0</dTotExent>
-            <dTotIVA>{monto_iva}</dTotIVA>
-            <dTotTrib>0</dTotTrib>
-            <dTotMnt>{monto_total}</dTotMnt>
-            <cMonedaRes>PYG</cMonedaRes>
-            <dTipCambio>1</dTipCambio>
-        </Totales>
+            CDC en formato hexadecimal (44 caracteres)
         """
-        return xml.strip()
+        return cdc_documento(self.documento)
     
     def generar_xml(self) -> str:
         """
@@ -281,34 +376,9 @@ class GeneradorXMLFactura:
             XML como string
         """
         try:
-            # Construir documento
-            xml_template = f"""<?xml version="1.0" encoding="UTF-8"?>
-<rFact xmlns="http://www.set.gov.py/dte/ns/v1.0"
-       xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-       xsi:schemaLocation="http://www.set.gov.py/dte/ns/v1.0 rFact.xsd"
-       version="{self.VERSION_SET}">
-    <dEmisin>
-        {self._generar_elemento_identidad()}
-        {self._generar_elemento_emisor()}
-        {self._generar_elemento_receptor()}
-        <Items>
-            {self._generar_items()}
-        </Items>
-        {self._generar_totales()}
-    </dEmisin>
-</rFact>
-            """
-            
-            # Limpiar y formattear
-            dom = minidom.parseString(xml_template)
-            xml_formateado = dom.toprettyxml(indent="  ")
-            
-            # Eliminar linea XML declaration de minidom (mantener la nuestra)
-            xml_lines = xml_formateado.split('\n')[1:]
-            xml_final = '<?xml version="1.0" encoding="UTF-8"?>\n' + '\n'.join(xml_lines)
-            
-            return xml_final
-            
+            salida = BytesIO()
+            EscritorXMLFactura(salida).escribir(self.documento)
+            return salida.getvalue().decode('utf-8')
         except Exception as e:
             raise ValueError(f"Error generando XML: {str(e)}")
     
@@ -344,6 +414,114 @@ class GeneradorXMLFactura:
         return str(dv)
 
 
+class GeneradorLoteFacturas:
+    """
+    Generación de XML y CDC para muchas ventas (facturación de fin de día)
+
+    Lee las ventas en bloques de TAMANO_LOTE_XML con .values().iterator()
+    y una consulta de detalles por bloque, escribe cada documento apenas se
+    arma y lo descarta: la memoria queda acotada por el tamaño del bloque,
+    no por la cantidad de ventas.
+    """
+
+    @staticmethod
+    def documentos(ventas, tamano_lote: int = TAMANO_LOTE_XML) -> Iterator[Dict]:
+        """
+        Documentos (dict de valores) de las ventas dadas, en orden de id
+
+        Args:
+            ventas: QuerySet de Ventas
+            tamano_lote: Ventas por consulta de detalles
+        """
+        emisor = datos_emisor()
+        filas = ventas.order_by('id_venta').values(
+            'id_venta', 'nro_factura_venta', 'fecha', 'monto_total',
+            'id_cliente__ruc_ci', 'id_cliente__nombres', 'id_cliente__apellidos',
+            'id_cliente__telefono', 'id_cliente__email', 'id_cliente__direccion',
+        ).iterator(chunk_size=tamano_lote)
+
+        bloque = []
+        for fila in filas:
+            bloque.append(fila)
+            if len(bloque) >= tamano_lote:
+                yield from GeneradorLoteFacturas._armar_bloque(bloque, emisor)
+                bloque = []
+        if bloque:
+            yield from GeneradorLoteFacturas._armar_bloque(bloque, emisor)
+
+    @staticmethod
+    def _armar_bloque(filas: List[Dict], emisor: Dict) -> Iterator[Dict]:
+        items_por_venta: Dict[int, List[Dict]] = {}
+        detalles = DetalleVenta.objects.filter(
+            id_venta_id__in=[fila['id_venta'] for fila in filas]
+        ).order_by('id_venta_id', 'id_detalle').values(
+            'id_venta_id', 'cantidad', 'precio_unitario',
+            subtotal=F('subtotal_total'),
+            descripcion=F('id_producto__descripcion'),
+        )
+        for detalle in detalles:
+            items_por_venta.setdefault(detalle.pop('id_venta_id'), []).append(detalle)
+        documentos = documentos_tributarios([fila['nro_factura_venta'] for fila in filas])
+
+        for fila in filas:
+            yield {
+                'id_venta': fila['id_venta'],
+                'tipo_doc': '1',
+                'fecha': timezone.localtime(fila['fecha']),
+                'monto_total': int(fila['monto_total']),
+                'emisor': emisor,
+                'timbrado': datos_timbrado(fila['id_venta'], documentos.get(fila['nro_factura_venta'])),
+                'receptor': {
+                    'ruc': fila['id_cliente__ruc_ci'],
+                    'nombre': f"{fila['id_cliente__nombres']} {fila['id_cliente__apellidos']}",
+                    'telefono': fila['id_cliente__telefono'],
+                    'email': fila['id_cliente__email'],
+                    'direccion': fila['id_cliente__direccion'],
+                },
+                'items': items_por_venta.get(fila['id_venta'], []),
+            }
+
+    @staticmethod
+    def generar(ventas, tamano_lote: int = TAMANO_LOTE_XML) -> Iterator[Tuple[int, str, bytes]]:
+        """
+        Genera (id_venta, cdc, xml) por venta
+
+        Returns:
+            Iterador de tuplas; el XML es bytes UTF-8
+        """
+        for documento in GeneradorLoteFacturas.documentos(ventas, tamano_lote):
+            salida = BytesIO()
+            EscritorXMLFactura(salida).escribir(documento)
+            yield documento['id_venta'], cdc_documento(documento), salida.getvalue()
+
+    @staticmethod
+    def escribir_directorio(ventas, destino, tamano_lote: int = TAMANO_LOTE_XML) -> Dict:
+        """
+        Escribe un archivo <cdc>.xml por venta directamente sobre disco
+
+        Args:
+            ventas: QuerySet de Ventas
+            destino: Directorio de salida (se crea si no existe)
+
+        Returns:
+            Dict con documentos, bytes y cdcs {id_venta: cdc}
+        """
+        destino = Path(destino)
+        destino.mkdir(parents=True, exist_ok=True)
+        resumen = {'documentos': 0, 'bytes': 0, 'cdcs': {}}
+
+        for documento in GeneradorLoteFacturas.documentos(ventas, tamano_lote):
+            cdc = cdc_documento(documento)
+            archivo = destino / f'{cdc}.xml'
+            with archivo.open('wb') as salida:
+                EscritorXMLFactura(salida).escribir(documento)
+            resumen['documentos'] += 1
+            resumen['bytes'] += archivo.stat().st_size
+            resumen['cdcs'][documento['id_venta']] = cdc
+
+        return resumen
+
+
 class ClienteEkuatia:
     """
     Cliente para integración con API Ekuatia (SET)
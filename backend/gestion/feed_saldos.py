@@ -0,0 +1,315 @@
+"""
+Feed incremental de saldos de tarjetas
+=======================================
+
+api_saldos_tiempo_real serializaba en cada consulta todas las tarjetas
+activas con su hijo y las ordenaba en Python; con varias pantallas
+consultando cada pocos segundos era el endpoint más pesado del sistema.
+
+FeedSaldos publica los cambios de saldo como un registro con cursor
+monótono (CambioSaldoTarjeta.id_cambio):
+
+- Los signals de Tarjeta, ConsumoTarjeta y CargasSaldo sólo marcan la
+  tarjeta; al confirmar la transacción se lee su saldo actual (los
+  triggers de MySQL ya lo aplicaron) y se inserta una fila por tarjeta
+  con el saldo y el nivel resultante. Cada fila trae el estado completo,
+  así que aplicar una fila dos veces no cambia el resultado.
+- El cliente pide "cambios desde el cursor N" y recibe sólo las tarjetas
+  que cambiaron; sin cursor, o si el cursor es anterior a lo que se
+  conserva, recibe la foto completa.
+- Los contadores negativo/bajo/ok se mantienen en memoria del proceso:
+  se cargan una vez y luego se actualizan con las filas nuevas.
+
+Los ids se asignan al insertar pero se ven al confirmar, así que un
+cursor puede ver el id N+1 antes que el N. Mientras haya un hueco
+reciente el cursor no avanza más allá de él (MARGEN_HUECOS): las filas
+siguientes se vuelven a enviar y, como son idempotentes, no hacen daño.
+"""
+
+import logging
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import CambioSaldoTarjeta, Tarjeta
+from .notificaciones_saldo import SALDO_ALERTA_DEFAULT
+
+logger = logging.getLogger(__name__)
+
+NEGATIVO = CambioSaldoTarjeta.NIVEL_NEGATIVO
+BAJO = CambioSaldoTarjeta.NIVEL_BAJO
+OK = CambioSaldoTarjeta.NIVEL_OK
+INACTIVA = CambioSaldoTarjeta.NIVEL_INACTIVA
+
+# Datos de la tarjeta y del hijo que muestra el tablero (además del saldo)
+CAMPOS_TARJETA = (
+    'saldo_alerta', 'permite_saldo_negativo', 'limite_credito', 'id_hijo__nombre', 'id_hijo__apellido',
+    'id_hijo__grado',
+)
+
+
+def nivel_saldo(saldo: Decimal, saldo_alerta: Optional[Decimal], estado: str = 'Activa') -> str:
+    """Nivel de una tarjeta: negativo, bajo, ok o inactiva (no se muestra en el tablero)"""
+    if estado != 'Activa':
+        return INACTIVA
+    saldo = saldo or Decimal('0')
+    if saldo < 0:
+        return NEGATIVO
+    if saldo < (saldo_alerta or SALDO_ALERTA_DEFAULT):
+        return BAJO
+    return OK
+
+
+def _datos_tarjeta(fila: Dict, saldo: Decimal, nivel: str) -> Dict:
+    """Tarjeta serializada para el tablero (misma forma en la foto y en los cambios)"""
+    saldo = float(saldo or 0)
+    return {
+        'nro_tarjeta': fila['nro_tarjeta'],
+        'estudiante': f"{fila['id_hijo__nombre']} {fila['id_hijo__apellido']}",
+        'grado': fila['id_hijo__grado'] or '',
+        'saldo': saldo,
+        'saldo_formateado': f'{saldo:,.0f}',
+        'limite_saldo_bajo': float(fila['saldo_alerta'] or SALDO_ALERTA_DEFAULT),
+        'estado': nivel,
+        'permite_saldo_negativo': fila['permite_saldo_negativo'],
+        'limite_credito': float(fila['limite_credito'] or 0),
+    }
+
+
+class _Contadores:
+    """Nivel por tarjeta activa y totales por nivel, al día hasta `cursor`"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cursor: Optional[int] = None
+        self.sincronizado = None
+        self.niveles: Dict[str, str] = {}
+        self.totales = {NEGATIVO: 0, BAJO: 0, OK: 0}
+
+    def aplicar(self, nro_tarjeta: str, nivel: str):
+        anterior = self.niveles.pop(nro_tarjeta, None)
+        if anterior is not None:
+            self.totales[anterior] -= 1
+        if nivel != INACTIVA:
+            self.niveles[nro_tarjeta] = nivel
+            self.totales[nivel] += 1
+
+
+class FeedSaldos:
+    """Cambios de saldo con cursor monótono y contadores por nivel"""
+
+    # Cambios devueltos como máximo por consulta
+    LIMITE_CAMBIOS = 500
+    # Un hueco de ids más nuevo que esto puede ser una fila todavía sin confirmar
+    MARGEN_HUECOS = timedelta(seconds=5)
+    # Cambios que se conservan; un cursor más viejo recibe la foto completa
+    RETENCION = timedelta(days=2)
+
+    _pendientes = threading.local()
+    _contadores = _Contadores()
+
+    # =========================================================================
+    # REGISTRO DE CAMBIOS
+    # =========================================================================
+
+    @staticmethod
+    def marcar(nros_tarjeta: Iterable[str]):
+        """
+        Marca tarjetas cuyo saldo pudo cambiar para registrarlas al confirmar la transacción
+
+        Todas las marcas de una transacción se registran juntas en el primer
+        callback; los siguientes encuentran el conjunto vacío.
+        """
+        pendientes = FeedSaldos._conjunto_pendiente()
+        pendientes.update(nros_tarjeta)
+        transaction.on_commit(FeedSaldos._vaciar)
+
+    @staticmethod
+    def _conjunto_pendiente() -> set:
+        pendientes = getattr(FeedSaldos._pendientes, 'nros', None)
+        if pendientes is None:
+            pendientes = FeedSaldos._pendientes.nros = set()
+        return pendientes
+
+    @staticmethod
+    def _vaciar():
+        pendientes = FeedSaldos._conjunto_pendiente()
+        if not pendientes:
+            return
+        nros = list(pendientes)
+        pendientes.clear()
+        try:
+            FeedSaldos.registrar(nros)
+        except Exception as e:
+            # El feed nunca debe afectar la venta o la recarga que movió el saldo
+            logger.error(f"Error registrando cambios de saldo: {e}")
+
+    @staticmethod
+    def registrar(nros_tarjeta: Iterable[str]) -> int:
+        """Inserta un cambio por tarjeta con su saldo y nivel actuales (una lectura y un INSERT)"""
+        cambios = [
+            CambioSaldoTarjeta(
+                nro_tarjeta_id=nro, saldo=saldo, nivel=nivel_saldo(saldo, saldo_alerta, estado)
+            )
+            for nro, saldo, saldo_alerta, estado in Tarjeta.objects.filter(
+                nro_tarjeta__in=list(nros_tarjeta)
+            ).values_list('nro_tarjeta', 'saldo_actual', 'saldo_alerta', 'estado')
+        ]
+        CambioSaldoTarjeta.objects.bulk_create(cambios)
+        return len(cambios)
+
+    # =========================================================================
+    # LECTURA
+    # =========================================================================
+
+    @staticmethod
+    def cursor_actual() -> int:
+        """Último id de cambio registrado (0 si no hay)"""
+        return CambioSaldoTarjeta.objects.aggregate(ultimo=Max('id_cambio'))['ultimo'] or 0
+
+    @staticmethod
+    def cursor_vigente(cursor: int) -> bool:
+        """False si se purgaron cambios posteriores al cursor (hay que pedir la foto completa)"""
+        primero = CambioSaldoTarjeta.objects.aggregate(primero=Min('id_cambio'))['primero']
+        return primero is None or cursor >= primero - 1
+
+    @staticmethod
+    def _cursor_seguro(filas: List[Tuple[int, object]], desde: int, ahora=None) -> int:
+        """
+        Cursor hasta donde las filas leídas son definitivas
+
+        filas: (id_cambio, fecha) ordenadas por id. Se detiene antes del
+        primer hueco reciente: ese id puede aparecer todavía.
+        """
+        limite = (ahora or timezone.now()) - FeedSaldos.MARGEN_HUECOS
+        cursor = desde
+        for id_cambio, fecha in filas:
+            if id_cambio != cursor + 1 and fecha > limite:
+                break
+            cursor = id_cambio
+        return cursor
+
+    @staticmethod
+    def foto() -> Tuple[List[Dict], int]:
+        """
+        Todas las tarjetas activas, de saldo más bajo a más alto, y el cursor desde el que seguir
+
+        El cursor se toma antes de leer las tarjetas: un cambio concurrente
+        se vuelve a recibir en la próxima consulta.
+        """
+        cursor = FeedSaldos.cursor_actual()
+        tarjetas = [
+            _datos_tarjeta(fila, fila['saldo_actual'], nivel_saldo(fila['saldo_actual'], fila['saldo_alerta']))
+            for fila in Tarjeta.objects.filter(estado='Activa').order_by('saldo_actual', 'nro_tarjeta').values(
+                'nro_tarjeta', 'saldo_actual', *CAMPOS_TARJETA
+            )
+        ]
+        return tarjetas, cursor
+
+    @staticmethod
+    def cambios_desde(cursor: int, limite: Optional[int] = None) -> Tuple[List[Dict], int, bool]:
+        """
+        Tarjetas que cambiaron después del cursor, con su último estado
+
+        Returns:
+            (cambios, nuevo_cursor, hay_mas). Las tarjetas que dejaron de estar
+            activas vienen con estado 'inactiva' para sacarlas del tablero.
+        """
+        limite = limite or FeedSaldos.LIMITE_CAMBIOS
+        prefijo = 'nro_tarjeta__'
+        filas = list(
+            CambioSaldoTarjeta.objects.filter(id_cambio__gt=cursor).order_by('id_cambio').values(
+                'id_cambio', 'nro_tarjeta', 'fecha', 'saldo', 'nivel', *(prefijo + campo for campo in CAMPOS_TARJETA)
+            )[:limite + 1]
+        )
+        hay_mas = len(filas) > limite
+        filas = filas[:limite]
+        nuevo_cursor = FeedSaldos._cursor_seguro([(f['id_cambio'], f['fecha']) for f in filas], cursor)
+
+        ultimos = {}
+        for fila in filas:
+            if fila['id_cambio'] > nuevo_cursor:
+                break
+            ultimos[fila['nro_tarjeta']] = fila
+
+        cambios = []
+        for nro, fila in ultimos.items():
+            if fila['nivel'] == INACTIVA:
+                cambios.append({'nro_tarjeta': nro, 'estado': INACTIVA})
+                continue
+            datos = {campo: fila[prefijo + campo] for campo in CAMPOS_TARJETA}
+            datos['nro_tarjeta'] = nro
+            cambios.append(_datos_tarjeta(datos, fila['saldo'], fila['nivel']))
+        return cambios, nuevo_cursor, hay_mas
+
+    # =========================================================================
+    # CONTADORES
+    # =========================================================================
+
+    @staticmethod
+    def estadisticas() -> Dict[str, int]:
+        """Totales por nivel de las tarjetas activas, al día con el último cambio registrado"""
+        contadores = FeedSaldos._contadores
+        ahora = timezone.now()
+        with contadores.lock:
+            # Sincronizados hace menos de media retención, sus cambios pendientes no se purgaron
+            if contadores.cursor is None or (
+                ahora - contadores.sincronizado > FeedSaldos.RETENCION / 2
+                and not FeedSaldos.cursor_vigente(contadores.cursor)
+            ):
+                FeedSaldos._cargar_contadores(contadores)
+            FeedSaldos._sincronizar(contadores)
+            contadores.sincronizado = ahora
+            totales = dict(contadores.totales)
+        return {
+            'total': sum(totales.values()),
+            'negativos': totales[NEGATIVO],
+            'bajos': totales[BAJO],
+            'ok': totales[OK],
+        }
+
+    @staticmethod
+    def _cargar_contadores(contadores: _Contadores):
+        """Carga inicial: una lectura de todas las tarjetas activas"""
+        contadores.cursor = FeedSaldos.cursor_actual()
+        contadores.niveles = {}
+        contadores.totales = {NEGATIVO: 0, BAJO: 0, OK: 0}
+        for nro, saldo, saldo_alerta in Tarjeta.objects.filter(estado='Activa').values_list(
+            'nro_tarjeta', 'saldo_actual', 'saldo_alerta'
+        ):
+            contadores.aplicar(nro, nivel_saldo(saldo, saldo_alerta))
+
+    @staticmethod
+    def _sincronizar(contadores: _Contadores):
+        """Aplica los cambios posteriores al cursor de los contadores"""
+        filas = list(
+            CambioSaldoTarjeta.objects.filter(id_cambio__gt=contadores.cursor).order_by('id_cambio').values_list(
+                'id_cambio', 'fecha', 'nro_tarjeta', 'nivel'
+            )
+        )
+        cursor = FeedSaldos._cursor_seguro([(id_cambio, fecha) for id_cambio, fecha, _, _ in filas], contadores.cursor)
+        for _, _, nro, nivel in filas:
+            contadores.aplicar(nro, nivel)
+        contadores.cursor = cursor
+
+    # =========================================================================
+    # MANTENIMIENTO
+    # =========================================================================
+
+    @staticmethod
+    def purgar(ahora=None) -> int:
+        """Elimina los cambios más viejos que RETENCION"""
+        limite = (ahora or timezone.now()) - FeedSaldos.RETENCION
+        return CambioSaldoTarjeta.objects.filter(fecha__lt=limite).delete()[0]
+
+    @staticmethod
+    def limpiar_local():
+        """Descarta los contadores de este proceso (tests, shell)"""
+        contadores = FeedSaldos._contadores
+        with contadores.lock:
+            contadores.cursor = None
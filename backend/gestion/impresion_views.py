@@ -0,0 +1,66 @@
+"""
+Views de la cola de impresión de tickets (spool por terminal)
+"""
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.views.decorators.http import require_http_methods
+
+from gestion.impresora_manager import ColaImpresion, despertar_worker
+from gestion.permisos import acceso_cajero
+
+
+@acceso_cajero
+@login_required
+@require_http_methods(["GET"])
+def estado_cola_impresion(request):
+    """Estado de la cola de impresión de una terminal"""
+    terminal = request.GET.get('terminal')
+    return JsonResponse({
+        'success': True,
+        'cola': ColaImpresion.estado_cola(terminal)
+    })
+
+
+@acceso_cajero
+@login_required
+@require_http_methods(["POST"])
+def reintentar_trabajo_impresion(request, trabajo_id):
+    """Reencola un ticket que falló después de agotar los reintentos"""
+    if not ColaImpresion.reintentar(trabajo_id):
+        return JsonResponse({
+            'success': False,
+            'error': 'El trabajo no existe o no está en estado ERROR'
+        }, status=404)
+
+    return JsonResponse({
+        'success': True,
+        'message': f'Trabajo #{trabajo_id} reencolado'
+    })
+
+
+@acceso_cajero
+@login_required
+@require_http_methods(["POST"])
+def reimprimir_ticket_venta(request, venta_id):
+    """Encola una reimpresión del ticket de una venta"""
+    trabajo = ColaImpresion.reimprimir_venta(venta_id, terminal=request.POST.get('terminal'))
+    if trabajo is None:
+        return JsonResponse({
+            'success': False,
+            'error': f'La venta #{venta_id} no tiene ticket para reimprimir'
+        }, status=404)
+
+    return JsonResponse({
+        'success': True,
+        'trabajo_impresion_id': trabajo.id_trabajo,
+        'message': f'Reimpresión de la venta #{venta_id} encolada'
+    })
+
+
+@acceso_cajero
+@login_required
+@require_http_methods(["POST"])
+def drenar_cola_impresion(request):
+    """Despierta el worker de la terminal (p. ej. tras reconectar la impresora)"""
+    despertar_worker(request.POST.get('terminal'))
+    return JsonResponse({'success': True})
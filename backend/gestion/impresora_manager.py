@@ -4,8 +4,12 @@ Maneja conexión, impresión y recuperación de errores en producción
 """
 
 import serial
+import threading
 from django.conf import settings
-from datetime import datetime
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from datetime import datetime, timedelta
 from pathlib import Path
 import logging
 
@@ -362,3 +366,309 @@ def obtener_estado_impresora():
     """Obtiene estado de la impresora sin crear instancia"""
     impresora = obtener_impresora()
     return impresora.obtener_estado()
+
+
+# ===== COLA DE IMPRESIÓN POR TERMINAL =====
+#
+# procesar_venta ya no imprime dentro de la transacción: encola un
+# TrabajoImpresion y, al confirmarse el commit, despierta un worker en
+# segundo plano que drena la cola de esa terminal. Una impresora lenta o
+# desconectada ya no retiene el bloqueo de la tarjeta ni la transacción.
+
+TERMINAL_DEFAULT = getattr(settings, 'IMPRESORA_TERMINAL', 'POS-01')
+BACKOFF_BASE_SEGUNDOS = 5
+BACKOFF_MAX_SEGUNDOS = 300
+TRABAJO_COLGADO_MINUTOS = 5
+INTERVALO_WORKER_SEGUNDOS = 30
+
+
+def obtener_impresora_terminal(terminal):
+    """
+    Obtiene la impresora asignada a una terminal
+
+    settings.IMPRESORAS_POR_TERMINAL = {'POS-01': 'COM3', 'POS-02': '/dev/ttyUSB0'}
+    Si la terminal no tiene puerto propio se usa el singleton global.
+    """
+    puertos = getattr(settings, 'IMPRESORAS_POR_TERMINAL', {})
+    puerto = puertos.get(terminal)
+    if not puerto:
+        return obtener_impresora()
+
+    with _workers_lock:
+        impresora = _impresoras_terminal.get(terminal)
+        if impresora is None:
+            impresora = ImpresoraTermica(puerto=puerto)
+            _impresoras_terminal[terminal] = impresora
+        return impresora
+
+
+class ColaImpresion:
+    """Spool persistente de tickets (tabla trabajos_impresion)"""
+
+    @staticmethod
+    def encolar_ticket(ticket_data, venta_id=None, terminal=None, tipo='TICKET_VENTA'):
+        """
+        Encola un ticket para imprimir después del commit
+
+        Args:
+            ticket_data: Dict en el formato de ImpresoraTermica.imprimir_ticket
+                         (la fecha puede ser datetime o string ISO)
+            venta_id: ID de la venta asociada
+            terminal: Terminal POS que debe imprimir (default: IMPRESORA_TERMINAL)
+            tipo: TICKET_VENTA o REIMPRESION
+
+        Returns:
+            TrabajoImpresion creado
+        """
+        from gestion.models import TrabajoImpresion
+
+        terminal = terminal or TERMINAL_DEFAULT
+        payload = dict(ticket_data)
+        if hasattr(payload.get('fecha'), 'isoformat'):
+            payload['fecha'] = payload['fecha'].isoformat()
+
+        trabajo = TrabajoImpresion.objects.create(
+            terminal=terminal,
+            tipo=tipo,
+            id_venta=venta_id,
+            payload=payload,
+        )
+
+        # Solo se imprime si la venta se confirma; en rollback el trabajo desaparece
+        transaction.on_commit(lambda: despertar_worker(terminal))
+        return trabajo
+
+    @staticmethod
+    def reimprimir_venta(venta_id, terminal=None):
+        """
+        Encola una copia del último ticket de una venta
+
+        Returns:
+            TrabajoImpresion nuevo o None si la venta no tiene ticket
+        """
+        from gestion.models import TrabajoImpresion
+
+        original = TrabajoImpresion.objects.filter(
+            id_venta=venta_id
+        ).order_by('-id_trabajo').first()
+        if not original:
+            return None
+
+        return ColaImpresion.encolar_ticket(
+            original.payload,
+            venta_id=venta_id,
+            terminal=terminal or original.terminal,
+            tipo='REIMPRESION',
+        )
+
+    @staticmethod
+    def reintentar(trabajo_id):
+        """
+        Vuelve a poner en cola un trabajo con error
+
+        Returns:
+            True si el trabajo se reencoló
+        """
+        from gestion.models import TrabajoImpresion
+
+        actualizados = TrabajoImpresion.objects.filter(
+            id_trabajo=trabajo_id,
+            estado='ERROR',
+        ).update(
+            estado='PENDIENTE',
+            intentos=0,
+            fecha_proximo_intento=timezone.now(),
+        )
+        if actualizados:
+            terminal = TrabajoImpresion.objects.filter(
+                id_trabajo=trabajo_id
+            ).values_list('terminal', flat=True).first()
+            transaction.on_commit(lambda: despertar_worker(terminal))
+        return bool(actualizados)
+
+    @staticmethod
+    def reclamar_siguiente(terminal):
+        """
+        Toma el siguiente trabajo pendiente de la terminal
+
+        El paso PENDIENTE -> IMPRIMIENDO es un UPDATE condicional, así dos
+        workers (hilos o procesos) nunca imprimen el mismo ticket.
+        """
+        from gestion.models import TrabajoImpresion
+
+        while True:
+            trabajo_id = TrabajoImpresion.objects.filter(
+                terminal=terminal,
+                estado='PENDIENTE',
+                fecha_proximo_intento__lte=timezone.now(),
+            ).order_by('id_trabajo').values_list('id_trabajo', flat=True).first()
+
+            if trabajo_id is None:
+                return None
+
+            reclamado = TrabajoImpresion.objects.filter(
+                id_trabajo=trabajo_id,
+                estado='PENDIENTE',
+            ).update(
+                estado='IMPRIMIENDO',
+                intentos=F('intentos') + 1,
+                # Marca de reclamo: permite detectar trabajos colgados
+                fecha_proximo_intento=timezone.now(),
+            )
+
+            if reclamado:
+                return TrabajoImpresion.objects.get(id_trabajo=trabajo_id)
+
+    @staticmethod
+    def procesar_pendientes(terminal=None, impresora=None, limite=50):
+        """
+        Drena la cola de una terminal
+
+        Args:
+            terminal: Terminal a procesar
+            impresora: Instancia con imprimir_ticket() (default: la de la terminal)
+            limite: Máximo de trabajos a procesar en esta pasada
+
+        Returns:
+            Dict con contadores {'impresos', 'reintentos', 'errores'}
+        """
+        terminal = terminal or TERMINAL_DEFAULT
+        impresora = impresora or obtener_impresora_terminal(terminal)
+        resultado = {'impresos': 0, 'reintentos': 0, 'errores': 0}
+
+        ColaImpresion.recuperar_colgados(terminal)
+
+        for _ in range(limite):
+            trabajo = ColaImpresion.reclamar_siguiente(terminal)
+            if trabajo is None:
+                break
+
+            try:
+                impreso = impresora.imprimir_ticket(_payload_a_ticket(trabajo.payload))
+                error = None if impreso else 'La impresora no respondió'
+            except Exception as e:
+                impreso = False
+                error = str(e)
+
+            if impreso:
+                trabajo.estado = 'IMPRESO'
+                trabajo.fecha_impresion = timezone.now()
+                trabajo.ultimo_error = None
+                resultado['impresos'] += 1
+            elif trabajo.intentos >= trabajo.max_intentos:
+                trabajo.estado = 'ERROR'
+                trabajo.ultimo_error = error
+                resultado['errores'] += 1
+            else:
+                espera = min(BACKOFF_BASE_SEGUNDOS * 2 ** (trabajo.intentos - 1), BACKOFF_MAX_SEGUNDOS)
+                trabajo.estado = 'PENDIENTE'
+                trabajo.ultimo_error = error
+                trabajo.fecha_proximo_intento = timezone.now() + timedelta(seconds=espera)
+                resultado['reintentos'] += 1
+
+            trabajo.save(update_fields=['estado', 'fecha_impresion', 'ultimo_error', 'fecha_proximo_intento'])
+
+            if not impreso:
+                # Impresora caída: no seguir martillando en esta pasada
+                break
+
+        return resultado
+
+    @staticmethod
+    def recuperar_colgados(terminal):
+        """Devuelve a PENDIENTE los trabajos que quedaron IMPRIMIENDO tras una caída del worker"""
+        from gestion.models import TrabajoImpresion
+
+        limite = timezone.now() - timedelta(minutes=TRABAJO_COLGADO_MINUTOS)
+        return TrabajoImpresion.objects.filter(
+            terminal=terminal,
+            estado='IMPRIMIENDO',
+            fecha_proximo_intento__lt=limite,
+        ).update(estado='PENDIENTE', fecha_proximo_intento=timezone.now())
+
+    @staticmethod
+    def estado_cola(terminal=None):
+        """
+        Resumen de la cola para el endpoint de estado
+
+        Returns:
+            Dict con conteos por estado, errores recientes y estado de impresora
+        """
+        from gestion.models import TrabajoImpresion
+
+        terminal = terminal or TERMINAL_DEFAULT
+        trabajos = TrabajoImpresion.objects.filter(terminal=terminal)
+        conteos = {
+            fila['estado']: fila['total']
+            for fila in trabajos.values('estado').annotate(total=Count('id_trabajo'))
+        }
+        errores = list(
+            trabajos.filter(estado='ERROR').order_by('-id_trabajo').values(
+                'id_trabajo', 'id_venta', 'intentos', 'ultimo_error'
+            )[:10]
+        )
+
+        return {
+            'terminal': terminal,
+            'pendientes': conteos.get('PENDIENTE', 0) + conteos.get('IMPRIMIENDO', 0),
+            'impresos': conteos.get('IMPRESO', 0),
+            'errores': conteos.get('ERROR', 0),
+            'ultimos_errores': errores,
+            'impresora': obtener_impresora_terminal(terminal).obtener_estado(),
+            'worker_activo': terminal in _workers and _workers[terminal].is_alive(),
+        }
+
+
+def _payload_a_ticket(payload):
+    """Reconstruye el dict de imprimir_ticket desde el JSON de la cola"""
+    ticket = dict(payload)
+    fecha = ticket.get('fecha')
+    if isinstance(fecha, str):
+        try:
+            ticket['fecha'] = datetime.fromisoformat(fecha)
+        except ValueError:
+            ticket['fecha'] = datetime.now()
+    elif fecha is None:
+        ticket['fecha'] = datetime.now()
+    ticket.setdefault('detalles', [])
+    return ticket
+
+
+class WorkerImpresion(threading.Thread):
+    """Hilo que drena la cola de una terminal cuando se le avisa (o cada intervalo)"""
+
+    def __init__(self, terminal):
+        super().__init__(name=f'impresion-{terminal}', daemon=True)
+        self.terminal = terminal
+        self.evento = threading.Event()
+
+    def run(self):
+        # Primera pasada al arrancar: trabajos que quedaron pendientes o
+        # colgados (procesar_pendientes los recupera) de un proceso anterior
+        while True:
+            try:
+                close_old_connections()
+                ColaImpresion.procesar_pendientes(self.terminal)
+            except Exception as e:
+                logger.error(f"Worker de impresión {self.terminal}: {e}")
+            finally:
+                close_old_connections()
+            self.evento.wait(INTERVALO_WORKER_SEGUNDOS)
+            self.evento.clear()
+
+
+_workers = {}
+_impresoras_terminal = {}
+_workers_lock = threading.Lock()
+
+
+def despertar_worker(terminal=None):
+    """Inicia (si hace falta) y despierta el worker de la terminal"""
+    terminal = terminal or TERMINAL_DEFAULT
+    with _workers_lock:
+        worker = _workers.get(terminal)
+        if worker is None or not worker.is_alive():
+            worker = WorkerImpresion(terminal)
+            _workers[terminal] = worker
+            worker.start()
+    worker.evento.set()
@@ -0,0 +1,317 @@
+"""
+Índice de búsqueda de productos en memoria para el POS
+=======================================================
+
+La búsqueda de la grilla del POS usaba descripcion__icontains OR
+codigo_barra__icontains, que en MySQL no puede usar el índice de
+descripcion y recorre la tabla completa en cada tecla.
+
+IndiceProductos mantiene en memoria del proceso los productos activos:
+
+- Texto normalizado (minúsculas, sin acentos) de descripción + código
+- Trigramas del texto -> ids (consultas de 3 o más caracteres)
+- Palabras ordenadas para búsqueda por prefijo (consultas de 1-2 caracteres)
+- Hash exacto código de barras -> id (lector de códigos)
+
+Las consultas de 3+ caracteres conservan la semántica de icontains:
+los trigramas reducen candidatos y luego se verifica la subcadena.
+
+El índice se actualiza en forma incremental desde los signals de Producto
+(al confirmar la transacción). Los demás procesos detectan el cambio por
+una versión compartida en el cache de Django y reconstruyen su índice.
+"""
+
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Producto
+
+
+_VACIA = ('', '', '')
+
+
+def normalizar_texto(texto: Optional[str]) -> str:
+    """Minúsculas, sin acentos y con espacios simples"""
+    if not texto:
+        return ''
+    texto = unicodedata.normalize('NFKD', texto)
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(texto.lower().split())
+
+
+def trigramas(texto: str) -> set:
+    """Trigramas de un texto normalizado"""
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+class IndiceBusqueda:
+    """
+    Estructuras de búsqueda sobre un conjunto de productos
+
+    Las actualizaciones reemplazan los conjuntos y listas en lugar de
+    modificarlos, así las búsquedas concurrentes nunca ven un estado a medias.
+    """
+
+    def __init__(self, filas: Iterable[Tuple[int, str, Optional[str]]] = ()):
+        # id -> (texto normalizado, clave de orden, código normalizado)
+        self.entradas: Dict[int, Tuple[str, str, str]] = {}
+        self.codigos: Dict[str, int] = {}
+        self.trigramas: Dict[str, FrozenSet[int]] = {}
+        self.palabras: List[Tuple[str, int]] = []
+
+        conjuntos: Dict[str, set] = {}
+        for id_producto, descripcion, codigo_barra in filas:
+            entrada = self._entrada(descripcion, codigo_barra)
+            self.entradas[id_producto] = entrada
+            if entrada[2]:
+                self.codigos[entrada[2]] = id_producto
+            for trigrama in trigramas(entrada[0]):
+                conjuntos.setdefault(trigrama, set()).add(id_producto)
+            self.palabras.extend((palabra, id_producto) for palabra in set(entrada[0].split()))
+
+        self.trigramas = {t: frozenset(ids) for t, ids in conjuntos.items()}
+        self.palabras.sort()
+
+    @staticmethod
+    def _entrada(descripcion: Optional[str], codigo_barra: Optional[str]) -> Tuple[str, str, str]:
+        descripcion_norm = normalizar_texto(descripcion)
+        codigo = normalizar_texto(codigo_barra)
+        texto = f'{descripcion_norm} {codigo}'.strip()
+        return texto, descripcion_norm, codigo
+
+    def __len__(self):
+        return len(self.entradas)
+
+    # =========================================================================
+    # CONSULTAS
+    # =========================================================================
+
+    def por_codigo(self, codigo: str) -> Optional[int]:
+        """Id del producto con ese código de barras exacto"""
+        return self.codigos.get(normalizar_texto(codigo))
+
+    def buscar(self, consulta: str, limite: int = 30) -> List[int]:
+        """
+        Ids de productos que coinciden con la consulta, ordenados por descripción
+
+        Un código de barras exacto aparece primero.
+        """
+        consulta = normalizar_texto(consulta)
+        if not consulta:
+            return []
+
+        if len(consulta) >= 3:
+            candidatos = self._por_trigramas(consulta)
+        else:
+            candidatos = self._por_prefijo(consulta)
+
+        exacto = self.codigos.get(consulta)
+        entradas = self.entradas
+        ordenados = sorted(
+            (i for i in candidatos if i in entradas),
+            key=lambda id_producto: entradas.get(id_producto, _VACIA)[1]
+        )
+        if exacto is not None:
+            ordenados = [exacto] + [i for i in ordenados if i != exacto]
+        return ordenados[:limite]
+
+    def _por_trigramas(self, consulta: str) -> set:
+        conjuntos = []
+        for trigrama in trigramas(consulta):
+            ids = self.trigramas.get(trigrama)
+            if not ids:
+                return set()
+            conjuntos.append(ids)
+        conjuntos.sort(key=len)
+
+        candidatos = set(conjuntos[0])
+        for ids in conjuntos[1:]:
+            candidatos &= ids
+            if not candidatos:
+                return candidatos
+
+        # Verificación de subcadena (semántica de icontains)
+        entradas = self.entradas
+        return {i for i in candidatos if consulta in entradas.get(i, _VACIA)[0]}
+
+    def _por_prefijo(self, consulta: str) -> set:
+        palabras = self.palabras
+        resultado = set()
+        posicion = bisect_left(palabras, (consulta,))
+        while posicion < len(palabras) and palabras[posicion][0].startswith(consulta):
+            resultado.add(palabras[posicion][1])
+            posicion += 1
+        return resultado
+
+    # =========================================================================
+    # ACTUALIZACIÓN INCREMENTAL
+    # =========================================================================
+
+    def quitar(self, id_producto: int):
+        entrada = self.entradas.pop(id_producto, None)
+        if entrada is None:
+            return
+        texto, _, codigo = entrada
+        if codigo and self.codigos.get(codigo) == id_producto:
+            del self.codigos[codigo]
+        for trigrama in trigramas(texto):
+            ids = self.trigramas.get(trigrama, frozenset()) - {id_producto}
+            if ids:
+                self.trigramas[trigrama] = ids
+            else:
+                self.trigramas.pop(trigrama, None)
+        quitar = {(palabra, id_producto) for palabra in texto.split()}
+        self.palabras = [p for p in self.palabras if p not in quitar]
+
+    def agregar(self, id_producto: int, descripcion: Optional[str], codigo_barra: Optional[str]):
+        self.quitar(id_producto)
+        entrada = self._entrada(descripcion, codigo_barra)
+        self.entradas[id_producto] = entrada
+        if entrada[2]:
+            self.codigos[entrada[2]] = id_producto
+        for trigrama in trigramas(entrada[0]):
+            self.trigramas[trigrama] = self.trigramas.get(trigrama, frozenset()) | {id_producto}
+        palabras = list(self.palabras)
+        for palabra in set(entrada[0].split()):
+            insort(palabras, (palabra, id_producto))
+        self.palabras = palabras
+
+
+class IndiceProductos:
+    """Índice de productos activos del proceso, con versión compartida"""
+
+    CLAVE_VERSION = 'pos:indice_productos:version'
+
+    _indice: Optional[IndiceBusqueda] = None
+    _version_local: Optional[int] = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _version_compartida() -> int:
+        version = cache.get(IndiceProductos.CLAVE_VERSION)
+        if version is None:
+            cache.add(IndiceProductos.CLAVE_VERSION, 1, None)
+            version = cache.get(IndiceProductos.CLAVE_VERSION, 1)
+        return version
+
+    @staticmethod
+    def obtener() -> IndiceBusqueda:
+        """Índice vigente (lo construye si no existe o cambió la versión)"""
+        version = IndiceProductos._version_compartida()
+        indice = IndiceProductos._indice
+        if indice is None or version != IndiceProductos._version_local:
+            indice = IndiceProductos.construir(version)
+        return indice
+
+    @staticmethod
+    def construir(version: Optional[int] = None) -> IndiceBusqueda:
+        """Reconstruye el índice con una sola query de productos activos"""
+        if version is None:
+            version = IndiceProductos._version_compartida()
+        indice = IndiceBusqueda(
+            Producto.objects.filter(activo=True).values_list(
+                'id_producto', 'descripcion', 'codigo_barra'
+            )
+        )
+        with IndiceProductos._lock:
+            IndiceProductos._indice = indice
+            IndiceProductos._version_local = version
+        return indice
+
+    @staticmethod
+    def buscar(consulta: str, limite: int = 30) -> List[int]:
+        """Ids de productos activos que coinciden con la consulta"""
+        return IndiceProductos.obtener().buscar(consulta, limite)
+
+    @staticmethod
+    def por_codigo(codigo: str) -> Optional[int]:
+        """Id del producto activo con ese código de barras"""
+        return IndiceProductos.obtener().por_codigo(codigo)
+
+    @staticmethod
+    def cargar(ids: List[int], queryset=None) -> List[Producto]:
+        """
+        Trae los productos de los ids en el orden del índice (una query)
+
+        Args:
+            ids: Resultado de buscar()
+            queryset: Queryset base (select_related, filtros extra)
+        """
+        if not ids:
+            return []
+        if queryset is None:
+            queryset = Producto.objects.all()
+        productos = queryset.in_bulk(ids)
+        return [productos[i] for i in ids if i in productos]
+
+    # =========================================================================
+    # ACTUALIZACIÓN DESDE SIGNALS
+    # =========================================================================
+
+    @staticmethod
+    def producto_guardado(producto: Producto):
+        """Refleja un Producto guardado al confirmar la transacción"""
+        id_producto = producto.id_producto
+        activo = producto.activo
+        descripcion = producto.descripcion
+        codigo_barra = producto.codigo_barra
+
+        def aplicar(indice: IndiceBusqueda):
+            if activo:
+                indice.agregar(id_producto, descripcion, codigo_barra)
+            else:
+                indice.quitar(id_producto)
+
+        transaction.on_commit(lambda: IndiceProductos._aplicar(aplicar))
+
+    @staticmethod
+    def producto_eliminado(id_producto: int):
+        """Quita un Producto eliminado al confirmar la transacción"""
+        transaction.on_commit(
+            lambda: IndiceProductos._aplicar(lambda indice: indice.quitar(id_producto))
+        )
+
+    @staticmethod
+    def _aplicar(cambio):
+        """Aplica el cambio al índice local y avisa a los demás procesos"""
+        try:
+            version = cache.incr(IndiceProductos.CLAVE_VERSION)
+        except ValueError:
+            version = None
+            cache.set(IndiceProductos.CLAVE_VERSION, 1, None)
+
+        with IndiceProductos._lock:
+            indice = IndiceProductos._indice
+            if indice is None:
+                return
+            cambio(indice)
+            # Si otro proceso cambió algo en el medio, la versión no coincide
+            # y el próximo acceso reconstruye el índice completo
+            if version is not None and IndiceProductos._version_local == version - 1:
+                IndiceProductos._version_local = version
+
+    @staticmethod
+    def invalidar():
+        """Fuerza la reconstrucción en todos los procesos (p. ej. tras un update masivo)"""
+        with IndiceProductos._lock:
+            IndiceProductos._indice = None
+        transaction.on_commit(IndiceProductos._incrementar_version)
+
+    @staticmethod
+    def limpiar_local():
+        """Descarta sólo el índice de este proceso (tests, shell)"""
+        with IndiceProductos._lock:
+            IndiceProductos._indice = None
+            IndiceProductos._version_local = None
+
+    @staticmethod
+    def _incrementar_version():
+        try:
+            cache.incr(IndiceProductos.CLAVE_VERSION)
+        except ValueError:
+            cache.set(IndiceProductos.CLAVE_VERSION, 1, None)
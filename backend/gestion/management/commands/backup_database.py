@@ -1,17 +1,19 @@
 """
 Django Management Command para Backup Automático de Base de Datos
-Uso: python manage.py backup_database
+Uso: python manage.py backup_database [--compress] [--hilos 4]
+     python manage.py backup_database --compress --tablas [--desde 2026-03-01]
+     python manage.py backup_database --verificar backups/backup_..._completo.manifest.json [--restaurar-en prueba]
 """
-import os
-import subprocess
-import gzip
-import shutil
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from pathlib import Path
 from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
 from django.core.mail import send_mail
 
+from gestion.respaldos import (
+    NIVEL_COMPRESION, SUFIJO_MANIFIESTO, TABLAS_PESADAS, BackupError, RespaldoMySQL
+)
+
 
 class Command(BaseCommand):
     help = 'Crea un backup de la base de datos MySQL y limpia backups antiguos'
@@ -33,38 +35,90 @@ class Command(BaseCommand):
             action='store_true',
             help='Enviar notificación por email',
         )
+        parser.add_argument(
+            '--hilos',
+            type=int,
+            default=None,
+            help='Hilos de compresión (default: settings.BACKUP_HILOS_COMPRESION)',
+        )
+        parser.add_argument(
+            '--nivel',
+            type=int,
+            choices=range(1, 10),
+            default=NIVEL_COMPRESION,
+            help=f'Nivel de compresión gzip (default: {NIVEL_COMPRESION})',
+        )
+        parser.add_argument(
+            '--tablas',
+            nargs='*',
+            default=None,
+            help=f'Volcar sólo estas tablas, un archivo por tabla (sin nombres: {", ".join(TABLAS_PESADAS)})',
+        )
+        parser.add_argument(
+            '--desde',
+            type=date.fromisoformat,
+            default=None,
+            help='Volcado incremental de las tablas pesadas desde AAAA-MM-DD (requiere --tablas)',
+        )
+        parser.add_argument(
+            '--directorio',
+            default=None,
+            help='Directorio de backups (default: BASE_DIR/backups)',
+        )
+        parser.add_argument(
+            '--verificar',
+            metavar='MANIFIESTO',
+            default=None,
+            help='Verificar los checksums de un backup en lugar de crear uno',
+        )
+        parser.add_argument(
+            '--restaurar-en',
+            metavar='BASE',
+            default=None,
+            help='Con --verificar: restaurar cada archivo en esta base de prueba',
+        )
 
     def handle(self, *args, **options):
+        if options['verificar']:
+            return self._verify_backup(Path(options['verificar']), options['restaurar_en'])
+        if options['desde'] is not None and options['tablas'] is None:
+            raise CommandError('--desde requiere --tablas')
+
         self.stdout.write('=' * 70)
         self.stdout.write(self.style.SUCCESS('🔄 INICIANDO BACKUP DE BASE DE DATOS'))
         self.stdout.write('=' * 70)
         
         # Configuración
         db_config = settings.DATABASES['default']
-        backup_dir = Path(settings.BASE_DIR) / 'backups'
+        backup_dir = Path(options['directorio'] or Path(settings.BASE_DIR) / 'backups')
         compress = options['compress']
         keep_days = options['keep_days']
         notify = options['notify']
         
         # Crear directorio de backups
-        backup_dir.mkdir(exist_ok=True)
+        backup_dir.mkdir(parents=True, exist_ok=True)
         
         try:
             # Crear backup
-            backup_file = self._create_backup(db_config, backup_dir, compress)
+            respaldo = RespaldoMySQL(
+                db_config, backup_dir, comprimir=compress, nivel=options['nivel'], hilos=options['hilos']
+            )
+            manifiesto = self._create_backup(respaldo, options['tablas'], options['desde'])
             
             # Limpiar backups antiguos
             deleted_count = self._cleanup_old_backups(backup_dir, keep_days)
             
             # Estadísticas
             total_backups = len(list(backup_dir.glob('backup_*.sql*')))
-            backup_size = backup_file.stat().st_size / (1024 * 1024)
+            backup_size = sum(a['bytes_gz'] or a['bytes_sql'] for a in manifiesto['archivos']) / (1024 * 1024)
             
             self.stdout.write('')
             self.stdout.write('=' * 70)
             self.stdout.write(self.style.SUCCESS('✅ BACKUP COMPLETADO EXITOSAMENTE'))
             self.stdout.write('=' * 70)
-            self.stdout.write(f'📄 Archivo: {backup_file.name}')
+            for archivo in manifiesto['archivos']:
+                self.stdout.write(f'📄 Archivo: {archivo["archivo"]}')
+            self.stdout.write(f'🔐 Manifiesto: {manifiesto["manifiesto"]}')
             self.stdout.write(f'💾 Tamaño: {backup_size:.2f} MB')
             self.stdout.write(f'📁 Total backups: {total_backups}')
             self.stdout.write(f'🗑️  Backups eliminados: {deleted_count}')
@@ -72,79 +126,69 @@ class Command(BaseCommand):
             
             # Enviar notificación por email
             if notify:
-                self._send_notification(backup_file, backup_size, total_backups)
+                self._send_notification(backup_dir / manifiesto['archivos'][0]['archivo'], backup_size, total_backups)
                 
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'❌ Error durante backup: {str(e)}'))
             raise CommandError(f'Backup falló: {str(e)}')
 
-    def _create_backup(self, db_config, backup_dir, compress=False):
-        """Crear backup de la base de datos"""
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_file = backup_dir / f'backup_{db_config["NAME"]}_{timestamp}.sql'
-        
+    def _create_backup(self, respaldo, tablas=None, desde=None):
+        """
+        Crear backup de la base de datos
+
+        mysqldump escribe en un pipe que se comprime en paralelo mientras se
+        genera (sin .sql intermedio en disco).
+        """
+        db_config = respaldo.db_config
         self.stdout.write(f'📊 Base de datos: {db_config["NAME"]}')
-        self.stdout.write(f'🖥️  Host: {db_config["HOST"]}')
-        self.stdout.write(f'📁 Directorio: {backup_dir}')
+        self.stdout.write(f'🖥️  Host: {db_config.get("HOST") or "localhost"}')
+        self.stdout.write(f'📁 Directorio: {respaldo.directorio}')
+        if respaldo.comprimir:
+            self.stdout.write(f'🗜️  Compresión: gzip nivel {respaldo.nivel}, {respaldo.hilos} hilo(s)')
         self.stdout.write('')
         
-        # Comando mysqldump
-        cmd = [
-            'mysqldump',
-            f'--host={db_config["HOST"]}',
-            f'--port={db_config["PORT"]}',
-            f'--user={db_config["USER"]}',
-            '--single-transaction',
-            '--quick',
-            '--lock-tables=false',
-            '--routines',
-            '--triggers',
-            '--events',
-            f'--result-file={backup_file}',
-            db_config['NAME']
-        ]
-        
-        # Agregar password si existe
-        if db_config.get('PASSWORD'):
-            cmd.insert(4, f'--password={db_config["PASSWORD"]}')
-        
         self.stdout.write('🔄 Ejecutando mysqldump...')
-        
-        # Ejecutar backup
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            check=False
-        )
-        
-        if result.returncode != 0:
-            raise Exception(f'mysqldump falló: {result.stderr}')
-        
-        size_mb = backup_file.stat().st_size / (1024 * 1024)
-        self.stdout.write(self.style.SUCCESS(f'✅ Backup creado: {size_mb:.2f} MB'))
-        
-        # Comprimir si se solicitó
-        if compress:
-            self.stdout.write('🗜️  Comprimiendo archivo...')
-            backup_gz = Path(str(backup_file) + '.gz')
-            
-            with open(backup_file, 'rb') as f_in:
-                with gzip.open(backup_gz, 'wb', compresslevel=9) as f_out:
-                    shutil.copyfileobj(f_in, f_out)
-            
-            # Eliminar archivo sin comprimir
-            backup_file.unlink()
-            
-            size_gz_mb = backup_gz.stat().st_size / (1024 * 1024)
-            ratio = (1 - size_gz_mb / size_mb) * 100
+        if tablas is None:
+            manifiesto = respaldo.completo()
+        else:
+            manifiesto = respaldo.por_tablas(tablas or list(TABLAS_PESADAS), desde)
+        
+        for archivo in manifiesto['archivos']:
+            size_mb = archivo['bytes_sql'] / (1024 * 1024)
+            if archivo['bytes_gz'] is None:
+                self.stdout.write(self.style.SUCCESS(f'✅ {archivo["archivo"]}: {size_mb:.2f} MB'))
+                continue
+            size_gz_mb = archivo['bytes_gz'] / (1024 * 1024)
+            ratio = (1 - archivo['bytes_gz'] / archivo['bytes_sql']) * 100 if archivo['bytes_sql'] else 0
             self.stdout.write(self.style.SUCCESS(
-                f'✅ Comprimido: {size_gz_mb:.2f} MB (reducción: {ratio:.1f}%)'
+                f'✅ {archivo["archivo"]}: {size_mb:.2f} MB → {size_gz_mb:.2f} MB (reducción: {ratio:.1f}%)'
             ))
-            
-            return backup_gz
         
-        return backup_file
+        return manifiesto
+
+    def _verify_backup(self, manifiesto, restaurar_en=None):
+        """Verificar checksums y marca de fin de los archivos de un manifiesto"""
+        if not manifiesto.exists():
+            raise CommandError(f'No existe el manifiesto {manifiesto}')
+
+        self.stdout.write(f'🔍 Verificando {manifiesto.name}...')
+        try:
+            resultados = RespaldoMySQL.verificar(manifiesto, restaurar_en, settings.DATABASES['default'])
+        except BackupError as e:
+            raise CommandError(str(e))
+
+        for resultado in resultados:
+            if resultado['ok']:
+                self.stdout.write(self.style.SUCCESS(f'  ✅ {resultado["archivo"]}'))
+            else:
+                self.stdout.write(self.style.ERROR(
+                    f'  ❌ {resultado["archivo"]}: {"; ".join(resultado["errores"])}'
+                ))
+
+        if not all(r['ok'] for r in resultados):
+            raise CommandError('Verificación fallida')
+        destino = f' y restaurado en {restaurar_en}' if restaurar_en else ''
+        self.stdout.write(self.style.SUCCESS(f'✅ Backup íntegro{destino}'))
 
     def _cleanup_old_backups(self, backup_dir, keep_days):
         """Eliminar backups más antiguos que keep_days"""
@@ -153,7 +197,8 @@ class Command(BaseCommand):
         fecha_limite = datetime.now() - timedelta(days=keep_days)
         deleted_count = 0
         
-        for archivo in backup_dir.glob('backup_*.sql*'):
+        archivos = [*backup_dir.glob('backup_*.sql*'), *backup_dir.glob(f'backup_*{SUFIJO_MANIFIESTO}')]
+        for archivo in archivos:
             fecha_archivo = datetime.fromtimestamp(archivo.stat().st_mtime)
             
             if fecha_archivo < fecha_limite:
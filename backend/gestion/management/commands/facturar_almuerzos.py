@@ -0,0 +1,64 @@
+"""
+Django Management Command para generar las cuentas mensuales de almuerzo
+Uso: python manage.py facturar_almuerzos --anio 2026 --mes 3 [--dry-run]
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from gestion.facturacion_almuerzos import FacturadorAlmuerzos, FacturacionConcurrenteError, FORMAS_COBRO
+
+
+class Command(BaseCommand):
+    help = 'Genera las cuentas mensuales de almuerzo de todos los hijos con consumos sin facturar'
+
+    def add_arguments(self, parser):
+        hoy = timezone.localdate()
+        parser.add_argument(
+            '--anio',
+            type=int,
+            default=hoy.year,
+            help='Año a facturar (default: año actual)',
+        )
+        parser.add_argument(
+            '--mes',
+            type=int,
+            default=hoy.month,
+            help='Mes a facturar (default: mes actual)',
+        )
+        parser.add_argument(
+            '--forma-cobro',
+            choices=FORMAS_COBRO,
+            default='CREDITO_MENSUAL',
+            help='Forma de cobro de las cuentas (default: CREDITO_MENSUAL)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Mostrar lo que se facturaría sin escribir nada',
+        )
+
+    def handle(self, *args, **options):
+        anio, mes = options['anio'], options['mes']
+        if not 1 <= mes <= 12:
+            raise CommandError('El mes debe estar entre 1 y 12')
+
+        if options['dry_run']:
+            previa = FacturadorAlmuerzos.previsualizar(anio, mes)
+            self.stdout.write(self.style.WARNING(f'🔎 Vista previa {mes}/{anio} (no se escribe nada)'))
+            self.stdout.write(f"   Hijos con consumos: {previa['hijos']}")
+            self.stdout.write(f"   Cuentas nuevas: {previa['cuentas_nuevas']}")
+            self.stdout.write(f"   Cuentas a actualizar: {previa['cuentas_existentes']}")
+            self.stdout.write(f"   Almuerzos: {previa['almuerzos']}")
+            self.stdout.write(f"   Monto total: ₲{previa['monto_total']:,.0f}")
+            return
+
+        try:
+            resultado = FacturadorAlmuerzos.facturar(anio, mes, options['forma_cobro'])
+        except FacturacionConcurrenteError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {mes}/{anio}: {resultado['cuentas_creadas']} cuentas nuevas, "
+            f"{resultado['cuentas_actualizadas']} actualizadas, "
+            f"{resultado['consumos_facturados']} consumos facturados"
+        ))
@@ -0,0 +1,56 @@
+"""
+Django Management Command para generar los XML de facturación electrónica del día
+Uso: python manage.py generar_xml_facturas --destino /ruta [--fecha 2026-03-15]
+"""
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from gestion.facturacion_electronica import GeneradorLoteFacturas, TAMANO_LOTE_XML
+from pos.models import Venta
+
+
+class Command(BaseCommand):
+    help = 'Genera un XML SET por cada venta con factura legal del día (archivos <cdc>.xml)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--destino',
+            required=True,
+            help='Directorio donde escribir los XML',
+        )
+        parser.add_argument(
+            '--fecha',
+            type=date.fromisoformat,
+            default=None,
+            help='Fecha de las ventas AAAA-MM-DD (default: hoy)',
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=TAMANO_LOTE_XML,
+            help=f'Ventas por consulta (default: {TAMANO_LOTE_XML})',
+        )
+
+    def handle(self, *args, **options):
+        fecha = options['fecha'] or timezone.localdate()
+        ventas = Venta.objects.filter(
+            fecha__date=fecha, genera_factura_legal=True
+        ).exclude(estado='ANULADO')
+
+        inicio = time.perf_counter()
+        try:
+            resumen = GeneradorLoteFacturas.escribir_directorio(ventas, options['destino'], options['lote'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        duracion = time.perf_counter() - inicio
+
+        if not resumen['documentos']:
+            self.stdout.write(f'No hay ventas con factura legal el {fecha}')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {fecha}: {resumen['documentos']} XML generados "
+            f"({resumen['bytes'] / 1024:.0f} KB) en {duracion:.1f} s → {options['destino']}"
+        ))
@@ -0,0 +1,28 @@
+"""
+Django Management Command para reconstruir la matriz de conflictos producto x restricción
+Uso: python manage.py reconstruir_matriz_restricciones [--solo-desactualizados]
+"""
+from django.core.management.base import BaseCommand
+
+from gestion.restricciones_matcher import MatrizConflictos
+
+
+class Command(BaseCommand):
+    help = 'Recalcula la matriz de conflictos entre productos y restricciones alimentarias'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--solo-desactualizados',
+            action='store_true',
+            help='Calcular sólo productos sin fila o de otra versión de palabras clave',
+        )
+
+    def handle(self, *args, **options):
+        if options['solo_desactualizados']:
+            total = MatrizConflictos.asegurar()
+        else:
+            total = len(MatrizConflictos.recalcular())
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Matriz de restricciones: {total} productos calculados (versión {MatrizConflictos.version()})"
+        ))
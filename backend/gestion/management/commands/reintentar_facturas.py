@@ -0,0 +1,39 @@
+"""
+Django Management Command para reenviar a SIFEN los documentos rechazados
+Uso: python manage.py reintentar_facturas [--limite 50] [--hilos 4]
+"""
+from django.core.management.base import BaseCommand
+
+from gestion.reintentos_set import ColaReintentosSET, TAMANO_LOTE
+
+
+class Command(BaseCommand):
+    help = 'Reenvía los documentos de la cola de reintentos SET cuyo próximo intento ya venció'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limite',
+            type=int,
+            default=TAMANO_LOTE,
+            help=f'Documentos por lote (default: {TAMANO_LOTE})',
+        )
+        parser.add_argument(
+            '--hilos',
+            type=int,
+            default=None,
+            help='Envíos simultáneos (default: settings.SET_REINTENTOS_CONCURRENCIA)',
+        )
+
+    def handle(self, *args, **options):
+        total = ColaReintentosSET.vaciar(options['limite'], hilos=options['hilos'])
+
+        if not total:
+            self.stdout.write('No hay reintentos vencidos')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Aceptados: {total.get('aceptado', 0)}, "
+            f"reprogramados: {total.get('reintento_programado', 0)}, "
+            f"frenados por SET: {total.get('limitado', 0) + total.get('diferido', 0)}, "
+            f"a revisión manual: {total.get('revision_manual', 0)}"
+        ))
+        self.stdout.write(f"   Cola: {ColaReintentosSET.estado_cola()}")
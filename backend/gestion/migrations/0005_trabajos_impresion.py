@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:19
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0004_modelos_avanzados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoImpresion',
+            fields=[
+                ('id_trabajo', models.BigAutoField(db_column='id_trabajo', primary_key=True, serialize=False)),
+                ('terminal', models.CharField(db_column='terminal', max_length=50)),
+                ('tipo', models.CharField(choices=[('TICKET_VENTA', 'Ticket de Venta'), ('REIMPRESION', 'Reimpresión')], db_column='tipo', default='TICKET_VENTA', max_length=20)),
+                ('id_venta', models.BigIntegerField(blank=True, db_column='id_venta', db_index=True, null=True)),
+                ('payload', models.JSONField(db_column='payload', help_text='Datos del ticket en formato de ImpresoraTermica.imprimir_ticket')),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('IMPRIMIENDO', 'Imprimiendo'), ('IMPRESO', 'Impreso'), ('ERROR', 'Error')], db_column='estado', default='PENDIENTE', max_length=12)),
+                ('intentos', models.IntegerField(db_column='intentos', default=0)),
+                ('max_intentos', models.IntegerField(db_column='max_intentos', default=5)),
+                ('ultimo_error', models.TextField(blank=True, db_column='ultimo_error', null=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, db_column='fecha_creacion')),
+                ('fecha_proximo_intento', models.DateTimeField(db_column='fecha_proximo_intento', default=django.utils.timezone.now)),
+                ('fecha_impresion', models.DateTimeField(blank=True, db_column='fecha_impresion', null=True)),
+            ],
+            options={
+                'verbose_name': 'Trabajo de Impresión',
+                'verbose_name_plural': 'Trabajos de Impresión',
+                'db_table': 'trabajos_impresion',
+                'abstract': False,
+                'managed': True,
+                'indexes': [models.Index(fields=['terminal', 'estado', 'fecha_proximo_intento'], name='idx_impresion_cola')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0005_trabajos_impresion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SecuenciaTimbrado',
+            fields=[
+                ('nro_timbrado', models.OneToOneField(db_column='nro_timbrado', on_delete=django.db.models.deletion.PROTECT, primary_key=True, related_name='secuencia', serialize=False, to='gestion.timbrados')),
+                ('ultimo_secuencial', models.IntegerField(db_column='ultimo_secuencial')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True, db_column='fecha_actualizacion')),
+            ],
+            options={
+                'verbose_name': 'Secuencia de Timbrado',
+                'verbose_name_plural': 'Secuencias de Timbrado',
+                'db_table': 'secuencias_timbrado',
+                'abstract': False,
+                'managed': True,
+            },
+        ),
+    ]
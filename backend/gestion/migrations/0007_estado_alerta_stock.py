@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0006_secuencias_timbrado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadoAlertaStock',
+            fields=[
+                ('id_producto', models.OneToOneField(db_column='id_producto', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='estado_alerta_stock', serialize=False, to='gestion.producto')),
+                ('nivel', models.PositiveSmallIntegerField(choices=[(0, 'Normal'), (1, 'Stock bajo'), (2, 'Agotado')], db_column='nivel', default=0)),
+                ('nivel_alertado', models.PositiveSmallIntegerField(choices=[(0, 'Normal'), (1, 'Stock bajo'), (2, 'Agotado')], db_column='nivel_alertado', default=0)),
+                ('fecha_alerta', models.DateTimeField(blank=True, db_column='fecha_alerta', null=True)),
+            ],
+            options={
+                'verbose_name': 'Estado de Alerta de Stock',
+                'verbose_name_plural': 'Estados de Alerta de Stock',
+                'db_table': 'estado_alerta_stock',
+                'abstract': False,
+                'managed': True,
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:39
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0007_estado_alerta_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MensajeSaliente',
+            fields=[
+                ('id_mensaje', models.BigAutoField(db_column='id_mensaje', primary_key=True, serialize=False)),
+                ('canal', models.CharField(choices=[('EMAIL', 'Email'), ('WHATSAPP', 'WhatsApp')], db_column='canal', max_length=10)),
+                ('destinatario', models.CharField(db_column='destinatario', max_length=255)),
+                ('asunto', models.CharField(blank=True, db_column='asunto', max_length=255, null=True)),
+                ('cuerpo', models.TextField(db_column='cuerpo')),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('ENVIANDO', 'Enviando'), ('ENVIADO', 'Enviado'), ('ERROR', 'Error')], db_column='estado', default='PENDIENTE', max_length=10)),
+                ('lote', models.CharField(blank=True, db_column='lote', help_text='Worker que reclamó el mensaje', max_length=32, null=True)),
+                ('intentos', models.IntegerField(db_column='intentos', default=0)),
+                ('max_intentos', models.IntegerField(db_column='max_intentos', default=5)),
+                ('ultimo_error', models.TextField(blank=True, db_column='ultimo_error', null=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, db_column='fecha_creacion')),
+                ('fecha_proximo_intento', models.DateTimeField(db_column='fecha_proximo_intento', default=django.utils.timezone.now)),
+                ('fecha_envio', models.DateTimeField(blank=True, db_column='fecha_envio', null=True)),
+                ('id_notificacion_saldo', models.ForeignKey(blank=True, db_column='id_notificacion_saldo', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='mensajes', to='gestion.notificacionsaldo')),
+            ],
+            options={
+                'verbose_name': 'Mensaje Saliente',
+                'verbose_name_plural': 'Mensajes Salientes',
+                'db_table': 'mensajes_salientes',
+                'abstract': False,
+                'managed': True,
+                'indexes': [models.Index(fields=['canal', 'estado', 'fecha_proximo_intento'], name='idx_mensajes_cola'), models.Index(fields=['lote'], name='idx_mensajes_lote')],
+            },
+        ),
+    ]
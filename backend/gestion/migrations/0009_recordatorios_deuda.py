@@ -0,0 +1,96 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def agregar_columna_si_falta(columna, definicion):
+    """
+    ALTER TABLE condicional: autorizacion_saldo_negativo ya trae estas
+    columnas en la base real (estructura1_Version3.sql), sólo se agregan
+    si faltan
+    """
+    return f"""
+    SET @add_sql = (
+      SELECT IF(
+        EXISTS(
+          SELECT 1 FROM information_schema.columns
+          WHERE table_schema = DATABASE()
+            AND table_name = 'autorizacion_saldo_negativo'
+            AND column_name = '{columna}'
+        ),
+        'SELECT 1;',
+        'ALTER TABLE autorizacion_saldo_negativo ADD COLUMN {columna} {definicion};'
+      )
+    );
+    PREPARE stmt FROM @add_sql;
+    EXECUTE stmt;
+    DEALLOCATE PREPARE stmt;
+    """
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0008_bandeja_salida'),
+        ('pos', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            # Columnas existentes en MySQL: se agregan sólo si faltan y no se borran al revertir
+            database_operations=[
+                migrations.RunSQL(
+                    sql=agregar_columna_si_falta(
+                        'nro_tarjeta',
+                        'VARCHAR(20) NOT NULL, ADD CONSTRAINT fk_asn_tarjeta FOREIGN KEY (nro_tarjeta) '
+                        'REFERENCES tarjetas(nro_tarjeta) ON DELETE CASCADE',
+                    ),
+                    reverse_sql=migrations.RunSQL.noop,
+                ),
+                migrations.RunSQL(
+                    sql=agregar_columna_si_falta('fecha_regularizacion', 'DATETIME DEFAULT NULL'),
+                    reverse_sql=migrations.RunSQL.noop,
+                ),
+                migrations.RunSQL(
+                    sql=agregar_columna_si_falta(
+                        'id_carga_regularizacion',
+                        'BIGINT DEFAULT NULL, ADD CONSTRAINT fk_asn_carga FOREIGN KEY (id_carga_regularizacion) '
+                        'REFERENCES cargas_saldo(id_carga) ON DELETE SET NULL',
+                    ),
+                    reverse_sql=migrations.RunSQL.noop,
+                ),
+                migrations.RunSQL(
+                    sql=agregar_columna_si_falta('regularizado', 'TINYINT(1) DEFAULT 0'),
+                    reverse_sql=migrations.RunSQL.noop,
+                ),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='autorizacionsaldonegativo',
+                    name='fecha_regularizacion',
+                    field=models.DateTimeField(blank=True, db_column='fecha_regularizacion', null=True),
+                ),
+                migrations.AddField(
+                    model_name='autorizacionsaldonegativo',
+                    name='id_carga_regularizacion',
+                    field=models.ForeignKey(blank=True, db_column='id_carga_regularizacion', null=True, on_delete=django.db.models.deletion.SET_NULL, to='gestion.cargassaldo'),
+                ),
+                migrations.AddField(
+                    model_name='autorizacionsaldonegativo',
+                    name='nro_tarjeta',
+                    field=models.ForeignKey(db_column='nro_tarjeta', default='', on_delete=django.db.models.deletion.CASCADE, related_name='autorizaciones_saldo_negativo', to='gestion.tarjeta'),
+                    preserve_default=False,
+                ),
+                migrations.AddField(
+                    model_name='autorizacionsaldonegativo',
+                    name='regularizado',
+                    field=models.BooleanField(db_column='regularizado', default=False),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='autorizacionsaldonegativo',
+            index=models.Index(fields=['regularizado', 'fecha_autorizacion'], name='idx_asn_pendientes_fecha'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0009_recordatorios_deuda'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            # uk_consumo_dia ya existe en MySQL (estructura1_Version3.sql); se crea sólo si falta
+            database_operations=[
+                migrations.RunSQL(
+                    sql="""
+                    SET @add_sql = (
+                      SELECT IF(
+                        EXISTS(
+                          SELECT 1 FROM information_schema.statistics
+                          WHERE table_schema = DATABASE()
+                            AND table_name = 'registro_consumo_almuerzo'
+                            AND index_name = 'uk_consumo_dia'
+                        ),
+                        'SELECT 1;',
+                        'ALTER TABLE registro_consumo_almuerzo ADD CONSTRAINT uk_consumo_dia UNIQUE (id_hijo, fecha_consumo);'
+                      )
+                    );
+                    PREPARE stmt FROM @add_sql;
+                    EXECUTE stmt;
+                    DEALLOCATE PREPARE stmt;
+                    """,
+                    reverse_sql=migrations.RunSQL.noop,
+                ),
+            ],
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name='registroconsumoalmuerzo',
+                    constraint=models.UniqueConstraint(fields=('id_hijo', 'fecha_consumo'), name='uk_consumo_dia'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:53
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0010_consumo_almuerzo_unico_dia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReintentoEnvioSET',
+            fields=[
+                ('id_reintento', models.BigAutoField(db_column='id_reintento', primary_key=True, serialize=False)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('ENVIANDO', 'Enviando'), ('ACEPTADO', 'Aceptado'), ('REVISION', 'Revisión manual')], db_column='estado', default='PENDIENTE', max_length=10)),
+                ('lote', models.CharField(blank=True, db_column='lote', help_text='Worker que reclamó el reintento', max_length=32, null=True)),
+                ('intentos', models.IntegerField(db_column='intentos', default=0)),
+                ('max_intentos', models.IntegerField(db_column='max_intentos', default=3)),
+                ('codigo_error', models.CharField(blank=True, db_column='codigo_error', max_length=10, null=True)),
+                ('ultimo_error', models.TextField(blank=True, db_column='ultimo_error', null=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, db_column='fecha_creacion')),
+                ('fecha_proximo_intento', models.DateTimeField(db_column='fecha_proximo_intento', default=django.utils.timezone.now)),
+                ('fecha_aceptacion', models.DateTimeField(blank=True, db_column='fecha_aceptacion', null=True)),
+                ('id_documento', models.OneToOneField(db_column='id_documento', on_delete=django.db.models.deletion.CASCADE, related_name='reintento_envio', to='gestion.datosfacturacionelect')),
+            ],
+            options={
+                'verbose_name': 'Reintento de Envío SET',
+                'verbose_name_plural': 'Reintentos de Envío SET',
+                'db_table': 'reintentos_envio_set',
+                'abstract': False,
+                'managed': True,
+                'indexes': [models.Index(fields=['estado', 'fecha_proximo_intento'], name='idx_reintentos_set_cola'), models.Index(fields=['lote'], name='idx_reintentos_set_lote')],
+            },
+        ),
+    ]
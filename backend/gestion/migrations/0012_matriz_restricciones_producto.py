@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0011_cola_reintentos_set'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatrizRestriccionProducto',
+            fields=[
+                ('id_producto', models.OneToOneField(db_column='id_producto', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='matriz_restricciones', serialize=False, to='gestion.producto')),
+                ('mascara', models.BigIntegerField(db_column='mascara', default=0, help_text='Bit por tipo de restricción con conflicto (confianza >= 50) sin contar observaciones')),
+                ('mascara_riesgo', models.BigIntegerField(db_column='mascara_riesgo', default=0, help_text='Bit por tipo de restricción con alguna coincidencia (confianza > 0)')),
+                ('confianzas', models.JSONField(db_column='confianzas', default=dict)),
+                ('razones', models.JSONField(db_column='razones', default=dict)),
+                ('version', models.CharField(db_column='version', help_text='Versión de las palabras clave y categorías con que se calculó', max_length=12)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True, db_column='fecha_actualizacion')),
+            ],
+            options={
+                'verbose_name': 'Matriz de Restricciones',
+                'verbose_name_plural': 'Matriz de Restricciones',
+                'db_table': 'matriz_restricciones_producto',
+                'abstract': False,
+                'managed': True,
+                'indexes': [models.Index(fields=['version'], name='idx_matriz_restr_version')],
+            },
+        ),
+    ]
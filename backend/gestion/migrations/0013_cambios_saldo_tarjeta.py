@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0012_matriz_restricciones_producto'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CambioSaldoTarjeta',
+            fields=[
+                ('id_cambio', models.BigAutoField(db_column='id_cambio', primary_key=True, serialize=False)),
+                ('saldo', models.DecimalField(db_column='saldo', decimal_places=2, max_digits=12)),
+                ('nivel', models.CharField(choices=[('negativo', 'Saldo negativo'), ('bajo', 'Saldo bajo'), ('ok', 'Saldo OK'), ('inactiva', 'Tarjeta no activa')], db_column='nivel', max_length=10)),
+                ('fecha', models.DateTimeField(auto_now_add=True, db_column='fecha')),
+                ('nro_tarjeta', models.ForeignKey(db_column='nro_tarjeta', on_delete=django.db.models.deletion.CASCADE, related_name='cambios_saldo', to='gestion.tarjeta')),
+            ],
+            options={
+                'verbose_name': 'Cambio de Saldo',
+                'verbose_name_plural': 'Cambios de Saldo',
+                'db_table': 'cambios_saldo_tarjeta',
+                'abstract': False,
+                'managed': True,
+                'indexes': [models.Index(fields=['fecha'], name='idx_cambio_saldo_fecha')],
+            },
+        ),
+    ]
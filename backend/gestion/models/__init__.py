@@ -15,6 +15,8 @@ from .portal import *
 from .promociones import *
 from .alergenos import *
 from .vistas import *
+from .impresion import *
+from .mensajeria import *
 
 # Nuevos modelos avanzados
 from .analytics import *
@@ -38,14 +40,14 @@ __all__ = [
     'Cliente', 'Hijo', 'RestriccionesHijos',
     
     # Productos
-    'Producto', 'StockUnico', 'PreciosPorLista', 'CostosHistoricos',
+    'Producto', 'StockUnico', 'EstadoAlertaStock', 'PreciosPorLista', 'CostosHistoricos',
     'HistoricoPrecios', 'MovimientosStock',
     
     # Empleados
     'Empleado',
     
     # Tarjetas
-    'Tarjeta', 'ConsumoTarjeta', 'CargasSaldo',
+    'Tarjeta', 'ConsumoTarjeta', 'CargasSaldo', 'CambioSaldoTarjeta',
     
     # Ventas - Modelos auxiliares (núcleo está en pos app)
     'AplicacionPagosVentas',
@@ -58,8 +60,9 @@ __all__ = [
     'ConciliacionPagos',
     
     # Fiscal
-    'DatosEmpresa', 'PuntosExpedicion', 'Timbrados', 'DocumentosTributarios',
+    'DatosEmpresa', 'PuntosExpedicion', 'Timbrados', 'DocumentosTributarios', 'SecuenciaTimbrado',
     'DatosFacturacionElect', 'DatosFacturacionFisica', 'Cajas', 'CierresCaja',
+    'ReintentoEnvioSET',
     
     # Almuerzos
     'TipoAlmuerzo', 'PlanesAlmuerzo', 'SuscripcionesAlmuerzo',
@@ -83,7 +86,13 @@ __all__ = [
     'Promocion', 'ProductoPromocion', 'CategoriaPromocion', 'PromocionAplicada',
     
     # Alérgenos
-    'Alergeno', 'ProductoAlergeno',
+    'Alergeno', 'ProductoAlergeno', 'MatrizRestriccionProducto',
+    
+    # Impresión
+    'TrabajoImpresion',
+    
+    # Mensajería saliente
+    'MensajeSaliente',
     
     # Vistas
     'VistaStockAlerta', 'VistaSaldoClientes', 'VistaVentasDiaDetallado',
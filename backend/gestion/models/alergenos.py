@@ -80,4 +80,43 @@ class ProductoAlergeno(ManagedModel):
     
     def __str__(self):
         tipo = 'Contiene' if self.contiene else 'Puede contener trazas de'
-        return f'{self.id_producto.descripcion} - {tipo} {self.id_alergeno.nombre}'
\ No newline at end of file
+        return f'{self.id_producto.descripcion} - {tipo} {self.id_alergeno.nombre}'
+
+class MatrizRestriccionProducto(ManagedModel):
+    '''Tabla matriz_restricciones_producto - Conflictos precalculados producto x tipo de restricción'''
+    id_producto = models.OneToOneField(
+        Producto,
+        on_delete=models.CASCADE,
+        db_column='id_producto',
+        primary_key=True,
+        related_name='matriz_restricciones'
+    )
+    mascara = models.BigIntegerField(
+        db_column='mascara',
+        default=0,
+        help_text='Bit por tipo de restricción con conflicto (confianza >= 50) sin contar observaciones'
+    )
+    mascara_riesgo = models.BigIntegerField(
+        db_column='mascara_riesgo',
+        default=0,
+        help_text='Bit por tipo de restricción con alguna coincidencia (confianza > 0)'
+    )
+    confianzas = models.JSONField(db_column='confianzas', default=dict)
+    razones = models.JSONField(db_column='razones', default=dict)
+    version = models.CharField(
+        db_column='version',
+        max_length=12,
+        help_text='Versión de las palabras clave y categorías con que se calculó'
+    )
+    fecha_actualizacion = models.DateTimeField(db_column='fecha_actualizacion', auto_now=True)
+    
+    class Meta(ManagedModel.Meta):
+        db_table = 'matriz_restricciones_producto'
+        verbose_name = 'Matriz de Restricciones'
+        verbose_name_plural = 'Matriz de Restricciones'
+        indexes = [
+            models.Index(fields=['version'], name='idx_matriz_restr_version'),
+        ]
+    
+    def __str__(self):
+        return f'Producto {self.id_producto_id} - máscara {self.mascara:b}'
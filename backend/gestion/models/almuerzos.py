@@ -218,6 +218,10 @@ class RegistroConsumoAlmuerzo(ManagedModel):
         verbose_name = 'Registro de Almuerzo'
         verbose_name_plural = 'Registros de Almuerzos'
         ordering = ['-fecha_consumo', '-hora_registro']
+        constraints = [
+            # Un almuerzo por hijo por día (uk_consumo_dia en MySQL)
+            models.UniqueConstraint(fields=['id_hijo', 'fecha_consumo'], name='uk_consumo_dia'),
+        ]
 
     def __str__(self):
         return f'{self.id_hijo.nombre_completo} - {self.fecha_consumo}'
@@ -1,6 +1,7 @@
 # gestion/models/fiscal.py
 
 from django.db import models
+from django.utils import timezone
 from .base import ManagedModel
 from .empleados import Empleado
 
@@ -102,6 +103,27 @@ class DocumentosTributarios(ManagedModel):
         return f'Doc {self.id_documento} - Timbrado {self.nro_timbrado_id}: Gs. {self.monto_total}'
 
 
+class SecuenciaTimbrado(ManagedModel):
+    '''Tabla secuencias_timbrado - Último nro_secuencial asignado por timbrado'''
+    nro_timbrado = models.OneToOneField(
+        Timbrados,
+        on_delete=models.PROTECT,
+        db_column='nro_timbrado',
+        primary_key=True,
+        related_name='secuencia'
+    )
+    ultimo_secuencial = models.IntegerField(db_column='ultimo_secuencial')
+    fecha_actualizacion = models.DateTimeField(db_column='fecha_actualizacion', auto_now=True)
+
+    class Meta(ManagedModel.Meta):
+        db_table = 'secuencias_timbrado'
+        verbose_name = 'Secuencia de Timbrado'
+        verbose_name_plural = 'Secuencias de Timbrado'
+
+    def __str__(self):
+        return f'Timbrado {self.nro_timbrado_id}: último {self.ultimo_secuencial}'
+
+
 class DatosFacturacionElect(ManagedModel):
     '''Tabla datos_facturacion_elect - Datos específicos de facturación electrónica'''
     id_documento = models.OneToOneField(
@@ -126,6 +148,45 @@ class DatosFacturacionElect(ManagedModel):
         return f'CDC: {self.cdc}'
 
 
+class ReintentoEnvioSET(ManagedModel):
+    '''Tabla reintentos_envio_set - Cola persistente de reenvíos de DE rechazados a SIFEN'''
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'Pendiente'),
+        ('ENVIANDO', 'Enviando'),
+        ('ACEPTADO', 'Aceptado'),
+        ('REVISION', 'Revisión manual'),
+    ]
+
+    id_reintento = models.BigAutoField(db_column='id_reintento', primary_key=True)
+    id_documento = models.OneToOneField(
+        DatosFacturacionElect,
+        on_delete=models.CASCADE,
+        db_column='id_documento',
+        related_name='reintento_envio'
+    )
+    estado = models.CharField(db_column='estado', max_length=10, choices=ESTADO_CHOICES, default='PENDIENTE')
+    lote = models.CharField(db_column='lote', max_length=32, blank=True, null=True, help_text='Worker que reclamó el reintento')
+    intentos = models.IntegerField(db_column='intentos', default=0)
+    max_intentos = models.IntegerField(db_column='max_intentos', default=3)
+    codigo_error = models.CharField(db_column='codigo_error', max_length=10, blank=True, null=True)
+    ultimo_error = models.TextField(db_column='ultimo_error', blank=True, null=True)
+    fecha_creacion = models.DateTimeField(db_column='fecha_creacion', auto_now_add=True)
+    fecha_proximo_intento = models.DateTimeField(db_column='fecha_proximo_intento', default=timezone.now)
+    fecha_aceptacion = models.DateTimeField(db_column='fecha_aceptacion', blank=True, null=True)
+
+    class Meta(ManagedModel.Meta):
+        db_table = 'reintentos_envio_set'
+        verbose_name = 'Reintento de Envío SET'
+        verbose_name_plural = 'Reintentos de Envío SET'
+        indexes = [
+            models.Index(fields=['estado', 'fecha_proximo_intento'], name='idx_reintentos_set_cola'),
+            models.Index(fields=['lote'], name='idx_reintentos_set_lote'),
+        ]
+
+    def __str__(self):
+        return f'Reintento #{self.id_reintento} (doc {self.id_documento_id}) - {self.estado}'
+
+
 class DatosFacturacionFisica(ManagedModel):
     '''Tabla datos_facturacion_fisica - Datos específicos de facturación física'''
     id_documento = models.OneToOneField(
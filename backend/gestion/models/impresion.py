@@ -0,0 +1,43 @@
+# gestion/models/impresion.py
+
+from django.db import models
+from django.utils import timezone
+from .base import ManagedModel
+
+
+class TrabajoImpresion(ManagedModel):
+    '''Tabla trabajos_impresion - Cola persistente de tickets por terminal POS'''
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'Pendiente'),
+        ('IMPRIMIENDO', 'Imprimiendo'),
+        ('IMPRESO', 'Impreso'),
+        ('ERROR', 'Error'),
+    ]
+    TIPO_CHOICES = [
+        ('TICKET_VENTA', 'Ticket de Venta'),
+        ('REIMPRESION', 'Reimpresión'),
+    ]
+
+    id_trabajo = models.BigAutoField(db_column='id_trabajo', primary_key=True)
+    terminal = models.CharField(db_column='terminal', max_length=50)
+    tipo = models.CharField(db_column='tipo', max_length=20, choices=TIPO_CHOICES, default='TICKET_VENTA')
+    id_venta = models.BigIntegerField(db_column='id_venta', blank=True, null=True, db_index=True)
+    payload = models.JSONField(db_column='payload', help_text='Datos del ticket en formato de ImpresoraTermica.imprimir_ticket')
+    estado = models.CharField(db_column='estado', max_length=12, choices=ESTADO_CHOICES, default='PENDIENTE')
+    intentos = models.IntegerField(db_column='intentos', default=0)
+    max_intentos = models.IntegerField(db_column='max_intentos', default=5)
+    ultimo_error = models.TextField(db_column='ultimo_error', blank=True, null=True)
+    fecha_creacion = models.DateTimeField(db_column='fecha_creacion', auto_now_add=True)
+    fecha_proximo_intento = models.DateTimeField(db_column='fecha_proximo_intento', default=timezone.now)
+    fecha_impresion = models.DateTimeField(db_column='fecha_impresion', blank=True, null=True)
+
+    class Meta(ManagedModel.Meta):
+        db_table = 'trabajos_impresion'
+        verbose_name = 'Trabajo de Impresión'
+        verbose_name_plural = 'Trabajos de Impresión'
+        indexes = [
+            models.Index(fields=['terminal', 'estado', 'fecha_proximo_intento'], name='idx_impresion_cola'),
+        ]
+
+    def __str__(self):
+        return f'Trabajo #{self.id_trabajo} ({self.terminal}) - {self.estado}'
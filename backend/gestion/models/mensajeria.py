@@ -0,0 +1,56 @@
+# gestion/models/mensajeria.py
+
+from django.db import models
+from django.utils import timezone
+from .base import ManagedModel
+
+
+class MensajeSaliente(ManagedModel):
+    '''Tabla mensajes_salientes - Bandeja de salida de emails y WhatsApp (outbox)'''
+    CANAL_EMAIL = 'EMAIL'
+    CANAL_WHATSAPP = 'WHATSAPP'
+
+    CANAL_CHOICES = [
+        (CANAL_EMAIL, 'Email'),
+        (CANAL_WHATSAPP, 'WhatsApp'),
+    ]
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'Pendiente'),
+        ('ENVIANDO', 'Enviando'),
+        ('ENVIADO', 'Enviado'),
+        ('ERROR', 'Error'),
+    ]
+
+    id_mensaje = models.BigAutoField(db_column='id_mensaje', primary_key=True)
+    canal = models.CharField(db_column='canal', max_length=10, choices=CANAL_CHOICES)
+    destinatario = models.CharField(db_column='destinatario', max_length=255)
+    asunto = models.CharField(db_column='asunto', max_length=255, blank=True, null=True)
+    cuerpo = models.TextField(db_column='cuerpo')
+    id_notificacion_saldo = models.ForeignKey(
+        'gestion.NotificacionSaldo',
+        on_delete=models.SET_NULL,
+        db_column='id_notificacion_saldo',
+        blank=True,
+        null=True,
+        related_name='mensajes'
+    )
+    estado = models.CharField(db_column='estado', max_length=10, choices=ESTADO_CHOICES, default='PENDIENTE')
+    lote = models.CharField(db_column='lote', max_length=32, blank=True, null=True, help_text='Worker que reclamó el mensaje')
+    intentos = models.IntegerField(db_column='intentos', default=0)
+    max_intentos = models.IntegerField(db_column='max_intentos', default=5)
+    ultimo_error = models.TextField(db_column='ultimo_error', blank=True, null=True)
+    fecha_creacion = models.DateTimeField(db_column='fecha_creacion', auto_now_add=True)
+    fecha_proximo_intento = models.DateTimeField(db_column='fecha_proximo_intento', default=timezone.now)
+    fecha_envio = models.DateTimeField(db_column='fecha_envio', blank=True, null=True)
+
+    class Meta(ManagedModel.Meta):
+        db_table = 'mensajes_salientes'
+        verbose_name = 'Mensaje Saliente'
+        verbose_name_plural = 'Mensajes Salientes'
+        indexes = [
+            models.Index(fields=['canal', 'estado', 'fecha_proximo_intento'], name='idx_mensajes_cola'),
+            models.Index(fields=['lote'], name='idx_mensajes_lote'),
+        ]
+
+    def __str__(self):
+        return f'Mensaje #{self.id_mensaje} ({self.canal}) - {self.estado}'
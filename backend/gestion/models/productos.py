@@ -80,6 +80,42 @@ class StockUnico(ManagedModel):
         return f'{self.id_producto.descripcion}: {self.cantidad}'
 
 
+class EstadoAlertaStock(ManagedModel):
+    '''Tabla estado_alerta_stock - Último umbral de stock cruzado por producto (motor de alertas)'''
+    NIVEL_NORMAL = 0
+    NIVEL_BAJO = 1
+    NIVEL_AGOTADO = 2
+
+    NIVEL_CHOICES = [
+        (NIVEL_NORMAL, 'Normal'),
+        (NIVEL_BAJO, 'Stock bajo'),
+        (NIVEL_AGOTADO, 'Agotado'),
+    ]
+
+    id_producto = models.OneToOneField(
+        Producto,
+        on_delete=models.CASCADE,
+        db_column='id_producto',
+        primary_key=True,
+        related_name='estado_alerta_stock'
+    )
+    nivel = models.PositiveSmallIntegerField(db_column='nivel', choices=NIVEL_CHOICES, default=NIVEL_NORMAL)
+    nivel_alertado = models.PositiveSmallIntegerField(
+        db_column='nivel_alertado',
+        choices=NIVEL_CHOICES,
+        default=NIVEL_NORMAL
+    )
+    fecha_alerta = models.DateTimeField(db_column='fecha_alerta', blank=True, null=True)
+
+    class Meta(ManagedModel.Meta):
+        db_table = 'estado_alerta_stock'
+        verbose_name = 'Estado de Alerta de Stock'
+        verbose_name_plural = 'Estados de Alerta de Stock'
+
+    def __str__(self):
+        return f'{self.id_producto_id}: {self.get_nivel_display()}'
+
+
 class PreciosPorLista(ManagedModel):
     '''Tabla precios_por_lista - Precios de productos por lista'''
     id_precio = models.AutoField(db_column='id_precio', primary_key=True)
@@ -183,4 +183,40 @@ class ConsumoTarjeta(ManagedModel):
         ordering = ['-fecha_consumo']
 
     def __str__(self):
-        return f'Consumo {self.nro_tarjeta} - Gs. {self.monto_consumido:,.0f}'
\ No newline at end of file
+        return f'Consumo {self.nro_tarjeta} - Gs. {self.monto_consumido:,.0f}'
+
+class CambioSaldoTarjeta(ManagedModel):
+    '''Tabla cambios_saldo_tarjeta - Registro de cambios de saldo (cursor del feed de saldos)'''
+    NIVEL_NEGATIVO = 'negativo'
+    NIVEL_BAJO = 'bajo'
+    NIVEL_OK = 'ok'
+    NIVEL_INACTIVA = 'inactiva'
+
+    NIVEL_CHOICES = [
+        (NIVEL_NEGATIVO, 'Saldo negativo'),
+        (NIVEL_BAJO, 'Saldo bajo'),
+        (NIVEL_OK, 'Saldo OK'),
+        (NIVEL_INACTIVA, 'Tarjeta no activa'),
+    ]
+
+    id_cambio = models.BigAutoField(db_column='id_cambio', primary_key=True)
+    nro_tarjeta = models.ForeignKey(
+        Tarjeta,
+        on_delete=models.CASCADE,
+        db_column='nro_tarjeta',
+        related_name='cambios_saldo'
+    )
+    saldo = models.DecimalField(db_column='saldo', max_digits=12, decimal_places=2)
+    nivel = models.CharField(db_column='nivel', max_length=10, choices=NIVEL_CHOICES)
+    fecha = models.DateTimeField(db_column='fecha', auto_now_add=True)
+
+    class Meta(ManagedModel.Meta):
+        db_table = 'cambios_saldo_tarjeta'
+        verbose_name = 'Cambio de Saldo'
+        verbose_name_plural = 'Cambios de Saldo'
+        indexes = [
+            models.Index(fields=['fecha'], name='idx_cambio_saldo_fecha'),
+        ]
+
+    def __str__(self):
+        return f'#{self.id_cambio} - Tarjeta {self.nro_tarjeta_id}: {self.nivel}'
@@ -62,6 +62,15 @@ class AutorizacionSaldoNegativo(ManagedModel):
     motivo = models.TextField(db_column='motivo')
     fecha_autorizacion = models.DateTimeField(db_column='fecha_autorizacion')
     estado = models.CharField(db_column='estado', max_length=10, choices=[('VIGENTE', 'Vigente'), ('UTILIZADA', 'Utilizada'), ('VENCIDA', 'Vencida')], default='VIGENTE')
+    # Columnas de regularización de la tabla MySQL (estructura1_Version3.sql)
+    nro_tarjeta = models.ForeignKey('Tarjeta', on_delete=models.CASCADE, db_column='nro_tarjeta', related_name='autorizaciones_saldo_negativo')
+    regularizado = models.BooleanField(db_column='regularizado', default=False)
+    fecha_regularizacion = models.DateTimeField(db_column='fecha_regularizacion', blank=True, null=True)
+    id_carga_regularizacion = models.ForeignKey('CargasSaldo', on_delete=models.SET_NULL, db_column='id_carga_regularizacion', blank=True, null=True)
     
     class Meta(ManagedModel.Meta):
         db_table = 'autorizacion_saldo_negativo'
+        indexes = [
+            # Recordatorios diarios: rangos de fecha sobre las deudas pendientes
+            models.Index(fields=['regularizado', 'fecha_autorizacion'], name='idx_asn_pendientes_fecha'),
+        ]
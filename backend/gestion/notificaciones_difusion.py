@@ -0,0 +1,160 @@
+"""
+Difusión de notificaciones del sistema en lote
+===============================================
+
+Los signals de venta y recarga recorrían todos los usuarios staff y por
+cada uno hacían un get_or_create de ConfiguracionNotificacionesSistema y
+un INSERT de NotificacionSistema, dentro del post_save de la venta.
+
+DifusorNotificaciones resuelve un evento con un número fijo de queries,
+sin importar cuántos destinatarios haya:
+
+1. Un SELECT de los usuarios destinatarios
+2. Un SELECT de sus configuraciones (+ un bulk_create de las faltantes)
+3. Un bulk_create de todas las notificaciones
+
+Los signals sólo encolan el evento: se difunde después del commit, en
+una tarea Celery si NOTIFICACIONES_ASINCRONAS está activo o en el mismo
+proceso si no lo está (o si el broker no responde).
+"""
+
+import logging
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from .models_notificaciones import NotificacionSistema, ConfiguracionNotificacionesSistema
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+DESTINATARIOS_STAFF = 'staff'
+DESTINATARIOS_SUPERUSUARIOS = 'superusuarios'
+
+PRIORIDADES_CRITICAS = ('alta', 'critica')
+
+
+def evento_notificacion(titulo: str, mensaje: str, tipo: str = 'info', prioridad: str = 'media',
+                        preferencia: Optional[str] = None, destinatarios=DESTINATARIOS_STAFF,
+                        respetar_solo_criticas: bool = False, icono: Optional[str] = None,
+                        url: Optional[str] = None) -> Dict:
+    """
+    Arma un evento de notificación serializable (JSON, para Celery)
+
+    Args:
+        preferencia: Campo de ConfiguracionNotificacionesSistema que habilita
+                     el evento (notif_ventas, notif_recargas, ...); None = siempre
+        destinatarios: 'staff', 'superusuarios' o lista de ids de usuario
+        respetar_solo_criticas: Omitir a quien eligió "solo críticas" si la
+                                prioridad no es alta/crítica
+    """
+    return {
+        'titulo': titulo,
+        'mensaje': mensaje,
+        'tipo': tipo,
+        'prioridad': prioridad,
+        'preferencia': preferencia,
+        'destinatarios': destinatarios,
+        'respetar_solo_criticas': respetar_solo_criticas,
+        'icono': icono,
+        'url': url,
+    }
+
+
+class DifusorNotificaciones:
+    """Crea las notificaciones de un evento para todos sus destinatarios en lote"""
+
+    @staticmethod
+    def _ids_destinatarios(destinatarios) -> List[int]:
+        if destinatarios == DESTINATARIOS_STAFF:
+            usuarios = User.objects.filter(is_staff=True, is_active=True)
+        elif destinatarios == DESTINATARIOS_SUPERUSUARIOS:
+            usuarios = User.objects.filter(is_superuser=True, is_active=True)
+        else:
+            usuarios = User.objects.filter(pk__in=list(destinatarios))
+        return list(usuarios.values_list('pk', flat=True))
+
+    @staticmethod
+    def configuraciones(ids_usuarios: Iterable[int]) -> Dict[int, ConfiguracionNotificacionesSistema]:
+        """
+        Configuración de cada usuario, creando las que falten en un solo INSERT
+
+        Returns:
+            {id_usuario: ConfiguracionNotificacionesSistema}
+        """
+        ids_usuarios = list(ids_usuarios)
+        configs = {
+            config.usuario_id: config
+            for config in ConfiguracionNotificacionesSistema.objects.filter(usuario_id__in=ids_usuarios)
+        }
+        faltantes = [
+            ConfiguracionNotificacionesSistema(usuario_id=id_usuario)
+            for id_usuario in ids_usuarios if id_usuario not in configs
+        ]
+        if faltantes:
+            ConfiguracionNotificacionesSistema.objects.bulk_create(faltantes, ignore_conflicts=True)
+            for config in faltantes:
+                configs[config.usuario_id] = config
+        return configs
+
+    @staticmethod
+    def difundir(evento: Dict) -> int:
+        """
+        Crea las notificaciones del evento
+
+        Returns:
+            Cantidad de notificaciones creadas
+        """
+        ids_usuarios = DifusorNotificaciones._ids_destinatarios(evento['destinatarios'])
+        if not ids_usuarios:
+            return 0
+
+        configs = DifusorNotificaciones.configuraciones(ids_usuarios)
+        preferencia = evento.get('preferencia')
+        solo_criticas_aplica = (
+            evento.get('respetar_solo_criticas') and evento['prioridad'] not in PRIORIDADES_CRITICAS
+        )
+
+        notificaciones = []
+        for id_usuario in ids_usuarios:
+            config = configs[id_usuario]
+            if preferencia and not getattr(config, preferencia):
+                continue
+            if solo_criticas_aplica and config.solo_criticas:
+                continue
+            notificaciones.append(NotificacionSistema(
+                usuario_id=id_usuario,
+                titulo=evento['titulo'],
+                mensaje=evento['mensaje'],
+                tipo=evento['tipo'],
+                prioridad=evento['prioridad'],
+                icono=evento.get('icono'),
+                url=evento.get('url'),
+            ))
+
+        NotificacionSistema.objects.bulk_create(notificaciones)
+        return len(notificaciones)
+
+    @staticmethod
+    def encolar(evento: Dict):
+        """Difunde el evento después del commit de la transacción actual"""
+        transaction.on_commit(lambda: DifusorNotificaciones._despachar(evento))
+
+    @staticmethod
+    def _despachar(evento: Dict):
+        if getattr(settings, 'NOTIFICACIONES_ASINCRONAS', False):
+            try:
+                from .tasks import tarea_difundir_notificacion
+                tarea_difundir_notificacion.delay(evento)
+                return
+            except Exception as e:
+                logger.warning(f"No se pudo encolar la notificación en Celery, se difunde en línea: {e}")
+
+        try:
+            DifusorNotificaciones.difundir(evento)
+        except Exception as e:
+            # Una notificación nunca debe afectar la operación que la originó
+            logger.error(f"Error difundiendo notificación '{evento.get('titulo')}': {e}")
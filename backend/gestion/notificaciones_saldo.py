@@ -3,66 +3,102 @@ Sistema de Notificaciones de Saldo
 Cantina Tita - 2026
 """
 
-from django.core.mail import send_mail
 from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
 from decimal import Decimal
 import logging
 
+from gestion.bandeja_salida import BandejaSalida
+from gestion.models import MensajeSaliente
+
 logger = logging.getLogger(__name__)
 
+# Menos dígitos que esto es un teléfono de relleno ('0', 'N/A')
+MIN_DIGITOS_TELEFONO = 6
 
-def verificar_saldo_y_notificar(tarjeta):
+# Umbral de alerta para tarjetas sin saldo_alerta (₲10,000)
+SALDO_ALERTA_DEFAULT = Decimal('10000')
+
+# No repetir la alerta de una tarjeta antes de este tiempo
+ESPERA_ENTRE_ALERTAS = timedelta(hours=24)
+
+# Tarjetas alertadas por transacción en el barrido nocturno
+TAMANO_LOTE_BARRIDO = 500
+
+
+def contacto_responsable(cliente):
     """
-    Verifica el saldo de una tarjeta y envía notificaciones si es necesario
+    Email y teléfono del responsable para avisos de saldo
     
-    Reglas:
-    - SALDO_CRITICO: saldo < 0 (negativo)
-    - SALDO_BAJO: 0 <= saldo < saldo_alerta
-    - SALDO_OK: saldo >= saldo_alerta
+    El email del portal (UsuarioPortal) tiene prioridad sobre el de la ficha
+    del cliente; UsuariosWebClientes no guarda email ni teléfono.
+    
+    Returns:
+        Tupla (email o None, teléfono o None)
     """
-    from gestion.models import NotificacionSaldo, Cliente
+    from gestion.models import UsuarioPortal
     
-    saldo = tarjeta.saldo_actual
-    saldo_alerta = tarjeta.saldo_alerta or 10000  # Default ₲10,000
+    if cliente is None:
+        return None, None
     
-    # Obtener email del padre/responsable
-    hijo = tarjeta.id_hijo
-    cliente = hijo.id_cliente_responsable
-    email_padre = None
-    telefono_padre = None
+    email = UsuarioPortal.objects.filter(
+        cliente=cliente, activo=True
+    ).values_list('email', flat=True).first() or cliente.email
     
-    # Buscar email y teléfono en UsuariosWebClientes o UsuarioPortal
-    try:
-        from gestion.models import UsuariosWebClientes
-        usuario_web = UsuariosWebClientes.objects.filter(
-            id_cliente=cliente,
-            activo=True
-        ).first()
-        if usuario_web:
-            email_padre = usuario_web.email
-            # Intentar obtener teléfono
-            if hasattr(usuario_web, 'telefono_celular'):
-                telefono_padre = usuario_web.telefono_celular
-            elif hasattr(usuario_web, 'telefono'):
-                telefono_padre = usuario_web.telefono
-    except:
-        pass
-    
-    # Determinar tipo de notificación
-    tipo_notificacion = None
-    mensaje = ""
+    return email or None, telefono_valido(cliente.telefono)
+
+
+def campos_contacto(prefijo):
+    """
+    Campos de values() con el contacto del responsable
+    
+    Args:
+        prefijo: Camino hasta Cliente (ej: 'id_hijo__id_cliente_responsable')
+    """
+    return [
+        f'{prefijo}__email',
+        f'{prefijo}__telefono',
+        f'{prefijo}__usuario_portal__email',
+        f'{prefijo}__usuario_portal__activo',
+    ]
+
+
+def contacto_de_fila(fila, prefijo):
+    """contacto_responsable sobre una fila traída con campos_contacto(prefijo)"""
+    email = (
+        fila[f'{prefijo}__usuario_portal__activo'] and fila[f'{prefijo}__usuario_portal__email']
+    ) or fila[f'{prefijo}__email'] or None
+    return email, telefono_valido(fila[f'{prefijo}__telefono'])
+
+
+def telefono_valido(telefono):
+    """El teléfono si parece real, None si es de relleno"""
+    if not telefono or sum(c.isdigit() for c in telefono) < MIN_DIGITOS_TELEFONO:
+        return None
+    return telefono
+
+
+def mensaje_saldo(saldo, saldo_alerta, estudiante, nro_tarjeta):
+    """
+    Tipo y texto (email) de la alerta de saldo
+    
+    Reglas:
+    - SALDO_NEGATIVO: saldo < 0
+    - SALDO_BAJO: 0 <= saldo < saldo_alerta
+    - Sin alerta: saldo >= saldo_alerta
     
+    Returns:
+        Tupla (tipo_notificacion o None, mensaje)
+    """
     if saldo < 0:
         # Saldo NEGATIVO (crítico)
-        tipo_notificacion = 'SALDO_NEGATIVO'
-        mensaje = f"""
+        return 'SALDO_NEGATIVO', f"""
         🚨 ALERTA: Saldo Negativo
         
-        La tarjeta de {hijo.nombre_completo} tiene saldo NEGATIVO.
+        La tarjeta de {estudiante} tiene saldo NEGATIVO.
         
-        Tarjeta: {tarjeta.nro_tarjeta}
+        Tarjeta: {nro_tarjeta}
         Saldo Actual: ₲ {saldo:,}
         Adeuda: ₲ {abs(saldo):,}
         
@@ -72,15 +108,14 @@ def verificar_saldo_y_notificar(tarjeta):
         Gracias,
         Cantina Tita
         """
-    elif saldo < saldo_alerta:
+    if saldo < saldo_alerta:
         # Saldo BAJO
-        tipo_notificacion = 'SALDO_BAJO'
-        mensaje = f"""
+        return 'SALDO_BAJO', f"""
         ⚠️ Aviso: Saldo Bajo
         
-        La tarjeta de {hijo.nombre_completo} tiene saldo bajo.
+        La tarjeta de {estudiante} tiene saldo bajo.
         
-        Tarjeta: {tarjeta.nro_tarjeta}
+        Tarjeta: {nro_tarjeta}
         Saldo Actual: ₲ {saldo:,}
         Saldo de Alerta: ₲ {saldo_alerta:,}
         
@@ -89,17 +124,46 @@ def verificar_saldo_y_notificar(tarjeta):
         Saludos,
         Cantina Tita
         """
-    else:
+    return None, ''
+
+
+def verificar_saldo_y_notificar(tarjeta):
+    """
+    Verifica el saldo de una tarjeta y encola notificaciones si es necesario
+    
+    No hace envíos: el email y el WhatsApp quedan en la bandeja de salida
+    y se entregan después del commit (la tarjeta puede estar bloqueada).
+    
+    Reglas:
+    - SALDO_CRITICO: saldo < 0 (negativo)
+    - SALDO_BAJO: 0 <= saldo < saldo_alerta
+    - SALDO_OK: saldo >= saldo_alerta
+    """
+    from gestion.models import NotificacionSaldo, Cliente
+    
+    saldo = tarjeta.saldo_actual
+    saldo_alerta = tarjeta.saldo_alerta or SALDO_ALERTA_DEFAULT
+    
+    hijo = tarjeta.id_hijo
+    cliente = hijo.id_cliente_responsable
+    
+    tipo_notificacion, mensaje = mensaje_saldo(
+        saldo, saldo_alerta, hijo.nombre_completo, tarjeta.nro_tarjeta
+    )
+    if tipo_notificacion is None:
         # Saldo OK, no notificar
         return None
     
     # Verificar si ya se envió notificación recientemente (evitar spam)
     if tarjeta.notificar_saldo_bajo and tarjeta.ultima_notificacion_saldo:
         tiempo_desde_ultima = timezone.now() - tarjeta.ultima_notificacion_saldo
-        if tiempo_desde_ultima < timedelta(hours=24):
+        if tiempo_desde_ultima < ESPERA_ENTRE_ALERTAS:
             # Ya se notificó hace menos de 24 horas
             return None
     
+    # Obtener email y teléfono del padre/responsable
+    email_padre, telefono_padre = contacto_responsable(cliente)
+    
     # Crear notificación en BD
     notificacion = NotificacionSaldo.objects.create(
         nro_tarjeta=tarjeta,
@@ -109,35 +173,29 @@ def verificar_saldo_y_notificar(tarjeta):
         email_destinatario=email_padre
     )
     
-    # Enviar email si hay dirección
+    # Encolar email y WhatsApp: se entregan después del commit, fuera de la
+    # transacción de la venta (BandejaSalida)
     if email_padre and settings.EMAIL_HOST:
-        try:
-            send_mail(
-                subject=f'Cantina Tita - {tipo_notificacion.replace("_", " ").title()}',
-                message=mensaje,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[email_padre],
-                fail_silently=True  # No fallar si email falla
-            )
-            notificacion.enviada_email = True
-            notificacion.fecha_envio = timezone.now()
-            notificacion.save()
-        except Exception as e:
-            logger.error(f"Error enviando email: {e}")
+        BandejaSalida.encolar(
+            MensajeSaliente.CANAL_EMAIL,
+            email_padre,
+            mensaje,
+            asunto=f'Cantina Tita - {tipo_notificacion.replace("_", " ").title()}',
+            notificacion=notificacion
+        )
     
-    # Enviar WhatsApp si hay teléfono y está configurado
     if telefono_padre and tarjeta.notificar_saldo_bajo:
-        enviado_whatsapp = enviar_notificacion_whatsapp(
-            telefono=telefono_padre,
-            tipo=tipo_notificacion,
-            tarjeta=tarjeta.nro_tarjeta,
-            estudiante=hijo.nombre_completo,
-            saldo=saldo
+        BandejaSalida.encolar(
+            MensajeSaliente.CANAL_WHATSAPP,
+            telefono_padre,
+            mensaje_whatsapp_saldo(
+                tipo=tipo_notificacion,
+                tarjeta=tarjeta.nro_tarjeta,
+                estudiante=hijo.nombre_completo,
+                saldo=saldo
+            ),
+            notificacion=notificacion
         )
-        
-        if enviado_whatsapp:
-            notificacion.enviada_sms = True  # Usamos campo enviada_sms para WhatsApp
-            notificacion.save()
     
     # Actualizar fecha de última notificación
     tarjeta.ultima_notificacion_saldo = timezone.now()
@@ -146,6 +204,156 @@ def verificar_saldo_y_notificar(tarjeta):
     return notificacion
 
 
+def barrer_saldos_bajos(ahora=None, tamano_lote=TAMANO_LOTE_BARRIDO):
+    """
+    Barrido nocturno de saldos bajos por conjuntos
+    
+    En lugar de recorrer todas las tarjetas con verificar_saldo_y_notificar
+    (varias consultas por tarjeta), una consulta trae sólo las tarjetas bajo
+    su umbral y fuera de la espera de 24 h. Luego, por lotes y en una
+    transacción cada uno:
+    
+    - Relee el lote con select_for_update y los datos de contacto en el
+      mismo JOIN (hijo, cliente y usuario del portal)
+    - Crea las NotificacionSaldo con bulk_create
+    - Encola emails y WhatsApp en la bandeja de salida con bulk_create
+    - Marca ultima_notificacion_saldo con un solo UPDATE
+    
+    Args:
+        ahora: Momento de referencia (tests)
+        tamano_lote: Tarjetas por transacción
+    
+    Returns:
+        Dict con métricas: candidatas, notificaciones, emails, whatsapp,
+        sin_contacto, lotes, segundos
+    """
+    import time
+    from django.db import transaction
+    from django.db.models import DecimalField, F, Max, Q, Value
+    from django.db.models.functions import Coalesce
+    from gestion.models import NotificacionSaldo, Tarjeta
+    
+    inicio = time.monotonic()
+    ahora = ahora or timezone.now()
+    
+    pendientes = Tarjeta.objects.filter(
+        estado='Activa',
+        notificar_saldo_bajo=True,
+    ).annotate(
+        umbral=Coalesce(
+            'saldo_alerta', Value(SALDO_ALERTA_DEFAULT),
+            output_field=DecimalField(max_digits=10, decimal_places=2)
+        )
+    ).filter(
+        Q(ultima_notificacion_saldo__isnull=True)
+        | Q(ultima_notificacion_saldo__lte=ahora - ESPERA_ENTRE_ALERTAS),
+        saldo_actual__lt=F('umbral'),
+    )
+    
+    ids = list(pendientes.order_by('nro_tarjeta').values_list('nro_tarjeta', flat=True))
+    metricas = {
+        'candidatas': len(ids), 'notificaciones': 0, 'emails': 0,
+        'whatsapp': 0, 'sin_contacto': 0, 'lotes': 0, 'segundos': 0.0,
+    }
+    total_lotes = (len(ids) + tamano_lote - 1) // tamano_lote
+    con_email = bool(settings.EMAIL_HOST)
+    
+    for i in range(0, len(ids), tamano_lote):
+        with transaction.atomic():
+            # Releer bloqueando: una venta pudo notificar o recargar entretanto
+            filas = list(
+                pendientes.filter(nro_tarjeta__in=ids[i:i + tamano_lote])
+                .select_for_update(of=('self',))
+                .values(
+                    'nro_tarjeta', 'saldo_actual', 'umbral',
+                    'id_hijo__nombre', 'id_hijo__apellido',
+                    *campos_contacto('id_hijo__id_cliente_responsable'),
+                )
+            )
+            
+            notificaciones, contactos = [], []
+            for fila in filas:
+                estudiante = f"{fila['id_hijo__nombre']} {fila['id_hijo__apellido']}"
+                tipo, mensaje = mensaje_saldo(
+                    fila['saldo_actual'], fila['umbral'], estudiante, fila['nro_tarjeta']
+                )
+                email, telefono = contacto_de_fila(fila, 'id_hijo__id_cliente_responsable')
+                
+                notificaciones.append(NotificacionSaldo(
+                    nro_tarjeta_id=fila['nro_tarjeta'],
+                    tipo_notificacion=tipo,
+                    saldo_actual=fila['saldo_actual'],
+                    mensaje=mensaje,
+                    email_destinatario=email,
+                ))
+                contactos.append((fila, tipo, estudiante, email, telefono))
+            
+            ultimo_id = NotificacionSaldo.objects.aggregate(ultimo=Max('id_notificacion'))['ultimo'] or 0
+            NotificacionSaldo.objects.bulk_create(notificaciones)
+            asignar_ids_notificaciones(notificaciones, ultimo_id)
+            
+            mensajes = []
+            for notificacion, (fila, tipo, estudiante, email, telefono) in zip(notificaciones, contactos):
+                if email and con_email:
+                    mensajes.append(MensajeSaliente(
+                        canal=MensajeSaliente.CANAL_EMAIL,
+                        destinatario=email,
+                        asunto=f'Cantina Tita - {tipo.replace("_", " ").title()}',
+                        cuerpo=notificacion.mensaje,
+                        id_notificacion_saldo=notificacion,
+                    ))
+                    metricas['emails'] += 1
+                if telefono:
+                    mensajes.append(MensajeSaliente(
+                        canal=MensajeSaliente.CANAL_WHATSAPP,
+                        destinatario=telefono,
+                        cuerpo=mensaje_whatsapp_saldo(
+                            tipo=tipo,
+                            tarjeta=fila['nro_tarjeta'],
+                            estudiante=estudiante,
+                            saldo=fila['saldo_actual']
+                        ),
+                        id_notificacion_saldo=notificacion,
+                    ))
+                    metricas['whatsapp'] += 1
+                if not (email and con_email) and not telefono:
+                    metricas['sin_contacto'] += 1
+            
+            BandejaSalida.encolar_varios(mensajes)
+            Tarjeta.objects.filter(
+                nro_tarjeta__in=[fila['nro_tarjeta'] for fila in filas]
+            ).update(ultima_notificacion_saldo=ahora)
+        
+        metricas['notificaciones'] += len(notificaciones)
+        metricas['lotes'] += 1
+        logger.info(
+            f"Barrido de saldos: lote {metricas['lotes']}/{total_lotes}, "
+            f"{metricas['notificaciones']}/{len(ids)} notificaciones"
+        )
+    
+    metricas['segundos'] = round(time.monotonic() - inicio, 3)
+    return metricas
+
+
+def asignar_ids_notificaciones(notificaciones, ultimo_id):
+    """
+    Completa los ids tras bulk_create en motores sin RETURNING (MySQL)
+    
+    Las tarjetas del lote están bloqueadas, así que su única notificación
+    con id mayor al último previo es la recién creada.
+    """
+    from gestion.models import NotificacionSaldo
+    
+    sin_id = {n.nro_tarjeta_id: n for n in notificaciones if n.pk is None}
+    if not sin_id:
+        return
+    for id_notificacion, nro_tarjeta in NotificacionSaldo.objects.filter(
+        nro_tarjeta__in=list(sin_id),
+        id_notificacion__gt=ultimo_id,
+    ).order_by('id_notificacion').values_list('id_notificacion', 'nro_tarjeta'):
+        sin_id[nro_tarjeta].pk = id_notificacion
+
+
 def notificar_regularizacion_saldo(tarjeta, carga_saldo):
     """
     Notifica cuando se regulariza un saldo negativo
@@ -156,17 +364,7 @@ def notificar_regularizacion_saldo(tarjeta, carga_saldo):
     cliente = hijo.id_cliente_responsable
     
     # Obtener email
-    email_padre = None
-    try:
-        from gestion.models import UsuariosWebClientes
-        usuario_web = UsuariosWebClientes.objects.filter(
-            id_cliente=cliente,
-            activo=True
-        ).first()
-        if usuario_web:
-            email_padre = usuario_web.email
-    except:
-        pass
+    email_padre, _ = contacto_responsable(cliente)
     
     mensaje = f"""
     ✅ Saldo Regularizado
@@ -174,7 +372,7 @@ def notificar_regularizacion_saldo(tarjeta, carga_saldo):
     La tarjeta de {hijo.nombre_completo} ha sido regularizada.
     
     Tarjeta: {tarjeta.nro_tarjeta}
-    Recarga: ₲ {carga_saldo.monto:,}
+    Recarga: ₲ {carga_saldo.monto_cargado:,}
     Nuevo Saldo: ₲ {tarjeta.saldo_actual:,}
     
     Gracias por su pago.
@@ -191,21 +389,15 @@ def notificar_regularizacion_saldo(tarjeta, carga_saldo):
         email_destinatario=email_padre
     )
     
-    # Enviar email
+    # Encolar email (se entrega después del commit de la recarga)
     if email_padre and settings.EMAIL_HOST:
-        try:
-            send_mail(
-                subject='Cantina Tita - Saldo Regularizado',
-                message=mensaje,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[email_padre],
-                fail_silently=True
-            )
-            notificacion.enviada_email = True
-            notificacion.fecha_envio = timezone.now()
-            notificacion.save()
-        except:
-            pass
+        BandejaSalida.encolar(
+            MensajeSaliente.CANAL_EMAIL,
+            email_padre,
+            mensaje,
+            asunto='Cantina Tita - Saldo Regularizado',
+            notificacion=notificacion
+        )
     
     return notificacion
 
@@ -229,50 +421,34 @@ def obtener_notificaciones_pendientes(cliente):
     return notificaciones
 
 
-def enviar_notificacion_whatsapp(telefono, tipo, tarjeta, estudiante, saldo):
+def mensaje_whatsapp_saldo(tipo, tarjeta, estudiante, saldo):
     """
-    Enviar notificación de saldo por WhatsApp con botones de acción
+    Texto de la notificación de saldo por WhatsApp con enlaces de acción
     
     Args:
-        telefono: Número de WhatsApp del padre
         tipo: Tipo de notificación (SALDO_BAJO, SALDO_NEGATIVO, etc.)
         tarjeta: Número de tarjeta
         estudiante: Nombre del estudiante
         saldo: Saldo actual
-    
-    Returns:
-        bool: True si se envió correctamente
     """
-    try:
-        from gestion.whatsapp_client import WhatsAppWebClient
-        
-        # Crear cliente WhatsApp
-        client = WhatsAppWebClient()
-        
-        # Verificar conexión
-        if not client.check_status():
-            logger.warning("WhatsApp no está conectado, saltando notificación")
-            return False
-        
-        # Preparar mensaje según tipo
-        if tipo == 'SALDO_BAJO':
-            emoji = '⚠️'
-            titulo = 'Saldo Bajo'
-            descripcion = f'El saldo de la tarjeta está bajo. Le recomendamos recargar pronto.'
-            urgencia = ''
-        elif tipo == 'SALDO_NEGATIVO':
-            emoji = '🚨'
-            titulo = 'Saldo Negativo'
-            descripcion = f'La tarjeta tiene saldo negativo. Por favor regularice a la brevedad.'
-            urgencia = '\n⚠️ *URGENTE:* Regularice el saldo lo antes posible.'
-        else:  # REGULARIZADO
-            emoji = '✅'
-            titulo = 'Saldo Regularizado'
-            descripcion = f'El saldo de la tarjeta ha sido regularizado exitosamente.'
-            urgencia = ''
-        
-        # Construir mensaje con formato WhatsApp
-        mensaje = f"""{emoji} *{titulo} - Cantina Tita*
+    if tipo == 'SALDO_BAJO':
+        emoji = '⚠️'
+        titulo = 'Saldo Bajo'
+        descripcion = f'El saldo de la tarjeta está bajo. Le recomendamos recargar pronto.'
+        urgencia = ''
+    elif tipo == 'SALDO_NEGATIVO':
+        emoji = '🚨'
+        titulo = 'Saldo Negativo'
+        descripcion = f'La tarjeta tiene saldo negativo. Por favor regularice a la brevedad.'
+        urgencia = '\n⚠️ *URGENTE:* Regularice el saldo lo antes posible.'
+    else:  # REGULARIZADO
+        emoji = '✅'
+        titulo = 'Saldo Regularizado'
+        descripcion = f'El saldo de la tarjeta ha sido regularizado exitosamente.'
+        urgencia = ''
+    
+    # Construir mensaje con formato WhatsApp
+    return f"""{emoji} *{titulo} - Cantina Tita*
 
 *Estudiante:* {estudiante}
 *Tarjeta:* {tarjeta}
@@ -286,9 +462,33 @@ def enviar_notificacion_whatsapp(telefono, tipo, tarjeta, estudiante, saldo):
 • 📞 Contactar cantina: {getattr(settings, 'CANTITA_WHATSAPP_CONTACTO', '+595981234567')}
 
 _Este es un mensaje automático del sistema de gestión de Cantina Tita._"""
+
+
+def enviar_notificacion_whatsapp(telefono, tipo, tarjeta, estudiante, saldo):
+    """
+    Enviar notificación de saldo por WhatsApp en el momento (sin bandeja)
+    
+    Las alertas de venta/recarga usan BandejaSalida; esta función queda para
+    envíos manuales desde el shell o el admin.
+    
+    Returns:
+        bool: True si se envió correctamente
+    """
+    try:
+        from gestion.whatsapp_client import WhatsAppWebClient
+        
+        # Crear cliente WhatsApp
+        client = WhatsAppWebClient()
+        
+        # Verificar conexión
+        if not client.check_status():
+            logger.warning("WhatsApp no está conectado, saltando notificación")
+            return False
         
         # Enviar mensaje
-        enviado = client.send_message(telefono, mensaje)
+        enviado = client.send_message(
+            telefono, mensaje_whatsapp_saldo(tipo, tarjeta, estudiante, saldo)
+        )
         
         if enviado:
             logger.info(f"✅ Notificación WhatsApp enviada a {telefono}: {tipo}")
@@ -300,4 +500,3 @@ _Este es un mensaje automático del sistema de gestión de Cantina Tita._"""
     except Exception as e:
         logger.error(f"Error enviando notificación WhatsApp: {e}")
         return False
-
@@ -0,0 +1,91 @@
+"""
+Asignación de numeración fiscal por timbrado
+=============================================
+
+Reemplaza el cálculo "último nro_secuencial + 1" de procesar_venta (un
+ORDER BY sobre documentos_tributarios por venta, con carrera entre cajeros
+concurrentes) por un contador por timbrado en la tabla secuencias_timbrado.
+
+Cada asignación es un SELECT ... FOR UPDATE por clave primaria más un UPDATE
+de la misma fila, dentro de la transacción de la venta:
+
+- O(1): no depende de cuántos documentos tenga el timbrado
+- Sin duplicados: el bloqueo de fila serializa a los cajeros del mismo timbrado
+- Sin huecos: si la venta hace rollback el contador vuelve con ella
+"""
+
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+
+from .models import DocumentosTributarios, SecuenciaTimbrado, Timbrados
+
+
+class TimbradoAgotadoError(Exception):
+    """El timbrado ya asignó su nro_final"""
+    pass
+
+
+class AsignadorSecuencial:
+    """Entrega el siguiente nro_secuencial de un timbrado"""
+
+    @staticmethod
+    def siguiente(timbrado: Timbrados) -> int:
+        """
+        Reserva el siguiente número del timbrado
+
+        Debe ejecutarse dentro de la transacción que crea el
+        DocumentosTributarios: el bloqueo de la fila del contador se
+        mantiene hasta el commit, y si la transacción se revierte el
+        número vuelve a quedar disponible.
+
+        Args:
+            timbrado: Timbrado del que se emite el documento
+
+        Returns:
+            nro_secuencial asignado
+
+        Raises:
+            TimbradoAgotadoError: Si se superaría el nro_final del timbrado
+        """
+        with transaction.atomic():
+            secuencia = AsignadorSecuencial._bloquear(timbrado)
+
+            nuevo_secuencial = secuencia.ultimo_secuencial + 1
+            if nuevo_secuencial > timbrado.nro_final:
+                raise TimbradoAgotadoError(
+                    f'El timbrado {timbrado.nro_timbrado} alcanzó su número final ({timbrado.nro_final})'
+                )
+
+            secuencia.ultimo_secuencial = nuevo_secuencial
+            secuencia.save(update_fields=['ultimo_secuencial', 'fecha_actualizacion'])
+
+        return nuevo_secuencial
+
+    @staticmethod
+    def _bloquear(timbrado: Timbrados) -> SecuenciaTimbrado:
+        """Obtiene la fila del contador con bloqueo, creándola si no existe"""
+        secuencia = SecuenciaTimbrado.objects.select_for_update().filter(
+            nro_timbrado=timbrado
+        ).first()
+        if secuencia is not None:
+            return secuencia
+
+        # Primera factura con este timbrado desde que existe el contador:
+        # se parte del último documento ya emitido o del nro_inicial
+        ultimo = DocumentosTributarios.objects.filter(
+            nro_timbrado=timbrado
+        ).aggregate(ultimo=Max('nro_secuencial'))['ultimo']
+        if ultimo is None:
+            ultimo = max(timbrado.nro_inicial, 1) - 1
+
+        try:
+            with transaction.atomic():
+                SecuenciaTimbrado.objects.create(
+                    nro_timbrado=timbrado,
+                    ultimo_secuencial=ultimo
+                )
+        except IntegrityError:
+            # Otro cajero creó el contador al mismo tiempo
+            pass
+
+        return SecuenciaTimbrado.objects.select_for_update().get(nro_timbrado=timbrado)
@@ -1,12 +1,22 @@
 """
 Sistema de control de acceso basado en roles (RBAC)
 Decoradores y utilidades para gestionar permisos por rol
+
+El rol de cada usuario se resuelve con CacheRoles: una vez por request
+(queda guardado en request.user, así que decoradores, context processor y
+permisos de la API comparten el resultado) y entre requests en memoria del
+proceso, invalidado al guardar o eliminar un Empleado o un TipoRolGeneral
+(signals.py).
 """
 from functools import wraps
+from typing import Optional
+
 from django.shortcuts import redirect
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 
+from .cache_referencia import AlmacenVersionado
+
 # Constantes de roles
 ROL_CAJERO = 'CAJERO'
 ROL_GERENTE = 'GERENTE'
@@ -22,14 +32,52 @@ JERARQUIA_ROLES = {
 }
 
 
+class CacheRoles:
+    """Rol (nombre_rol) de cada usuario empleado activo"""
+    
+    CLAVE_VERSION = 'rbac:roles:version'
+    # Atributo del usuario del request donde queda el rol resuelto
+    ATRIBUTO_USUARIO = '_rol_empleado'
+    
+    _almacen = AlmacenVersionado(CLAVE_VERSION)
+    
+    @staticmethod
+    def rol(username: str) -> Optional[str]:
+        """Rol del empleado activo con ese usuario (None si no es empleado)"""
+        from gestion.models import Empleado
+        
+        return CacheRoles._almacen.obtener(
+            username,
+            lambda: Empleado.objects.filter(
+                usuario=username, activo=True
+            ).values_list('id_rol__nombre_rol', flat=True).first()
+        )
+    
+    @staticmethod
+    def invalidar():
+        """Descarta los roles cacheados en todos los procesos"""
+        CacheRoles._almacen.invalidar()
+    
+    @staticmethod
+    def limpiar_local():
+        """Limpia sólo la copia de este proceso (tests, shell)"""
+        CacheRoles._almacen.limpiar_local()
+
+
 def obtener_rol_empleado(user):
     """Obtiene el rol del empleado autenticado"""
-    try:
-        from gestion.models import Empleado
-        empleado = Empleado.objects.select_related('id_rol').get(usuario=user.username, activo=True)
-        return empleado.id_rol.nombre_rol
-    except Empleado.DoesNotExist:
+    if not getattr(user, 'is_authenticated', False):
         return None
+    
+    # Memo del request: request.user es el mismo objeto durante todo el request
+    try:
+        return getattr(user, CacheRoles.ATRIBUTO_USUARIO)
+    except AttributeError:
+        pass
+    
+    rol = CacheRoles.rol(user.username)
+    setattr(user, CacheRoles.ATRIBUTO_USUARIO, rol)
+    return rol
 
 
 def tiene_permiso(user, roles_permitidos):
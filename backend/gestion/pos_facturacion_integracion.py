@@ -21,6 +21,7 @@ from .models import MediosPago
 from pos.models import Venta as Ventas
 from .facturacion_electronica import GeneradorXMLFactura, ClienteEkuatia
 from .pos_general_views import imprimir_ticket_venta
+from .ratelimit_utils import ratelimit_venta
 
 # Métodos de pago que PERMITEN facturación electrónica
 MEDIOS_PAGO_CON_FACTURA_ELECTRONICA = [
@@ -457,6 +458,7 @@ class IntegradorPOSFacturacion:
 
 
 @require_http_methods(["POST"])
+@ratelimit_venta
 @transaction.atomic
 def procesar_venta_con_factura_api(request):
     """
@@ -39,7 +39,8 @@ from .models import (
     TarifasComision, DetalleComisionVenta, CierresCaja,
     RestriccionesHijos, ProductoAlergeno
 )
-from .restricciones_matcher import verificar_restricciones_venta
+from .restricciones_matcher import MatrizConflictos, verificar_restricciones_venta
+from .ratelimit_utils import ratelimit_venta
 
 
 @require_http_methods(["GET"])
@@ -309,44 +310,49 @@ def verificar_restricciones_carrito_api(request):
                 'error': 'Hijo no encontrado'
             }, status=404)
         
+        # in_bulk devuelve claves int: los ids del JSON ("5" o 5) se normalizan antes
+        try:
+            ids_carrito = [int(item['id_producto']) for item in productos if item.get('id_producto')]
+        except (TypeError, ValueError):
+            return JsonResponse({
+                'success': False,
+                'error': 'ID de producto inválido'
+            }, status=400)
+        
         # Verificar restricciones para cada producto
         alertas = []
         
-        for item in productos:
-            id_producto = item.get('id_producto')
-            producto = Producto.objects.filter(id_producto=id_producto).first()
+        # Usar la matriz de conflictos: una consulta para todo el carrito
+        restricciones_hijo = list(RestriccionesHijos.objects.filter(
+            id_hijo=hijo,
+            activo=True
+        ))
+        productos_carrito = Producto.objects.in_bulk(ids_carrito)
+        conflictos = MatrizConflictos.conflictos(productos_carrito.keys(), restricciones_hijo)
+        
+        for id_producto in ids_carrito:
+            producto = productos_carrito.get(id_producto)
             
             if not producto:
                 continue
             
-            # Usar función de matching automático para verificar restricciones
-            restricciones_hijo = RestriccionesHijos.objects.filter(
-                id_hijo=hijo,
-                activo=True
-            )
-            
-            for restriccion in restricciones_hijo:
-                tiene_conflicto, razon, confianza = ProductoRestriccionMatcher.analizar_producto(
-                    producto, restriccion
-                )
+            for restriccion, confianza, razon in conflictos.get(producto.id_producto, []):
+                # Determinar severidad (de baja a alta según confianza)
+                if confianza >= 90:
+                    severidad = 'ALTA'
+                elif confianza >= 70:
+                    severidad = 'MEDIA'
+                else:
+                    severidad = 'BAJA'
                 
-                if tiene_conflicto:
-                    # Determinar severidad (de baja a alta según confianza)
-                    if confianza >= 90:
-                        severidad = 'ALTA'
-                    elif confianza >= 70:
-                        severidad = 'MEDIA'
-                    else:
-                        severidad = 'BAJA'
-                    
-                    alertas.append({
-                        'id_producto': producto.id_producto,
-                        'nombre_producto': producto.descripcion,
-                        'restriccion': restriccion.tipo_restriccion,
-                        'severidad': severidad,
-                        'razon': razon,
-                        'confianza': confianza
-                    })
+                alertas.append({
+                    'id_producto': producto.id_producto,
+                    'nombre_producto': producto.descripcion,
+                    'restriccion': restriccion.tipo_restriccion,
+                    'severidad': severidad,
+                    'razon': razon,
+                    'confianza': confianza
+                })
         
         return JsonResponse({
             'success': True,
@@ -367,8 +373,7 @@ def verificar_restricciones_carrito_api(request):
 
 
 @require_http_methods(["POST"])
-@transaction.atomic
-@require_http_methods(["POST"])
+@ratelimit_venta
 @transaction.atomic
 def procesar_venta_api(request):
     """
@@ -510,60 +515,57 @@ def procesar_venta_api(request):
         
         # VALIDAR RESTRICCIONES ALIMENTARIAS si existe hijo
         if hijo:
-            from gestion.restricciones_matcher import ProductoRestriccionMatcher
             from gestion.models import RestriccionesHijos
             
             # Obtener restricciones del hijo
-            restricciones_hijo = RestriccionesHijos.objects.filter(
+            restricciones_hijo = list(RestriccionesHijos.objects.filter(
                 id_hijo=hijo,
                 activo=True
-            )
+            ))
             
             # Si tiene restricciones, validar todos los productos
-            if restricciones_hijo.exists():
+            if restricciones_hijo:
                 alertas_restricciones = []
+                conflictos = MatrizConflictos.conflictos(
+                    [detalle['producto'].id_producto for detalle in detalles_venta], restricciones_hijo
+                )
                 
                 for detalle in detalles_venta:
                     producto = detalle['producto']
                     
-                    for restriccion in restricciones_hijo:
-                        tiene_conflicto, razon, confianza = ProductoRestriccionMatcher.analizar_producto(
-                            producto, restriccion
-                        )
+                    for restriccion, confianza, razon in conflictos.get(producto.id_producto, []):
+                        # Determinar severidad según confianza
+                        if confianza >= 90:
+                            severidad = 'ALTA'
+                        elif confianza >= 70:
+                            severidad = 'MEDIA'
+                        else:
+                            severidad = 'BAJA'
+                        
+                        # Si es severidad ALTA, bloquear la venta
+                        if severidad == 'ALTA':
+                            return JsonResponse({
+                                'success': False,
+                                'error': f'ALERTA DE RESTRICCIÓN ALTA: {producto.descripcion} contiene {restriccion.tipo_restriccion}. Razón: {razon}. Requiere autorización.',
+                                'tipo': 'restriccion_bloqueada',
+                                'restriccion': {
+                                    'producto': producto.descripcion,
+                                    'tipo': restriccion.tipo_restriccion,
+                                    'severidad': severidad,
+                                    'razon': razon,
+                                    'confianza': confianza
+                                }
+                            }, status=403)
                         
-                        if tiene_conflicto:
-                            # Determinar severidad según confianza
-                            if confianza >= 90:
-                                severidad = 'ALTA'
-                            elif confianza >= 70:
-                                severidad = 'MEDIA'
-                            else:
-                                severidad = 'BAJA'
-                            
-                            # Si es severidad ALTA, bloquear la venta
-                            if severidad == 'ALTA':
-                                return JsonResponse({
-                                    'success': False,
-                                    'error': f'ALERTA DE RESTRICCIÓN ALTA: {producto.descripcion} contiene {restriccion.tipo_restriccion}. Razón: {razon}. Requiere autorización.',
-                                    'tipo': 'restriccion_bloqueada',
-                                    'restriccion': {
-                                        'producto': producto.descripcion,
-                                        'tipo': restriccion.tipo_restriccion,
-                                        'severidad': severidad,
-                                        'razon': razon,
-                                        'confianza': confianza
-                                    }
-                                }, status=403)
-                            
-                            # Alertas de severidad MEDIA/BAJA
-                            alertas_restricciones.append({
-                                'id_producto': producto.id_producto,
-                                'nombre_producto': producto.descripcion,
-                                'restriccion': restriccion.tipo_restriccion,
-                                'severidad': severidad,
-                                'razon': razon,
-                                'confianza': confianza
-                            })
+                        # Alertas de severidad MEDIA/BAJA
+                        alertas_restricciones.append({
+                            'id_producto': producto.id_producto,
+                            'nombre_producto': producto.descripcion,
+                            'restriccion': restriccion.tipo_restriccion,
+                            'severidad': severidad,
+                            'razon': razon,
+                            'confianza': confianza
+                        })
                 
                 # Si hay alertas, devolver para confirmación
                 if alertas_restricciones:
@@ -13,8 +13,8 @@ from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 import json
 
-from .models import Producto, Hijo, RestriccionesHijos
-from .restricciones_matcher import ProductoRestriccionMatcher
+from .catalogo_seguro import CatalogoSeguro
+from .models import Hijo, RestriccionesHijos
 from .pos_utils import VerificadorRestricciones
 
 
@@ -64,61 +64,22 @@ def sugerir_productos_seguros(request):
             }, status=404)
         
         # Obtener restricciones
-        restricciones = RestriccionesHijos.objects.filter(
+        restricciones = list(RestriccionesHijos.objects.filter(
             id_hijo=hijo,
             activo=True
-        )
+        ))
         
-        productos_recomendados = []
-        
-        # Base de productos a considerar
-        query = Producto.objects.filter(activo=True)
-        
-        if solo_stock:
-            query = query.select_related('stock').filter(stock__stock_actual__gt=0)
-        
-        for producto in query[:100]:
-            es_seguro = True
-            razon = "Sin restricciones detectadas"
-            
-            # Verificar cada restricción
-            for restriccion in restricciones:
-                tiene_conflicto, razon_conflicto, confianza = \
-                    ProductoRestriccionMatcher.analizar_producto(
-                        producto, restriccion
-                    )
-                
-                if tiene_conflicto:
-                    es_seguro = False
-                    razon = f"⚠️ {restriccion.tipo_restriccion}: {razon_conflicto}"
-                    break
-            
-            if es_seguro:
-                stock_actual = producto.stock.stock_actual if hasattr(producto, 'stock') else 0
-                
-                # Obtener precio de venta
-                precio_producto = producto.precios.filter(
-                    id_lista_precio__activo=True
-                ).order_by('-id_lista_precio__fecha_vigencia').first()
-                
-                precio_venta = precio_producto.precio_venta if precio_producto else 0
-                
-                productos_recomendados.append({
-                    'id': producto.id_producto,
-                    'descripcion': producto.descripcion,
-                    'precio_venta': int(precio_venta),
-                    'stock_actual': float(stock_actual),
-                    'razon_recomendacion': razon
-                })
-                
-                if len(productos_recomendados) >= limite:
-                    break
+        # Catálogo seguro compartido por los hijos con las mismas restricciones
+        productos_recomendados = [
+            dict(producto, razon_recomendacion="Sin restricciones detectadas")
+            for producto in CatalogoSeguro.recomendar(restricciones, limite, solo_stock)
+        ]
         
         return JsonResponse({
             'success': True,
             'productos': productos_recomendados,
             'total': len(productos_recomendados),
-            'tiene_restricciones': restricciones.exists()
+            'tiene_restricciones': bool(restricciones)
         })
         
     except json.JSONDecodeError:
@@ -178,16 +139,8 @@ def obtener_detalles_restriccion(request):
                 'error': 'Restricción no encontrada'
             }, status=404)
         
-        # Contar productos con alerta
-        hijo = Hijo.objects.get(id_hijo=id_hijo)
-        productos_alerta = 0
-        
-        for producto in Producto.objects.filter(activo=True)[:50]:
-            tiene_conflicto, _, _ = ProductoRestriccionMatcher.analizar_producto(
-                producto, restriccion
-            )
-            if tiene_conflicto:
-                productos_alerta += 1
+        # Contar productos con alerta (catálogos seguros cacheados)
+        productos_alerta = CatalogoSeguro.productos_con_alerta(restriccion)
         
         return JsonResponse({
             'success': True,
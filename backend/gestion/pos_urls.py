@@ -1,6 +1,8 @@
 from django.urls import path
 from . import pos_views_basicas as pos_views_basicas
 from . import pos_views
+from . import impresion_views
+from . import dashboard_saldos_views
 
 app_name = 'pos'
 
@@ -29,4 +31,14 @@ urlpatterns = [
     path('almuerzos/registro/', pos_views.registro_consumo_almuerzo_view, name='registro_consumo_almuerzo_view'),
     path('almuerzos/suscripciones/', pos_views.suscripciones_almuerzo_view, name='suscripciones_almuerzo_view'),
     path('almuerzos/reportes/', pos_views.reportes_almuerzos_view, name='reportes_almuerzos_view'),
+    
+    # Saldos de tarjetas en tiempo real (feed incremental y SSE)
+    path('saldos/tiempo-real/api/', dashboard_saldos_views.api_saldos_tiempo_real, name='api_saldos_tiempo_real'),
+    path('saldos/tiempo-real/stream/', dashboard_saldos_views.stream_saldos_tiempo_real, name='stream_saldos_tiempo_real'),
+    
+    # Cola de impresión de tickets
+    path('impresion/estado/', impresion_views.estado_cola_impresion, name='estado_cola_impresion'),
+    path('impresion/drenar/', impresion_views.drenar_cola_impresion, name='drenar_cola_impresion'),
+    path('impresion/trabajos/<int:trabajo_id>/reintentar/', impresion_views.reintentar_trabajo_impresion, name='reintentar_trabajo_impresion'),
+    path('impresion/ventas/<int:venta_id>/reimprimir/', impresion_views.reimprimir_ticket_venta, name='reimprimir_ticket_venta'),
 ]
\ No newline at end of file
@@ -17,7 +17,7 @@ from .models import (
     Producto, Tarjeta, RestriccionesHijos, Hijo, 
     MediosPago, TarifasComision
 )
-from .restricciones_matcher import ProductoRestriccionMatcher
+from .restricciones_matcher import MatrizConflictos
 from django.utils import timezone
 
 
@@ -168,55 +168,60 @@ class VerificadorRestricciones:
                 ],
                 'confianza_promedio': float
             }
+        
+        Raises:
+            ValueError: Si un id_producto no es numérico
         """
         alertas = []
         confianzas = []
         
         # Obtener restricciones del hijo
-        restricciones = RestriccionesHijos.objects.filter(
+        restricciones = list(RestriccionesHijos.objects.filter(
             id_hijo=hijo,
             activo=True
-        )
+        ))
         
-        if not restricciones.exists():
+        if not restricciones:
             return {
                 'tiene_alertas': False,
                 'alertas': [],
                 'confianza_promedio': 100
             }
         
-        for item in productos:
-            try:
-                producto = Producto.objects.get(id_producto=item['id_producto'])
-                
-                for restriccion in restricciones:
-                    tiene_conflicto, razon, confianza = \
-                        ProductoRestriccionMatcher.analizar_producto(
-                            producto, restriccion
-                        )
-                    
-                    if tiene_conflicto:
-                        confianzas.append(confianza)
-                        
-                        # Determinar severidad
-                        if confianza >= 90:
-                            severidad = 'ALTA'
-                        elif confianza >= 70:
-                            severidad = 'MEDIA'
-                        else:
-                            severidad = 'BAJA'
-                        
-                        alertas.append({
-                            'id_producto': producto.id_producto,
-                            'nombre_producto': producto.descripcion,
-                            'restriccion': restriccion.tipo_restriccion,
-                            'severidad': severidad,
-                            'razon': razon,
-                            'confianza': confianza
-                        })
-                        
-            except Producto.DoesNotExist:
+        # in_bulk devuelve claves int: los ids del JSON ("5" o 5) se normalizan antes
+        try:
+            ids_carrito = [int(item['id_producto']) for item in productos]
+        except (TypeError, ValueError):
+            raise ValueError('ID de producto inválido en el carrito')
+        
+        # Productos y conflictos de todo el carrito en dos consultas
+        productos_carrito = Producto.objects.in_bulk(ids_carrito)
+        conflictos = MatrizConflictos.conflictos(productos_carrito.keys(), restricciones)
+        
+        for id_producto in ids_carrito:
+            producto = productos_carrito.get(id_producto)
+            if producto is None:
                 continue
+            
+            for restriccion, confianza, razon in conflictos.get(producto.id_producto, []):
+                confianzas.append(confianza)
+                
+                # Determinar severidad
+                if confianza >= 90:
+                    severidad = 'ALTA'
+                elif confianza >= 70:
+                    severidad = 'MEDIA'
+                else:
+                    severidad = 'BAJA'
+                
+                alertas.append({
+                    'id_producto': producto.id_producto,
+                    'nombre_producto': producto.descripcion,
+                    'restriccion': restriccion.tipo_restriccion,
+                    'severidad': severidad,
+                    'razon': razon,
+                    'confianza': confianza
+                })
         
         confianza_promedio = (sum(confianzas) / len(confianzas)) if confianzas else 100
         
@@ -241,12 +246,12 @@ class VerificadorRestricciones:
         Returns:
             QuerySet de Productos
         """
-        restricciones = RestriccionesHijos.objects.filter(
+        restricciones = list(RestriccionesHijos.objects.filter(
             id_hijo=hijo,
             activo=True
-        )
+        ))
         
-        if not restricciones.exists():
+        if not restricciones:
             # Sin restricciones, retornar productos en stock
             return Producto.objects.filter(
                 activo=True
@@ -254,29 +259,10 @@ class VerificadorRestricciones:
                 stock__stock_actual__gt=0
             )[:limite]
         
-        # Productos que no generan alertas
-        productos_seguros = []
-        
-        for producto in Producto.objects.filter(activo=True)[:100]:
-            es_seguro = True
-            
-            for restriccion in restricciones:
-                tiene_conflicto, _, _ = \
-                    ProductoRestriccionMatcher.analizar_producto(
-                        producto, restriccion
-                    )
-                
-                if tiene_conflicto:
-                    es_seguro = False
-                    break
-            
-            if es_seguro:
-                productos_seguros.append(producto.id_producto)
-                
-                if len(productos_seguros) >= limite:
-                    break
-        
-        return Producto.objects.filter(id_producto__in=productos_seguros)
+        # Productos que no generan alertas (filtro por máscara en la matriz)
+        return MatrizConflictos.filtrar_seguros(
+            Producto.objects.filter(activo=True), restricciones
+        )[:limite]
 
 
 class GeneradorAlertas:
@@ -0,0 +1,183 @@
+"""
+Registro de detalles de venta en lote para el POS
+==================================================
+
+Reemplaza el ciclo ítem por ítem de procesar_venta (un SELECT de producto,
+un INSERT de detalle y un UPDATE de stock por cada línea) por un número
+constante de queries por venta:
+
+1. Un SELECT de todos los productos del carrito
+2. Un INSERT con bulk_create de todos los DetalleVenta
+3. Un UPDATE set-based que descuenta el stock de todos los productos
+
+Así la latencia de la venta (y el tiempo que la tarjeta queda bloqueada
+con select_for_update) no crece con el tamaño del carrito.
+"""
+
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List, Optional
+
+from django.core.exceptions import ValidationError
+from django.db.models import Case, DecimalField, F, Value, When
+from django.utils import timezone
+
+from pos.models import DetalleVenta
+from .models import Producto, StockUnico
+from .alertas_stock import MotorAlertasStock
+
+
+class LineaVenta:
+    """Línea normalizada del carrito (un producto, cantidad y precio)"""
+
+    __slots__ = ('id_producto', 'cantidad', 'precio', 'subtotal', 'descripcion')
+
+    def __init__(self, id_producto: int, cantidad: Decimal, precio: Decimal, descripcion: str = ''):
+        self.id_producto = id_producto
+        self.cantidad = cantidad
+        self.precio = precio
+        self.subtotal = precio * cantidad
+        self.descripcion = descripcion
+
+    def acumular(self, cantidad: Decimal, precio: Decimal):
+        """
+        Suma otra línea del mismo producto (detalle_venta es único por venta+producto)
+
+        Las dos líneas deben tener el mismo precio: el detalle guarda un solo
+        precio_unitario y tiene que cumplir precio_unitario * cantidad = subtotal.
+        """
+        if precio != self.precio:
+            raise ValidationError(
+                f'El producto {self.id_producto} aparece con precios distintos ({self.precio} y {precio})'
+            )
+        self.cantidad += cantidad
+        self.subtotal += precio * cantidad
+
+
+class RegistradorVentaLote:
+    """Escribe los detalles y descuenta el stock de una venta en lote"""
+
+    @staticmethod
+    def normalizar_items(items: List[Dict]) -> List[LineaVenta]:
+        """
+        Convierte los items del carrito (JSON del POS) en líneas de venta
+
+        Los productos repetidos se agrupan en una sola línea porque
+        detalle_venta tiene unique_together (id_venta, id_producto).
+
+        Args:
+            items: Lista de dicts con id, price, quantity o peso/esPorKilo
+
+        Returns:
+            Lista de LineaVenta en el orden en que aparecen en el carrito
+        """
+        lineas: Dict[int, LineaVenta] = {}
+
+        for item in items:
+            try:
+                id_producto = int(item['id'])
+                if item.get('esPorKilo'):
+                    cantidad = Decimal(str(item.get('peso', 1)))
+                else:
+                    cantidad = Decimal(str(item.get('quantity', 1)))
+                precio = Decimal(str(item['price']))
+            except (KeyError, TypeError, ValueError, InvalidOperation):
+                raise ValidationError(f'Ítem de carrito inválido: {item}')
+
+            if cantidad <= 0:
+                raise ValidationError(f'La cantidad debe ser mayor a 0 (producto {id_producto})')
+            # Precio 0 es válido (promociones, regalos)
+            if precio < 0:
+                raise ValidationError(f'El precio unitario no puede ser negativo (producto {id_producto})')
+
+            if id_producto in lineas:
+                lineas[id_producto].acumular(cantidad, precio)
+            else:
+                lineas[id_producto] = LineaVenta(
+                    id_producto, cantidad, precio, item.get('name', '')
+                )
+
+        return list(lineas.values())
+
+    @staticmethod
+    def registrar(venta, items: List[Dict], lineas: Optional[List[LineaVenta]] = None) -> List[DetalleVenta]:
+        """
+        Registra los detalles de la venta y descuenta el stock
+
+        Debe ejecutarse dentro de la transacción de la venta.
+        Los productos inexistentes se omiten (mismo comportamiento que
+        el ciclo anterior de procesar_venta).
+
+        Args:
+            venta: Instancia de pos.models.Venta ya guardada
+            items: Items del carrito tal como llegan del POS
+            lineas: Líneas ya normalizadas (opcional, evita normalizar dos veces)
+
+        Returns:
+            Lista de DetalleVenta creados
+        """
+        if lineas is None:
+            lineas = RegistradorVentaLote.normalizar_items(items)
+        if not lineas:
+            return []
+
+        # 1 query: todos los productos del carrito
+        productos = Producto.objects.in_bulk(
+            [linea.id_producto for linea in lineas]
+        )
+        lineas = [linea for linea in lineas if linea.id_producto in productos]
+        if not lineas:
+            return []
+
+        # 1 query: todos los detalles de la venta
+        detalles = [
+            DetalleVenta(
+                id_venta=venta,
+                id_producto=productos[linea.id_producto],
+                cantidad=linea.cantidad,
+                precio_unitario=int(linea.precio),
+                subtotal_total=int(linea.subtotal),
+            )
+            for linea in lineas
+        ]
+        DetalleVenta.objects.bulk_create(detalles)
+
+        # 1 query: descuento de stock set-based
+        cantidades = {linea.id_producto: linea.cantidad for linea in lineas}
+        RegistradorVentaLote.descontar_stock(cantidades)
+        # update() no dispara signals: las alertas se evalúan al confirmar la venta
+        MotorAlertasStock.marcar(cantidades.keys())
+
+        return detalles
+
+    @staticmethod
+    def descontar_stock(cantidades: Dict[int, Decimal]) -> int:
+        """
+        Descuenta stock de varios productos con un único UPDATE
+
+        UPDATE stock_unico SET cantidad = cantidad - CASE id_producto ... END
+        WHERE id_producto IN (...)
+
+        Args:
+            cantidades: {id_producto: cantidad a descontar}
+
+        Returns:
+            Cantidad de filas de stock actualizadas
+        """
+        if not cantidades:
+            return 0
+
+        descuento = Case(
+            *[
+                When(id_producto_id=id_producto, then=Value(cantidad))
+                for id_producto, cantidad in cantidades.items()
+            ],
+            default=Value(Decimal('0')),
+            output_field=DecimalField(max_digits=10, decimal_places=3),
+        )
+        return StockUnico.objects.filter(
+            id_producto_id__in=list(cantidades.keys())
+        ).update(
+            cantidad=F('cantidad') - descuento,
+            # update() no dispara auto_now
+            fecha_ultima_actualizacion=timezone.now(),
+        )
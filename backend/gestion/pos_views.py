@@ -9,6 +9,7 @@ from django.views.decorators.csrf import csrf_exempt
 from django.db.models import Q, F, Sum, Count
 from django.db import transaction, models
 from django.utils import timezone
+from django.core.exceptions import ValidationError
 from decimal import Decimal
 import json
 
@@ -25,6 +26,10 @@ from gestion.models import (
 )
 
 from gestion.seguridad_utils import registrar_auditoria
+from gestion.pos_venta_batch import RegistradorVentaLote
+from gestion.numeracion_fiscal import AsignadorSecuencial
+from gestion.cache_referencia import CacheReferencia, MapaPrecios
+from gestion.indice_productos import IndiceProductos
 from gestion.restricciones_utils import (
     analizar_restricciones_producto,
     analizar_carrito_completo
@@ -40,6 +45,7 @@ from gestion.promociones_utils import (
     registrar_promocion_aplicada
 )
 from gestion.permisos import acceso_cajero, solo_administrador, solo_gerente_o_superior
+from gestion.ratelimit_utils import ratelimit_recarga, ratelimit_venta
 
 
 import os
@@ -52,33 +58,15 @@ from django.core.files.base import ContentFile
 def venta_view(request):
     """Vista principal del POS"""
     # Obtener lista de precios por defecto (ID 1 o la primera)
-    try:
-        from gestion.models import ListaPrecios, PreciosPorLista
-        lista_precios = ListaPrecios.objects.filter(activo=True).first()
-    except:
-        lista_precios = None
+    lista_precios = CacheReferencia.lista_precios_default()
     
     # Obtener productos activos con stock y precios
     productos = Producto.objects.filter(
         activo=True
     ).select_related('id_categoria', 'stock').order_by('descripcion')[:50]
     
-    # Agregar precio de cada producto
-    for producto in productos:
-        if lista_precios:
-            try:
-                precio_obj = PreciosPorLista.objects.get(
-                    id_producto=producto,
-                    id_lista=lista_precios
-                )
-                producto.precio_actual = precio_obj.precio_unitario_neto
-            except PreciosPorLista.DoesNotExist:
-                producto.precio_actual = 0
-        else:
-            producto.precio_actual = 0
-        
-        # Marcar si es almuerzo por kilo
-        producto.es_por_kilo = 'KILO' in producto.descripcion.upper()
+    # Agregar precio y marca de almuerzo por kilo (desde MapaPrecios)
+    productos = MapaPrecios.anotar(productos, lista_precios)
     
     # Obtener tipos de pago disponibles
     tipos_pago = TiposPago.objects.filter(activo=True).order_by('descripcion')
@@ -100,39 +88,21 @@ def venta_view(request):
 @require_http_methods(["POST"])
 def buscar_productos(request):
     """Búsqueda de productos en tiempo real con HTMX"""
-    from gestion.models import ListaPrecios, PreciosPorLista
-    
     query = request.POST.get('q', '').strip()
     
-    # Obtener lista de precios
-    lista_precios = ListaPrecios.objects.filter(activo=True).first()
-    
     if query:
-        productos = Producto.objects.filter(
-            Q(descripcion__icontains=query) | Q(codigo_barra__icontains=query),
-            activo=True
-        ).select_related('id_categoria', 'stock').order_by('descripcion')[:30]
+        # Índice en memoria (prefijo/trigramas + código de barras exacto)
+        productos = IndiceProductos.cargar(
+            IndiceProductos.buscar(query, limite=30),
+            Producto.objects.select_related('id_categoria', 'stock')
+        )
     else:
         productos = Producto.objects.filter(
             activo=True
         ).select_related('id_categoria', 'stock').order_by('descripcion')[:50]
     
-    # Agregar precio actual desde la tabla de precios
-    for producto in productos:
-        if lista_precios:
-            try:
-                precio_obj = PreciosPorLista.objects.get(
-                    id_producto=producto,
-                    id_lista=lista_precios
-                )
-                producto.precio_actual = precio_obj.precio_unitario_neto
-            except PreciosPorLista.DoesNotExist:
-                producto.precio_actual = 0
-        else:
-            producto.precio_actual = 0
-        
-        # Marcar si es por kilo
-        producto.es_por_kilo = 'KILO' in producto.descripcion.upper()
+    # Agregar precio actual y marca por kilo (una query por lista, cacheada)
+    productos = MapaPrecios.anotar(productos)
     
     return render(request, 'pos/partials/productos_grid.html', {
         'productos': productos
@@ -145,10 +115,7 @@ def buscar_productos(request):
 @csrf_exempt
 def productos_por_categoria(request):
     """Filtrar productos por categoría"""
-    from gestion.models import ListaPrecios, PreciosPorLista
-    
     categoria = request.GET.get('categoria', 'todos')
-    lista_precios = ListaPrecios.objects.filter(activo=True).first()
     
     if categoria == 'todos':
         productos = Producto.objects.filter(activo=True)
@@ -160,21 +127,8 @@ def productos_por_categoria(request):
     
     productos = productos.select_related('id_categoria', 'stock').order_by('descripcion')[:50]
     
-    # Agregar precio actual
-    for producto in productos:
-        if lista_precios:
-            try:
-                precio_obj = PreciosPorLista.objects.get(
-                    id_producto=producto,
-                    id_lista=lista_precios
-                )
-                producto.precio_actual = precio_obj.precio_unitario_neto
-            except PreciosPorLista.DoesNotExist:
-                producto.precio_actual = 0
-        else:
-            producto.precio_actual = 0
-        
-        producto.es_por_kilo = 'KILO' in producto.descripcion.upper()
+    # Agregar precio actual y marca por kilo
+    productos = MapaPrecios.anotar(productos)
     
     return render(request, 'pos/partials/productos_grid.html', {
         'productos': productos
@@ -259,6 +213,7 @@ def buscar_tarjeta(request):
 @login_required
 @csrf_exempt
 @require_http_methods(["POST"])
+@ratelimit_venta
 @transaction.atomic
 @acceso_cajero
 def procesar_venta(request):
@@ -290,6 +245,15 @@ def procesar_venta(request):
                 'error': 'El carrito está vacío'
             })
         
+        # Validar y agrupar los items antes de tocar la base de datos
+        try:
+            lineas_venta = RegistradorVentaLote.normalizar_items(items)
+        except ValidationError as e:
+            return JsonResponse({
+                'success': False,
+                'error': e.messages[0]
+            })
+        
         # 💰 VALIDAR PAGOS MIXTOS si existen
         if pagos_mixtos:
             # Calcular comisión total en base al total de productos
@@ -318,61 +282,24 @@ def procesar_venta(request):
         try:
             empleado = Empleado.objects.get(usuario=request.user.username)
         except Empleado.DoesNotExist:
-            # Buscar o crear rol genérico
-            rol_generico, _ = TipoRolGeneral.objects.get_or_create(
-                nombre_rol='SISTEMA',
-                defaults={'descripcion': 'Rol del sistema'}
-            )
-            
-            # Crear o buscar empleado genérico
-            empleado, created = Empleado.objects.get_or_create(
-                usuario='SISTEMA',
-                defaults={
-                    'id_rol': rol_generico,
-                    'nombre': 'SISTEMA',
-                    'apellido': 'POS',
-                    'contrasena_hash': 'N/A',
-                    'direccion': 'N/A',
-                    'ciudad': 'N/A',
-                    'telefono': '0',
-                    'email': 'sistema@pos.local',
-                    'activo': True
-                }
-            )
+            # Empleado genérico del sistema (desde CacheReferencia)
+            empleado = CacheReferencia.empleado_sistema()
         
-        # Obtener o crear cliente genérico
+        # Obtener cliente genérico (datos de referencia en memoria)
         try:
-            # Obtener lista de precios por defecto
-            lista_precios_default = ListaPrecios.objects.filter(activo=True).first()
-            if not lista_precios_default:
+            if not CacheReferencia.lista_precios_default():
                 return JsonResponse({
                     'success': False,
                     'error': 'No hay lista de precios activa en el sistema'
                 })
             
-            # Obtener tipo de cliente por defecto
-            tipo_cliente_default = TipoCliente.objects.first()
-            if not tipo_cliente_default:
+            if not CacheReferencia.tipo_cliente_default():
                 return JsonResponse({
                     'success': False,
                     'error': 'No hay tipo de cliente configurado en el sistema'
                 })
             
-            cliente_generico, created = Cliente.objects.get_or_create(
-                ruc_ci='0000000',
-                defaults={
-                    'nombres': 'CLIENTE',
-                    'apellidos': 'GENERICO',
-                    'id_lista': lista_precios_default,
-                    'id_tipo_cliente': tipo_cliente_default,
-                    'direccion': 'N/A',
-                    'ciudad': 'N/A',
-                    'telefono': '0',
-                    'email': 'generico@sistema.local',
-                    'limite_credito': 0,
-                    'activo': True
-                }
-            )
+            cliente_generico = CacheReferencia.cliente_generico()
         except Exception as e:
             return JsonResponse({
                 'success': False,
@@ -485,19 +412,15 @@ def procesar_venta(request):
         if genera_factura_legal:
             try:
                 # Buscar timbrado activo
-                timbrado_activo = Timbrados.objects.filter(activo=True).first()
+                timbrado_activo = CacheReferencia.timbrado_activo()
                 if not timbrado_activo:
                     return JsonResponse({
                         'success': False,
                         'error': 'No hay timbrado activo configurado para emitir facturas'
                     })
                 
-                # Obtener el último nro_secuencial para este timbrado
-                ultimo_doc = DocumentosTributarios.objects.filter(
-                    nro_timbrado=timbrado_activo
-                ).order_by('-nro_secuencial').first()
-                
-                nuevo_secuencial = (ultimo_doc.nro_secuencial + 1) if ultimo_doc else 1
+                # Reservar el siguiente nro_secuencial (contador bloqueado por timbrado)
+                nuevo_secuencial = AsignadorSecuencial.siguiente(timbrado_activo)
                 
                 # Crear documento tributario
                 documento = DocumentosTributarios.objects.create(
@@ -541,42 +464,9 @@ def procesar_venta(request):
             genera_factura_legal=genera_factura_legal
         )
         
-        # Crear detalles de venta
-        for item in items:
-            try:
-                producto = Producto.objects.select_related(
-                    'id_categoria',
-                    'stock'
-                ).get(id_producto=item['id'])
-                
-                # Manejar cantidad o peso según el tipo de producto
-                if item.get('esPorKilo'):
-                    cantidad = Decimal(str(item.get('peso', 1)))
-                else:
-                    cantidad = Decimal(str(item.get('quantity', 1)))
-                    
-                precio = Decimal(str(item['price']))
-                subtotal = precio * cantidad
-                
-                # Crear detalle (simplificado para venta con tarjeta, completo para contado/crédito)
-                DetalleVenta.objects.create(
-                    id_venta=venta,
-                    id_producto=producto,
-                    cantidad=cantidad,
-                    precio_unitario=int(precio),
-                    subtotal_total=int(subtotal)
-                )
-                
-                # Actualizar stock
-                try:
-                    stock = StockUnico.objects.get(id_producto=producto)
-                    stock.stock_actual = F('stock_actual') - cantidad
-                    stock.save()
-                except StockUnico.DoesNotExist:
-                    pass
-                    
-            except Producto.DoesNotExist:
-                continue
+        # Crear detalles de venta y descontar stock en lote
+        # (número constante de queries sin importar el tamaño del carrito)
+        RegistradorVentaLote.registrar(venta, items, lineas=lineas_venta)
         
         # Si hay tarjeta Y es uso exclusivo, descontar saldo (proceso simplificado)
         if tarjeta and tiene_tarjeta_exclusiva:
@@ -649,7 +539,7 @@ def procesar_venta(request):
                 try:
                     from gestion.notificaciones_saldo import verificar_saldo_y_notificar
                     verificar_saldo_y_notificar(tarjeta)
-                    print(f"📧 NOTIFICACIÓN: Notificación de saldo enviada para tarjeta {tarjeta.nro_tarjeta}")
+                    print(f"📧 NOTIFICACIÓN: Notificación de saldo encolada para tarjeta {tarjeta.nro_tarjeta}")
                 except Exception as e:
                     print(f"⚠️ ERROR al enviar notificación de saldo: {e}")
         
@@ -691,9 +581,8 @@ def procesar_venta(request):
                     monto_pago = Decimal(str(pago_data.get('monto', 0)))
                     
                     # Cargar el medio de pago
-                    try:
-                        medio_pago = MediosPago.objects.get(id_medio_pago=medio_id)
-                    except MediosPago.DoesNotExist:
+                    medio_pago = CacheReferencia.medio_pago(medio_id)
+                    if medio_pago is None:
                         print(f"⚠️ ERROR: Medio de pago #{medio_id} no encontrado")
                         continue
                     
@@ -767,44 +656,44 @@ def procesar_venta(request):
                     # No fallar la venta, solo registrar el error
         
         # ========================================
-        # 🖨️ IMPRIMIR TICKET EN IMPRESORA TÉRMICA
+        # 🖨️ ENCOLAR TICKET PARA LA IMPRESORA TÉRMICA
         # ========================================
-        ticket_impreso = False
+        # La impresión ocurre después del commit en el worker de la terminal,
+        # así una impresora lenta o desconectada no retiene la transacción.
+        trabajo_impresion = None
         error_impresion = None
         
         try:
-            from gestion.impresora_manager import ImpresoraTermica
+            from gestion.impresora_manager import ColaImpresion
             
-            impresora = ImpresoraTermica()
-            
-            # Preparar datos del ticket
+            # Preparar datos del ticket (formato de ImpresoraTermica.imprimir_ticket)
             ticket_data = {
-                'venta_id': venta.id_venta,
-                'fecha': venta.fecha.strftime('%d/%m/%Y %H:%M'),
+                'numero': venta.id_venta,
+                'fecha': venta.fecha,
                 'cliente': f"{cliente.nombres} {cliente.apellidos}",
                 'cajero': f"{empleado.nombre} {empleado.apellido}",
-                'items': [],
+                'detalles': [
+                    {
+                        'producto': linea.descripcion or 'Producto',
+                        'cantidad': float(linea.cantidad),
+                        'precio': float(linea.precio),
+                        'subtotal': float(linea.subtotal)
+                    }
+                    for linea in lineas_venta
+                ],
                 'subtotal': float(total),
                 'descuento': float(descuento_promocion) if descuento_promocion > 0 else 0,
                 'total': float(total),
                 'nro_factura': nro_factura,
-                'tipo_venta': tipo_venta_final
+                'tipo_venta': tipo_venta_final,
+                'metodo_pago': 'TARJETA' if tiene_tarjeta_exclusiva else 'CONTADO'
             }
             
-            # Agregar items
-            for item in items:
-                ticket_data['items'].append({
-                    'descripcion': item.get('name', 'Producto'),
-                    'cantidad': item.get('quantity', 1),
-                    'precio': item.get('price', 0),
-                    'subtotal': item.get('quantity', 1) * item.get('price', 0)
-                })
-            
             # Agregar información de tarjeta si existe
             if tarjeta:
                 ticket_data['tarjeta'] = {
                     'nro': tarjeta.nro_tarjeta,
-                    'titular': f"{tarjeta.id_hijo.descripcions} {tarjeta.id_hijo.apellidos}" if tarjeta.id_hijo else 'N/A',
+                    'titular': f"{tarjeta.id_hijo.nombre} {tarjeta.id_hijo.apellido}" if tarjeta.id_hijo else 'N/A',
                     'saldo_anterior': float(tarjeta.saldo_actual + total) if tiene_tarjeta_exclusiva else None,
                     'saldo_actual': float(tarjeta.saldo_actual) if tiene_tarjeta_exclusiva else None
                 }
@@ -813,31 +702,24 @@ def procesar_venta(request):
             if pagos_mixtos:
                 ticket_data['pagos'] = []
                 for pago in pagos_mixtos:
-                    medio_id = pago.get('medio_id')
-                    try:
-                        medio = MediosPago.objects.get(id_medio_pago=medio_id)
+                    medio = CacheReferencia.medio_pago(pago.get('medio_id'))
+                    if medio is not None:
                         ticket_data['pagos'].append({
                             'medio': medio.descripcion,
                             'monto': float(pago.get('monto', 0)),
                             'referencia': pago.get('referencia', '')
                         })
-                    except:
-                        pass
             
-            # Intentar imprimir
-            if impresora.imprimir_ticket(ticket_data):
-                ticket_impreso = True
-                print(f"✅ Ticket impreso correctamente para venta #{venta.id_venta}")
-            else:
-                error_impresion = "La impresora no respondió"
-                print(f"⚠️ No se pudo imprimir el ticket para venta #{venta.id_venta}")
+            trabajo_impresion = ColaImpresion.encolar_ticket(
+                ticket_data,
+                venta_id=venta.id_venta,
+                terminal=data.get('terminal')
+            )
+            print(f"🖨️ Ticket encolado (trabajo #{trabajo_impresion.id_trabajo}) para venta #{venta.id_venta}")
                 
-        except ImportError:
-            error_impresion = "Módulo de impresora no disponible"
-            print(f"⚠️ Módulo de impresora no disponible")
         except Exception as e:
             error_impresion = str(e)
-            print(f"⚠️ Error al imprimir ticket: {e}")
+            print(f"⚠️ Error al encolar ticket: {e}")
             # NO fallar la venta si hay error de impresión
         
         # Preparar respuesta con información actualizada
@@ -846,11 +728,12 @@ def procesar_venta(request):
             'venta_id': venta.id_venta,
             'total': float(total),
             'message': '¡Venta procesada exitosamente!',
-            'ticket_impreso': ticket_impreso
+            'ticket_encolado': trabajo_impresion is not None,
+            'trabajo_impresion_id': trabajo_impresion.id_trabajo if trabajo_impresion else None
         }
         
         if error_impresion:
-            response_data['warning'] = f'Venta exitosa pero no se pudo imprimir: {error_impresion}'
+            response_data['warning'] = f'Venta exitosa pero no se pudo encolar el ticket: {error_impresion}'
         
         # Si hay tarjeta, incluir información del saldo actualizado
         if tarjeta:
@@ -1790,6 +1673,7 @@ def recargas_view(request):
 
 @acceso_cajero
 @login_required
+@ratelimit_recarga
 def procesar_recarga(request):
     """Procesar recarga de tarjeta"""
     if request.method != 'POST':
@@ -6225,6 +6109,7 @@ def nueva_compra(request):
     return render(request, 'apps/pos/compras/nueva.html', context)
 
 @login_required
+@ratelimit_recarga
 def procesar_recarga(request):
     """Procesar recarga de saldo"""
     if request.method == 'POST':
@@ -6688,17 +6573,20 @@ def buscar_producto(request):
     productos = []
     
     if q:
-        productos = Producto.objects.filter(
-            Q(nombre__icontains=q) | Q(codigo__icontains=q)
-        ).filter(stock__gt=0)[:10]
+        # Candidatos desde el índice en memoria; el stock se filtra en la BD
+        productos = IndiceProductos.cargar(
+            IndiceProductos.buscar(q, limite=50),
+            Producto.objects.select_related('stock').filter(stock__cantidad__gt=0)
+        )[:10]
+        productos = MapaPrecios.anotar(productos)
     
     return JsonResponse({
         'productos': [{
-            'id': p.id,
-            'nombre': p.nombre,
-            'codigo': p.codigo,
-            'precio': float(p.precio),
-            'stock': p.stock
+            'id': p.id_producto,
+            'nombre': p.descripcion,
+            'codigo': p.codigo_barra,
+            'precio': float(p.precio_actual),
+            'stock': float(p.stock.cantidad)
         } for p in productos]
     })
 
@@ -2,32 +2,66 @@
 Decoradores y utilidades para Rate Limiting
 """
 from functools import wraps
+from django.conf import settings
 from django.core.cache import cache
 from django.http import JsonResponse
 from rest_framework import status
 from rest_framework.response import Response
 import hashlib
+import threading
 import time
 
 
 class RateLimiter:
     """
-    Sistema de rate limiting personalizado usando Redis/Cache
+    Sistema de rate limiting con contadores atómicos del cache (Redis/LocMem)
+
+    Cada ventana es una clave entera que se incrementa con cache.incr, así
+    no hay lectura-modificación-escritura ni pickling de dicts, y el conteo
+    es correcto con requests concurrentes.
+
+    Modos:
+        'fijo': contador por ventana (se reinicia al cambiar la ventana)
+        'deslizante': ventana actual + peso proporcional de la anterior
+
+    Bucket local: cada proceso reserva cupo en lotes con un solo incr y lo
+    consume sin tocar el cache compartido mientras el cliente esté lejos del
+    límite. Cerca del límite reserva de a uno, así nunca se supera.
     """
     
-    def __init__(self, max_requests, window_seconds):
+    MODO_FIJO = 'fijo'
+    MODO_DESLIZANTE = 'deslizante'
+    
+    def __init__(self, max_requests, window_seconds, modo=MODO_FIJO, bucket_local=True, prefijo='ratelimit'):
         """
         Args:
             max_requests: Número máximo de requests permitidos
             window_seconds: Ventana de tiempo en segundos
+            modo: 'fijo' o 'deslizante'
+            bucket_local: Reservar cupo en lotes por proceso
+            prefijo: Prefijo de las claves de cache (una política por prefijo)
         """
+        if modo not in (self.MODO_FIJO, self.MODO_DESLIZANTE):
+            raise ValueError(f'Modo de rate limit inválido: {modo}')
+        
         self.max_requests = max_requests
         self.window_seconds = window_seconds
+        self.modo = modo
+        self.prefijo = prefijo
+        # Tamaño del lote reservado por proceso (1 = sin bucket local)
+        self.lote = max(1, max_requests // 20) if bucket_local else 1
+        
+        # {cache_key: tokens reservados} de la ventana actual
+        self._buckets = {}
+        self._ventana_buckets = None
+        # {cache_key: conteo final de la ventana anterior} (ya no cambia)
+        self._anteriores = {}
+        self._lock = threading.Lock()
     
     def get_cache_key(self, identifier):
         """Generar clave de cache única"""
         hash_id = hashlib.md5(identifier.encode()).hexdigest()
-        return f'ratelimit:{hash_id}'
+        return f'{self.prefijo}:{hash_id}'
     
     def is_allowed(self, identifier):
         """
@@ -40,41 +74,173 @@ class RateLimiter:
             (allowed, remaining, reset_time)
         """
         cache_key = self.get_cache_key(identifier)
+        ahora = time.time()
+        ventana = int(ahora // self.window_seconds)
+        reset_time = (ventana + 1) * self.window_seconds
+        
+        with self._lock:
+            if ventana != self._ventana_buckets:
+                # Cambió la ventana: los cupos reservados ya no valen
+                self._buckets = {}
+                self._anteriores = {}
+                self._ventana_buckets = ventana
+            
+            tokens = self._buckets.get(cache_key, 0)
+            if tokens > 0:
+                # Cupo ya reservado por este proceso: sin ir al cache
+                self._buckets[cache_key] = tokens - 1
+                return True, tokens - 1, reset_time
+        
+        ocupado = self._peso_anterior(cache_key, ventana, ahora)
+        
+        # Se reserva un lote con un solo incr; lejos del límite se conserva
+        # completo, cerca del límite se conserva uno y se devuelve el resto
+        clave_ventana = f'{cache_key}:{ventana}'
+        usados = self._incrementar(clave_ventana, self.lote)
+        libres = self.max_requests - ocupado - (usados - self.lote)
+        if libres <= 0:
+            reservados = 0
+        elif libres > 2 * self.lote:
+            reservados = self.lote
+        else:
+            reservados = 1
+        
+        if reservados < self.lote:
+            try:
+                cache.decr(clave_ventana, self.lote - reservados)
+            except ValueError:
+                pass
+        
+        if reservados == 0:
+            return False, 0, reset_time
+        
+        if reservados > 1:
+            with self._lock:
+                if self._ventana_buckets == ventana:
+                    self._buckets[cache_key] = self._buckets.get(cache_key, 0) + reservados - 1
+        
+        remaining = max(0, libres - reservados)
+        return True, remaining, reset_time
+    
+    def _incrementar(self, clave, cantidad):
+        """incr atómico; crea la clave con add si no existe"""
+        timeout = self.window_seconds * (2 if self.modo == self.MODO_DESLIZANTE else 1) + 1
+        try:
+            return cache.incr(clave, cantidad)
+        except ValueError:
+            if cache.add(clave, cantidad, timeout):
+                return cantidad
+            # Otro proceso la creó entre el incr y el add
+            return cache.incr(clave, cantidad)
+    
+    def _peso_anterior(self, cache_key, ventana, ahora):
+        """Requests de la ventana anterior que todavía cuentan (modo deslizante)"""
+        if self.modo != self.MODO_DESLIZANTE:
+            return 0
+        
+        anterior = self._anteriores.get(cache_key)
+        if anterior is None:
+            anterior = cache.get(f'{cache_key}:{ventana - 1}', 0)
+            with self._lock:
+                if self._ventana_buckets == ventana:
+                    self._anteriores[cache_key] = anterior
+        
+        transcurrido = (ahora % self.window_seconds) / self.window_seconds
+        return int(anterior * (1 - transcurrido))
+
+
+class PoliticaRateLimit:
+    """Límite de una ruta o grupo de rutas"""
+    
+    def __init__(self, max_requests, window_seconds, modo=RateLimiter.MODO_FIJO, bucket_local=True):
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self.modo = modo
+        self.bucket_local = bucket_local
+
+
+# Políticas por ruta (se pueden sobrescribir con settings.RATELIMIT_POLITICAS)
+POLITICAS = {
+    'global': PoliticaRateLimit(1000, 3600),
+    'login': PoliticaRateLimit(5, 3600, modo=RateLimiter.MODO_DESLIZANTE, bucket_local=False),
+    'api': PoliticaRateLimit(100, 3600),
+    'venta': PoliticaRateLimit(200, 3600, modo=RateLimiter.MODO_DESLIZANTE),
+    'recarga': PoliticaRateLimit(30, 3600, modo=RateLimiter.MODO_DESLIZANTE, bucket_local=False),
+}
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def obtener_limiter(nombre_politica):
+    """
+    RateLimiter compartido de una política (mantiene el bucket local del proceso)
+    
+    settings.RATELIMIT_POLITICAS puede redefinir una política con un dict:
+        {'venta': {'max_requests': 300, 'window_seconds': 3600, 'modo': 'deslizante'}}
+    """
+    limiter = _limiters.get(nombre_politica)
+    if limiter is not None:
+        return limiter
+    
+    politica = POLITICAS[nombre_politica]
+    config = {
+        'max_requests': politica.max_requests,
+        'window_seconds': politica.window_seconds,
+        'modo': politica.modo,
+        'bucket_local': politica.bucket_local,
+    }
+    config.update(getattr(settings, 'RATELIMIT_POLITICAS', {}).get(nombre_politica, {}))
+    
+    with _limiters_lock:
+        if nombre_politica not in _limiters:
+            _limiters[nombre_politica] = RateLimiter(prefijo=f'ratelimit:{nombre_politica}', **config)
+        return _limiters[nombre_politica]
+
+
+def _respuesta_limite_excedido(request, reset_time):
+    """Respuesta 429 (DRF o Django según la vista)"""
+    contenido = {
+        'error': 'Rate limit exceeded',
+        'message': 'Demasiadas solicitudes. Por favor, intente más tarde.',
+        'retry_after': reset_time - int(time.time())
+    }
+    if hasattr(request, 'accepted_renderer'):
+        return Response(contenido, status=status.HTTP_429_TOO_MANY_REQUESTS)
+    return JsonResponse(contenido, status=429)
+
+
+def _aplicar_limiter(func, limiter, key_func):
+    """Envuelve una vista con un RateLimiter ya construido"""
+    @wraps(func)
+    def wrapper(request, *args, **kwargs):
+        # Obtener identificador
+        if key_func:
+            identifier = key_func(request)
+        else:
+            # Usar IP por defecto
+            identifier = get_client_ip(request)
+        
+        # Verificar límite
+        allowed, remaining, reset_time = limiter.is_allowed(identifier)
         
-        # Obtener datos actuales del cache
-        data = cache.get(cache_key)
-        current_time = int(time.time())
-        
-        if data is None:
-            # Primera request
-            data = {
-                'count': 1,
-                'reset_time': current_time + self.window_seconds
-            }
-            cache.set(cache_key, data, self.window_seconds)
-            return True, self.max_requests - 1, data['reset_time']
-        
-        # Verificar si la ventana expiró
-        if current_time >= data['reset_time']:
-            # Resetear contador
-            data = {
-                'count': 1,
-                'reset_time': current_time + self.window_seconds
-            }
-            cache.set(cache_key, data, self.window_seconds)
-            return True, self.max_requests - 1, data['reset_time']
-        
-        # Incrementar contador
-        if data['count'] < self.max_requests:
-            data['count'] += 1
-            cache.set(cache_key, data, self.window_seconds)
-            return True, self.max_requests - data['count'], data['reset_time']
-        
-        # Límite excedido
-        return False, 0, data['reset_time']
-
-
-def ratelimit(max_requests=60, window_seconds=3600, key_func=None):
+        if not allowed:
+            return _respuesta_limite_excedido(request, reset_time)
+        
+        # Agregar headers de rate limit
+        response = func(request, *args, **kwargs)
+        
+        if hasattr(response, '__setitem__'):
+            response['X-RateLimit-Limit'] = str(limiter.max_requests)
+            response['X-RateLimit-Remaining'] = str(remaining)
+            response['X-RateLimit-Reset'] = str(reset_time)
+        
+        return response
+    
+    return wrapper
+
+
+def ratelimit(max_requests=60, window_seconds=3600, key_func=None, modo=RateLimiter.MODO_FIJO):
     """
     Decorador para aplicar rate limiting a vistas
     
@@ -82,6 +248,7 @@ def ratelimit(max_requests=60, window_seconds=3600, key_func=None):
         max_requests: Número máximo de requests
         window_seconds: Ventana de tiempo en segundos
         key_func: Función para obtener el identificador (default: IP)
+        modo: 'fijo' o 'deslizante'
     
     Ejemplo:
         @ratelimit(max_requests=10, window_seconds=60)
@@ -89,48 +256,26 @@ def ratelimit(max_requests=60, window_seconds=3600, key_func=None):
             ...
     """
     def decorator(func):
-        @wraps(func)
-        def wrapper(request, *args, **kwargs):
-            limiter = RateLimiter(max_requests, window_seconds)
-            
-            # Obtener identificador
-            if key_func:
-                identifier = key_func(request)
-            else:
-                # Usar IP por defecto
-                identifier = get_client_ip(request)
-            
-            # Verificar límite
-            allowed, remaining, reset_time = limiter.is_allowed(identifier)
-            
-            if not allowed:
-                # Límite excedido
-                if hasattr(request, 'accepted_renderer'):
-                    # DRF Response
-                    return Response({
-                        'error': 'Rate limit exceeded',
-                        'message': 'Demasiadas solicitudes. Por favor, intente más tarde.',
-                        'retry_after': reset_time - int(time.time())
-                    }, status=status.HTTP_429_TOO_MANY_REQUESTS)
-                else:
-                    # Django Response
-                    return JsonResponse({
-                        'error': 'Rate limit exceeded',
-                        'message': 'Demasiadas solicitudes. Por favor, intente más tarde.',
-                        'retry_after': reset_time - int(time.time())
-                    }, status=429)
-            
-            # Agregar headers de rate limit
-            response = func(request, *args, **kwargs)
-            
-            if hasattr(response, '__setitem__'):
-                response['X-RateLimit-Limit'] = str(max_requests)
-                response['X-RateLimit-Remaining'] = str(remaining)
-                response['X-RateLimit-Reset'] = str(reset_time)
-            
-            return response
-        
-        return wrapper
+        # Un limiter por vista decorada (conserva el bucket local entre requests)
+        limiter = RateLimiter(
+            max_requests, window_seconds, modo=modo,
+            prefijo=f'ratelimit:{func.__module__}.{func.__qualname__}'
+        )
+        return _aplicar_limiter(func, limiter, key_func)
+    return decorator
+
+
+def ratelimit_politica(nombre_politica, key_func=None):
+    """
+    Decorador que aplica una política de POLITICAS
+    
+    Ejemplo:
+        @ratelimit_politica('venta', key_func=get_user_identifier)
+        def procesar_venta(request):
+            ...
+    """
+    def decorator(func):
+        return _aplicar_limiter(func, obtener_limiter(nombre_politica), key_func)
     return decorator
 
 
@@ -154,23 +299,23 @@ def get_user_identifier(request):
 # Decoradores predefinidos para casos comunes
 
 def ratelimit_login(func):
-    """Rate limit para login: 5 intentos por hora"""
-    return ratelimit(max_requests=5, window_seconds=3600)(func)
+    """Rate limit para login: 5 intentos por hora (ventana deslizante)"""
+    return ratelimit_politica('login')(func)
 
 
 def ratelimit_api(func):
     """Rate limit para APIs: 100 requests por hora"""
-    return ratelimit(max_requests=100, window_seconds=3600, key_func=get_user_identifier)(func)
+    return ratelimit_politica('api', key_func=get_user_identifier)(func)
 
 
 def ratelimit_venta(func):
-    """Rate limit para ventas: 200 por hora"""
-    return ratelimit(max_requests=200, window_seconds=3600, key_func=get_user_identifier)(func)
+    """Rate limit para ventas: 200 por hora (ventana deslizante)"""
+    return ratelimit_politica('venta', key_func=get_user_identifier)(func)
 
 
 def ratelimit_recarga(func):
-    """Rate limit para recargas: 30 por hora"""
-    return ratelimit(max_requests=30, window_seconds=3600, key_func=get_user_identifier)(func)
+    """Rate limit para recargas: 30 por hora (ventana deslizante, sin bucket local)"""
+    return ratelimit_politica('recarga', key_func=get_user_identifier)(func)
 
 
 # Middleware de Rate Limiting
@@ -182,7 +327,7 @@ class RateLimitMiddleware:
     
     def __init__(self, get_response):
         self.get_response = get_response
-        self.limiter = RateLimiter(max_requests=1000, window_seconds=3600)
+        self.limiter = obtener_limiter('global')
     
     def __call__(self, request):
         # Obtener identificador
@@ -192,17 +337,13 @@ class RateLimitMiddleware:
         allowed, remaining, reset_time = self.limiter.is_allowed(identifier)
         
         if not allowed:
-            return JsonResponse({
-                'error': 'Rate limit exceeded',
-                'message': 'Demasiadas solicitudes. Por favor, intente más tarde.',
-                'retry_after': reset_time - int(time.time())
-            }, status=429)
+            return _respuesta_limite_excedido(request, reset_time)
         
         # Continuar con el request
         response = self.get_response(request)
         
         # Agregar headers
-        response['X-RateLimit-Limit'] = '1000'
+        response['X-RateLimit-Limit'] = str(self.limiter.max_requests)
         response['X-RateLimit-Remaining'] = str(remaining)
         response['X-RateLimit-Reset'] = str(reset_time)
         
@@ -6,7 +6,6 @@ Fecha: 10 Enero 2026
 """
 
 import logging
-import time
 from datetime import datetime, timedelta
 from decimal import Decimal
 from typing import Dict, List, Optional, Tuple
@@ -19,12 +18,12 @@ from django.core.mail import send_mail
 from django.conf import settings
 from django.utils import timezone
 from django.db import transaction
-from django.core.cache import cache
 
 from .models import (
     DocumentosTributarios, Ventas, DatosFacturacionElect,
     AlertasSistema, AuditoriaOperacion
 )
+from .reintentos_set import ColaReintentosSET
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -117,13 +116,15 @@ CODIGOS_ERROR_SET = {
 class SETAPIClient:
     """Cliente HTTP con reintentos automáticos para API SET"""
     
-    def __init__(self, max_retries=3, backoff_factor=1):
+    def __init__(self, max_retries=3, backoff_factor=1, pool_size=10):
         """
         Inicializa cliente con estrategia de reintentos
         
         Args:
-            max_retries: Número máximo de reintentos
+            max_retries: Número máximo de reintentos (0 = sin reintentos
+                internos; 429/503 se devuelven a quien llama para regular el ritmo)
             backoff_factor: Factor de espera exponencial (1, 2, 4, 8...)
+            pool_size: Conexiones reutilizables (envíos simultáneos)
         """
         self.base_url = settings.SET_API_URL if hasattr(settings, 'SET_API_URL') else 'https://sifen.set.gov.py/dte/rest'
         self.timeout = 30  # segundos
@@ -131,14 +132,17 @@ class SETAPIClient:
         # Configurar sesión con reintentos automáticos
         self.session = requests.Session()
         
-        retry_strategy = Retry(
-            total=max_retries,
-            backoff_factor=backoff_factor,
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["GET", "POST"]
-        )
+        if max_retries:
+            retry_strategy = Retry(
+                total=max_retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=["GET", "POST"]
+            )
+        else:
+            retry_strategy = 0
         
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        adapter = HTTPAdapter(max_retries=retry_strategy, pool_connections=1, pool_maxsize=pool_size)
         self.session.mount("http://", adapter)
         self.session.mount("https://", adapter)
     
@@ -200,11 +204,16 @@ class SETAPIClient:
             
         except requests.exceptions.HTTPError as e:
             logger.error(f"HTTP Error {e.response.status_code}: {e}")
-            return {
+            respuesta = {
                 'codigo': str(e.response.status_code),
                 'mensaje': f'Error HTTP: {e.response.text}',
                 'estado': 'error'
             }
+            # 429/503: SET indica cuánto esperar antes de volver a enviar
+            retry_after = e.response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                respuesta['reintentar_en'] = int(retry_after)
+            return respuesta
             
         except Exception as e:
             logger.exception(f"Error inesperado al enviar CDC {cdc}: {e}")
@@ -346,7 +355,10 @@ class ManejadorRechazos:
     
     def reintentar_masivo(self, limite: int = 10) -> List[Dict]:
         """
-        Reintenta envío de documentos pendientes
+        Reenvía los documentos cuyo reintento programado ya venció
+        
+        Los toma de la cola persistente (reintentos_envio_set) y los envía en
+        paralelo con ritmo adaptativo (ver reintentos_set.ColaReintentosSET)
         
         Args:
             limite: Cantidad máxima de documentos a procesar
@@ -356,34 +368,7 @@ class ManejadorRechazos:
         """
         logger.info(f"Iniciando reintento masivo (límite: {limite})")
         
-        # Obtener documentos pendientes de reintento
-        documentos_pendientes = DocumentosTributarios.objects.filter(
-            estado='rechazado',
-            intentos_envio__lt=self.max_reintentos_automaticos,
-            fecha_rechazo__gte=timezone.now() - timedelta(days=7)  # Solo últimos 7 días
-        ).order_by('fecha_rechazo')[:limite]
-        
-        resultados = []
-        
-        for doc in documentos_pendientes:
-            try:
-                resultado = self.reintentar_envio(doc)
-                resultados.append({
-                    'cdc': doc.cdc,
-                    'exito': resultado.get('exito', False),
-                    'mensaje': resultado.get('mensaje', '')
-                })
-                
-                # Esperar 1 segundo entre reintentos para no saturar API
-                time.sleep(1)
-                
-            except Exception as e:
-                logger.exception(f"Error al reintentar CDC {doc.cdc}: {e}")
-                resultados.append({
-                    'cdc': doc.cdc,
-                    'exito': False,
-                    'mensaje': f'Error: {str(e)}'
-                })
+        resultados = ColaReintentosSET.procesar_pendientes(limite=limite)
         
         logger.info(f"Reintento masivo completado: {len([r for r in resultados if r['exito']])} exitosos de {len(resultados)}")
         
@@ -392,7 +377,7 @@ class ManejadorRechazos:
     def _programar_reintento(self, documento: DocumentosTributarios, 
                             error_info: Dict) -> Dict:
         """
-        Programa un reintento futuro
+        Programa un reintento futuro en la cola persistente
         
         Args:
             documento: Documento a reintentar
@@ -403,14 +388,14 @@ class ManejadorRechazos:
         """
         espera_segundos = error_info.get('espera_segundos', 60)
         
-        # Guardar en cache para procesamiento posterior
-        cache_key = f"reintento_factura:{documento.cdc}"
-        cache.set(cache_key, {
-            'documento_id': documento.id_documento,
-            'programado_para': (timezone.now() + timedelta(seconds=espera_segundos)).isoformat()
-        }, timeout=espera_segundos + 60)
+        ColaReintentosSET.programar(
+            documento.id_documento,
+            documento.codigo_error,
+            documento.mensaje_error,
+            espera_segundos
+        )
         
-        logger.info(f"Reintento programado para CDC {documento.cdc} en {espera_segundos} segundos")
+        logger.info(f"Reintento programado para documento {documento.id_documento} en {espera_segundos} segundos")
         
         return {
             'exito': False,
@@ -553,44 +538,3 @@ class ManejadorRechazos:
             logger.info(f"Notificación enviada para CDC {documento.cdc}")
         except Exception as e:
             logger.error(f"Error al enviar notificación: {e}")
-
-
-# =============================================================================
-# COMANDO DJANGO PARA REINTENTOS AUTOMÁTICOS
-# =============================================================================
-
-"""
-Crear archivo: gestion/management/commands/reintentar_facturas.py
-
-from django.core.management.base import BaseCommand
-from gestion.rechazo_set_handler import ManejadorRechazos
-
-class Command(BaseCommand):
-    help = 'Reintenta envío de facturas rechazadas'
-    
-    def add_arguments(self, parser):
-        parser.add_argument(
-            '--limite',
-            type=int,
-            default=10,
-            help='Cantidad máxima de documentos a procesar'
-        )
-    
-    def handle(self, *args, **options):
-        limite = options['limite']
-        
-        manejador = ManejadorRechazos()
-        resultados = manejador.reintentar_masivo(limite=limite)
-        
-        exitosos = len([r for r in resultados if r['exito']])
-        
-        self.stdout.write(
-            self.style.SUCCESS(
-                f'Procesados {len(resultados)} documentos. '
-                f'Exitosos: {exitosos}, Fallidos: {len(resultados) - exitosos}'
-            )
-        )
-
-# Ejecutar cada 15 minutos con cron:
-# */15 * * * * cd /ruta/proyecto && python manage.py reintentar_facturas --limite=20
-"""
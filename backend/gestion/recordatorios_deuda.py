@@ -0,0 +1,226 @@
+"""
+Recordatorios de deuda por saldo negativo
+==========================================
+
+tarea_recordatorios_deuda cargaba todas las autorizaciones sin regularizar,
+calculaba los días de deuda en Python y actuaba sólo en los días 3, 7 y 15;
+por cada coincidencia buscaba el contacto con otra consulta, y después
+bloquear_tarjetas_morosidad volvía a recorrer las deudas guardando tarjeta
+por tarjeta. El costo crecía con el histórico de deudas.
+
+ProgramadorRecordatoriosDeuda trabaja por días calendario:
+
+- Una consulta trae sólo las autorizaciones pendientes cuya
+  fecha_autorizacion cae en alguno de los días objetivo (rangos sobre el
+  índice idx_asn_pendientes_fecha), con tarjeta, hijo y contacto en el JOIN
+- Una tarjeta con varias autorizaciones recibe un solo recordatorio (el
+  escalón más alto)
+- Los recordatorios y avisos de bloqueo se encolan en la bandeja de salida
+- Las tarjetas morosas se bloquean con un único UPDATE
+"""
+
+import logging
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .bandeja_salida import BandejaSalida
+from .models import AutorizacionSaldoNegativo, MensajeSaliente, NotificacionSaldo, Tarjeta
+from .notificaciones_saldo import asignar_ids_notificaciones, campos_contacto, contacto_de_fila
+
+logger = logging.getLogger(__name__)
+
+# Días de deuda en que se envía recordatorio: {días: tipo}
+ESCALONES = {3: 'amable', 7: 'urgente', 15: 'critico'}
+# A partir de este día de deuda se bloquea la tarjeta
+DIAS_BLOQUEO = 15
+
+_CLIENTE = 'nro_tarjeta__id_hijo__id_cliente_responsable'
+_CLIENTE_TARJETA = 'id_hijo__id_cliente_responsable'
+
+_ASUNTOS = {
+    'amable': 'Recordatorio: Saldo Pendiente - Tarjeta {tarjeta}',
+    'urgente': '⚠️ URGENTE: Saldo Pendiente - Tarjeta {tarjeta}',
+    'critico': '🚨 CRÍTICO: Bloqueo Inminente - Tarjeta {tarjeta}',
+}
+_URGENCIAS = {'amable': 'RECORDATORIO', 'urgente': 'URGENTE', 'critico': 'CRÍTICO'}
+
+
+def inicio_dia(dia: date) -> datetime:
+    """Medianoche local del día (límite de los rangos de fecha_autorizacion)"""
+    inicio = datetime.combine(dia, time.min)
+    return timezone.make_aware(inicio) if settings.USE_TZ else inicio
+
+
+class ProgramadorRecordatoriosDeuda:
+    """Recordatorios escalonados y bloqueo por morosidad sobre rangos de fecha"""
+
+    @staticmethod
+    def deudas_en_escalon(hoy: date) -> List[Dict]:
+        """
+        Autorizaciones pendientes cuyo día de deuda es un escalón
+
+        Returns:
+            Una fila por tarjeta (la del escalón más alto) con 'dias', 'tipo',
+            saldo, nombre del hijo y contacto
+        """
+        condicion = Q()
+        for dias in ESCALONES:
+            dia = hoy - timedelta(days=dias)
+            condicion |= Q(
+                fecha_autorizacion__gte=inicio_dia(dia),
+                fecha_autorizacion__lt=inicio_dia(dia + timedelta(days=1)),
+            )
+
+        filas = AutorizacionSaldoNegativo.objects.filter(
+            condicion, regularizado=False
+        ).values(
+            'nro_tarjeta', 'fecha_autorizacion',
+            'nro_tarjeta__saldo_actual',
+            'nro_tarjeta__id_hijo__nombre', 'nro_tarjeta__id_hijo__apellido',
+            *campos_contacto(_CLIENTE),
+        )
+
+        por_tarjeta: Dict[str, Dict] = {}
+        for fila in filas:
+            fila['dias'] = (hoy - timezone.localtime(fila['fecha_autorizacion']).date()).days
+            actual = por_tarjeta.get(fila['nro_tarjeta'])
+            if actual is None or fila['dias'] > actual['dias']:
+                por_tarjeta[fila['nro_tarjeta']] = fila
+        for fila in por_tarjeta.values():
+            fila['tipo'] = ESCALONES[fila['dias']]
+        return sorted(por_tarjeta.values(), key=lambda fila: fila['nro_tarjeta'])
+
+    @staticmethod
+    def encolar_recordatorios(filas: List[Dict]) -> Dict[str, int]:
+        """
+        Crea las NotificacionSaldo y encola los emails en un solo paso
+
+        Returns:
+            Dict con recordatorios por escalón ('3_dias', ...) y 'sin_email'
+        """
+        resultado = {f'{dias}_dias': 0 for dias in ESCALONES}
+        resultado['sin_email'] = 0
+
+        con_email = []
+        for fila in filas:
+            email, _ = contacto_de_fila(fila, _CLIENTE)
+            if email:
+                con_email.append((fila, email))
+            else:
+                resultado['sin_email'] += 1
+                logger.warning(f"No hay email para tarjeta {fila['nro_tarjeta']}")
+        if not con_email:
+            return resultado
+
+        notificaciones = []
+        for fila, email in con_email:
+            saldo = fila['nro_tarjeta__saldo_actual']
+            notificaciones.append(NotificacionSaldo(
+                nro_tarjeta_id=fila['nro_tarjeta'],
+                tipo_notificacion='SALDO_NEGATIVO',
+                saldo_actual=saldo,
+                mensaje=(
+                    f"Recordatorio {_URGENCIAS[fila['tipo']]}: Deuda de Gs. {abs(saldo):,.0f} "
+                    f"por {fila['dias']} días"
+                ),
+                email_destinatario=email,
+            ))
+
+        with transaction.atomic():
+            ultimo_id = NotificacionSaldo.objects.aggregate(ultimo=Max('id_notificacion'))['ultimo'] or 0
+            NotificacionSaldo.objects.bulk_create(notificaciones)
+            asignar_ids_notificaciones(notificaciones, ultimo_id)
+
+            BandejaSalida.encolar_varios([
+                MensajeSaliente(
+                    canal=MensajeSaliente.CANAL_EMAIL,
+                    destinatario=email,
+                    asunto=_ASUNTOS[fila['tipo']].format(tarjeta=fila['nro_tarjeta']),
+                    cuerpo=ProgramadorRecordatoriosDeuda.texto_recordatorio(fila),
+                    id_notificacion_saldo=notificacion,
+                )
+                for notificacion, (fila, email) in zip(notificaciones, con_email)
+            ])
+
+        for fila, _ in con_email:
+            resultado[f"{fila['dias']}_dias"] += 1
+        return resultado
+
+    @staticmethod
+    def texto_recordatorio(fila: Dict) -> str:
+        estudiante = f"{fila['nro_tarjeta__id_hijo__nombre']} {fila['nro_tarjeta__id_hijo__apellido']}"
+        return (
+            f"{_URGENCIAS[fila['tipo']]}: la tarjeta {fila['nro_tarjeta']} de {estudiante} "
+            f"tiene una deuda de Gs. {abs(fila['nro_tarjeta__saldo_actual']):,.0f} "
+            f"desde hace {fila['dias']} días.\n\n"
+            f"Por favor ingrese al portal para recargar: {settings.SITE_URL}/portal/recargas/"
+        )
+
+    @staticmethod
+    def bloquear_morosos(hoy: date) -> int:
+        """
+        Bloquea con un UPDATE las tarjetas con deuda pendiente desde el día
+        DIAS_BLOQUEO o antes, y encola el aviso de bloqueo
+
+        Returns:
+            Cantidad de tarjetas bloqueadas
+        """
+        limite = inicio_dia(hoy - timedelta(days=DIAS_BLOQUEO - 1))
+        morosas = AutorizacionSaldoNegativo.objects.filter(
+            regularizado=False,
+            fecha_autorizacion__lt=limite,
+        )
+
+        with transaction.atomic():
+            filas = list(
+                Tarjeta.objects.filter(
+                    nro_tarjeta__in=morosas.values('nro_tarjeta')
+                ).exclude(estado='Bloqueada').annotate(
+                    desde=Subquery(
+                        morosas.filter(nro_tarjeta=OuterRef('pk'))
+                        .order_by('fecha_autorizacion').values('fecha_autorizacion')[:1]
+                    )
+                ).values('nro_tarjeta', 'desde', *campos_contacto(_CLIENTE_TARJETA))
+            )
+            if not filas:
+                return 0
+
+            bloqueadas = Tarjeta.objects.filter(
+                nro_tarjeta__in=[fila['nro_tarjeta'] for fila in filas]
+            ).exclude(estado='Bloqueada').update(estado='Bloqueada')
+
+            mensajes = []
+            for fila in filas:
+                logger.warning(f"🔒 Tarjeta bloqueada por morosidad: {fila['nro_tarjeta']}")
+                email, _ = contacto_de_fila(fila, _CLIENTE_TARJETA)
+                if not email:
+                    continue
+                dias_deuda = (hoy - timezone.localtime(fila['desde']).date()).days
+                mensajes.append(MensajeSaliente(
+                    canal=MensajeSaliente.CANAL_EMAIL,
+                    destinatario=email,
+                    asunto=f"🔒 TARJETA BLOQUEADA - {fila['nro_tarjeta']}",
+                    cuerpo=(
+                        f"Su tarjeta {fila['nro_tarjeta']} ha sido bloqueada por morosidad "
+                        f"de {dias_deuda} días.\n\n"
+                        f"Contacto: {settings.SITE_URL}/portal/contacto/"
+                    ),
+                ))
+            BandejaSalida.encolar_varios(mensajes)
+
+        return bloqueadas
+
+    @staticmethod
+    def ejecutar(hoy: Optional[date] = None) -> Dict[str, int]:
+        """Recordatorios del día y bloqueo de morosos"""
+        hoy = hoy or timezone.localdate()
+        resultado = ProgramadorRecordatoriosDeuda.encolar_recordatorios(
+            ProgramadorRecordatoriosDeuda.deudas_en_escalon(hoy)
+        )
+        resultado['bloqueadas'] = ProgramadorRecordatoriosDeuda.bloquear_morosos(hoy)
+        return resultado
@@ -0,0 +1,354 @@
+"""
+Cola persistente de reenvíos a SIFEN
+=====================================
+
+ManejadorRechazos.reintentar_masivo reenviaba los documentos rechazados de
+a uno, con un time.sleep(1) fijo entre cada uno, y los reintentos
+programados vivían sólo en el cache (reintento_factura:*): con LocMem se
+perdían al reiniciar. Además el Retry del SETAPIClient repetía los
+429/503 por su cuenta, sin bajar el ritmo de los demás envíos.
+
+ColaReintentosSET guarda los reintentos en reintentos_envio_set:
+
+- Cada fila tiene su fecha_proximo_intento (backoff exponencial según el
+  código de CODIGOS_ERROR_SET) y sobrevive a reinicios
+- Los lotes se reclaman con un UPDATE condicional con marca de lote (como
+  la bandeja de salida): dos workers nunca reenvían el mismo documento
+- Un pool acotado de hilos (settings.SET_REINTENTOS_CONCURRENCIA) envía en
+  paralelo sobre una sola sesión HTTP
+- LimitadorSET regula el ritmo: cada 429/503 duplica el intervalo entre
+  envíos y respeta Retry-After; cada aceptación lo reduce de a poco. Un
+  documento frenado por el límite vuelve a la cola sin gastar un intento
+"""
+
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import AlertasSistema, DatosFacturacionElect, ReintentoEnvioSET
+
+logger = logging.getLogger(__name__)
+
+TAMANO_LOTE = 50
+BACKOFF_MAX_SEGUNDOS = 3600
+ESPERA_DEFAULT_SEGUNDOS = 60
+REINTENTO_COLGADO_MINUTOS = 10
+
+# Respuestas de SET que indican exceso de envíos
+CODIGOS_LIMITE = ('429', '503')
+# Intervalo entre envíos del limitador (segundos)
+INTERVALO_BASE = 0.5
+INTERVALO_MAX = 30.0
+FACTOR_ACELERACION = 0.8
+# Espera mínima de un documento frenado (evita volver a reclamarlo enseguida)
+ESPERA_LIMITE_MIN_SEGUNDOS = 5
+# Pausa máxima que un hilo espera su turno; más allá se difiere a la cola
+PAUSA_MAX_SEGUNDOS = 30
+
+# Documento sin XML para reenviar: no tiene sentido reintentar
+CODIGO_SIN_XML = 'SIN_XML'
+_ERROR_SIN_XML = {
+    'descripcion': 'XML firmado no disponible',
+    'tipo': 'validacion',
+    'reintentar': False,
+    'accion': 'Regenerar y firmar el XML del documento',
+}
+
+
+def concurrencia() -> int:
+    """Envíos simultáneos permitidos a SET"""
+    return max(1, int(getattr(settings, 'SET_REINTENTOS_CONCURRENCIA', 4)))
+
+
+class LimitadorSET:
+    """
+    Ritmo de envíos compartido por los hilos del pool
+
+    Aumento multiplicativo del intervalo ante 429/503 y disminución gradual
+    con cada aceptación (el ritmo se adapta a lo que SET tolera).
+    """
+
+    def __init__(self, intervalo_max: float = INTERVALO_MAX, pausa_max: float = PAUSA_MAX_SEGUNDOS,
+                 reloj: Callable[[], float] = time.monotonic, dormir: Callable[[float], None] = time.sleep):
+        self.intervalo = 0.0
+        self.intervalo_max = intervalo_max
+        self.pausa_max = pausa_max
+        self.frenadas = 0
+        self._reloj = reloj
+        self._dormir = dormir
+        self._proximo = 0.0
+        self._lock = threading.Lock()
+
+    def esperar_turno(self) -> bool:
+        """
+        Espera el turno del siguiente envío
+
+        Returns:
+            False si la pausa supera pausa_max (el documento se difiere)
+        """
+        with self._lock:
+            ahora = self._reloj()
+            turno = max(ahora, self._proximo)
+            if turno - ahora > self.pausa_max:
+                return False
+            self._proximo = turno + self.intervalo
+        if turno > ahora:
+            self._dormir(turno - ahora)
+        return True
+
+    def frenar(self, pausa: Optional[float] = None):
+        """SET respondió 429/503: duplica el intervalo y pausa lo indicado en Retry-After"""
+        with self._lock:
+            self.intervalo = min(max(self.intervalo * 2, INTERVALO_BASE), self.intervalo_max)
+            self._proximo = max(self._proximo, self._reloj() + (pausa or self.intervalo))
+            self.frenadas += 1
+
+    def acelerar(self):
+        """Envío aceptado: acorta el intervalo"""
+        with self._lock:
+            self.intervalo *= FACTOR_ACELERACION
+            if self.intervalo < INTERVALO_BASE / 10:
+                self.intervalo = 0.0
+
+    def pausa_restante(self) -> float:
+        with self._lock:
+            return max(0.0, self._proximo - self._reloj())
+
+
+class ColaReintentosSET:
+    """Reintentos de envío a SIFEN persistidos en reintentos_envio_set"""
+
+    # Compartido entre pasadas del mismo proceso: conserva el ritmo aprendido
+    _limitador = LimitadorSET()
+
+    @staticmethod
+    def programar(id_documento: int, codigo_error: str, mensaje_error: str,
+                  espera_segundos: int = ESPERA_DEFAULT_SEGUNDOS) -> ReintentoEnvioSET:
+        """
+        Agrega o reprograma el reenvío de un documento (conserva los intentos hechos)
+
+        Args:
+            id_documento: Documento con DatosFacturacionElect (CDC y XML)
+        """
+        reintento, _ = ReintentoEnvioSET.objects.update_or_create(
+            id_documento_id=id_documento,
+            defaults={
+                'estado': 'PENDIENTE',
+                'lote': None,
+                'codigo_error': codigo_error,
+                'ultimo_error': mensaje_error,
+                'fecha_proximo_intento': timezone.now() + timedelta(seconds=espera_segundos),
+            }
+        )
+        return reintento
+
+    @staticmethod
+    def reclamar_lote(limite: int = TAMANO_LOTE) -> List[ReintentoEnvioSET]:
+        """Toma hasta `limite` reintentos vencidos (PENDIENTE -> ENVIANDO con marca de lote)"""
+        ahora = timezone.now()
+        ids = list(
+            ReintentoEnvioSET.objects.filter(
+                estado='PENDIENTE',
+                fecha_proximo_intento__lte=ahora,
+            ).order_by('fecha_proximo_intento').values_list('id_reintento', flat=True)[:limite]
+        )
+        if not ids:
+            return []
+
+        lote = uuid.uuid4().hex
+        ReintentoEnvioSET.objects.filter(
+            id_reintento__in=ids,
+            estado='PENDIENTE',
+        ).update(estado='ENVIANDO', lote=lote, fecha_proximo_intento=ahora)
+        return list(
+            ReintentoEnvioSET.objects.select_related('id_documento').filter(
+                lote=lote, estado='ENVIANDO'
+            ).order_by('id_reintento')
+        )
+
+    @staticmethod
+    def procesar_pendientes(limite: int = TAMANO_LOTE, cliente=None,
+                            limitador: Optional[LimitadorSET] = None,
+                            hilos: Optional[int] = None) -> List[Dict]:
+        """
+        Reenvía un lote de documentos vencidos
+
+        Args:
+            cliente: SETAPIClient (default: uno sin reintentos internos)
+            limitador: LimitadorSET (default: el compartido del proceso)
+            hilos: Envíos simultáneos (default: settings.SET_REINTENTOS_CONCURRENCIA)
+
+        Returns:
+            Lista con {'cdc', 'exito', 'accion', 'mensaje'} por documento
+        """
+        from .rechazo_set_handler import SETAPIClient
+
+        ColaReintentosSET.recuperar_colgados()
+        reintentos = ColaReintentosSET.reclamar_lote(limite)
+        if not reintentos:
+            return []
+
+        hilos = hilos or concurrencia()
+        cliente = cliente or SETAPIClient(max_retries=0, pool_size=hilos)
+        limitador = limitador or ColaReintentosSET._limitador
+        respuestas = ColaReintentosSET._enviar(reintentos, cliente, limitador, hilos)
+        return ColaReintentosSET._registrar(reintentos, respuestas, limitador)
+
+    @staticmethod
+    def _enviar(reintentos: List[ReintentoEnvioSET], cliente, limitador: LimitadorSET,
+                hilos: int) -> List[Optional[Dict]]:
+        """Envía en paralelo; None para los documentos diferidos por el limitador"""
+        def enviar(reintento):
+            datos = reintento.id_documento
+            if not datos.xml_transmitido:
+                return {'estado': 'error', 'codigo': CODIGO_SIN_XML, 'mensaje': _ERROR_SIN_XML['descripcion']}
+            if not limitador.esperar_turno():
+                return None
+            try:
+                respuesta = cliente.enviar_de(datos.xml_transmitido, datos.cdc)
+            except Exception as e:
+                respuesta = {'estado': 'error', 'codigo': '9999', 'mensaje': str(e)}
+            if str(respuesta.get('codigo', '')) in CODIGOS_LIMITE:
+                limitador.frenar(respuesta.get('reintentar_en'))
+            elif respuesta.get('estado') == 'aceptado':
+                limitador.acelerar()
+            return respuesta
+
+        if hilos == 1 or len(reintentos) == 1:
+            return [enviar(reintento) for reintento in reintentos]
+        with ThreadPoolExecutor(max_workers=min(hilos, len(reintentos)), thread_name_prefix='reintentos-set') as pool:
+            return list(pool.map(enviar, reintentos))
+
+    @staticmethod
+    def _registrar(reintentos: List[ReintentoEnvioSET], respuestas: List[Optional[Dict]],
+                   limitador: LimitadorSET) -> List[Dict]:
+        """Guarda el resultado del lote con un bulk_update"""
+        from .rechazo_set_handler import CODIGOS_ERROR_SET
+
+        ahora = timezone.now()
+        espera_limite = max(limitador.pausa_restante(), ESPERA_LIMITE_MIN_SEGUNDOS)
+        aceptados, rechazados, a_revision, resultados = [], [], [], []
+
+        for reintento, respuesta in zip(reintentos, respuestas):
+            cdc = reintento.id_documento.cdc
+            reintento.lote = None
+
+            if respuesta is None:
+                reintento.estado = 'PENDIENTE'
+                reintento.fecha_proximo_intento = ahora + timedelta(seconds=espera_limite)
+                resultados.append({'cdc': cdc, 'exito': False, 'accion': 'diferido',
+                                   'mensaje': 'Envío diferido por límite de SET'})
+                continue
+
+            codigo = str(respuesta.get('codigo', '9999'))
+            mensaje = respuesta.get('mensaje', 'Error desconocido')
+
+            if respuesta.get('estado') == 'aceptado':
+                reintento.estado = 'ACEPTADO'
+                reintento.intentos += 1
+                reintento.fecha_aceptacion = ahora
+                reintento.codigo_error = None
+                reintento.ultimo_error = None
+                aceptados.append(reintento.id_documento_id)
+                resultados.append({'cdc': cdc, 'exito': True, 'accion': 'aceptado', 'mensaje': 'Documento aceptado'})
+                continue
+
+            reintento.codigo_error = codigo[:10]
+            reintento.ultimo_error = mensaje
+
+            if codigo in CODIGOS_LIMITE:
+                # No cuenta como intento: SET no llegó a evaluar el documento
+                espera = max(respuesta.get('reintentar_en') or 0, espera_limite)
+                reintento.estado = 'PENDIENTE'
+                reintento.fecha_proximo_intento = ahora + timedelta(seconds=espera)
+                resultados.append({'cdc': cdc, 'exito': False, 'accion': 'limitado', 'mensaje': mensaje})
+                continue
+
+            reintento.intentos += 1
+            info = _ERROR_SIN_XML if codigo == CODIGO_SIN_XML else CODIGOS_ERROR_SET.get(codigo, {})
+            if (info and not info['reintentar']) or reintento.intentos >= reintento.max_intentos:
+                reintento.estado = 'REVISION'
+                rechazados.append(reintento.id_documento_id)
+                a_revision.append((reintento, info.get('accion', 'Máximo de reintentos alcanzado')))
+                resultados.append({'cdc': cdc, 'exito': False, 'accion': 'revision_manual', 'mensaje': mensaje})
+                continue
+
+            espera = min(
+                info.get('espera_segundos', ESPERA_DEFAULT_SEGUNDOS) * 2 ** (reintento.intentos - 1),
+                BACKOFF_MAX_SEGUNDOS
+            )
+            reintento.estado = 'PENDIENTE'
+            reintento.fecha_proximo_intento = ahora + timedelta(seconds=espera)
+            resultados.append({'cdc': cdc, 'exito': False, 'accion': 'reintento_programado', 'mensaje': mensaje})
+
+        with transaction.atomic():
+            ReintentoEnvioSET.objects.bulk_update(reintentos, [
+                'estado', 'lote', 'intentos', 'codigo_error', 'ultimo_error',
+                'fecha_proximo_intento', 'fecha_aceptacion',
+            ])
+            if aceptados:
+                DatosFacturacionElect.objects.filter(id_documento__in=aceptados).update(
+                    estado_sifen='Aprobado', fecha_respuesta=ahora
+                )
+            if rechazados:
+                DatosFacturacionElect.objects.filter(id_documento__in=rechazados).update(
+                    estado_sifen='Rechazado', fecha_respuesta=ahora
+                )
+                AlertasSistema.objects.bulk_create([
+                    AlertasSistema(
+                        tipo='Sistema',
+                        mensaje=(
+                            f'Factura {reintento.id_documento.cdc} requiere revisión manual '
+                            f'({reintento.codigo_error}): {accion}'
+                        )[:500],
+                        fecha_creacion=ahora,
+                        estado='Pendiente',
+                    )
+                    for reintento, accion in a_revision
+                ])
+
+        for reintento, _ in a_revision:
+            logger.warning(f"CDC {reintento.id_documento.cdc} marcado para revisión manual")
+        return resultados
+
+    @staticmethod
+    def vaciar(limite: int = TAMANO_LOTE, **opciones) -> Dict[str, int]:
+        """
+        Procesa lotes hasta que no queden reintentos vencidos
+
+        Returns:
+            Conteo por acción ('aceptado', 'reintento_programado', ...)
+        """
+        total: Dict[str, int] = {}
+        while True:
+            resultados = ColaReintentosSET.procesar_pendientes(limite, **opciones)
+            if not resultados:
+                return total
+            for resultado in resultados:
+                total[resultado['accion']] = total.get(resultado['accion'], 0) + 1
+
+    @staticmethod
+    def recuperar_colgados() -> int:
+        """Devuelve a PENDIENTE los reintentos que quedaron ENVIANDO tras una caída del worker"""
+        limite = timezone.now() - timedelta(minutes=REINTENTO_COLGADO_MINUTOS)
+        return ReintentoEnvioSET.objects.filter(
+            estado='ENVIANDO',
+            fecha_proximo_intento__lt=limite,
+        ).update(estado='PENDIENTE', lote=None, fecha_proximo_intento=timezone.now())
+
+    @staticmethod
+    def estado_cola() -> Dict[str, int]:
+        """Conteos por estado"""
+        return {
+            fila['estado']: fila['total']
+            for fila in ReintentoEnvioSET.objects.values('estado').annotate(total=Count('id_reintento'))
+        }
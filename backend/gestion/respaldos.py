@@ -0,0 +1,407 @@
+"""
+Backups de MySQL comprimidos en streaming
+==========================================
+
+backup_database escribía primero el .sql completo con --result-file y
+recién después lo comprimía con gzip nivel 9 en un solo hilo: el doble de
+disco y una segunda pasada tan larga como el dump.
+
+RespaldoMySQL lee la salida de mysqldump por un pipe y la comprime
+mientras se genera:
+
+- CompresorGzipParalelo corta el stream en bloques y comprime cada bloque
+  como un miembro gzip independiente en un pool de hilos (zlib libera el
+  GIL). Un gzip multi-miembro es un .gz estándar: gunzip, zcat y
+  gzip.open lo leen sin cambios. Hay como máximo 2 x hilos bloques en
+  vuelo, así que la memoria no depende del tamaño de la base
+- Se calcula el SHA-256 del SQL y del .gz en la misma pasada y se guardan
+  en un manifiesto JSON junto a los archivos
+- El archivo se escribe como .parcial y se renombra sólo si mysqldump
+  terminó bien: un dump cortado nunca queda con nombre de backup válido
+
+Las tablas de mayor volumen (TABLAS_PESADAS) se pueden volcar por
+separado y en forma incremental desde una fecha (--where con
+--no-create-info --replace, para aplicar sobre un backup completo).
+
+verificar() descomprime cada archivo del manifiesto en streaming, compara
+los checksums, comprueba la marca final de mysqldump y opcionalmente lo
+restaura en una base de prueba con el cliente mysql.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, List, Optional
+
+from django.conf import settings
+
+# Tablas de mayor volumen y condición para el volcado incremental
+TABLAS_PESADAS = {
+    'consumos_tarjeta': "fecha_consumo >= '{desde}'",
+    'ventas': "fecha >= '{desde}'",
+    'detalle_venta': "id_venta IN (SELECT id_venta FROM ventas WHERE fecha >= '{desde}')",
+    'auditoria_operaciones': "fecha_operacion >= '{desde}'",
+}
+
+TAMANO_BLOQUE = 4 * 1024 * 1024
+NIVEL_COMPRESION = 6
+# Última línea que escribe mysqldump cuando termina el volcado
+MARCA_FIN_DUMP = b'-- Dump completed'
+SUFIJO_MANIFIESTO = '.manifest.json'
+
+
+class BackupError(Exception):
+    """Falló el volcado o la verificación de un backup"""
+    pass
+
+
+def hilos_compresion() -> int:
+    """Hilos de compresión (settings.BACKUP_HILOS_COMPRESION)"""
+    return max(1, int(getattr(settings, 'BACKUP_HILOS_COMPRESION', min(4, os.cpu_count() or 1))))
+
+
+def _comprimir_bloque(bloque: bytes, nivel: int) -> bytes:
+    # mtime=0: el mismo SQL produce siempre el mismo .gz
+    return gzip.compress(bloque, compresslevel=nivel, mtime=0)
+
+
+class _SalidaConChecksum:
+    """Cuenta y calcula el SHA-256 de los bytes escritos en un archivo"""
+
+    def __init__(self, salida: BinaryIO):
+        self.salida = salida
+        self.sha256 = hashlib.sha256()
+        self.bytes = 0
+
+    def write(self, datos: bytes):
+        self.salida.write(datos)
+        self.sha256.update(datos)
+        self.bytes += len(datos)
+
+
+class CompresorGzipParalelo:
+    """
+    Escritor de gzip multi-miembro con compresión de bloques en paralelo
+
+    Los bloques se escriben en el orden en que llegaron; escribir() se
+    bloquea cuando hay 2 x hilos bloques pendientes.
+    """
+
+    def __init__(self, salida: BinaryIO, nivel: int = NIVEL_COMPRESION,
+                 hilos: Optional[int] = None, tamano_bloque: int = TAMANO_BLOQUE):
+        self.salida = _SalidaConChecksum(salida)
+        self.nivel = nivel
+        self.hilos = hilos or hilos_compresion()
+        self.tamano_bloque = tamano_bloque
+        self.sha256_sql = hashlib.sha256()
+        self.bytes_sql = 0
+        self.cola_sql = b''
+        self._buffer = bytearray()
+        self._pendientes = deque()
+        self._pool = ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix='backup-gzip')
+
+    def escribir(self, datos: bytes):
+        self.sha256_sql.update(datos)
+        self.bytes_sql += len(datos)
+        # Últimos bytes del SQL para comprobar la marca de fin
+        self.cola_sql = (self.cola_sql + datos)[-256:]
+        self._buffer += datos
+        while len(self._buffer) >= self.tamano_bloque:
+            self._encolar(bytes(self._buffer[:self.tamano_bloque]))
+            del self._buffer[:self.tamano_bloque]
+
+    def _encolar(self, bloque: bytes):
+        self._pendientes.append(self._pool.submit(_comprimir_bloque, bloque, self.nivel))
+        while len(self._pendientes) > 2 * self.hilos:
+            self.salida.write(self._pendientes.popleft().result())
+
+    def cerrar(self) -> Dict:
+        """
+        Comprime lo que queda y espera los bloques pendientes
+
+        Returns:
+            Dict con bytes_sql, bytes_gz, sha256_sql, sha256_gz y completo
+        """
+        try:
+            if self._buffer or not self.bytes_sql:
+                self._encolar(bytes(self._buffer))
+                self._buffer.clear()
+            while self._pendientes:
+                self.salida.write(self._pendientes.popleft().result())
+        finally:
+            self.abortar()
+        return {
+            'bytes_sql': self.bytes_sql,
+            'bytes_gz': self.salida.bytes,
+            'sha256_sql': self.sha256_sql.hexdigest(),
+            'sha256_gz': self.salida.sha256.hexdigest(),
+            'completo': MARCA_FIN_DUMP in self.cola_sql,
+        }
+
+    def abortar(self):
+        for pendiente in self._pendientes:
+            pendiente.cancel()
+        self._pool.shutdown(wait=True)
+
+
+class _EscritorPlano:
+    """Mismo contrato que CompresorGzipParalelo, sin comprimir (backups sin --compress)"""
+
+    def __init__(self, salida: BinaryIO):
+        self.salida = _SalidaConChecksum(salida)
+        self.cola_sql = b''
+
+    def escribir(self, datos: bytes):
+        self.salida.write(datos)
+        self.cola_sql = (self.cola_sql + datos)[-256:]
+
+    def cerrar(self) -> Dict:
+        return {
+            'bytes_sql': self.salida.bytes,
+            'bytes_gz': None,
+            'sha256_sql': self.salida.sha256.hexdigest(),
+            'sha256_gz': None,
+            'completo': MARCA_FIN_DUMP in self.cola_sql,
+        }
+
+    def abortar(self):
+        pass
+
+
+def volcar(comando: List[str], destino: Path, comprimir: bool = True, nivel: int = NIVEL_COMPRESION,
+           hilos: Optional[int] = None, tamano_bloque: int = TAMANO_BLOQUE,
+           entorno: Optional[Dict[str, str]] = None) -> Dict:
+    """
+    Ejecuta `comando` y escribe su salida en `destino` (comprimida si corresponde)
+
+    Raises:
+        BackupError: El comando terminó con error o no escribió la marca de fin
+
+    Returns:
+        Dict de CompresorGzipParalelo.cerrar() con archivo agregado
+    """
+    parcial = destino.with_name(destino.name + '.parcial')
+    try:
+        # stderr a un archivo temporal: con un PIPE sin leer mysqldump podría bloquearse
+        with tempfile.TemporaryFile() as errores, parcial.open('wb') as salida:
+            proceso = subprocess.Popen(comando, stdout=subprocess.PIPE, stderr=errores, env=entorno)
+            escritor = (CompresorGzipParalelo(salida, nivel, hilos, tamano_bloque)
+                        if comprimir else _EscritorPlano(salida))
+            try:
+                for bloque in iter(lambda: proceso.stdout.read(tamano_bloque), b''):
+                    escritor.escribir(bloque)
+                resumen = escritor.cerrar()
+            except BaseException:
+                proceso.kill()
+                escritor.abortar()
+                raise
+            finally:
+                proceso.stdout.close()
+                codigo = proceso.wait()
+
+            if codigo != 0:
+                errores.seek(0)
+                mensaje = errores.read().decode('utf-8', 'replace').strip()
+                raise BackupError(f'{Path(comando[0]).name} falló ({codigo}): {mensaje}')
+        if not resumen['completo']:
+            raise BackupError(f'Volcado incompleto: falta "{MARCA_FIN_DUMP.decode()}" al final')
+    except BaseException:
+        parcial.unlink(missing_ok=True)
+        raise
+
+    parcial.replace(destino)
+    resumen['archivo'] = destino.name
+    return resumen
+
+
+class RespaldoMySQL:
+    """Volcados completos o por tabla de la base configurada, con manifiesto de checksums"""
+
+    def __init__(self, db_config: Dict, directorio: Path, comprimir: bool = True,
+                 nivel: int = NIVEL_COMPRESION, hilos: Optional[int] = None,
+                 tamano_bloque: int = TAMANO_BLOQUE):
+        self.db_config = db_config
+        self.directorio = Path(directorio)
+        self.comprimir = comprimir
+        self.nivel = nivel
+        self.hilos = hilos or hilos_compresion()
+        self.tamano_bloque = tamano_bloque
+        self.marca = datetime.now().strftime('%Y%m%d_%H%M%S')
+
+    def _conexion(self) -> List[str]:
+        db = self.db_config
+        argumentos = [f'--host={db.get("HOST") or "localhost"}']
+        if db.get('PORT'):
+            argumentos.append(f'--port={db["PORT"]}')
+        argumentos.append(f'--user={db.get("USER", "")}')
+        return argumentos
+
+    def _entorno(self) -> Dict[str, str]:
+        # La contraseña va por entorno y no en la línea de comandos (visible en ps)
+        entorno = dict(os.environ)
+        if self.db_config.get('PASSWORD'):
+            entorno['MYSQL_PWD'] = self.db_config['PASSWORD']
+        return entorno
+
+    def _nombre(self, sufijo: str = '') -> str:
+        extension = '.sql.gz' if self.comprimir else '.sql'
+        return f'backup_{self.db_config["NAME"]}_{self.marca}{sufijo}{extension}'
+
+    def _volcar(self, argumentos: List[str], nombre: str) -> Dict:
+        comando = [getattr(settings, 'BACKUP_MYSQLDUMP_BIN', 'mysqldump'), *self._conexion(), *argumentos]
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        return volcar(
+            comando, self.directorio / nombre, self.comprimir, self.nivel,
+            self.hilos, self.tamano_bloque, self._entorno(),
+        )
+
+    def completo(self) -> Dict:
+        """Volcado de toda la base (estructura, datos, rutinas, triggers y eventos)"""
+        archivo = self._volcar([
+            '--single-transaction',
+            '--quick',
+            '--lock-tables=false',
+            '--routines',
+            '--triggers',
+            '--events',
+            self.db_config['NAME'],
+        ], self._nombre())
+        return self._guardar_manifiesto('completo', [archivo])
+
+    def por_tablas(self, tablas: Iterable[str], desde: Optional[date] = None) -> Dict:
+        """
+        Un archivo por tabla; con `desde`, sólo las filas desde esa fecha
+
+        Args:
+            tablas: Nombres de tabla (con `desde`, sólo de TABLAS_PESADAS)
+            desde: Fecha de inicio del volcado incremental
+
+        Raises:
+            BackupError: Tabla sin condición incremental conocida
+        """
+        tablas = list(tablas)
+        if desde is not None:
+            desconocidas = [t for t in tablas if t not in TABLAS_PESADAS]
+            if desconocidas:
+                raise BackupError(f'Sin volcado incremental para: {", ".join(desconocidas)}')
+
+        archivos = []
+        for tabla in tablas:
+            argumentos = ['--single-transaction', '--quick', '--lock-tables=false', '--skip-triggers']
+            sufijo = f'_{tabla}'
+            if desde is not None:
+                # Sin CREATE TABLE y con REPLACE: se aplica sobre un backup completo
+                argumentos += [
+                    '--no-create-info', '--replace',
+                    f'--where={TABLAS_PESADAS[tabla].format(desde=desde.isoformat())}',
+                ]
+                sufijo += f'_desde{desde:%Y%m%d}'
+            archivos.append(self._volcar([*argumentos, self.db_config['NAME'], tabla], self._nombre(sufijo)))
+
+        if desde is not None:
+            return self._guardar_manifiesto('incremental', archivos, desde=desde.isoformat())
+        return self._guardar_manifiesto('tablas', archivos)
+
+    def _guardar_manifiesto(self, tipo: str, archivos: List[Dict], **extra) -> Dict:
+        manifiesto = {
+            'base': self.db_config['NAME'],
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'tipo': tipo,
+            'nivel': self.nivel if self.comprimir else None,
+            'archivos': archivos,
+            'manifiesto': f'backup_{self.db_config["NAME"]}_{self.marca}_{tipo}{SUFIJO_MANIFIESTO}',
+            **extra,
+        }
+        ruta = self.directorio / manifiesto['manifiesto']
+        ruta.write_text(json.dumps(manifiesto, indent=2), encoding='utf-8')
+        return manifiesto
+
+    @staticmethod
+    def verificar(ruta_manifiesto: Path, restaurar_en: Optional[str] = None,
+                  db_config: Optional[Dict] = None, tamano_bloque: int = TAMANO_BLOQUE) -> List[Dict]:
+        """
+        Verifica los archivos de un manifiesto (y opcionalmente los restaura)
+
+        Args:
+            ruta_manifiesto: Manifiesto JSON escrito por completo()/por_tablas()
+            restaurar_en: Base de prueba donde cargar cada archivo con el cliente mysql
+            db_config: Conexión para la restauración
+
+        Returns:
+            Lista de {archivo, ok, errores} por archivo
+        """
+        ruta_manifiesto = Path(ruta_manifiesto)
+        manifiesto = json.loads(ruta_manifiesto.read_text(encoding='utf-8'))
+        resultados = []
+        for archivo in manifiesto['archivos']:
+            ruta = ruta_manifiesto.parent / archivo['archivo']
+            if not ruta.exists():
+                resultados.append({'archivo': archivo['archivo'], 'ok': False, 'errores': ['No existe']})
+                continue
+            errores = RespaldoMySQL._verificar_archivo(ruta, archivo, restaurar_en, db_config, tamano_bloque)
+            resultados.append({'archivo': archivo['archivo'], 'ok': not errores, 'errores': errores})
+        return resultados
+
+    @staticmethod
+    def _verificar_archivo(ruta: Path, esperado: Dict, restaurar_en: Optional[str],
+                           db_config: Optional[Dict], tamano_bloque: int) -> List[str]:
+        errores = []
+        if esperado.get('sha256_gz'):
+            sha256_gz = hashlib.sha256()
+            with ruta.open('rb') as comprimido:
+                for bloque in iter(lambda: comprimido.read(tamano_bloque), b''):
+                    sha256_gz.update(bloque)
+            if sha256_gz.hexdigest() != esperado['sha256_gz']:
+                # El .gz está dañado: no tiene sentido descomprimirlo
+                return ['SHA-256 del archivo comprimido no coincide']
+
+        proceso = None
+        if restaurar_en:
+            respaldo = RespaldoMySQL(db_config or {}, ruta.parent)
+            comando = [getattr(settings, 'BACKUP_MYSQL_BIN', 'mysql'), *respaldo._conexion(), restaurar_en]
+            salida_restauracion = tempfile.TemporaryFile()
+            proceso = subprocess.Popen(
+                comando, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                stderr=salida_restauracion, env=respaldo._entorno(),
+            )
+
+        sha256_sql = hashlib.sha256()
+        bytes_sql = 0
+        cola = b''
+        abrir = gzip.open if ruta.name.endswith('.gz') else open
+        try:
+            with abrir(ruta, 'rb') as sql:
+                for bloque in iter(lambda: sql.read(tamano_bloque), b''):
+                    sha256_sql.update(bloque)
+                    bytes_sql += len(bloque)
+                    cola = (cola + bloque)[-256:]
+                    if proceso is not None:
+                        proceso.stdin.write(bloque)
+        except BrokenPipeError:
+            errores.append('El cliente mysql cerró la entrada')
+        except (OSError, EOFError) as e:
+            errores.append(f'No se pudo leer: {e}')
+
+        if sha256_sql.hexdigest() != esperado['sha256_sql'] or bytes_sql != esperado['bytes_sql']:
+            errores.append('SHA-256 del SQL no coincide')
+        if MARCA_FIN_DUMP not in cola:
+            errores.append('Volcado incompleto (sin marca de fin)')
+
+        if proceso is not None:
+            try:
+                proceso.stdin.close()
+            except BrokenPipeError:
+                pass
+            if proceso.wait() != 0:
+                salida_restauracion.seek(0)
+                detalle = salida_restauracion.read().decode('utf-8', 'replace').strip()
+                errores.append(f'Restauración en {restaurar_en} falló: {detalle}')
+            salida_restauracion.close()
+        return errores
@@ -8,7 +8,7 @@ from django.views.decorators.http import require_http_methods
 import json
 
 from gestion.models import Tarjeta, Producto
-from gestion.restricciones_matcher import ProductoRestriccionMatcher, verificar_restricciones_venta
+from gestion.restricciones_matcher import MatrizConflictos, ProductoRestriccionMatcher, verificar_restricciones_venta
 
 
 @login_required
@@ -129,33 +129,15 @@ def obtener_productos_seguros_api(request, tarjeta_codigo):
         
         # Obtener restricciones
         from gestion.models import RestriccionesHijos
-        restricciones = RestriccionesHijos.objects.filter(
+        restricciones = list(RestriccionesHijos.objects.filter(
             id_hijo=tarjeta.id_hijo,
             activo=True
-        )
+        ))
         
-        if not restricciones.exists():
-            # Sin restricciones, retornar todos los productos
-            productos = Producto.objects.filter(activo=True)[:50]
-        else:
-            # Filtrar productos seguros
-            productos_todos = Producto.objects.filter(activo=True)
-            productos_seguros = []
-            
-            for producto in productos_todos:
-                es_seguro = True
-                for restriccion in restricciones:
-                    tiene_conflicto, _, _ = ProductoRestriccionMatcher.analizar_producto(
-                        producto, restriccion
-                    )
-                    if tiene_conflicto:
-                        es_seguro = False
-                        break
-                
-                if es_seguro:
-                    productos_seguros.append(producto)
-            
-            productos = productos_seguros[:50]
+        # Filtrar productos seguros (sin restricciones, todos)
+        productos = MatrizConflictos.filtrar_seguros(
+            Producto.objects.filter(activo=True), restricciones
+        )[:50]
         
         # Formatear productos
         productos_json = []
@@ -3,12 +3,87 @@ Sistema de Matching Automático: Producto vs Restricción Alimentaria
 
 Este módulo implementa el análisis automático de productos contra restricciones
 alimentarias de los estudiantes, utilizando palabras clave y categorías.
+
+Las palabras clave de todos los tipos se compilan en un solo autómata
+Aho-Corasick (AutomataPalabras) que encuentra todas las presentes en una
+pasada por la descripción. El resultado por producto se guarda en
+matriz_restricciones_producto (MatrizConflictos): una máscara de bits con los
+tipos de restricción en conflicto y la confianza y razones de cada uno. Los
+controles de carrito y los listados de productos seguros consultan esa
+matriz en lugar de analizar producto x restricción en Python.
 """
 
-from django.db import models
-from decimal import Decimal
-from typing import List, Dict, Tuple
-import re
+import hashlib
+import json
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from django.db import transaction
+from django.db.models import F, QuerySet
+
+# Umbral de confianza a partir del cual hay conflicto
+UMBRAL_CONFLICTO = 50
+PUNTAJE_PALABRA = 30
+PUNTAJE_CATEGORIA = 20
+PUNTAJE_OBSERVACION = 15
+SIN_COINCIDENCIAS = "Sin coincidencias detectadas"
+
+# Productos por INSERT al reconstruir la matriz
+TAMANO_LOTE_MATRIZ = 500
+
+
+class AutomataPalabras:
+    """
+    Autómata Aho-Corasick sobre un conjunto de palabras clave
+
+    buscar() recorre el texto una sola vez y devuelve todas las palabras que
+    aparecen como subcadena (igual que `palabra in texto` para cada una),
+    incluidas las superpuestas ('mani' dentro de 'mantequilla de mani').
+    """
+
+    def __init__(self, palabras: Iterable[str]):
+        self._transiciones: List[Dict[str, int]] = [{}]
+        self._fallo: List[int] = [0]
+        self._salida: List[frozenset] = [frozenset()]
+
+        for palabra in set(palabras):
+            estado = 0
+            for caracter in palabra:
+                siguiente = self._transiciones[estado].get(caracter)
+                if siguiente is None:
+                    siguiente = len(self._transiciones)
+                    self._transiciones[estado][caracter] = siguiente
+                    self._transiciones.append({})
+                    self._fallo.append(0)
+                    self._salida.append(frozenset())
+                estado = siguiente
+            self._salida[estado] = self._salida[estado] | {palabra}
+
+        # Enlaces de fallo por niveles (BFS)
+        pendientes = deque(self._transiciones[0].values())
+        while pendientes:
+            estado = pendientes.popleft()
+            for caracter, siguiente in self._transiciones[estado].items():
+                pendientes.append(siguiente)
+                fallo = self._fallo[estado]
+                while fallo and caracter not in self._transiciones[fallo]:
+                    fallo = self._fallo[fallo]
+                self._fallo[siguiente] = self._transiciones[fallo].get(caracter, 0)
+                self._salida[siguiente] = self._salida[siguiente] | self._salida[self._fallo[siguiente]]
+
+    def buscar(self, texto: str) -> Set[str]:
+        """Palabras del autómata contenidas en el texto"""
+        transiciones, fallo, salida = self._transiciones, self._fallo, self._salida
+        encontradas: Set[str] = set()
+        estado = 0
+        for caracter in texto:
+            while estado and caracter not in transiciones[estado]:
+                estado = fallo[estado]
+            estado = transiciones[estado].get(caracter, 0)
+            if salida[estado]:
+                encontradas |= salida[estado]
+        return encontradas
 
 
 class ProductoRestriccionMatcher:
@@ -96,53 +171,17 @@ class ProductoRestriccionMatcher:
             Tuple (tiene_conflicto: bool, razon: str, nivel_confianza: int)
             nivel_confianza: 0-100 (0=sin match, 100=match seguro)
         """
-        tipo_restriccion = restriccion.tipo_restriccion
-        keywords = cls.KEYWORDS_RESTRICCIONES.get(tipo_restriccion, [])
-        categorias_riesgo = cls.CATEGORIAS_RIESGO.get(tipo_restriccion, [])
-        
-        nivel_confianza = 0
-        razones = []
-        
-        # 1. Buscar palabras clave en descripción del producto
-        descripcion_lower = producto.descripcion.lower()
-        
-        for keyword in keywords:
-            if keyword in descripcion_lower:
-                nivel_confianza += 30
-                razones.append(f"Contiene '{keyword}' en descripción")
-        
-        # 2. Verificar categoría del producto
+        categoria = None
         if hasattr(producto, 'id_categoria') and producto.id_categoria:
-            categoria_nombre = producto.id_categoria.nombre
-            if categoria_nombre in categorias_riesgo:
-                nivel_confianza += 20
-                razones.append(f"Pertenece a categoría de riesgo: {categoria_nombre}")
-        
-        # 3. Revisar componentes si es un almuerzo
-        if hasattr(producto, 'componentesalmuerzo_set'):
-            componentes = producto.componentesalmuerzo_set.all()
-            for componente in componentes:
-                comp_desc = componente.nombre_componente.lower()
-                for keyword in keywords:
-                    if keyword in comp_desc:
-                        nivel_confianza += 25
-                        razones.append(f"Componente '{componente.nombre_componente}' puede contener {keyword}")
-        
-        # 4. Verificar observaciones específicas de la restricción
-        if restriccion.observaciones:
-            obs_lower = restriccion.observaciones.lower()
-            for keyword in keywords:
-                if keyword in obs_lower:
-                    nivel_confianza += 15
-                    razones.append(f"Observaciones mencionan '{keyword}'")
-        
-        # Limitar confianza a 100
-        nivel_confianza = min(nivel_confianza, 100)
-        
-        tiene_conflicto = nivel_confianza >= 50  # Umbral: 50% de confianza
-        razon = "; ".join(razones) if razones else "Sin coincidencias detectadas"
-        
-        return tiene_conflicto, razon, nivel_confianza
+            categoria = producto.id_categoria.nombre
+        
+        fila = MatrizConflictos.evaluar(producto.descripcion, categoria)
+        tipo = restriccion.tipo_restriccion
+        return MatrizConflictos.combinar(
+            fila['confianzas'].get(tipo, 0),
+            fila['razones'].get(tipo, []),
+            MatrizConflictos.evaluar_observaciones(restriccion)
+        )
     
     @classmethod
     def analizar_carrito(cls, items_carrito: List[Dict], tarjeta) -> Dict:
@@ -170,7 +209,7 @@ class ProductoRestriccionMatcher:
                 'requiere_autorizacion': bool
             }
         """
-        from gestion.models import RestriccionesHijos, Producto
+        from gestion.models import RestriccionesHijos
         
         resultado = {
             'tiene_alertas': False,
@@ -184,49 +223,45 @@ class ProductoRestriccionMatcher:
             return resultado
         
         # Obtener restricciones del hijo
-        restricciones = RestriccionesHijos.objects.filter(
+        restricciones = list(RestriccionesHijos.objects.filter(
             id_hijo=tarjeta.id_hijo,
             activo=True
-        )
+        ))
         
-        if not restricciones.exists():
+        if not restricciones:
             return resultado
         
-        # Analizar cada producto contra cada restricción
-        for item in items_carrito:
-            producto = item.get('producto')
-            if not producto:
-                continue
-            
-            for restriccion in restricciones:
-                tiene_conflicto, razon, nivel_confianza = cls.analizar_producto(
-                    producto, restriccion
-                )
+        # Conflictos de todo el carrito en una consulta a la matriz
+        productos = [item.get('producto') for item in items_carrito if item.get('producto')]
+        conflictos = MatrizConflictos.conflictos(
+            [producto.id_producto for producto in productos], restricciones
+        )
+        
+        for producto in productos:
+            for restriccion, nivel_confianza, razon in conflictos.get(producto.id_producto, []):
+                # Determinar severidad según nivel de confianza
+                if nivel_confianza >= 80:
+                    severidad = 'alta'
+                    resultado['requiere_autorizacion'] = True
+                elif nivel_confianza >= 60:
+                    severidad = 'media'
+                    resultado['requiere_autorizacion'] = True
+                else:
+                    severidad = 'baja'
                 
-                if tiene_conflicto:
-                    # Determinar severidad según nivel de confianza
-                    if nivel_confianza >= 80:
-                        severidad = 'alta'
-                        resultado['requiere_autorizacion'] = True
-                    elif nivel_confianza >= 60:
-                        severidad = 'media'
-                        resultado['requiere_autorizacion'] = True
-                    else:
-                        severidad = 'baja'
-                    
-                    resultado['alertas'].append({
-                        'producto': producto,
-                        'restriccion': restriccion,
-                        'razon': razon,
-                        'nivel_confianza': nivel_confianza,
-                        'severidad': severidad
-                    })
-                    resultado['tiene_alertas'] = True
+                resultado['alertas'].append({
+                    'producto': producto,
+                    'restriccion': restriccion,
+                    'razon': razon,
+                    'nivel_confianza': nivel_confianza,
+                    'severidad': severidad
+                })
+                resultado['tiene_alertas'] = True
         
         return resultado
     
     @classmethod
-    def obtener_productos_seguros(cls, restriccion, categoria=None) -> List:
+    def obtener_productos_seguros(cls, restriccion, categoria=None) -> QuerySet:
         """
         Obtiene lista de productos seguros para una restricción específica
         
@@ -244,17 +279,7 @@ class ProductoRestriccionMatcher:
         if categoria:
             productos = productos.filter(id_categoria=categoria)
         
-        # Filtrar productos que NO contengan palabras clave de la restricción
-        tipo_restriccion = restriccion.tipo_restriccion
-        keywords = cls.KEYWORDS_RESTRICCIONES.get(tipo_restriccion, [])
-        
-        productos_seguros = []
-        for producto in productos:
-            tiene_conflicto, _, _ = cls.analizar_producto(producto, restriccion)
-            if not tiene_conflicto:
-                productos_seguros.append(producto)
-        
-        return productos_seguros
+        return MatrizConflictos.filtrar_seguros(productos, [restriccion])
     
     @classmethod
     def sugerir_alternativas(cls, producto, restriccion, max_resultados=5) -> List:
@@ -272,7 +297,7 @@ class ProductoRestriccionMatcher:
         categoria = producto.id_categoria if hasattr(producto, 'id_categoria') else None
         productos_seguros = cls.obtener_productos_seguros(restriccion, categoria)
         
-        return productos_seguros[:max_resultados]
+        return list(productos_seguros[:max_resultados])
 
 
 # Función de utilidad para usar en views
@@ -289,13 +314,336 @@ def verificar_restricciones_venta(tarjeta, items_carrito):
     """
     from gestion.models import Producto
     
-    # Convertir items a formato esperado
-    items = []
-    for item in items_carrito:
-        try:
-            producto = Producto.objects.get(id_producto=item['producto_id'])
-            items.append({'producto': producto, 'cantidad': item.get('cantidad', 1)})
-        except Producto.DoesNotExist:
-            continue
+    # Convertir items a formato esperado (una consulta para todo el carrito)
+    productos = Producto.objects.in_bulk(
+        [item['producto_id'] for item in items_carrito]
+    )
+    items = [
+        {'producto': productos[item['producto_id']], 'cantidad': item.get('cantidad', 1)}
+        for item in items_carrito
+        if item['producto_id'] in productos
+    ]
     
     return ProductoRestriccionMatcher.analizar_carrito(items, tarjeta)
+
+
+
+class MatrizConflictos:
+    """
+    Matriz precalculada producto x tipo de restricción
+    
+    Por producto guarda (MatrizRestriccionProducto):
+    - mascara: bit del tipo si la descripción y la categoría ya alcanzan el
+      umbral de conflicto
+    - mascara_riesgo: bit del tipo si hubo alguna coincidencia
+    - confianzas / razones: puntaje y razones por tipo, para armar la alerta
+    
+    Las observaciones de cada restricción se suman al consultar. Las filas se
+    recalculan al guardar el producto o su categoría, y cuando cambian las
+    palabras clave o categorías de riesgo (versión distinta) al consultarlas.
+    filtrar_seguros revisa los productos desactualizados una vez por proceso
+    y versión; los productos insertados sin signals (bulk_create,
+    importaciones) se completan con reconstruir_matriz_restricciones.
+    """
+    
+    _compilado: Optional[Dict] = None
+    _lock = threading.Lock()
+    # Versión de la matriz ya completada por este proceso
+    _version_asegurada: Optional[str] = None
+    
+    @staticmethod
+    def _motor() -> Dict:
+        """Autómata, bits por tipo y versión, compilados una vez por proceso"""
+        compilado = MatrizConflictos._compilado
+        if compilado is not None:
+            return compilado
+        
+        with MatrizConflictos._lock:
+            if MatrizConflictos._compilado is None:
+                keywords = ProductoRestriccionMatcher.KEYWORDS_RESTRICCIONES
+                categorias = ProductoRestriccionMatcher.CATEGORIAS_RIESGO
+                
+                # palabra -> [(tipo, posición en la lista del tipo)]
+                palabras: Dict[str, List[Tuple[str, int]]] = {}
+                for tipo, lista in keywords.items():
+                    for posicion, palabra in enumerate(lista):
+                        palabras.setdefault(palabra, []).append((tipo, posicion))
+                
+                firma = json.dumps([keywords, categorias], sort_keys=True, ensure_ascii=False)
+                MatrizConflictos._compilado = {
+                    'automata': AutomataPalabras(palabras),
+                    'palabras': palabras,
+                    'bits': {tipo: 1 << i for i, tipo in enumerate(keywords)},
+                    'categorias': categorias,
+                    'version': hashlib.sha1(firma.encode('utf-8')).hexdigest()[:12],
+                }
+            return MatrizConflictos._compilado
+    
+    @staticmethod
+    def version() -> str:
+        return MatrizConflictos._motor()['version']
+    
+    @staticmethod
+    def evaluar(descripcion: str, categoria: Optional[str]) -> Dict:
+        """
+        Fila de la matriz para una descripción y nombre de categoría
+        
+        Returns:
+            {'mascara', 'mascara_riesgo', 'confianzas': {tipo: int}, 'razones': {tipo: [str]}}
+            (sólo los tipos con alguna coincidencia, confianza sin tope)
+        """
+        motor = MatrizConflictos._motor()
+        
+        coincidencias: Dict[str, List[Tuple[int, str]]] = {}
+        for palabra in motor['automata'].buscar((descripcion or '').lower()):
+            for tipo, posicion in motor['palabras'][palabra]:
+                coincidencias.setdefault(tipo, []).append((posicion, palabra))
+        
+        confianzas = {}
+        razones = {}
+        mascara = mascara_riesgo = 0
+        for tipo, bit in motor['bits'].items():
+            # Mismo orden de razones que la lista de palabras clave
+            encontradas = sorted(coincidencias.get(tipo, []))
+            puntaje = PUNTAJE_PALABRA * len(encontradas)
+            razones_tipo = [f"Contiene '{palabra}' en descripción" for _, palabra in encontradas]
+            
+            if categoria and categoria in motor['categorias'].get(tipo, []):
+                puntaje += PUNTAJE_CATEGORIA
+                razones_tipo.append(f"Pertenece a categoría de riesgo: {categoria}")
+            
+            if puntaje:
+                confianzas[tipo] = puntaje
+                razones[tipo] = razones_tipo
+                mascara_riesgo |= bit
+                if puntaje >= UMBRAL_CONFLICTO:
+                    mascara |= bit
+        
+        return {
+            'mascara': mascara,
+            'mascara_riesgo': mascara_riesgo,
+            'confianzas': confianzas,
+            'razones': razones,
+        }
+    
+    @staticmethod
+    def evaluar_observaciones(restriccion) -> Tuple[int, List[str]]:
+        """Puntaje y razones por palabras clave del tipo mencionadas en las observaciones"""
+        if not restriccion.observaciones:
+            return 0, []
+        
+        motor = MatrizConflictos._motor()
+        tipo = restriccion.tipo_restriccion
+        encontradas = sorted(
+            (posicion, palabra)
+            for palabra in motor['automata'].buscar(restriccion.observaciones.lower())
+            for tipo_palabra, posicion in motor['palabras'][palabra]
+            if tipo_palabra == tipo
+        )
+        return (
+            PUNTAJE_OBSERVACION * len(encontradas),
+            [f"Observaciones mencionan '{palabra}'" for _, palabra in encontradas],
+        )
+    
+    @staticmethod
+    def combinar(confianza: int, razones: List[str], observaciones: Tuple[int, List[str]]) -> Tuple[bool, str, int]:
+        """Resultado de analizar_producto a partir de la fila y las observaciones"""
+        puntaje_obs, razones_obs = observaciones
+        nivel_confianza = min(confianza + puntaje_obs, 100)
+        razones = list(razones) + razones_obs
+        razon = "; ".join(razones) if razones else SIN_COINCIDENCIAS
+        return nivel_confianza >= UMBRAL_CONFLICTO, razon, nivel_confianza
+    
+    # -------------------------------------------------------------------------
+    # Persistencia
+    # -------------------------------------------------------------------------
+    
+    @staticmethod
+    def recalcular(productos: Optional[QuerySet] = None) -> Dict[int, Dict]:
+        """
+        Recalcula y guarda las filas de los productos (todos si no se indica)
+        
+        Returns:
+            {id_producto: fila}
+        """
+        from gestion.models import MatrizRestriccionProducto, Producto
+        
+        if productos is None:
+            productos = Producto.objects.all()
+        version = MatrizConflictos.version()
+        
+        filas = {}
+        lote = []
+        
+        consulta = productos.order_by().values_list('id_producto', 'descripcion', 'id_categoria__nombre')
+        for id_producto, descripcion, categoria in consulta.iterator(chunk_size=TAMANO_LOTE_MATRIZ):
+            fila = MatrizConflictos.evaluar(descripcion, categoria)
+            filas[id_producto] = fila
+            lote.append(MatrizRestriccionProducto(id_producto_id=id_producto, version=version, **fila))
+            if len(lote) >= TAMANO_LOTE_MATRIZ:
+                MatrizConflictos._guardar(lote)
+                lote = []
+        if lote:
+            MatrizConflictos._guardar(lote)
+        
+        return filas
+    
+    @staticmethod
+    def _guardar(lote: List):
+        """Reemplaza las filas de los productos del lote"""
+        from gestion.models import MatrizRestriccionProducto
+        
+        with transaction.atomic():
+            MatrizRestriccionProducto.objects.filter(
+                id_producto__in=[fila.id_producto_id for fila in lote]
+            ).delete()
+            MatrizRestriccionProducto.objects.bulk_create(lote)
+    
+    @staticmethod
+    def asegurar() -> int:
+        """Calcula las filas faltantes o de otra versión; devuelve cuántas"""
+        from gestion.models import Producto
+        
+        version = MatrizConflictos.version()
+        total = len(MatrizConflictos.recalcular(
+            Producto.objects.exclude(matriz_restricciones__version=version)
+        ))
+        
+        def recordar():
+            MatrizConflictos._version_asegurada = version
+        # Las filas de una transacción revertida no cuentan como aseguradas
+        transaction.on_commit(recordar)
+        return total
+    
+    @staticmethod
+    def asegurar_version():
+        """asegurar() sólo si este proceso todavía no completó la versión vigente"""
+        if MatrizConflictos._version_asegurada != MatrizConflictos.version():
+            MatrizConflictos.asegurar()
+    
+    @staticmethod
+    def limpiar_local():
+        """Olvida la versión asegurada por este proceso (tests, shell)"""
+        MatrizConflictos._version_asegurada = None
+    
+    @staticmethod
+    def filas(ids: Iterable[int]) -> Dict[int, Dict]:
+        """Filas de la matriz para los productos, calculando las que falten"""
+        from gestion.models import MatrizRestriccionProducto, Producto
+        
+        ids = set(ids)
+        if not ids:
+            return {}
+        
+        filas = {
+            fila.pop('id_producto'): fila
+            for fila in MatrizRestriccionProducto.objects.filter(
+                id_producto__in=ids, version=MatrizConflictos.version()
+            ).values('id_producto', 'mascara', 'mascara_riesgo', 'confianzas', 'razones')
+        }
+        faltantes = ids - filas.keys()
+        if faltantes:
+            filas.update(MatrizConflictos.recalcular(Producto.objects.filter(id_producto__in=faltantes)))
+        return filas
+    
+    # -------------------------------------------------------------------------
+    # Consultas
+    # -------------------------------------------------------------------------
+    
+    @staticmethod
+    def conflictos(ids: Iterable[int], restricciones) -> Dict[int, List[Tuple[object, int, str]]]:
+        """
+        Conflictos de varios productos contra las restricciones de un hijo
+        
+        Args:
+            ids: IDs de producto
+            restricciones: RestriccionesHijos (iterable)
+            
+        Returns:
+            {id_producto: [(restriccion, nivel_confianza, razon)]} sólo con los
+            productos en conflicto, en el orden de las restricciones
+        """
+        restricciones = [(r, MatrizConflictos.evaluar_observaciones(r)) for r in restricciones]
+        if not restricciones:
+            return {}
+        
+        resultado = {}
+        for id_producto, fila in MatrizConflictos.filas(ids).items():
+            for restriccion, observaciones in restricciones:
+                tipo = restriccion.tipo_restriccion
+                tiene_conflicto, razon, nivel_confianza = MatrizConflictos.combinar(
+                    fila['confianzas'].get(tipo, 0), fila['razones'].get(tipo, []), observaciones
+                )
+                if tiene_conflicto:
+                    resultado.setdefault(id_producto, []).append((restriccion, nivel_confianza, razon))
+        return resultado
+    
+    @staticmethod
+    def filtrar_seguros(productos: QuerySet, restricciones) -> QuerySet:
+        """
+        Restringe un QuerySet de Producto a los que no tienen conflicto
+        con ninguna de las restricciones
+        
+        Los tipos cuyas observaciones no suman puntaje se filtran por máscara
+        en SQL; si las observaciones bajan el umbral, los productos con alguna
+        coincidencia de ese tipo se revisan por confianza.
+        """
+        motor = MatrizConflictos._motor()
+        
+        bits_conflicto = 0
+        umbrales = []  # (bit, tipo, umbral) de tipos con observaciones
+        for restriccion in restricciones:
+            tipo = restriccion.tipo_restriccion
+            bit = motor['bits'].get(tipo)
+            puntaje_obs, _ = MatrizConflictos.evaluar_observaciones(restriccion)
+            umbral = UMBRAL_CONFLICTO - puntaje_obs
+            if umbral <= 0:
+                # Las observaciones solas alcanzan: todo producto conflictúa
+                return productos.none()
+            if bit is None:
+                continue
+            bits_conflicto |= bit
+            if puntaje_obs:
+                umbrales.append((bit, tipo, umbral))
+        
+        if not bits_conflicto:
+            return productos
+        
+        MatrizConflictos.asegurar_version()
+        seguros = productos.alias(
+            _conflicto_restriccion=F('matriz_restricciones__mascara').bitand(bits_conflicto)
+        ).filter(_conflicto_restriccion=0)
+        
+        if umbrales:
+            bits_riesgo = 0
+            for bit, _, _ in umbrales:
+                bits_riesgo |= bit
+            candidatos = seguros.alias(
+                _riesgo_restriccion=F('matriz_restricciones__mascara_riesgo').bitand(bits_riesgo)
+            ).exclude(_riesgo_restriccion=0).values_list('id_producto', 'matriz_restricciones__confianzas')
+            excluidos = [
+                id_producto for id_producto, confianzas in candidatos
+                if any(confianzas.get(tipo, 0) >= umbral for _, tipo, umbral in umbrales)
+            ]
+            if excluidos:
+                seguros = seguros.exclude(id_producto__in=excluidos)
+        
+        return seguros
+    
+    @staticmethod
+    def producto_guardado(producto):
+        """Recalcula la fila de un Producto guardado, sin volver a leerlo"""
+        from gestion.models import MatrizRestriccionProducto
+        
+        categoria = producto.id_categoria.nombre if producto.id_categoria_id else None
+        fila = MatrizConflictos.evaluar(producto.descripcion, categoria)
+        MatrizConflictos._guardar([MatrizRestriccionProducto(
+            id_producto_id=producto.id_producto, version=MatrizConflictos.version(), **fila
+        )])
+    
+    @staticmethod
+    def categoria_guardada(categoria):
+        """Recalcula las filas de los productos de una Categoria guardada"""
+        from gestion.models import Producto
+        
+        MatrizConflictos.recalcular(Producto.objects.filter(id_categoria=categoria.id_categoria))
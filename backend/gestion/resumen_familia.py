@@ -0,0 +1,235 @@
+"""
+Resumen de la familia para el portal de padres
+===============================================
+
+portal_dashboard_view hacía unas diez consultas por visita (cantidad de
+hijos, suma de saldos, ventas recientes, almuerzos del mes, recargas del
+mes, recargas recientes) y además seguía recarga.nro_tarjeta.id_hijo por
+cada recarga listada. A las 7 de la mañana todos los padres abren el
+portal a la vez.
+
+ResumenFamilia arma el resumen de un cliente en cuatro consultas (familia
+con sus totales, hijos con tarjeta y almuerzos del mes, ventas recientes,
+recargas recientes) y lo guarda en el cache compartido por cliente y mes.
+La visita habitual se sirve del cache sin consultar la base.
+
+- Ventas, recargas, consumos con tarjeta, almuerzos y cambios de
+  tarjetas o hijos marcan al cliente afectado (signals.py); al confirmar
+  la transacción se resuelven los clientes de todas las marcas en una
+  consulta y se borran sus resúmenes.
+- TTL corto como red de seguridad para escrituras que no pasan por el
+  ORM (triggers, scripts).
+"""
+
+import logging
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, Optional
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, DecimalField, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from pos.models import Venta
+
+from .models import CargasSaldo, Cliente, Hijo, RegistroConsumoAlmuerzo
+
+logger = logging.getLogger(__name__)
+
+# Recargas que cuentan como acreditadas
+ESTADO_RECARGA_CONFIRMADA = 'CONFIRMADO'
+
+
+def _inicio_mes(ahora):
+    return timezone.localtime(ahora).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+class ResumenFamilia:
+    """Saldos, almuerzos, recargas y movimientos recientes de un cliente, cacheados por cliente"""
+
+    PREFIJO_CACHE = 'portal:resumen_familia'
+    TTL = 300
+    DIAS_CONSUMOS = 30
+    MAX_CONSUMOS = 10
+    MAX_RECARGAS = 5
+    MAX_TRANSACCIONES = 10
+
+    _pendientes = threading.local()
+
+    @staticmethod
+    def clave(id_cliente: int, ahora=None) -> str:
+        """Clave del resumen; incluye el mes para que los totales mensuales no crucen de mes"""
+        mes = timezone.localtime(ahora or timezone.now()).strftime('%Y%m')
+        return f'{ResumenFamilia.PREFIJO_CACHE}:{id_cliente}:{mes}'
+
+    @staticmethod
+    def obtener(id_cliente: int) -> Optional[Dict]:
+        """Resumen del cliente desde el cache, o calculado y cacheado (None si el cliente no existe)"""
+        clave = ResumenFamilia.clave(id_cliente)
+        resumen = cache.get(clave)
+        if resumen is None:
+            resumen = ResumenFamilia.calcular(id_cliente)
+            if resumen is not None:
+                cache.set(clave, resumen, ResumenFamilia.TTL)
+        return resumen
+
+    @staticmethod
+    def calcular(id_cliente: int, ahora=None) -> Optional[Dict]:
+        """Calcula el resumen desde la base de datos (cuatro consultas)"""
+        ahora = ahora or timezone.now()
+        inicio_mes = _inicio_mes(ahora)
+
+        cliente = Cliente.objects.filter(pk=id_cliente).annotate(
+            recargas_mes=Coalesce(
+                Subquery(
+                    CargasSaldo.objects.filter(
+                        id_cliente_origen=OuterRef('pk'),
+                        estado=ESTADO_RECARGA_CONFIRMADA,
+                        fecha_carga__gte=inicio_mes,
+                    ).values('id_cliente_origen').annotate(total=Sum('monto_cargado')).values('total')
+                ),
+                Value(Decimal('0')),
+                output_field=DecimalField(max_digits=14, decimal_places=2),
+            )
+        ).values('id_cliente', 'nombres', 'apellidos', 'recargas_mes').first()
+        if cliente is None:
+            return None
+
+        hijos = [
+            {
+                'id_hijo': fila['id_hijo'],
+                'nombres': fila['nombre'],
+                'apellidos': fila['apellido'],
+                'grado': fila['grado'],
+                'nro_tarjeta': fila['tarjeta__nro_tarjeta'],
+                'saldo': fila['tarjeta__saldo_actual'],
+                'almuerzos_mes': fila['almuerzos_mes'],
+            }
+            for fila in Hijo.objects.filter(id_cliente_responsable_id=id_cliente).annotate(
+                almuerzos_mes=Coalesce(
+                    Subquery(
+                        RegistroConsumoAlmuerzo.objects.filter(
+                            id_hijo=OuterRef('pk'), fecha_consumo__gte=inicio_mes.date()
+                        ).values('id_hijo').annotate(total=Count('pk')).values('total')
+                    ),
+                    Value(0),
+                    output_field=IntegerField(),
+                )
+            ).order_by('nombre', 'id_hijo').values(
+                'id_hijo', 'nombre', 'apellido', 'grado', 'tarjeta__nro_tarjeta', 'tarjeta__saldo_actual',
+                'almuerzos_mes',
+            )
+        ]
+
+        consumos_recientes = [
+            {
+                'id_venta': fila['id_venta'],
+                'fecha': fila['fecha'],
+                'monto_total': fila['monto_total'],
+                'hijo': fila['id_hijo__nombre'] or 'N/A',
+            }
+            for fila in Venta.objects.filter(
+                id_hijo__id_cliente_responsable_id=id_cliente,
+                fecha__gte=ahora - timedelta(days=ResumenFamilia.DIAS_CONSUMOS),
+            ).order_by('-fecha').values('id_venta', 'fecha', 'monto_total', 'id_hijo__nombre')[
+                :ResumenFamilia.MAX_CONSUMOS
+            ]
+        ]
+
+        recargas_recientes = CargasSaldo.objects.filter(
+            id_cliente_origen_id=id_cliente, estado=ESTADO_RECARGA_CONFIRMADA
+        ).order_by('-fecha_carga').values('fecha_carga', 'monto_cargado', 'nro_tarjeta__id_hijo__nombre')[
+            :ResumenFamilia.MAX_RECARGAS
+        ]
+
+        transacciones = [
+            {
+                'tipo': 'consumo',
+                'descripcion': f"Consumo de {consumo['hijo']}",
+                'monto': -consumo['monto_total'],  # Negativo porque es un gasto
+                'fecha': consumo['fecha'],
+                'hijo': consumo['hijo'],
+            }
+            for consumo in consumos_recientes[:ResumenFamilia.MAX_RECARGAS]
+        ] + [
+            {
+                'tipo': 'recarga',
+                'descripcion': f"Recarga para {recarga['nro_tarjeta__id_hijo__nombre']}",
+                'monto': recarga['monto_cargado'],  # Positivo porque es un ingreso
+                'fecha': recarga['fecha_carga'],
+                'hijo': recarga['nro_tarjeta__id_hijo__nombre'],
+            }
+            for recarga in recargas_recientes
+        ]
+        transacciones.sort(key=lambda t: t['fecha'], reverse=True)
+
+        return {
+            'cliente': {
+                'id_cliente': cliente['id_cliente'],
+                'nombres': cliente['nombres'],
+                'apellidos': cliente['apellidos'],
+            },
+            'hijos': hijos,
+            'total_hijos': len(hijos),
+            'saldo_total': sum((h['saldo'] for h in hijos if h['saldo'] is not None), Decimal('0')),
+            'almuerzos_mes': sum(h['almuerzos_mes'] for h in hijos),
+            'recargas_mes': cliente['recargas_mes'],
+            'consumos_recientes': consumos_recientes,
+            'ultimas_transacciones': transacciones[:ResumenFamilia.MAX_TRANSACCIONES],
+        }
+
+    # =========================================================================
+    # INVALIDACIÓN
+    # =========================================================================
+
+    @staticmethod
+    def marcar(clientes: Iterable[int] = (), hijos: Iterable[int] = (), tarjetas: Iterable[str] = ()):
+        """
+        Marca clientes (directamente o por hijo o tarjeta) para invalidar su resumen al confirmar
+
+        No hace consultas: los clientes de los hijos y tarjetas marcados se
+        resuelven juntos en el primer callback de la transacción.
+        """
+        pendientes = ResumenFamilia._marcas_pendientes()
+        pendientes['clientes'].update(c for c in clientes if c)
+        pendientes['hijos'].update(h for h in hijos if h)
+        pendientes['tarjetas'].update(t for t in tarjetas if t)
+        transaction.on_commit(ResumenFamilia._vaciar)
+
+    @staticmethod
+    def _marcas_pendientes() -> Dict[str, set]:
+        pendientes = getattr(ResumenFamilia._pendientes, 'marcas', None)
+        if pendientes is None:
+            pendientes = ResumenFamilia._pendientes.marcas = {'clientes': set(), 'hijos': set(), 'tarjetas': set()}
+        return pendientes
+
+    @staticmethod
+    def _vaciar():
+        pendientes = ResumenFamilia._marcas_pendientes()
+        if not any(pendientes.values()):
+            return
+        clientes = set(pendientes['clientes'])
+        hijos, tarjetas = list(pendientes['hijos']), list(pendientes['tarjetas'])
+        for marcas in pendientes.values():
+            marcas.clear()
+        try:
+            if hijos or tarjetas:
+                clientes.update(
+                    Hijo.objects.filter(
+                        Q(pk__in=hijos) | Q(tarjeta__nro_tarjeta__in=tarjetas)
+                    ).values_list('id_cliente_responsable_id', flat=True)
+                )
+            ResumenFamilia.invalidar(clientes)
+        except Exception as e:
+            # El resumen del portal nunca debe afectar la operación que lo invalidó
+            logger.error(f"Error invalidando resúmenes del portal: {e}")
+
+    @staticmethod
+    def invalidar(clientes: Iterable[int]):
+        """Borra el resumen del mes en curso de los clientes"""
+        claves = [ResumenFamilia.clave(id_cliente) for id_cliente in clientes]
+        if claves:
+            cache.delete_many(claves)
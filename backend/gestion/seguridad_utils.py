@@ -12,6 +12,7 @@ from .models import (
     IntentoLogin, AuditoriaOperacion, TokenRecuperacion, BloqueoCuenta,
     PatronAcceso, AnomaliaDetectada, SesionActiva, Intento2Fa, RenovacionSesion
 )
+from .auditoria_diferida import BufferAuditoria
 
 
 def obtener_geolocalizacion_ip(ip_address):
@@ -134,9 +135,15 @@ def registrar_auditoria(
     descripcion=None,
     datos_anteriores=None,
     datos_nuevos=None,
-    mensaje_error=None
+    mensaje_error=None,
+    durable=None
 ):
-    """Registrar una operación en la auditoría con geolocalización"""
+    """
+    Registrar una operación en la auditoría con geolocalización
+
+    Se escribe en lote fuera del request (BufferAuditoria), salvo las
+    operaciones críticas o con durable=True, que se insertan en el momento.
+    """
     try:
         usuario = getattr(request, 'user', None)
         usuario_str = usuario.username if usuario and usuario.is_authenticated else 'Anónimo'
@@ -149,9 +156,8 @@ def registrar_auditoria(
             id_usuario = usuario.id if hasattr(usuario, 'id') else None
         
         ip_address = obtener_ip_cliente(request)
-        ciudad, pais = obtener_geolocalizacion_ip(ip_address)
         
-        AuditoriaOperacion.objects.create(
+        evento = AuditoriaOperacion(
             usuario=usuario_str,
             tipo_usuario=tipo_usuario,
             id_usuario=id_usuario,
@@ -162,13 +168,13 @@ def registrar_auditoria(
             datos_anteriores=datos_anteriores,
             datos_nuevos=datos_nuevos,
             ip_address=ip_address,
-            ciudad=ciudad,
-            pais=pais,
             user_agent=request.META.get('HTTP_USER_AGENT', '')[:500],
             fecha_operacion=timezone.now(),
             resultado=resultado,
             mensaje_error=mensaje_error
         )
+        # Ciudad y país se completan al escribir (ipapi.co puede tardar 2 s)
+        BufferAuditoria.registrar(evento, durable, geolocalizar=True)
     except Exception as e:
         print(f"Error al registrar auditoría: {e}")
 
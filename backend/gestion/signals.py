@@ -16,12 +16,35 @@ from django.dispatch import receiver
 from django.core.cache import cache
 
 from .cache_reportes import ReporteCache, invalidar_cache_dashboard
+from .cache_utils import invalidate_cache
+from .cache_referencia import CacheReferencia, MapaPrecios, RUC_CLIENTE_GENERICO, USUARIO_SISTEMA
+from .catalogo_seguro import CatalogoSeguro
+from .checkin_almuerzo import RegistradorAlmuerzos
+from .feed_saldos import FeedSaldos
+from .indice_productos import IndiceProductos
+from .permisos import CacheRoles
+from .restricciones_matcher import MatrizConflictos
+from .resumen_familia import ResumenFamilia
 from .models import (
     Producto,
     Cliente,
     Categoria,
     DatosFacturacionElect,
     RegistroConsumoAlmuerzo,
+    TipoAlmuerzo,
+    CuentaAlmuerzoMensual,
+    ListaPrecios,
+    TipoCliente,
+    MediosPago,
+    Timbrados,
+    DatosEmpresa,
+    Empleado,
+    PreciosPorLista,
+    TipoRolGeneral,
+    Tarjeta,
+    ConsumoTarjeta,
+    CargasSaldo,
+    Hijo,
 )
 
 
@@ -51,6 +74,19 @@ def invalidar_cache_producto_guardado(sender, instance, created, **kwargs):
     
     # Invalidar lista de productos
     cache.delete('productos_list:all')
+    invalidate_cache(key_prefix='productos')
+    
+    # Invalidar marca "por kilo" de la grilla del POS
+    MapaPrecios.invalidar()
+    
+    # Actualizar índice de búsqueda del POS
+    IndiceProductos.producto_guardado(instance)
+    
+    # Recalcular conflictos con restricciones alimentarias
+    MatrizConflictos.producto_guardado(instance)
+    
+    # Recomendaciones de productos seguros del POS
+    CatalogoSeguro.invalidar()
     
     # Log para debugging
     action = 'creado' if created else 'modificado'
@@ -65,6 +101,10 @@ def invalidar_cache_producto_eliminado(sender, instance, **kwargs):
     cache_reportes.invalidar_tipo('productos')
     invalidar_cache_dashboard()
     cache.delete('productos_list:all')
+    invalidate_cache(key_prefix='productos')
+    MapaPrecios.invalidar()
+    IndiceProductos.producto_eliminado(instance.id_producto)
+    CatalogoSeguro.invalidar()
     
     print(f"[CACHE] Producto {instance.descripcion} eliminado - Cache invalidado")
 
@@ -199,6 +239,8 @@ def invalidar_cache_almuerzo_eliminado(sender, instance, **kwargs):
     from datetime import date
     
     cache_reportes.invalidar_tipo('almuerzos')
+    # El hijo vuelve a poder registrar almuerzo en el POS
+    RegistradorAlmuerzos.invalidar()
     hoy = date.today()
     cache.delete(f'almuerzo_stats:{hoy}')
     
@@ -248,6 +290,11 @@ def invalidar_cache_categoria_guardada(sender, instance, created, **kwargs):
     cache_reportes.invalidar_tipo('productos')
     cache.delete('categorias_list:all')
     
+    # El nombre de la categoría cuenta para las restricciones alimentarias
+    if not created:
+        MatrizConflictos.categoria_guardada(instance)
+        CatalogoSeguro.invalidar()
+    
     action = 'creada' if created else 'modificada'
     print(f"[CACHE] Categoría {instance.nombre} {action} - Cache invalidado")
 
@@ -263,6 +310,136 @@ def invalidar_cache_categoria_eliminada(sender, instance, **kwargs):
     print(f"[CACHE] Categoría {instance.nombre} eliminada - Cache invalidado")
 
 
+# =============================================================================
+# SIGNALS PARA DATOS DE REFERENCIA DEL POS
+# =============================================================================
+
+@receiver(post_save, sender=ListaPrecios)
+@receiver(post_delete, sender=ListaPrecios)
+@receiver(post_save, sender=TipoCliente)
+@receiver(post_delete, sender=TipoCliente)
+@receiver(post_save, sender=MediosPago)
+@receiver(post_delete, sender=MediosPago)
+@receiver(post_save, sender=Timbrados)
+@receiver(post_delete, sender=Timbrados)
+@receiver(post_save, sender=DatosEmpresa)
+@receiver(post_delete, sender=DatosEmpresa)
+def invalidar_cache_referencia(sender, instance, **kwargs):
+    """
+    Invalida los datos de referencia del POS (CacheReferencia)
+    cuando cambia una lista de precios, tipo de cliente, medio de pago,
+    timbrado o los datos de la empresa
+    """
+    CacheReferencia.invalidar()
+
+
+@receiver(post_save, sender=PreciosPorLista)
+@receiver(post_delete, sender=PreciosPorLista)
+def invalidar_mapa_precios(sender, instance, **kwargs):
+    """Invalida los precios de la grilla del POS (MapaPrecios)"""
+    MapaPrecios.invalidar()
+
+
+@receiver(post_save, sender=Cliente)
+@receiver(post_delete, sender=Cliente)
+def invalidar_cache_referencia_cliente(sender, instance, **kwargs):
+    """Invalida CacheReferencia sólo si cambió el cliente genérico"""
+    if instance.ruc_ci == RUC_CLIENTE_GENERICO:
+        CacheReferencia.invalidar()
+
+
+@receiver(post_save, sender=Empleado)
+@receiver(post_delete, sender=Empleado)
+def invalidar_cache_referencia_empleado(sender, instance, **kwargs):
+    """Invalida CacheReferencia sólo si cambió el empleado SISTEMA"""
+    if instance.usuario == USUARIO_SISTEMA:
+        CacheReferencia.invalidar()
+
+
+@receiver(post_save, sender=Empleado)
+@receiver(post_delete, sender=Empleado)
+@receiver(post_save, sender=TipoRolGeneral)
+@receiver(post_delete, sender=TipoRolGeneral)
+def invalidar_cache_roles(sender, instance, **kwargs):
+    """Invalida los roles cacheados de permisos (CacheRoles)"""
+    CacheRoles.invalidar()
+
+
+@receiver(post_save, sender=TipoAlmuerzo)
+@receiver(post_delete, sender=TipoAlmuerzo)
+@receiver(post_delete, sender=CuentaAlmuerzoMensual)
+def invalidar_registrador_almuerzos(sender, instance, **kwargs):
+    """Invalida el tipo predeterminado y las cuentas del POS de almuerzo (RegistradorAlmuerzos)"""
+    RegistradorAlmuerzos.invalidar()
+
+
+# =============================================================================
+# SIGNALS PARA SALDOS DE TARJETAS
+# =============================================================================
+
+@receiver(post_save, sender=Tarjeta)
+def marcar_saldo_tarjeta(sender, instance, **kwargs):
+    """Marca la tarjeta para el feed de saldos (FeedSaldos registra al confirmar)"""
+    FeedSaldos.marcar([instance.nro_tarjeta])
+
+
+@receiver(post_save, sender=ConsumoTarjeta)
+@receiver(post_save, sender=CargasSaldo)
+def marcar_saldo_movimiento(sender, instance, **kwargs):
+    """
+    Marca la tarjeta de un consumo o una recarga para el feed de saldos
+    
+    En MySQL el saldo lo mueven triggers sobre estas tablas, sin pasar por
+    el save de Tarjeta.
+    """
+    FeedSaldos.marcar([instance.nro_tarjeta_id])
+
+
+# =============================================================================
+# SIGNALS PARA EL RESUMEN DEL PORTAL DE PADRES
+# =============================================================================
+
+@receiver(post_save, sender='pos.Venta')
+@receiver(post_delete, sender='pos.Venta')
+def invalidar_resumen_familia_venta(sender, instance, **kwargs):
+    """Invalida el resumen del portal del cliente de la venta y del responsable del hijo"""
+    ResumenFamilia.marcar(clientes=[instance.id_cliente_id], hijos=[instance.id_hijo_id])
+
+
+@receiver(post_save, sender=CargasSaldo)
+def invalidar_resumen_familia_recarga(sender, instance, **kwargs):
+    """Invalida el resumen del portal de quien recargó y del dueño de la tarjeta"""
+    ResumenFamilia.marcar(clientes=[instance.id_cliente_origen_id], tarjetas=[instance.nro_tarjeta_id])
+
+
+@receiver(post_save, sender=ConsumoTarjeta)
+def invalidar_resumen_familia_consumo(sender, instance, **kwargs):
+    """Invalida el resumen del portal del dueño de la tarjeta (cambió su saldo)"""
+    ResumenFamilia.marcar(tarjetas=[instance.nro_tarjeta_id])
+
+
+@receiver(post_save, sender=Tarjeta)
+@receiver(post_delete, sender=Tarjeta)
+@receiver(post_save, sender=RegistroConsumoAlmuerzo)
+@receiver(post_delete, sender=RegistroConsumoAlmuerzo)
+def invalidar_resumen_familia_hijo(sender, instance, **kwargs):
+    """Invalida el resumen del portal del responsable del hijo (saldo de su tarjeta o almuerzos)"""
+    ResumenFamilia.marcar(hijos=[instance.id_hijo_id])
+
+
+@receiver(post_save, sender=Hijo)
+@receiver(post_delete, sender=Hijo)
+def invalidar_resumen_familia_hijos(sender, instance, **kwargs):
+    """Invalida el resumen del portal del responsable (alta, baja o cambio de un hijo)"""
+    ResumenFamilia.marcar(clientes=[instance.id_cliente_responsable_id])
+
+
+@receiver(post_save, sender=Cliente)
+def invalidar_resumen_familia_cliente(sender, instance, **kwargs):
+    """Invalida el resumen del portal del cliente (nombre mostrado)"""
+    ResumenFamilia.marcar(clientes=[instance.pk])
+
+
 # =============================================================================
 # FUNCIONES AUXILIARES
 # =============================================================================
@@ -324,4 +501,4 @@ def habilitar_signals():
 # En producción, considerar usar django-signals-ahoy o similar
 
 print("[SIGNALS] Sistema de invalidación automática de cache CARGADO")
-print("[SIGNALS] Modelos conectados: Producto, Cliente, Stock, Ventas, Almuerzos, Facturación")
+print("[SIGNALS] Modelos conectados: Producto, Cliente, Stock, Ventas, Almuerzos, Facturación, Datos de referencia POS, Saldos de tarjetas, Portal de padres")
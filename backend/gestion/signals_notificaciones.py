@@ -1,11 +1,17 @@
 """
 Señales para generar notificaciones automáticas
 """
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 from decimal import Decimal
 
+from .notificaciones_difusion import (
+    DifusorNotificaciones, evento_notificacion, DESTINATARIOS_SUPERUSUARIOS
+)
+from .alertas_stock import MotorAlertasStock
+from .catalogo_seguro import CatalogoSeguro
+
 User = get_user_model()
 
 
@@ -13,186 +19,73 @@ User = get_user_model()
 def notificar_nueva_venta(sender, instance, created, **kwargs):
     """
     Genera notificación cuando se registra una nueva venta
+    
+    Sólo encola el evento: la difusión a los usuarios staff se hace en lote
+    después del commit (DifusorNotificaciones), fuera de la transacción de la venta.
     """
     if created:
-        from .models_notificaciones import NotificacionSistema, ConfiguracionNotificacionesSistema
+        monto = Decimal(instance.monto_total or 0)
         
-        # Notificar a cajeros y administradores
-        usuarios = User.objects.filter(
-            is_staff=True,
-            is_active=True
-        )
+        # Determinar prioridad según el monto
+        if monto >= Decimal('500000'):
+            prioridad = 'alta'
+        elif monto >= Decimal('100000'):
+            prioridad = 'media'
+        else:
+            prioridad = 'baja'
         
-        for usuario in usuarios:
-            config = ConfiguracionNotificacionesSistema.get_or_create_for_user(usuario)
-            
-            # Verificar si tiene habilitadas las notificaciones de ventas
-            if not config.notif_ventas:
-                continue
-            
-            # Determinar prioridad según el monto
-            if instance.total >= Decimal('500000'):
-                prioridad = 'alta'
-            elif instance.total >= Decimal('100000'):
-                prioridad = 'media'
-            else:
-                prioridad = 'baja'
-            
-            # Verificar si solo quiere críticas
-            if config.solo_criticas and prioridad not in ['alta', 'critica']:
-                continue
-            
-            NotificacionSistema.crear_notificacion(
-                usuario=usuario,
-                titulo='Nueva Venta Registrada',
-                mensaje=f'Se realizó una venta por ₲ {instance.total:,.0f}',
-                tipo='venta',
-                prioridad=prioridad,
-                icono='fa-cash-register',
-                url=f'/pos/ventas/{instance.id}/'
-            )
+        DifusorNotificaciones.encolar(evento_notificacion(
+            titulo='Nueva Venta Registrada',
+            mensaje=f'Se realizó una venta por ₲ {monto:,.0f}',
+            tipo='venta',
+            prioridad=prioridad,
+            preferencia='notif_ventas',
+            respetar_solo_criticas=True,
+            icono='fa-cash-register',
+            url=f'/pos/ventas/{instance.id_venta}/'
+        ))
 
 
 @receiver(post_save, sender='gestion.CargasSaldo')
 def notificar_nueva_recarga(sender, instance, created, **kwargs):
     """
-    Genera notificación cuando se realiza una recarga
+    Genera notificación a staff cuando se realiza una recarga (difusión en lote post-commit)
     """
     if created:
-        from .models_notificaciones import NotificacionSistema, ConfiguracionNotificacionesSistema
-        
-        # Notificar al cliente (padre) de la recarga
-        if hasattr(instance, 'cliente') and instance.cliente:
-            cliente_user = instance.cliente.usuario if hasattr(instance.cliente, 'usuario') else None
-            
-            if cliente_user:
-                config = ConfiguracionNotificacionesSistema.get_or_create_for_user(cliente_user)
-                
-                if config.notif_recargas:
-                    NotificacionSistema.crear_notificacion(
-                        usuario=cliente_user,
-                        titulo='Recarga Exitosa',
-                        mensaje=f'Se acreditaron ₲ {instance.monto:,.0f} a tu cuenta',
-                        tipo='recarga',
-                        prioridad='media',
-                        icono='fa-credit-card',
-                        url='/clientes/historial/'
-                    )
-        
-        # Notificar a staff
-        usuarios_staff = User.objects.filter(is_staff=True, is_active=True)
-        for usuario in usuarios_staff:
-            config = ConfiguracionNotificacionesSistema.get_or_create_for_user(usuario)
-            
-            if config.notif_recargas:
-                NotificacionSistema.crear_notificacion(
-                    usuario=usuario,
-                    titulo='Nueva Recarga',
-                    mensaje=f'Recarga de ₲ {instance.monto:,.0f} procesada',
-                    tipo='recarga',
-                    prioridad='baja',
-                    icono='fa-credit-card'
-                )
+        DifusorNotificaciones.encolar(evento_notificacion(
+            titulo='Nueva Recarga',
+            mensaje=f'Recarga de ₲ {instance.monto_cargado:,.0f} procesada',
+            tipo='recarga',
+            prioridad='baja',
+            preferencia='notif_recargas',
+            icono='fa-credit-card'
+        ))
 
 
-@receiver(pre_save, sender='gestion.Producto')
-def notificar_stock_bajo(sender, instance, **kwargs):
+@receiver(post_save, sender='gestion.StockUnico')
+def marcar_stock_modificado(sender, instance, created, **kwargs):
     """
-    Genera notificación cuando un producto tiene stock bajo
+    Marca el producto para el motor de alertas de stock
+    
+    No hace queries: MotorAlertasStock evalúa todos los productos marcados
+    una vez al confirmar la transacción y deduplica con EstadoAlertaStock.
+    Un stock nuevo invalida además el conjunto de productos disponibles.
     """
-    if instance.pk:  # Solo para productos existentes
-        from .models_notificaciones import NotificacionSistema, ConfiguracionNotificacionesSistema
-        
-        try:
-            producto_anterior = sender.objects.get(pk=instance.pk)
-            
-            # Solo notificar si el stock cambió y está por debajo del mínimo
-            if (producto_anterior.stock != instance.stock and 
-                instance.stock <= instance.stock_minimo and 
-                instance.stock > 0):
-                
-                # Notificar a administradores
-                usuarios = User.objects.filter(
-                    is_staff=True,
-                    is_active=True
-                )
-                
-                for usuario in usuarios:
-                    config = ConfiguracionNotificacionesSistema.get_or_create_for_user(usuario)
-                    
-                    if not config.notif_stock:
-                        continue
-                    
-                    # Verificar si ya existe una notificación reciente sobre este producto
-                    from django.utils import timezone
-                    from datetime import timedelta
-                    
-                    hace_1_hora = timezone.now() - timedelta(hours=1)
-                    
-                    notif_existente = NotificacionSistema.objects.filter(
-                        usuario=usuario,
-                        tipo='stock',
-                        mensaje__icontains=instance.nombre,
-                        creada_en__gte=hace_1_hora
-                    ).exists()
-                    
-                    if not notif_existente:
-                        NotificacionSistema.crear_notificacion(
-                            usuario=usuario,
-                            titulo='⚠️ Stock Bajo',
-                            mensaje=f'El producto "{instance.nombre}" tiene solo {instance.stock} unidades disponibles',
-                            tipo='stock',
-                            prioridad='alta' if instance.stock <= 5 else 'media',
-                            icono='fa-exclamation-triangle',
-                            url='/gestion/productos/'
-                        )
-        
-        except sender.DoesNotExist:
-            pass
+    if created:
+        CatalogoSeguro.invalidar_stock()
+    MotorAlertasStock.marcar([instance.id_producto_id])
 
 
-@receiver(post_save, sender='gestion.Producto')
-def notificar_producto_agotado(sender, instance, **kwargs):
+@receiver(post_save, sender='gestion.MovimientosStock')
+def marcar_movimiento_stock(sender, instance, created, **kwargs):
     """
-    Genera notificación crítica cuando un producto se agota
+    Marca el producto de un movimiento de stock para el motor de alertas
+    
+    En MySQL el trigger trg_stock_unico_after_movement actualiza stock_unico
+    sin pasar por el ORM, así que el post_save de StockUnico no se dispara.
     """
-    if instance.stock == 0:
-        from .models_notificaciones import NotificacionSistema, ConfiguracionNotificacionesSistema
-        
-        # Notificar a administradores
-        usuarios = User.objects.filter(
-            is_staff=True,
-            is_active=True
-        )
-        
-        for usuario in usuarios:
-            config = ConfiguracionNotificacionesSistema.get_or_create_for_user(usuario)
-            
-            if config.notif_stock:
-                # Verificar si no se notificó recientemente
-                from django.utils import timezone
-                from datetime import timedelta
-                
-                hace_30_min = timezone.now() - timedelta(minutes=30)
-                
-                notif_existente = NotificacionSistema.objects.filter(
-                    usuario=usuario,
-                    tipo='stock',
-                    mensaje__icontains=instance.nombre,
-                    prioridad='critica',
-                    creada_en__gte=hace_30_min
-                ).exists()
-                
-                if not notif_existente:
-                    NotificacionSistema.crear_notificacion(
-                        usuario=usuario,
-                        titulo='🚨 Producto Agotado',
-                        mensaje=f'El producto "{instance.nombre}" se ha AGOTADO',
-                        tipo='stock',
-                        prioridad='critica',
-                        icono='fa-times-circle',
-                        url='/gestion/productos/'
-                    )
+    if created:
+        MotorAlertasStock.marcar([instance.id_producto_id])
 
 
 def notificar_sistema(titulo, mensaje, usuarios=None, prioridad='media'):
@@ -207,35 +100,27 @@ def notificar_sistema(titulo, mensaje, usuarios=None, prioridad='media'):
             prioridad='baja'
         )
     """
-    from .models_notificaciones import NotificacionSistema, ConfiguracionNotificacionesSistema
-    
     if usuarios is None:
         # Por defecto, notificar a superusuarios
-        usuarios = User.objects.filter(
-            is_superuser=True,
-            is_active=True
-        )
+        destinatarios = DESTINATARIOS_SUPERUSUARIOS
+    else:
+        destinatarios = [usuario.pk for usuario in usuarios]
     
-    for usuario in usuarios:
-        config = ConfiguracionNotificacionesSistema.get_or_create_for_user(usuario)
-        
-        if config.notif_sistema:
-            if config.solo_criticas and prioridad not in ['alta', 'critica']:
-                continue
-            
-            NotificacionSistema.crear_notificacion(
-                usuario=usuario,
-                titulo=titulo,
-                mensaje=mensaje,
-                tipo='sistema',
-                prioridad=prioridad,
-                icono='fa-server'
-            )
+    return DifusorNotificaciones.difundir(evento_notificacion(
+        titulo=titulo,
+        mensaje=mensaje,
+        tipo='sistema',
+        prioridad=prioridad,
+        preferencia='notif_sistema',
+        destinatarios=destinatarios,
+        respetar_solo_criticas=True,
+        icono='fa-server'
+    ))
 
 
 def notificar_usuarios(usuarios, titulo, mensaje, tipo='info', prioridad='media', **kwargs):
     """
-    Función helper para notificar a múltiples usuarios
+    Función helper para notificar a múltiples usuarios (un solo INSERT)
     
     Uso:
         from .signals_notificaciones import notificar_usuarios
@@ -250,8 +135,8 @@ def notificar_usuarios(usuarios, titulo, mensaje, tipo='info', prioridad='media'
     """
     from .models_notificaciones import NotificacionSistema
     
-    for usuario in usuarios:
-        NotificacionSistema.crear_notificacion(
+    return NotificacionSistema.objects.bulk_create([
+        NotificacionSistema(
             usuario=usuario,
             titulo=titulo,
             mensaje=mensaje,
@@ -259,3 +144,5 @@ def notificar_usuarios(usuarios, titulo, mensaje, tipo='info', prioridad='media'
             prioridad=prioridad,
             **kwargs
         )
+        for usuario in usuarios
+    ])
@@ -28,223 +28,36 @@ def tarea_recordatorios_deuda():
     Escalamiento:
     - 3 días: Recordatorio amable
     - 7 días: Recordatorio urgente
-    - 15 días: Advertencia de bloqueo
+    - 15 días: Advertencia de bloqueo (y bloqueo de la tarjeta)
+    
+    Sólo consulta las deudas cuyo día de autorización es un escalón
+    (ProgramadorRecordatoriosDeuda); los emails salen por la bandeja.
     
     Se ejecuta diariamente a las 08:00
     """
-    from gestion.models import AutorizacionSaldoNegativo, Tarjeta, UsuariosWebClientes, NotificacionSaldo
+    from gestion.recordatorios_deuda import ProgramadorRecordatoriosDeuda
     
     logger.info("🔔 Iniciando tarea de recordatorios de deuda...")
     
-    hoy = timezone.now()
-    recordatorios_enviados = {
-        '3_dias': 0,
-        '7_dias': 0,
-        '15_dias': 0
-    }
-    
-    # Buscar autorizaciones pendientes
-    autorizaciones_pendientes = AutorizacionSaldoNegativo.objects.filter(
-        regularizado=False
-    ).select_related('nro_tarjeta')
-    
-    for auth in autorizaciones_pendientes:
-        dias_deuda = (hoy - auth.fecha_autorizacion).days
-        
-        # Determinar tipo de recordatorio
-        tipo_recordatorio = None
-        if dias_deuda == 3:
-            tipo_recordatorio = 'amable'
-            key = '3_dias'
-        elif dias_deuda == 7:
-            tipo_recordatorio = 'urgente'
-            key = '7_dias'
-        elif dias_deuda == 15:
-            tipo_recordatorio = 'critico'
-            key = '15_dias'
-        
-        if tipo_recordatorio:
-            # Buscar email del padre
-            try:
-                hijo = auth.nro_tarjeta.id_hijo
-                if not hijo:
-                    continue
-                
-                cliente = hijo.id_cliente
-                if not cliente:
-                    continue
-                
-                usuario_web = UsuariosWebClientes.objects.filter(
-                    id_cliente=cliente
-                ).first()
-                
-                if not usuario_web or not usuario_web.correo_electronico:
-                    logger.warning(f"No hay email para tarjeta {auth.nro_tarjeta}")
-                    continue
-                
-                # Enviar recordatorio
-                enviado = enviar_recordatorio_deuda(
-                    auth=auth,
-                    email_destino=usuario_web.correo_electronico,
-                    tipo=tipo_recordatorio,
-                    dias_deuda=dias_deuda
-                )
-                
-                if enviado:
-                    recordatorios_enviados[key] += 1
-                    logger.info(f"✅ Recordatorio {tipo_recordatorio} enviado: {auth.nro_tarjeta} ({dias_deuda} días)")
-                
-            except Exception as e:
-                logger.error(f"Error enviando recordatorio para {auth.nro_tarjeta}: {e}")
-                continue
-    
-    # Bloquear tarjetas con deuda > 15 días
-    bloqueadas = bloquear_tarjetas_morosidad()
+    resultado = ProgramadorRecordatoriosDeuda.ejecutar()
     
     logger.info(f"""
     ✅ Tarea de recordatorios completada:
-    - Recordatorios 3 días: {recordatorios_enviados['3_dias']}
-    - Recordatorios 7 días: {recordatorios_enviados['7_dias']}
-    - Advertencias 15 días: {recordatorios_enviados['15_dias']}
-    - Tarjetas bloqueadas: {bloqueadas}
+    - Recordatorios 3 días: {resultado['3_dias']}
+    - Recordatorios 7 días: {resultado['7_dias']}
+    - Advertencias 15 días: {resultado['15_dias']}
+    - Sin email: {resultado['sin_email']}
+    - Tarjetas bloqueadas: {resultado['bloqueadas']}
     """)
     
-    return recordatorios_enviados
-
-
-def enviar_recordatorio_deuda(auth, email_destino, tipo, dias_deuda):
-    """Enviar email de recordatorio según tipo"""
-    
-    tarjeta = auth.nro_tarjeta
-    estudiante = auth.estudiante_nombre
-    monto_deuda = auth.monto_autorizado
-    
-    # Configurar mensaje según tipo
-    if tipo == 'amable':
-        asunto = f"Recordatorio: Saldo Pendiente - Tarjeta {tarjeta}"
-        template = 'emails/recordatorio_deuda_amable.html'
-        urgencia = 'RECORDATORIO'
-    elif tipo == 'urgente':
-        asunto = f"⚠️ URGENTE: Saldo Pendiente - Tarjeta {tarjeta}"
-        template = 'emails/recordatorio_deuda_urgente.html'
-        urgencia = 'URGENTE'
-    else:  # critico
-        asunto = f"🚨 CRÍTICO: Bloqueo Inminente - Tarjeta {tarjeta}"
-        template = 'emails/recordatorio_deuda_critico.html'
-        urgencia = 'CRÍTICO'
-    
-    # Contexto para template
-    contexto = {
-        'tarjeta': tarjeta,
-        'estudiante': estudiante,
-        'monto_deuda': monto_deuda,
-        'dias_deuda': dias_deuda,
-        'fecha_autorizacion': auth.fecha_autorizacion,
-        'urgencia': urgencia,
-        'url_recarga': f"{settings.SITE_URL}/portal/recargas/",
-    }
-    
-    try:
-        # Renderizar HTML
-        html_message = render_to_string(template, contexto)
-        
-        # Enviar email
-        send_mail(
-            subject=asunto,
-            message=f"Deuda pendiente: Gs. {monto_deuda:,.0f}. Por favor ingrese al portal para recargar.",
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[email_destino],
-            html_message=html_message,
-            fail_silently=False
-        )
-        
-        # Registrar notificación
-        from gestion.models import NotificacionSaldo
-        NotificacionSaldo.objects.create(
-            nro_tarjeta=tarjeta,
-            tipo='SALDO_NEGATIVO',
-            mensaje=f"Recordatorio {urgencia}: Deuda de Gs. {monto_deuda:,.0f} por {dias_deuda} días",
-            saldo_monto=tarjeta.saldo_actual,
-            enviada_email=True,
-            email_destino=email_destino
-        )
-        
-        return True
-        
-    except Exception as e:
-        logger.error(f"Error enviando recordatorio: {e}")
-        return False
+    return resultado
 
 
 def bloquear_tarjetas_morosidad():
-    """Bloquear tarjetas con deuda mayor a 15 días"""
-    from gestion.models import AutorizacionSaldoNegativo, Tarjeta, UsuariosWebClientes
-    
-    hoy = timezone.now()
-    fecha_limite = hoy - timedelta(days=15)
-    bloqueadas = 0
-    
-    # Buscar deudas viejas
-    deudas_criticas = AutorizacionSaldoNegativo.objects.filter(
-        regularizado=False,
-        fecha_autorizacion__lte=fecha_limite
-    ).select_related('nro_tarjeta')
-    
-    for auth in deudas_criticas:
-        tarjeta = auth.nro_tarjeta
-        
-        # Verificar si ya está bloqueada
-        if tarjeta.estado == 'Bloqueada':
-            continue
-        
-        # Bloquear tarjeta
-        tarjeta.estado = 'Bloqueada'
-        tarjeta.save()
-        
-        bloqueadas += 1
-        logger.warning(f"🔒 Tarjeta bloqueada por morosidad: {tarjeta}")
-        
-        # Enviar notificación de bloqueo
-        try:
-            hijo = tarjeta.id_hijo
-            if hijo and hijo.id_cliente:
-                usuario_web = UsuariosWebClientes.objects.filter(
-                    id_cliente=hijo.id_cliente
-                ).first()
-                
-                if usuario_web and usuario_web.correo_electronico:
-                    enviar_notificacion_bloqueo(
-                        tarjeta=tarjeta,
-                        email=usuario_web.correo_electronico,
-                        dias_deuda=(hoy - auth.fecha_autorizacion).days
-                    )
-        except Exception as e:
-            logger.error(f"Error enviando notificación de bloqueo: {e}")
-    
-    return bloqueadas
-
-
-def enviar_notificacion_bloqueo(tarjeta, email, dias_deuda):
-    """Enviar email notificando bloqueo de tarjeta"""
+    """Bloquear tarjetas con deuda mayor a 15 días (un solo UPDATE)"""
+    from gestion.recordatorios_deuda import ProgramadorRecordatoriosDeuda
     
-    asunto = f"🔒 TARJETA BLOQUEADA - {tarjeta}"
-    
-    contexto = {
-        'tarjeta': tarjeta,
-        'dias_deuda': dias_deuda,
-        'url_contacto': f"{settings.SITE_URL}/portal/contacto/",
-    }
-    
-    html_message = render_to_string('emails/tarjeta_bloqueada.html', contexto)
-    
-    send_mail(
-        subject=asunto,
-        message=f"Su tarjeta {tarjeta} ha sido bloqueada por morosidad de {dias_deuda} días.",
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=[email],
-        html_message=html_message,
-        fail_silently=True
-    )
+    return ProgramadorRecordatoriosDeuda.bloquear_morosos(timezone.localdate())
 
 
 @shared_task(name='limpieza_notificaciones_antiguas')
@@ -269,36 +82,94 @@ def tarea_limpieza_notificaciones():
     return eliminadas
 
 
+@shared_task(name='purgar_feed_saldos')
+def tarea_purgar_feed_saldos():
+    """
+    Eliminar los cambios de saldo más viejos que la retención del feed
+
+    Se ejecuta diariamente a las 03:00
+    """
+    from gestion.feed_saldos import FeedSaldos
+
+    eliminados = FeedSaldos.purgar()
+    logger.info(f"🧹 Cambios de saldo purgados: {eliminados}")
+    return eliminados
+
+
+@shared_task(name='difundir_notificacion_sistema')
+def tarea_difundir_notificacion(evento):
+    """
+    Crear en lote las notificaciones de un evento (venta, recarga, sistema)
+    
+    Encolada por DifusorNotificaciones después del commit
+    """
+    from gestion.notificaciones_difusion import DifusorNotificaciones
+    
+    creadas = DifusorNotificaciones.difundir(evento)
+    logger.info(f"🔔 Notificación '{evento.get('titulo')}' difundida a {creadas} usuarios")
+    return creadas
+
+
+@shared_task(name='procesar_bandeja_salida')
+def tarea_procesar_bandeja_salida():
+    """
+    Entregar los emails y WhatsApp pendientes de la bandeja de salida
+    
+    Encolada al confirmar una venta/recarga que generó mensajes y cada
+    minuto desde beat (reintentos con backoff)
+    """
+    from gestion.bandeja_salida import BandejaSalida
+    
+    total = {'enviados': 0, 'reintentos': 0, 'errores': 0}
+    while True:
+        resultado = BandejaSalida.procesar_pendientes()
+        if not sum(resultado.values()):
+            break
+        for clave, cantidad in resultado.items():
+            total[clave] += cantidad
+    
+    if total['enviados'] or total['errores']:
+        logger.info(f"📤 Bandeja de salida: {total}")
+    return total
+
+
+@shared_task(name='reintentar_envios_set')
+def tarea_reintentar_envios_set():
+    """
+    Reenviar a SIFEN los documentos de la cola de reintentos cuyo próximo
+    intento ya venció (cada minuto desde beat)
+    """
+    from gestion.reintentos_set import ColaReintentosSET
+    
+    total = ColaReintentosSET.vaciar()
+    if total:
+        logger.info(f"🧾 Reintentos SET: {total}")
+    return total
+
+
 @shared_task(name='verificar_saldos_bajos_diario')
 def tarea_verificar_saldos_bajos():
     """
-    Verificar tarjetas con saldo bajo y enviar notificaciones
+    Verificar tarjetas con saldo bajo y encolar notificaciones
+    
+    Barrido por conjuntos (barrer_saldos_bajos): el costo depende de las
+    alertas a emitir, no de la cantidad de tarjetas. La entrega la hace la
+    bandeja de salida por lotes.
     
     Se ejecuta diariamente a las 20:00
     """
-    from gestion.models import Tarjeta
-    from gestion.notificaciones_saldo import verificar_saldo_y_notificar
+    from gestion.notificaciones_saldo import barrer_saldos_bajos
     
     logger.info("📊 Verificando saldos bajos...")
     
-    # Tarjetas activas con notificaciones habilitadas
-    tarjetas = Tarjeta.objects.filter(
-        estado='Activa',
-        notificar_saldo_bajo=True
-    )
-    
-    notificaciones_enviadas = 0
-    
-    for tarjeta in tarjetas:
-        try:
-            enviada = verificar_saldo_y_notificar(tarjeta)
-            if enviada:
-                notificaciones_enviadas += 1
-        except Exception as e:
-            logger.error(f"Error verificando saldo de {tarjeta}: {e}")
+    metricas = barrer_saldos_bajos()
     
-    logger.info(f"✅ Notificaciones de saldo bajo enviadas: {notificaciones_enviadas}")
-    return notificaciones_enviadas
+    logger.info(
+        f"✅ Notificaciones de saldo bajo: {metricas['notificaciones']} "
+        f"(emails: {metricas['emails']}, WhatsApp: {metricas['whatsapp']}, "
+        f"sin contacto: {metricas['sin_contacto']}) en {metricas['segundos']}s"
+    )
+    return metricas
 
 
 @shared_task(name='generar_reporte_diario_gerencia')
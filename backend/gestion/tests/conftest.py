@@ -7,7 +7,8 @@ from django.utils import timezone
 
 from gestion.models import (
     Cliente, TipoCliente, ListaPrecios, TipoRolGeneral, Empleado,
-    TiposPago, MediosPago
+    TiposPago, MediosPago, Categoria, UnidadMedida, Impuesto,
+    Producto, StockUnico, PuntosExpedicion, Timbrados, Hijo, Tarjeta
 )
 
 
@@ -54,6 +55,29 @@ def cliente(tipo_cliente, lista_precios):
     return cliente
 
 
+@pytest.fixture
+def hijo(cliente):
+    """Hijo del cliente de prueba"""
+    return Hijo.objects.create(
+        id_cliente_responsable=cliente,
+        nombre='Ana',
+        apellido='Pérez',
+        activo=True
+    )
+
+
+@pytest.fixture
+def tarjeta(hijo):
+    """Tarjeta activa con ₲50.000 de saldo y alerta en ₲10.000"""
+    return Tarjeta.objects.create(
+        nro_tarjeta='00012345',
+        id_hijo=hijo,
+        saldo_actual=Decimal('50000'),
+        saldo_alerta=Decimal('10000'),
+        estado='Activa'
+    )
+
+
 @pytest.fixture
 def tipo_rol():
     """Tipo de rol general"""
@@ -104,3 +128,130 @@ def medio_pago():
         }
     )
     return medio
+
+
+@pytest.fixture
+def categoria():
+    """Categoría de producto"""
+    cat, created = Categoria.objects.get_or_create(
+        nombre='Bebidas',
+        defaults={'activo': True}
+    )
+    return cat
+
+
+@pytest.fixture
+def unidad_medida():
+    """Unidad de medida"""
+    unidad, created = UnidadMedida.objects.get_or_create(
+        nombre='Unidad',
+        defaults={'abreviatura': 'u', 'activo': True}
+    )
+    return unidad
+
+
+@pytest.fixture
+def impuesto():
+    """Impuesto (IVA 10%)"""
+    imp, created = Impuesto.objects.get_or_create(
+        nombre_impuesto='IVA 10%',
+        defaults={
+            'porcentaje': 10.0,
+            'vigente_desde': timezone.now().date(),
+            'activo': True
+        }
+    )
+    return imp
+
+
+@pytest.fixture
+def productos_con_stock(categoria, unidad_medida, impuesto):
+    """40 productos activos con 100 unidades de stock cada uno"""
+    # bulk_create: en MySQL el stock lo crea el trigger trg_crear_stock_unico
+    Producto.objects.bulk_create([
+        Producto(
+            codigo_barra=f'TEST{i:04d}',
+            descripcion=f'Producto Test {i}',
+            id_categoria=categoria,
+            id_unidad_medida=unidad_medida,
+            id_impuesto=impuesto,
+            stock_minimo=5,
+            activo=True
+        )
+        for i in range(40)
+    ])
+    productos = list(Producto.objects.filter(codigo_barra__startswith='TEST').order_by('codigo_barra'))
+    StockUnico.objects.bulk_create([
+        StockUnico(id_producto=producto, cantidad=Decimal('100'))
+        for producto in productos
+    ])
+    return productos
+
+
+@pytest.fixture
+def timbrado():
+    """Timbrado activo 001-001 con numeración 1..999999"""
+    punto, created = PuntosExpedicion.objects.get_or_create(
+        codigo_establecimiento='001',
+        codigo_punto_expedicion='001',
+        defaults={'activo': True}
+    )
+    timb, created = Timbrados.objects.get_or_create(
+        nro_timbrado=12345678,
+        defaults={
+            'id_punto': punto,
+            'tipo_documento': 'Factura',
+            'fecha_inicio': timezone.now().date(),
+            'fecha_fin': timezone.now().date(),
+            'nro_inicial': 1,
+            'nro_final': 999999,
+            'activo': True
+        }
+    )
+    return timb
+
+
+@pytest.fixture(scope='session', autouse=True)
+def cache_de_pruebas():
+    """
+    Cache en memoria propio de cada proceso de pytest
+
+    El default de settings es un archivo SQLite compartido en el servidor:
+    cache.clear() entre tests borraría el del servidor de desarrollo y el
+    de los otros workers de xdist.
+    """
+    from django.test import override_settings
+    with override_settings(CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'cantina-tests',
+            'KEY_PREFIX': 'cantina',
+            'OPTIONS': {'MAX_ENTRIES': 20000},
+        }
+    }):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def limpiar_cache_referencia():
+    """Evita que los caches del POS (en memoria y compartido) conserven datos de otro test"""
+    from django.core.cache import cache
+    from gestion.auditoria_diferida import BufferAuditoria
+    from gestion.cache_referencia import CacheReferencia, MapaPrecios
+    from gestion.catalogo_seguro import CatalogoSeguro
+    from gestion.checkin_almuerzo import RegistradorAlmuerzos
+    from gestion.feed_saldos import FeedSaldos
+    from gestion.indice_productos import IndiceProductos
+    from gestion.permisos import CacheRoles
+    from gestion.restricciones_matcher import MatrizConflictos
+    caches_locales = (
+        CacheReferencia, MapaPrecios, IndiceProductos, RegistradorAlmuerzos, BufferAuditoria,
+        CatalogoSeguro, CacheRoles, FeedSaldos, MatrizConflictos,
+    )
+    # El cache de pruebas vive toda la sesión: cada test arranca vacío
+    cache.clear()
+    for cache_local in caches_locales:
+        cache_local.limpiar_local()
+    yield
+    for cache_local in caches_locales:
+        cache_local.limpiar_local()
@@ -0,0 +1,147 @@
+"""
+Tests del motor de alertas de stock (alertas_stock.MotorAlertasStock)
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from gestion.alertas_stock import MotorAlertasStock
+from gestion.catalogo_seguro import CatalogoSeguro
+from gestion.models import EstadoAlertaStock, StockUnico
+from gestion.models_notificaciones import NotificacionSistema
+
+User = get_user_model()
+
+
+def _fijar_stock(productos, cantidad):
+    StockUnico.objects.filter(id_producto__in=productos).update(cantidad=Decimal(cantidad))
+
+
+def _ids(productos):
+    return [p.id_producto for p in productos]
+
+
+@pytest.fixture
+def staff():
+    return User.objects.create_user(username='encargado', is_staff=True)
+
+
+class TestNivel:
+    """Tests de clasificación por umbral (sin base de datos)"""
+
+    def test_niveles(self):
+        """Test: Agotado en cero o negativo, bajo hasta el mínimo inclusive"""
+        assert MotorAlertasStock.nivel(Decimal('0'), Decimal('5')) == EstadoAlertaStock.NIVEL_AGOTADO
+        assert MotorAlertasStock.nivel(Decimal('-1'), Decimal('5')) == EstadoAlertaStock.NIVEL_AGOTADO
+        assert MotorAlertasStock.nivel(Decimal('5'), Decimal('5')) == EstadoAlertaStock.NIVEL_BAJO
+        assert MotorAlertasStock.nivel(Decimal('6'), Decimal('5')) == EstadoAlertaStock.NIVEL_NORMAL
+
+
+@pytest.mark.django_db
+class TestMotorAlertasStock:
+    """Tests de deduplicación y agrupación de alertas"""
+
+    def test_alerta_una_vez_por_ventana(self, productos_con_stock, staff, django_capture_on_commit_callbacks):
+        """Test: Un producto que sigue bajo o rebota dentro de la ventana no repite la alerta"""
+        producto = productos_con_stock[:1]
+        ahora = timezone.now()
+
+        _fijar_stock(producto, 3)
+        with django_capture_on_commit_callbacks(execute=True):
+            assert MotorAlertasStock.evaluar(_ids(producto), ahora=ahora)
+            # Sigue bajo: sin nueva alerta
+            assert MotorAlertasStock.evaluar(_ids(producto), ahora=ahora) == {}
+
+            # Repone y vuelve a bajar dentro de la ventana
+            _fijar_stock(producto, 50)
+            MotorAlertasStock.evaluar(_ids(producto), ahora=ahora)
+            _fijar_stock(producto, 2)
+            assert MotorAlertasStock.evaluar(_ids(producto), ahora=ahora + timedelta(minutes=10)) == {}
+
+        assert NotificacionSistema.objects.filter(usuario=staff, tipo='stock').count() == 1
+
+        # Pasada la ventana vuelve a alertar
+        _fijar_stock(producto, 50)
+        MotorAlertasStock.evaluar(_ids(producto), ahora=ahora)
+        _fijar_stock(producto, 2)
+        alertas = MotorAlertasStock.evaluar(
+            _ids(producto), ahora=ahora + MotorAlertasStock.VENTANA + timedelta(seconds=1)
+        )
+        assert EstadoAlertaStock.NIVEL_BAJO in alertas
+
+    def test_agotado_despues_de_bajo(self, productos_con_stock, staff, django_capture_on_commit_callbacks):
+        """Test: Pasar de bajo a agotado emite la alerta crítica aunque esté dentro de la ventana"""
+        producto = productos_con_stock[:1]
+
+        with django_capture_on_commit_callbacks(execute=True):
+            _fijar_stock(producto, 3)
+            MotorAlertasStock.evaluar(_ids(producto))
+            _fijar_stock(producto, 0)
+            MotorAlertasStock.evaluar(_ids(producto))
+
+        prioridades = sorted(
+            NotificacionSistema.objects.filter(usuario=staff, tipo='stock').values_list('prioridad', flat=True)
+        )
+        assert prioridades == ['alta', 'critica']
+        estado = EstadoAlertaStock.objects.get(id_producto=producto[0])
+        assert estado.nivel == EstadoAlertaStock.NIVEL_AGOTADO
+
+    def test_agrupa_productos_y_queries_constantes(self, productos_con_stock, staff,
+                                                  django_capture_on_commit_callbacks):
+        """Test: Varios productos que cruzan el umbral generan una sola notificación"""
+        _fijar_stock(productos_con_stock[:2], 1)
+        # Sin estado previo se compara con el conjunto cacheado de CatalogoSeguro
+        CatalogoSeguro.con_stock()
+        with CaptureQueriesContext(connection) as pocos:
+            MotorAlertasStock.evaluar(_ids(productos_con_stock[:2]))
+
+        _fijar_stock(productos_con_stock[2:30], 1)
+        with django_capture_on_commit_callbacks(execute=True):
+            with CaptureQueriesContext(connection) as muchos:
+                alertas = MotorAlertasStock.evaluar(_ids(productos_con_stock[2:30]))
+
+        assert len(alertas[EstadoAlertaStock.NIVEL_BAJO]) == 28
+        assert len(muchos.captured_queries) == len(pocos.captured_queries)
+        notificacion = NotificacionSistema.objects.get(usuario=staff, tipo='stock')
+        assert notificacion.mensaje.startswith('28 productos con stock bajo')
+        assert 'y 23 más' in notificacion.mensaje
+
+    def test_stock_normal_no_crea_estado(self, productos_con_stock):
+        """Test: Los productos sin alertas no ocupan filas en la tabla de estado"""
+        assert MotorAlertasStock.evaluar(_ids(productos_con_stock)) == {}
+        assert EstadoAlertaStock.objects.count() == 0
+
+
+@pytest.mark.django_db
+class TestDisparadores:
+    """Tests de los puntos que alimentan al motor"""
+
+    def test_save_de_stock_alerta_al_confirmar(self, productos_con_stock, staff,
+                                              django_capture_on_commit_callbacks):
+        """Test: Guardar un StockUnico por debajo del mínimo alerta después del commit"""
+        stock = StockUnico.objects.get(id_producto=productos_con_stock[0])
+        with django_capture_on_commit_callbacks(execute=True):
+            stock.cantidad = Decimal('0')
+            stock.save()
+
+        notificacion = NotificacionSistema.objects.get(usuario=staff, tipo='stock')
+        assert notificacion.prioridad == 'critica'
+        assert productos_con_stock[0].descripcion in notificacion.mensaje
+
+    def test_editar_producto_no_consulta_notificaciones(self, productos_con_stock, staff):
+        """Test: Editar un producto no hace lecturas extra ni busca notificaciones previas"""
+        producto = productos_con_stock[0]
+        producto.descripcion = 'Producto renombrado'
+        with CaptureQueriesContext(connection) as queries:
+            producto.save()
+
+        sqls = [q['sql'] for q in queries.captured_queries]
+        tabla_notificaciones = NotificacionSistema._meta.db_table
+        assert not any(tabla_notificaciones in sql or 'LIKE' in sql for sql in sqls)
+        assert not any(sql.lstrip().startswith('SELECT') and 'productos' in sql for sql in sqls)
@@ -0,0 +1,235 @@
+"""
+Tests de la auditoría con escritura diferida (auditoria_diferida.BufferAuditoria)
+Incluye benchmark del costo de registrar en el request
+"""
+
+import time
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from gestion import auditoria_diferida
+from gestion.auditoria_diferida import BufferAuditoria
+from gestion.models import AuditoriaOperacion
+from gestion.seguridad_utils import registrar_auditoria
+
+
+@pytest.fixture(autouse=True)
+def sin_worker(monkeypatch):
+    """Registra los avisos al worker en lugar de arrancar el hilo"""
+    avisos = []
+    monkeypatch.setattr(auditoria_diferida, 'despertar_worker', lambda urgente=False: avisos.append(urgente))
+    return avisos
+
+
+@pytest.fixture
+def geolocalizaciones(monkeypatch):
+    consultadas = []
+
+    def geolocalizar(ip):
+        consultadas.append(ip)
+        return 'Asunción', 'Paraguay'
+    monkeypatch.setattr('gestion.seguridad_utils.obtener_geolocalizacion_ip', geolocalizar)
+    return consultadas
+
+
+def _request(ip='181.120.0.1'):
+    request = RequestFactory().post('/pos/venta/', REMOTE_ADDR=ip, HTTP_USER_AGENT='Caja 1')
+    request.user = AnonymousUser()
+    request.session = {'cliente_usuario': 'cajero1', 'cliente_id': 7}
+    return request
+
+
+def _registrar(cantidad, operacion='VENTA_CON_RESTRICCIONES', ip='181.120.0.1'):
+    for i in range(cantidad):
+        registrar_auditoria(
+            _request(ip), operacion, tipo_usuario='EMPLEADO', tabla_afectada='ventas',
+            id_registro=i, descripcion=f'evento {i}',
+        )
+
+
+@pytest.mark.django_db
+class TestBufferAuditoria:
+    """Tests de diferido, orden, durabilidad y reintentos"""
+
+    def test_escribe_despues_del_commit(self, geolocalizaciones, django_capture_on_commit_callbacks):
+        """Test: El evento no se inserta en el request sino al vaciar el buffer"""
+        with django_capture_on_commit_callbacks(execute=True):
+            with CaptureQueriesContext(connection) as consultas:
+                _registrar(1)
+
+        assert len(consultas) == 0 and geolocalizaciones == []
+        assert BufferAuditoria.pendientes() == 1
+
+        assert BufferAuditoria.vaciar() == 1
+        evento = AuditoriaOperacion.objects.get()
+        assert (evento.usuario, evento.ip_address, evento.ciudad) == ('cajero1', '181.120.0.1', 'Asunción')
+
+    def test_rollback_no_audita(self, geolocalizaciones, django_capture_on_commit_callbacks):
+        """Test: Si la transacción se revierte el evento no llega al buffer"""
+        with django_capture_on_commit_callbacks(execute=True):
+            with pytest.raises(ValueError):
+                with transaction.atomic():
+                    _registrar(1)
+                    raise ValueError('venta fallida')
+
+        assert BufferAuditoria.pendientes() == 0
+
+    def test_orden_y_lotes(self, geolocalizaciones, settings, sin_worker, django_capture_on_commit_callbacks):
+        """Test: Los eventos se insertan en orden, en lotes de AUDITORIA_LOTE"""
+        settings.AUDITORIA_LOTE = 10
+        with django_capture_on_commit_callbacks(execute=True):
+            _registrar(25)
+
+        # El worker se despierta en cuanto hay un lote completo
+        assert sin_worker[:9] == [False] * 9 and all(sin_worker[9:])
+
+        with CaptureQueriesContext(connection) as consultas:
+            assert BufferAuditoria.vaciar() == 25
+
+        assert sum(q['sql'].startswith('INSERT') for q in consultas.captured_queries) == 3
+        descripciones = list(AuditoriaOperacion.objects.order_by('id_auditoria').values_list('descripcion', flat=True))
+        assert descripciones == [f'evento {i}' for i in range(25)]
+
+    def test_geolocaliza_una_vez_por_ip(self, geolocalizaciones, django_capture_on_commit_callbacks):
+        """Test: Una consulta de geolocalización por IP distinta en el lote"""
+        with django_capture_on_commit_callbacks(execute=True):
+            _registrar(5, ip='181.120.0.1')
+            _registrar(5, ip='190.104.0.2')
+
+        BufferAuditoria.vaciar()
+
+        assert geolocalizaciones == ['181.120.0.1', '190.104.0.2']
+
+    def test_operacion_critica_inmediata(self, geolocalizaciones, django_capture_on_commit_callbacks):
+        """Test: Operaciones críticas y durable=True se insertan en el momento"""
+        _registrar(1, operacion='APROBAR_PAGO_TRANSFERENCIA')
+        registrar_auditoria(_request(), 'LOGIN_PORTAL', durable=True)
+
+        assert AuditoriaOperacion.objects.count() == 2
+        assert BufferAuditoria.pendientes() == 0
+        assert AuditoriaOperacion.objects.filter(ciudad='Asunción').count() == 2
+
+    def test_desactivada(self, geolocalizaciones, settings):
+        """Test: Con AUDITORIA_DIFERIDA=False cada evento se inserta como antes"""
+        settings.AUDITORIA_DIFERIDA = False
+        _registrar(3)
+
+        assert AuditoriaOperacion.objects.count() == 3
+        assert BufferAuditoria.pendientes() == 0
+
+    def test_falla_de_base_reintenta(self, geolocalizaciones, monkeypatch, django_capture_on_commit_callbacks):
+        """Test: Si el INSERT falla el lote vuelve al frente, sin perder el orden ni geolocalizar de nuevo"""
+        with django_capture_on_commit_callbacks(execute=True):
+            _registrar(3)
+        original = AuditoriaOperacion.objects.bulk_create
+
+        def caida(*args, **kwargs):
+            raise RuntimeError('MySQL server has gone away')
+        monkeypatch.setattr(AuditoriaOperacion.objects, 'bulk_create', caida)
+        assert BufferAuditoria.vaciar() == 0
+        assert BufferAuditoria.pendientes() == 3
+
+        with django_capture_on_commit_callbacks(execute=True):
+            _registrar(1, ip='190.104.0.2')
+        monkeypatch.setattr(AuditoriaOperacion.objects, 'bulk_create', original)
+        assert BufferAuditoria.vaciar() == 4
+
+        assert list(AuditoriaOperacion.objects.order_by('id_auditoria').values_list('id_registro', flat=True)) == [
+            0, 1, 2, 0
+        ]
+        assert geolocalizaciones == ['181.120.0.1', '190.104.0.2']
+
+    def test_evento_invalido_no_traba_el_buffer(self, geolocalizaciones, django_capture_on_commit_callbacks):
+        """Test: Un evento que no se puede insertar se descarta y el resto del lote se escribe"""
+        with django_capture_on_commit_callbacks(execute=True):
+            _registrar(1)
+            registrar_auditoria(
+                _request(), 'VENTA_CON_RESTRICCIONES', tipo_usuario='EMPLEADO', tabla_afectada='ventas',
+                id_registro=99, datos_nuevos={'monto': Decimal('1')},
+            )
+            _registrar(1)
+
+        assert BufferAuditoria.vaciar() == 2
+        assert BufferAuditoria.pendientes() == 0
+
+        with django_capture_on_commit_callbacks(execute=True):
+            _registrar(1)
+        assert BufferAuditoria.vaciar() == 1
+        assert AuditoriaOperacion.objects.count() == 3
+
+    def test_reintentos_acotados(self, geolocalizaciones, monkeypatch, django_capture_on_commit_callbacks):
+        """Test: Con la base caída los eventos se descartan después de MAX_REINTENTOS vaciados"""
+        with django_capture_on_commit_callbacks(execute=True):
+            _registrar(2)
+
+        def caida(*args, **kwargs):
+            raise RuntimeError('MySQL server has gone away')
+        monkeypatch.setattr(AuditoriaOperacion.objects, 'bulk_create', caida)
+        for _ in range(auditoria_diferida.MAX_REINTENTOS - 1):
+            BufferAuditoria.vaciar()
+            assert BufferAuditoria.pendientes() == 2
+
+        assert BufferAuditoria.vaciar() == 0
+        assert BufferAuditoria.pendientes() == 0
+
+    def test_buffer_acotado(self, geolocalizaciones, settings, monkeypatch, django_capture_on_commit_callbacks):
+        """Test: El buffer no crece más allá de MAX_BUFFER_FACTOR x lote"""
+        settings.AUDITORIA_LOTE = 2
+        monkeypatch.setattr(BufferAuditoria, 'vaciar', staticmethod(lambda: 0))
+        with django_capture_on_commit_callbacks(execute=True):
+            _registrar(2 * auditoria_diferida.MAX_BUFFER_FACTOR + 5)
+
+        assert BufferAuditoria.pendientes() == 2 * auditoria_diferida.MAX_BUFFER_FACTOR
+
+    def test_contrapresion(self, geolocalizaciones, settings, django_capture_on_commit_callbacks):
+        """Test: Con el worker atascado, quien registra vacía el buffer"""
+        settings.AUDITORIA_LOTE = 2
+        with django_capture_on_commit_callbacks(execute=True):
+            _registrar(2 * auditoria_diferida.MAX_PENDIENTES_FACTOR)
+
+        assert BufferAuditoria.pendientes() == 0
+        assert AuditoriaOperacion.objects.count() == 20
+
+    def test_vacia_al_salir(self, geolocalizaciones, django_capture_on_commit_callbacks):
+        """Test: Lo pendiente se escribe al terminar el proceso"""
+        with django_capture_on_commit_callbacks(execute=True):
+            _registrar(4)
+
+        auditoria_diferida._vaciar_al_salir()
+
+        assert AuditoriaOperacion.objects.count() == 4
+
+    @pytest.mark.slow
+    def test_benchmark_registro(self, settings, monkeypatch, django_capture_on_commit_callbacks):
+        """Benchmark: 500 eventos con geolocalización de 2 ms, insertados en el request vs. diferidos"""
+        print("\n📊 BENCHMARK: Costo de registrar_auditoria en el request (500 eventos)")
+
+        def geolocalizar(ip):
+            time.sleep(0.002)
+            return 'Asunción', 'Paraguay'
+        monkeypatch.setattr('gestion.seguridad_utils.obtener_geolocalizacion_ip', geolocalizar)
+
+        settings.AUDITORIA_DIFERIDA = False
+        inicio = time.perf_counter()
+        _registrar(500)
+        sincronico = time.perf_counter() - inicio
+
+        settings.AUDITORIA_DIFERIDA = True
+        inicio = time.perf_counter()
+        with django_capture_on_commit_callbacks(execute=True):
+            _registrar(500)
+        diferido = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        BufferAuditoria.vaciar()
+        escritura = time.perf_counter() - inicio
+
+        print(f"   En el request: {sincronico * 1000:.0f} ms")
+        print(f"   Diferido:      {diferido * 1000:.0f} ms (+ {escritura * 1000:.0f} ms en el worker)")
+        assert AuditoriaOperacion.objects.count() == 1000
+        assert diferido < sincronico / 5
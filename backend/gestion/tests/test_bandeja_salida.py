@@ -0,0 +1,152 @@
+"""
+Tests de la bandeja de salida de mensajes (bandeja_salida.BandejaSalida)
+"""
+
+import threading
+import time
+from decimal import Decimal
+
+import pytest
+from django.core import mail
+from django.db import transaction
+from django.utils import timezone
+
+from gestion import bandeja_salida
+from gestion.bandeja_salida import BandejaSalida, EMAIL, WHATSAPP
+from gestion.models import MensajeSaliente, NotificacionSaldo, UsuarioPortal
+from gestion.notificaciones_saldo import verificar_saldo_y_notificar
+
+
+class RemitenteFalso:
+    """Remitente que registra los envíos y la concurrencia máxima alcanzada"""
+
+    def __init__(self, fallar=(), demora=0):
+        self.fallar = set(fallar)
+        self.demora = demora
+        self.enviados = []
+        self.en_curso = 0
+        self.max_en_curso = 0
+        self.lock = threading.Lock()
+
+    def enviar_lote(self, mensajes):
+        with self.lock:
+            self.en_curso += 1
+            self.max_en_curso = max(self.max_en_curso, self.en_curso)
+        time.sleep(self.demora)
+        resultados = {}
+        for mensaje in mensajes:
+            if mensaje.destinatario in self.fallar:
+                resultados[mensaje.id_mensaje] = 'rechazado'
+            else:
+                self.enviados.append(mensaje.destinatario)
+                resultados[mensaje.id_mensaje] = None
+        with self.lock:
+            self.en_curso -= 1
+        return resultados
+
+
+@pytest.fixture
+def sin_worker(monkeypatch):
+    """Registra los avisos al worker en lugar de iniciar el hilo"""
+    avisos = []
+    monkeypatch.setattr(bandeja_salida, 'despertar_worker', lambda: avisos.append(1))
+    return avisos
+
+
+@pytest.mark.django_db
+class TestBandejaSalida:
+    """Tests de encolado, entrega y reintentos"""
+
+    def test_rollback_descarta_mensaje(self, sin_worker, django_capture_on_commit_callbacks):
+        """Test: Un mensaje de una venta revertida no se envía ni despierta al worker"""
+        with django_capture_on_commit_callbacks(execute=True):
+            with pytest.raises(RuntimeError):
+                with transaction.atomic():
+                    BandejaSalida.encolar(EMAIL, 'padre@test.com', 'cuerpo')
+                    raise RuntimeError('venta cancelada')
+
+        assert MensajeSaliente.objects.count() == 0
+        assert sin_worker == []
+
+    def test_entrega_y_reintento(self, sin_worker):
+        """Test: Los enviados quedan ENVIADO; los rechazados se reprograman con backoff"""
+        for destinatario in ('a@test.com', 'b@test.com', 'malo@test.com'):
+            BandejaSalida.encolar(EMAIL, destinatario, 'cuerpo', asunto='Aviso')
+        remitente = RemitenteFalso(fallar={'malo@test.com'})
+
+        resultado = BandejaSalida.procesar_pendientes(canales=[EMAIL], remitentes={EMAIL: remitente})
+
+        assert resultado == {'enviados': 2, 'reintentos': 1, 'errores': 0}
+        assert sorted(remitente.enviados) == ['a@test.com', 'b@test.com']
+        malo = MensajeSaliente.objects.get(destinatario='malo@test.com')
+        assert malo.estado == 'PENDIENTE'
+        assert malo.fecha_proximo_intento > timezone.now()
+        # En backoff: la siguiente pasada no lo reintenta todavía
+        assert BandejaSalida.procesar_pendientes(canales=[EMAIL], remitentes={EMAIL: remitente}) == {
+            'enviados': 0, 'reintentos': 0, 'errores': 0
+        }
+
+    def test_error_al_agotar_intentos(self, sin_worker):
+        """Test: Sin más intentos el mensaje queda en ERROR"""
+        mensaje = BandejaSalida.encolar(WHATSAPP, '0981000000', 'cuerpo')
+        MensajeSaliente.objects.filter(pk=mensaje.pk).update(intentos=4)
+
+        resultado = BandejaSalida.procesar_pendientes(
+            canales=[WHATSAPP], remitentes={WHATSAPP: RemitenteFalso(fallar={'0981000000'})}
+        )
+
+        assert resultado['errores'] == 1
+        assert MensajeSaliente.objects.get(pk=mensaje.pk).estado == 'ERROR'
+
+    def test_concurrencia_por_canal(self, sin_worker, settings):
+        """Test: El lote se reparte sin superar el límite de envíos simultáneos del canal"""
+        settings.MENSAJERIA_CONCURRENCIA = {'WHATSAPP': 3}
+        for i in range(12):
+            BandejaSalida.encolar(WHATSAPP, f'09810000{i:02d}', 'cuerpo')
+        remitente = RemitenteFalso(demora=0.05)
+
+        resultado = BandejaSalida.procesar_pendientes(canales=[WHATSAPP], remitentes={WHATSAPP: remitente})
+
+        assert resultado['enviados'] == 12
+        assert remitente.max_en_curso == 3
+
+    def test_lote_reclamado_una_sola_vez(self, sin_worker):
+        """Test: Un mensaje reclamado por un worker no lo toma otro"""
+        for i in range(5):
+            BandejaSalida.encolar(EMAIL, f'p{i}@test.com', 'cuerpo')
+
+        primero = BandejaSalida.reclamar_lote(EMAIL, limite=3)
+        segundo = BandejaSalida.reclamar_lote(EMAIL, limite=10)
+
+        assert len(primero) == 3 and len(segundo) == 2
+        assert not {m.id_mensaje for m in primero} & {m.id_mensaje for m in segundo}
+
+
+@pytest.mark.django_db
+class TestAlertaSaldo:
+    """Tests de verificar_saldo_y_notificar sobre la bandeja"""
+
+    def test_venta_solo_encola(self, tarjeta, cliente, sin_worker, settings, django_capture_on_commit_callbacks):
+        """Test: La alerta no envía nada dentro de la transacción; el worker entrega después"""
+        settings.EMAIL_HOST = 'smtp.test'
+        UsuarioPortal.objects.create(cliente=cliente, email='padre@test.com', password_hash='x')
+        tarjeta.saldo_actual = Decimal('5000')
+
+        with django_capture_on_commit_callbacks(execute=True):
+            with transaction.atomic():
+                notificacion = verificar_saldo_y_notificar(tarjeta)
+                assert len(mail.outbox) == 0
+
+        assert notificacion.tipo_notificacion == 'SALDO_BAJO'
+        canales = set(MensajeSaliente.objects.values_list('canal', 'destinatario'))
+        assert canales == {(EMAIL, 'padre@test.com'), (WHATSAPP, cliente.telefono)}
+        assert sin_worker
+
+        BandejaSalida.procesar_pendientes(
+            remitentes={WHATSAPP: RemitenteFalso()}
+        )
+
+        assert len(mail.outbox) == 1
+        assert mail.outbox[0].to == ['padre@test.com']
+        notificacion = NotificacionSaldo.objects.get(pk=notificacion.pk)
+        assert notificacion.enviada_email and notificacion.enviada_sms
@@ -0,0 +1,113 @@
+"""
+Tests del barrido nocturno de saldos bajos (notificaciones_saldo.barrer_saldos_bajos)
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from gestion import bandeja_salida
+from gestion.models import Hijo, MensajeSaliente, NotificacionSaldo, Tarjeta, UsuarioPortal
+from gestion.notificaciones_saldo import barrer_saldos_bajos
+
+
+@pytest.fixture(autouse=True)
+def sin_worker(monkeypatch, settings):
+    settings.EMAIL_HOST = 'smtp.test'
+    monkeypatch.setattr(bandeja_salida, 'despertar_worker', lambda: None)
+
+
+def _tarjeta(cliente, nro, saldo, alerta=Decimal('10000'), **campos):
+    hijo = Hijo.objects.create(id_cliente_responsable=cliente, nombre=f'Hijo{nro}', apellido='Test')
+    return Tarjeta.objects.create(
+        nro_tarjeta=nro, id_hijo=hijo, saldo_actual=Decimal(saldo), saldo_alerta=alerta, **campos
+    )
+
+
+@pytest.mark.django_db
+class TestBarridoSaldosBajos:
+    """Tests de selección, contactos y métricas del barrido"""
+
+    def test_selecciona_solo_tarjetas_a_alertar(self, cliente):
+        """Test: Sólo tarjetas activas, con aviso habilitado, bajo el umbral y fuera de las 24 h"""
+        ahora = timezone.now()
+        _tarjeta(cliente, 'BAJO', 5000)
+        _tarjeta(cliente, 'NEGATIVO', -2000)
+        _tarjeta(cliente, 'SIN_UMBRAL', 9000, alerta=None)
+        _tarjeta(cliente, 'VIEJA', 5000, ultima_notificacion_saldo=ahora - timedelta(hours=25))
+        _tarjeta(cliente, 'OK', 50000)
+        _tarjeta(cliente, 'RECIENTE', 5000, ultima_notificacion_saldo=ahora - timedelta(hours=2))
+        _tarjeta(cliente, 'SIN_AVISO', 5000, notificar_saldo_bajo=False)
+        _tarjeta(cliente, 'BLOQUEADA', 5000, estado='Bloqueada')
+
+        metricas = barrer_saldos_bajos(ahora=ahora)
+
+        notificadas = dict(NotificacionSaldo.objects.values_list('nro_tarjeta', 'tipo_notificacion'))
+        assert notificadas == {
+            'BAJO': 'SALDO_BAJO', 'NEGATIVO': 'SALDO_NEGATIVO',
+            'SIN_UMBRAL': 'SALDO_BAJO', 'VIEJA': 'SALDO_BAJO',
+        }
+        assert metricas['candidatas'] == metricas['notificaciones'] == 4
+        assert set(
+            Tarjeta.objects.filter(ultima_notificacion_saldo=ahora).values_list('nro_tarjeta', flat=True)
+        ) == set(notificadas)
+        # Dentro de la espera de 24 h no se repite
+        assert barrer_saldos_bajos(ahora=ahora + timedelta(hours=1))['notificaciones'] == 0
+
+    def test_encola_en_bandeja_enlazado_a_la_notificacion(self, cliente):
+        """Test: Email del portal y WhatsApp del cliente, cada uno con su NotificacionSaldo"""
+        UsuarioPortal.objects.create(cliente=cliente, email='portal@test.com', password_hash='x')
+        _tarjeta(cliente, 'T1', 1000)
+        _tarjeta(cliente, 'T2', 2000)
+
+        metricas = barrer_saldos_bajos()
+
+        assert (metricas['emails'], metricas['whatsapp'], metricas['sin_contacto']) == (2, 2, 0)
+        for notificacion in NotificacionSaldo.objects.all():
+            assert notificacion.email_destinatario == 'portal@test.com'
+            assert set(notificacion.mensajes.values_list('canal', 'destinatario')) == {
+                (MensajeSaliente.CANAL_EMAIL, 'portal@test.com'),
+                (MensajeSaliente.CANAL_WHATSAPP, cliente.telefono),
+            }
+
+    def test_portal_inactivo_y_sin_contacto(self, cliente):
+        """Test: Portal inactivo usa el email del cliente; sin email ni teléfono no encola"""
+        UsuarioPortal.objects.create(cliente=cliente, email='portal@test.com', password_hash='x', activo=False)
+        cliente.email = 'ficha@test.com'
+        cliente.telefono = '0'
+        cliente.save()
+        _tarjeta(cliente, 'T1', 1000)
+
+        barrer_saldos_bajos()
+        assert list(MensajeSaliente.objects.values_list('canal', 'destinatario')) == [
+            (MensajeSaliente.CANAL_EMAIL, 'ficha@test.com')
+        ]
+
+        cliente.email = None
+        cliente.save()
+        UsuarioPortal.objects.all().delete()
+        Tarjeta.objects.update(ultima_notificacion_saldo=None)
+        assert barrer_saldos_bajos()['sin_contacto'] == 1
+
+    def test_consultas_no_crecen_con_las_tarjetas(self, cliente):
+        """Test: Las consultas dependen de los lotes de alertas, no del total de tarjetas"""
+        for i in range(3):
+            _tarjeta(cliente, f'BAJA{i}', 1000)
+        Tarjeta.objects.bulk_create([
+            Tarjeta(nro_tarjeta=f'OK{i}', id_hijo=Hijo.objects.create(
+                id_cliente_responsable=cliente, nombre='H', apellido=str(i)
+            ), saldo_actual=Decimal('90000'))
+            for i in range(40)
+        ])
+
+        with CaptureQueriesContext(connection) as consultas:
+            metricas = barrer_saldos_bajos(tamano_lote=2)
+
+        assert metricas['notificaciones'] == 3 and metricas['lotes'] == 2
+        # 1 selección + por lote: transacción (2), lectura, máximo id, alta, mensajes,
+        # marca y, en motores sin RETURNING, la lectura de ids
+        assert len(consultas) <= 1 + metricas['lotes'] * 8
@@ -0,0 +1,166 @@
+"""
+Tests de la invalidación por generación del cache compartido (cache_compartido)
+Usa un SQLiteCache temporal como backend compartido entre workers
+"""
+
+import threading
+
+import pytest
+from django.core.cache import caches
+from django.test import override_settings
+
+from gestion.cache_compartido import EspacioCache, espacio_cache
+from gestion.cache_reportes import ReporteCache
+from gestion.cache_utils import cache_result, invalidate_cache
+
+
+@pytest.fixture
+def cache_archivos(tmp_path):
+    """Backend compartido en disco, como en producción con CACHE_BACKEND=sqlite"""
+    with override_settings(CACHES={
+        'default': {
+            'BACKEND': 'gestion.cache_sqlite.SQLiteCache',
+            'LOCATION': str(tmp_path / 'cache.sqlite3'),
+        }
+    }):
+        yield caches['default']
+
+
+def _en_otro_worker(funcion):
+    """Ejecuta en otro hilo, que abre su propia conexión al backend"""
+    resultado = {}
+    hilo = threading.Thread(target=lambda: resultado.setdefault('valor', funcion()))
+    hilo.start()
+    hilo.join()
+    return resultado.get('valor')
+
+
+class TestEspacioCache:
+    """Tests de espacios con contador de generación"""
+
+    def test_invalidar_espacio(self, cache_archivos):
+        """Test: Invalidar oculta todas las claves del espacio y no toca las demás"""
+        productos = EspacioCache('productos')
+        productos.set('categoria:1', 'a')
+        productos.set('categoria:2', 'b')
+        cache_archivos.set('ajena', 'c')
+
+        productos.invalidar()
+
+        assert productos.get('categoria:1') is None
+        assert productos.get('categoria:2') is None
+        assert cache_archivos.get('ajena') == 'c'
+
+    def test_invalidar_padre_invalida_hijos(self, cache_archivos):
+        """Test: Invalidar 'reporte' invalida todos los tipos de reporte"""
+        padre = EspacioCache('reporte')
+        ventas = EspacioCache('reporte:ventas', padre)
+        stock = EspacioCache('reporte:stock', padre)
+        ventas.set('x', 1)
+        stock.set('x', 2)
+
+        ventas.invalidar()
+        assert ventas.get('x') is None
+        assert stock.get('x') == 2
+
+        padre.invalidar()
+        assert stock.get('x') is None
+
+    def test_contador_perdido_no_revive_claves(self, cache_archivos):
+        """Test: Si se pierde el contador, la generación nueva no coincide con la vieja"""
+        espacio = EspacioCache('dashboard')
+        espacio.set('datos', 'viejo')
+        cache_archivos.delete(espacio.clave_generacion)
+
+        assert espacio.get('datos') is None
+
+    def test_invalidacion_visible_en_otro_worker(self, cache_archivos):
+        """Test: Lo que un worker invalida deja de verse en los demás"""
+        espacio = EspacioCache('productos')
+        espacio.set('lista', [1, 2, 3])
+
+        assert _en_otro_worker(lambda: EspacioCache('productos').get('lista')) == [1, 2, 3]
+
+        _en_otro_worker(lambda: EspacioCache('productos').invalidar())
+
+        assert espacio.get('lista') is None
+
+    def test_registro_por_nombre(self):
+        """Test: espacio_cache devuelve siempre el mismo espacio y enlaza el padre"""
+        espacio = espacio_cache('reporte:prueba', padre='reporte')
+        assert espacio is espacio_cache('reporte:prueba')
+        assert espacio.padre is espacio_cache('reporte')
+
+
+class TestSQLiteCache:
+    """Tests del backend SQLite compartido"""
+
+    def test_operaciones_basicas(self, cache_archivos):
+        """Test: set/get/add/delete/get_many y vencimiento"""
+        cache_archivos.set('a', {'x': 1})
+        assert cache_archivos.get('a') == {'x': 1}
+        assert cache_archivos.add('a', 'otro') is False
+        assert cache_archivos.add('b', 2) is True
+        assert cache_archivos.get_many(['a', 'b', 'c']) == {'a': {'x': 1}, 'b': 2}
+
+        cache_archivos.set('vencida', 1, timeout=-1)
+        assert cache_archivos.get('vencida') is None
+        assert cache_archivos.add('vencida', 3) is True
+
+        assert cache_archivos.delete('a') is True
+        assert cache_archivos.get('a', 'default') == 'default'
+        with pytest.raises(ValueError):
+            cache_archivos.incr('inexistente')
+
+    def test_incr_atomico_entre_workers(self, cache_archivos):
+        """Test: Incrementos concurrentes desde varias conexiones no se pierden"""
+        cache_archivos.set('contador', 0, None)
+        hilos, incrementos = 8, 50
+
+        def worker():
+            backend = caches['default']
+            for _ in range(incrementos):
+                backend.incr('contador')
+
+        trabajadores = [threading.Thread(target=worker) for _ in range(hilos)]
+        for hilo in trabajadores:
+            hilo.start()
+        for hilo in trabajadores:
+            hilo.join()
+
+        assert cache_archivos.get('contador') == hilos * incrementos
+
+
+class TestInvalidacionExistente:
+    """Tests de ReporteCache y cache_utils sobre los espacios"""
+
+    def test_reporte_invalidar_tipo(self, cache_archivos):
+        """Test: invalidar_tipo funciona sin delete_pattern"""
+        ReporteCache.set_reporte('productos', {'total': 10}, fecha='2026-01-01')
+        ReporteCache.set_reporte('ventas', {'total': 5}, fecha='2026-01-01')
+
+        ReporteCache.invalidar_tipo('productos')
+
+        assert ReporteCache.get_reporte('productos', fecha='2026-01-01') is None
+        assert ReporteCache.get_reporte('ventas', fecha='2026-01-01') == {'total': 5}
+
+        ReporteCache.invalidar_todos()
+        assert ReporteCache.get_reporte('ventas', fecha='2026-01-01') is None
+
+    def test_invalidate_cache_no_limpia_todo(self, cache_archivos):
+        """Test: invalidate_cache invalida el prefijo sin cache.clear()"""
+        llamadas = []
+
+        @cache_result(timeout=60, key_prefix='productos')
+        def listar(categoria):
+            llamadas.append(categoria)
+            return [categoria]
+
+        cache_archivos.set('ratelimit:ip', 7)
+        listar(1)
+        listar(1)
+        invalidate_cache(key_prefix='productos')
+        listar(1)
+
+        assert llamadas == [1, 1]
+        assert cache_archivos.get('ratelimit:ip') == 7
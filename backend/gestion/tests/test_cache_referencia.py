@@ -0,0 +1,119 @@
+"""
+Tests del cache de datos de referencia del POS (cache_referencia.CacheReferencia)
+"""
+
+import pytest
+from decimal import Decimal
+from django.core.cache import cache
+from django.utils import timezone
+
+from gestion.models import Cliente, MediosPago, PreciosPorLista, Producto
+from gestion.cache_referencia import CacheReferencia, MapaPrecios
+
+
+@pytest.mark.django_db
+class TestCacheReferencia:
+    """Tests de lecturas en memoria e invalidación versionada"""
+
+    def test_segunda_lectura_sin_queries(self, lista_precios, tipo_cliente, medio_pago, timbrado,
+                                         django_assert_num_queries):
+        """Test: Después de precargar, una venta no consulta datos de referencia"""
+        # La primera precarga crea el cliente genérico y el empleado SISTEMA
+        CacheReferencia.precargar()
+        disponibles = CacheReferencia.precargar()
+        assert all(disponibles.values())
+
+        with django_assert_num_queries(0):
+            assert CacheReferencia.lista_precios_default() == lista_precios
+            assert CacheReferencia.tipo_cliente_default() == tipo_cliente
+            assert CacheReferencia.timbrado_activo() == timbrado
+            assert CacheReferencia.medio_pago(medio_pago.id_medio_pago) == medio_pago
+            assert CacheReferencia.medio_pago(str(medio_pago.id_medio_pago)) == medio_pago
+            assert CacheReferencia.medio_pago(99999) is None
+            assert CacheReferencia.cliente_generico().ruc_ci == '0000000'
+            assert CacheReferencia.empleado_sistema().usuario == 'SISTEMA'
+
+    def test_cliente_generico_recien_creado_no_se_cachea(self, lista_precios, tipo_cliente,
+                                                         django_assert_max_num_queries):
+        """Test: El cliente creado en la transacción actual no queda en memoria"""
+        CacheReferencia.cliente_generico()
+        assert Cliente.objects.filter(ruc_ci='0000000').count() == 1
+
+        # La segunda vez ya existe y se cachea
+        CacheReferencia.cliente_generico()
+        with django_assert_max_num_queries(0):
+            CacheReferencia.cliente_generico()
+
+    def test_signal_invalida_al_confirmar(self, medio_pago, django_capture_on_commit_callbacks):
+        """Test: Modificar un medio de pago invalida el cache en todos los procesos"""
+        CacheReferencia.medios_pago()
+        version = cache.get(CacheReferencia.CLAVE_VERSION)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            MediosPago.objects.filter(pk=medio_pago.pk).update(descripcion='Efectivo PYG')
+            medio_pago.refresh_from_db()
+            medio_pago.save()
+
+        assert cache.get(CacheReferencia.CLAVE_VERSION) == version + 1
+        assert CacheReferencia.medio_pago(medio_pago.pk).descripcion == 'Efectivo PYG'
+
+    def test_otro_proceso_detecta_nueva_version(self, lista_precios, django_assert_num_queries):
+        """Test: Un cambio de versión hecho por otro proceso descarta la copia local"""
+        CacheReferencia.lista_precios_default()
+
+        cache.incr(CacheReferencia.CLAVE_VERSION)
+
+        with django_assert_num_queries(1):
+            CacheReferencia.lista_precios_default()
+
+
+@pytest.fixture
+def productos_con_precio(productos_con_stock, lista_precios):
+    """Precio de lista para los primeros 30 productos; el primero se vende por kilo"""
+    Producto.objects.filter(pk=productos_con_stock[0].pk).update(descripcion='Almuerzo por Kilo')
+    PreciosPorLista.objects.bulk_create([
+        PreciosPorLista(
+            id_producto=producto,
+            id_lista_precios=lista_precios,
+            precio_venta=Decimal(1000 + i),
+            fecha_vigencia=timezone.now()
+        )
+        for i, producto in enumerate(productos_con_stock[:30])
+    ])
+    return productos_con_stock
+
+
+@pytest.mark.django_db
+class TestMapaPrecios:
+    """Tests de precios de la grilla del POS"""
+
+    def test_anotar_precio_y_por_kilo(self, productos_con_precio, lista_precios):
+        """Test: Cada producto recibe su precio de lista y la marca por kilo"""
+        productos = MapaPrecios.anotar(Producto.objects.order_by('codigo_barra'))
+
+        assert productos[0].es_por_kilo is True
+        assert productos[1].es_por_kilo is False
+        assert productos[5].precio_actual == Decimal('1005')
+        assert productos[35].precio_actual == 0
+
+    def test_grilla_en_queries_constantes(self, productos_con_precio, lista_precios,
+                                          django_assert_num_queries):
+        """Test: Con el mapa cargado la grilla sólo consulta los productos"""
+        MapaPrecios.anotar(Producto.objects.all()[:5])
+
+        with django_assert_num_queries(1):
+            productos = MapaPrecios.anotar(
+                Producto.objects.filter(activo=True).select_related('stock').order_by('descripcion')[:30]
+            )
+        assert len(productos) == 30
+
+    def test_cambio_de_precio_invalida(self, productos_con_precio, lista_precios):
+        """Test: Guardar un PreciosPorLista descarta el mapa cacheado"""
+        producto = productos_con_precio[2]
+        assert MapaPrecios.precios(lista_precios.pk)[producto.pk] == Decimal('1002')
+
+        precio = PreciosPorLista.objects.get(id_producto=producto, id_lista_precios=lista_precios)
+        precio.precio_venta = Decimal('2500')
+        precio.save()
+
+        assert MapaPrecios.precios(lista_precios.pk)[producto.pk] == Decimal('2500')
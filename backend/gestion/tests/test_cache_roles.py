@@ -0,0 +1,149 @@
+"""
+Tests de la resolución de roles cacheada (permisos.CacheRoles)
+Cubre decoradores, context processor y permisos de la API; incluye benchmark
+"""
+
+import time
+
+import pytest
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from gestion.api_permissions import IsAdministrador, IsCajero, IsGerente
+from gestion.context_processors import rol_usuario
+from gestion.models import Empleado, TipoRolGeneral
+from gestion.permisos import (
+    ROL_CAJERO, ROL_GERENTE, CacheRoles, acceso_cajero, obtener_rol_empleado, solo_gerente_o_superior
+)
+
+
+@acceso_cajero
+def vista_caja(request):
+    return HttpResponse('ok')
+
+
+@solo_gerente_o_superior
+def vista_reportes(request):
+    return HttpResponse('ok')
+
+
+@pytest.fixture
+def cajero():
+    """Usuario Django con su Empleado de rol CAJERO"""
+    rol, _ = TipoRolGeneral.objects.get_or_create(nombre_rol=ROL_CAJERO)
+    Empleado.objects.create(
+        id_rol=rol, nombre='Carla', apellido='Gómez', usuario='cgomez', contrasena_hash='x', activo=True
+    )
+    return User.objects.create_user(username='cgomez')
+
+
+def _request(usuario):
+    """Request como lo arma el middleware: un objeto usuario nuevo por request"""
+    request = RequestFactory().get('/pos/')
+    request.user = User.objects.get(pk=usuario.pk)
+    request.session = {}
+    request._messages = FallbackStorage(request)
+    return request
+
+
+@pytest.mark.django_db
+class TestCacheRoles:
+    """Tests de memo por request, cache entre requests e invalidación"""
+
+    def test_una_consulta_por_request(self, cajero):
+        """Test: Decorador, context processor y permisos de la API resuelven el rol una sola vez"""
+        request = _request(cajero)
+
+        with CaptureQueriesContext(connection) as consultas:
+            assert vista_caja(request).status_code == 200
+            contexto = rol_usuario(request)
+            assert IsCajero().has_permission(request, None)
+            assert not IsGerente().has_permission(request, None)
+
+        assert len(consultas) == 1
+        assert contexto['usuario_rol'] == ROL_CAJERO and contexto['es_cajero']
+
+    def test_sin_consultas_entre_requests(self, cajero):
+        """Test: Los requests siguientes toman el rol del cache del proceso"""
+        vista_caja(_request(cajero))
+
+        request = _request(cajero)
+        with CaptureQueriesContext(connection) as consultas:
+            assert vista_caja(request).status_code == 200
+
+        assert len(consultas) == 0
+
+    def test_cambio_de_rol(self, cajero):
+        """Test: Cambiar el rol del empleado se ve en el próximo request"""
+        assert vista_reportes(_request(cajero)).status_code == 302
+
+        gerente, _ = TipoRolGeneral.objects.get_or_create(nombre_rol=ROL_GERENTE)
+        empleado = Empleado.objects.get(usuario='cgomez')
+        empleado.id_rol = gerente
+        empleado.save()
+
+        assert vista_reportes(_request(cajero)).status_code == 200
+
+    def test_renombrar_rol(self, cajero):
+        """Test: Renombrar un TipoRolGeneral invalida los roles cacheados"""
+        assert obtener_rol_empleado(_request(cajero).user) == ROL_CAJERO
+
+        rol = TipoRolGeneral.objects.get(nombre_rol=ROL_CAJERO)
+        rol.nombre_rol = 'ADMINISTRADOR'
+        rol.save()
+
+        assert IsAdministrador().has_permission(_request(cajero), None)
+
+    def test_empleado_inactivo(self, cajero):
+        """Test: Un empleado dado de baja pierde el acceso, también en la API"""
+        Empleado.objects.filter(usuario='cgomez').update(activo=False)
+        CacheRoles.invalidar()
+
+        request = _request(cajero)
+        assert vista_caja(request).status_code == 302
+        assert not IsCajero().has_permission(request, None)
+
+    def test_no_empleado(self, db):
+        """Test: Un usuario sin Empleado no tiene rol, y eso también se cachea"""
+        usuario = User.objects.create_user(username='visitante')
+        assert obtener_rol_empleado(_request(usuario).user) is None
+
+        with CaptureQueriesContext(connection) as consultas:
+            assert obtener_rol_empleado(_request(usuario).user) is None
+        assert len(consultas) == 1  # sólo la carga del usuario en _request
+
+    @pytest.mark.slow
+    def test_benchmark_resolucion_rol(self, cajero):
+        """Benchmark: 500 requests con decorador + context processor + permiso de API"""
+        print("\n📊 BENCHMARK: Resolución de rol en 500 requests")
+        requests = [_request(cajero) for _ in range(1000)]
+
+        def atender(request):
+            vista_caja(request)
+            rol_usuario(request)
+            IsCajero().has_permission(request, None)
+
+        inicio = time.perf_counter()
+        with CaptureQueriesContext(connection) as sin_cache:
+            for request in requests[:500]:
+                # Antes: una consulta por decorador, context processor y permiso
+                for _ in range(3):
+                    CacheRoles.limpiar_local()
+                    request.user.__dict__.pop(CacheRoles.ATRIBUTO_USUARIO, None)
+                    obtener_rol_empleado(request.user)
+        antes = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        with CaptureQueriesContext(connection) as con_cache:
+            for request in requests[500:]:
+                atender(request)
+        despues = time.perf_counter() - inicio
+
+        print(f"   Sin cache: {antes * 1000:.0f} ms, {len(sin_cache)} consultas")
+        print(f"   Con cache: {despues * 1000:.0f} ms, {len(con_cache)} consultas")
+        assert len(con_cache) <= 1
+        assert despues < antes
@@ -0,0 +1,183 @@
+"""
+Tests del catálogo de productos seguros por firma de restricciones (catalogo_seguro)
+Incluye benchmark de sugerir_productos_seguros
+"""
+
+import json
+import time
+from decimal import Decimal
+
+import pytest
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from gestion.alertas_stock import MotorAlertasStock
+from gestion.catalogo_seguro import CatalogoSeguro
+from gestion.models import Hijo, PreciosPorLista, Producto, RestriccionesHijos, StockUnico
+from gestion.pos_sugerencias_api import obtener_detalles_restriccion, sugerir_productos_seguros
+
+DESCRIPCIONES = ['Agua mineral', 'Alfajor de dulce de leche', 'Jugo de naranja', 'Pan con queso y manteca', 'Yogur con leche']
+
+
+@pytest.fixture
+def catalogo(categoria, unidad_medida, impuesto, lista_precios):
+    """Productos con stock y precio en la lista por defecto"""
+    Producto.objects.bulk_create([
+        Producto(
+            codigo_barra=f'S{i:03d}', descripcion=descripcion, id_categoria=categoria,
+            id_unidad_medida=unidad_medida, id_impuesto=impuesto, stock_minimo=2, activo=True
+        )
+        for i, descripcion in enumerate(DESCRIPCIONES)
+    ])
+    productos = {p.descripcion: p for p in Producto.objects.filter(codigo_barra__startswith='S')}
+    StockUnico.objects.bulk_create([StockUnico(id_producto=p, cantidad=Decimal('10')) for p in productos.values()])
+    PreciosPorLista.objects.bulk_create([
+        PreciosPorLista(id_producto=p, id_lista_precios=lista_precios, precio_venta=Decimal(1000 * (i + 1)),
+                        fecha_vigencia='2026-01-01T00:00:00Z')
+        for i, p in enumerate(productos.values())
+    ])
+    return productos
+
+
+def _post(vista, datos):
+    request = RequestFactory().post('/', data=json.dumps(datos), content_type='application/json')
+    return json.loads(vista(request).content)
+
+
+def _restriccion(hijo, tipo, observaciones=None):
+    return RestriccionesHijos.objects.create(id_hijo=hijo, tipo_restriccion=tipo, observaciones=observaciones)
+
+
+@pytest.mark.django_db
+class TestCatalogoSeguro:
+    """Tests de firma, recomendaciones e invalidación"""
+
+    def test_firma_compartida(self, hijo, cliente):
+        """Test: La firma depende del tipo y del puntaje de las observaciones, no del hijo ni del texto"""
+        hermano = Hijo.objects.create(id_cliente_responsable=cliente, nombre='Luis', apellido='Pérez', activo=True)
+        a = [_restriccion(hijo, 'Celíaco', 'sin harina'), _restriccion(hijo, 'Diabetes')]
+        b = [_restriccion(hermano, 'Diabetes'), _restriccion(hermano, 'Celíaco', 'nada de trigo')]
+
+        assert CatalogoSeguro.firma(a) == CatalogoSeguro.firma(b)
+        assert CatalogoSeguro.firma(a) != CatalogoSeguro.firma(a[:1])
+        assert CatalogoSeguro.firma([_restriccion(hijo, 'Celíaco')]) != CatalogoSeguro.firma(a[:1])
+
+    def test_recomendaciones(self, hijo, catalogo):
+        """Test: Sólo productos seguros, con precio y stock, en orden de descripción"""
+        _restriccion(hijo, 'Intolerancia a la lactosa')
+
+        respuesta = _post(sugerir_productos_seguros, {'id_hijo': hijo.id_hijo, 'limite': 10})
+
+        assert respuesta['success'] and respuesta['tiene_restricciones']
+        assert [(p['descripcion'], p['precio_venta'], p['stock_actual']) for p in respuesta['productos']] == [
+            ('Agua mineral', 1000, 10.0), ('Jugo de naranja', 3000, 10.0),
+        ]
+
+    def test_sirve_desde_el_catalogo(self, hijo, catalogo):
+        """Test: Con el catálogo cargado una recomendación no analiza productos ni consulta precios"""
+        restricciones = [_restriccion(hijo, 'Diabetes')]
+        CatalogoSeguro.recomendar(restricciones, limite=3)
+
+        with CaptureQueriesContext(connection) as consultas:
+            recomendados = CatalogoSeguro.recomendar(restricciones, limite=3)
+
+        assert len(consultas) == 1 and 'stock_unico' in consultas.captured_queries[0]['sql']
+        assert [p['descripcion'] for p in recomendados] == ['Agua mineral', 'Pan con queso y manteca', 'Yogur con leche']
+
+    def test_agotado_y_repuesto(self, hijo, catalogo, django_capture_on_commit_callbacks):
+        """Test: Un producto que se agota sale de las recomendaciones y vuelve al reponerse"""
+        agua = catalogo['Agua mineral']
+        assert CatalogoSeguro.recomendar([], limite=1)[0]['descripcion'] == 'Agua mineral'
+
+        with django_capture_on_commit_callbacks(execute=True):
+            StockUnico.objects.filter(id_producto=agua).update(cantidad=0)
+            MotorAlertasStock.marcar([agua.id_producto])
+        assert CatalogoSeguro.recomendar([], limite=1)[0]['descripcion'] == 'Alfajor de dulce de leche'
+        assert CatalogoSeguro.recomendar([], limite=1, solo_stock=False)[0]['descripcion'] == 'Agua mineral'
+
+        with django_capture_on_commit_callbacks(execute=True):
+            StockUnico.objects.filter(id_producto=agua).update(cantidad=5)
+            MotorAlertasStock.marcar([agua.id_producto])
+        assert CatalogoSeguro.recomendar([], limite=1)[0]['descripcion'] == 'Agua mineral'
+
+    def test_producto_nuevo_con_stock(self, hijo, catalogo, categoria, unidad_medida, impuesto,
+                                      django_capture_on_commit_callbacks):
+        """Test: Un producto que recibe su primer stock entra en las recomendaciones"""
+        assert len(CatalogoSeguro.recomendar([], 10)) == len(DESCRIPCIONES)
+        nuevo = Producto.objects.create(
+            codigo_barra='S999', descripcion='Zanahoria rallada', id_categoria=categoria,
+            id_unidad_medida=unidad_medida, id_impuesto=impuesto, stock_minimo=2, activo=True
+        )
+
+        with django_capture_on_commit_callbacks(execute=True):
+            StockUnico.objects.create(id_producto=nuevo, cantidad=Decimal('10'))
+
+        assert CatalogoSeguro.recomendar([], 10)[-1]['descripcion'] == 'Zanahoria rallada'
+
+    def test_repuesto_sin_estado_de_alerta(self, hijo, catalogo, django_capture_on_commit_callbacks):
+        """Test: Sin EstadoAlertaStock la disponibilidad anterior sale del conjunto cacheado"""
+        agua = catalogo['Agua mineral']
+        StockUnico.objects.filter(id_producto=agua).update(cantidad=0)
+        assert CatalogoSeguro.recomendar([], limite=1)[0]['descripcion'] == 'Alfajor de dulce de leche'
+
+        with django_capture_on_commit_callbacks(execute=True):
+            StockUnico.objects.filter(id_producto=agua).update(cantidad=10)
+            MotorAlertasStock.marcar([agua.id_producto])
+
+        assert CatalogoSeguro.recomendar([], limite=1)[0]['descripcion'] == 'Agua mineral'
+
+    def test_producto_modificado(self, hijo, catalogo, django_capture_on_commit_callbacks):
+        """Test: Renombrar un producto invalida los catálogos"""
+        restricciones = [_restriccion(hijo, 'Intolerancia a la lactosa')]
+        assert len(CatalogoSeguro.productos(restricciones)) == 2
+
+        with django_capture_on_commit_callbacks(execute=True):
+            jugo = catalogo['Jugo de naranja']
+            jugo.descripcion = 'Jugo de naranja con leche y crema'
+            jugo.save()
+
+        assert [d for _, d in CatalogoSeguro.productos(restricciones)] == ['Agua mineral']
+
+    def test_detalles_restriccion(self, hijo, catalogo):
+        """Test: productos_con_alerta cuenta los productos activos en conflicto"""
+        _restriccion(hijo, 'Intolerancia a la lactosa')
+
+        respuesta = _post(obtener_detalles_restriccion, {
+            'id_hijo': hijo.id_hijo, 'tipo_restriccion': 'Intolerancia a la lactosa'
+        })
+
+        assert respuesta['restriccion']['productos_con_alerta'] == 3
+
+    @pytest.mark.slow
+    def test_benchmark_sugerencias(self, hijo, categoria, unidad_medida, impuesto, lista_precios):
+        """Benchmark: 2.000 productos, 10 recomendaciones armando el catálogo vs. con el catálogo cargado"""
+        print("\n📊 BENCHMARK: sugerir_productos_seguros (2.000 productos, 2 restricciones)")
+        Producto.objects.bulk_create([
+            Producto(
+                codigo_barra=f'B{i:05d}', descripcion=f'{DESCRIPCIONES[i % len(DESCRIPCIONES)]} {i:05d}',
+                id_categoria=categoria, id_unidad_medida=unidad_medida, id_impuesto=impuesto, activo=True
+            )
+            for i in range(2000)
+        ])
+        StockUnico.objects.bulk_create([
+            StockUnico(id_producto_id=id_producto, cantidad=Decimal(id_producto % 3))
+            for id_producto in Producto.objects.values_list('id_producto', flat=True)
+        ])
+        _restriccion(hijo, 'Intolerancia a la lactosa')
+        _restriccion(hijo, 'Celíaco', 'sin harina')
+        datos = {'id_hijo': hijo.id_hijo, 'limite': 10}
+
+        inicio = time.perf_counter()
+        primera = _post(sugerir_productos_seguros, datos)
+        fria = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        for _ in range(50):
+            respuesta = _post(sugerir_productos_seguros, datos)
+        caliente = (time.perf_counter() - inicio) / 50
+
+        print(f"   Primera llamada (arma el catálogo): {fria * 1000:.1f} ms")
+        print(f"   Llamadas siguientes:                 {caliente * 1000:.2f} ms")
+        assert respuesta == primera and len(respuesta['productos']) == 10
+        assert caliente < fria
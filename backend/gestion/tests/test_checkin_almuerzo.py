@@ -0,0 +1,157 @@
+"""
+Tests del registro rápido de almuerzos en el POS (checkin_almuerzo.RegistradorAlmuerzos)
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from gestion.checkin_almuerzo import (
+    AlmuerzoDuplicadoError, RegistradorAlmuerzos, TipoAlmuerzoNoConfiguradoError
+)
+from gestion.models import CuentaAlmuerzoMensual, Hijo, RegistroConsumoAlmuerzo, Tarjeta, TipoAlmuerzo
+
+
+@pytest.fixture
+def tipo_almuerzo():
+    return TipoAlmuerzo.objects.create(nombre='Menú del día', precio_unitario=Decimal('15000'))
+
+
+@pytest.fixture
+def otra_tarjeta(cliente):
+    hijo = Hijo.objects.create(id_cliente_responsable=cliente, nombre='Luis', apellido='Pérez')
+    return Tarjeta.objects.create(nro_tarjeta='00099999', id_hijo=hijo, estado='Activa')
+
+
+def escrituras(consultas):
+    return [q['sql'] for q in consultas.captured_queries if q['sql'].startswith(('INSERT', 'UPDATE'))]
+
+
+@pytest.mark.django_db
+class TestRegistradorAlmuerzos:
+    """Tests de duplicados, cuenta mensual y cantidad de escrituras"""
+
+    def test_registra_y_crea_cuenta(self, tarjeta, tipo_almuerzo, django_capture_on_commit_callbacks):
+        """Test: Primer almuerzo del mes crea la cuenta a crédito con ese almuerzo"""
+        with django_capture_on_commit_callbacks(execute=True):
+            resultado = RegistradorAlmuerzos.registrar(tarjeta)
+
+        assert resultado['cuenta_creada']
+        registro = resultado['registro']
+        assert registro.fecha_consumo == timezone.localdate()
+        assert registro.marcado_en_cuenta and registro.costo_almuerzo == Decimal('15000')
+        cuenta = CuentaAlmuerzoMensual.objects.get(pk=resultado['id_cuenta'])
+        assert (cuenta.cantidad_almuerzos, cuenta.monto_total) == (1, Decimal('15000'))
+        assert cuenta.forma_cobro == 'CREDITO_MENSUAL'
+
+    def test_duplicado_sin_consultar(self, tarjeta, tipo_almuerzo, django_capture_on_commit_callbacks):
+        """Test: La segunda pasada del día se rechaza desde memoria"""
+        with django_capture_on_commit_callbacks(execute=True):
+            RegistradorAlmuerzos.registrar(tarjeta)
+
+        with CaptureQueriesContext(connection) as consultas:
+            with pytest.raises(AlmuerzoDuplicadoError):
+                RegistradorAlmuerzos.registrar(tarjeta)
+
+        assert len(consultas) == 0
+        assert RegistroConsumoAlmuerzo.objects.count() == 1
+
+    def test_duplicado_de_otro_proceso(self, tarjeta, tipo_almuerzo, django_capture_on_commit_callbacks):
+        """Test: Un registro que la memoria no conoce lo frena la restricción única"""
+        RegistradorAlmuerzos.servidos(timezone.localdate())
+        RegistroConsumoAlmuerzo.objects.create(id_hijo=tarjeta.id_hijo, costo_almuerzo=Decimal('15000'))
+
+        with pytest.raises(AlmuerzoDuplicadoError):
+            RegistradorAlmuerzos.registrar(tarjeta)
+
+        assert RegistroConsumoAlmuerzo.objects.count() == 1
+        assert not CuentaAlmuerzoMensual.objects.exists()
+        assert RegistradorAlmuerzos.ya_almorzo(tarjeta.id_hijo_id, timezone.localdate())
+
+    def test_otro_integrity_error_se_propaga(self, tarjeta, tipo_almuerzo, monkeypatch):
+        """Test: Un IntegrityError que no es de uk_consumo_dia no se informa como duplicado"""
+        def fallar(*args):
+            raise IntegrityError('FOREIGN KEY constraint failed')
+        monkeypatch.setattr(RegistradorAlmuerzos, '_sumar_a_cuenta', staticmethod(fallar))
+
+        with pytest.raises(IntegrityError):
+            RegistradorAlmuerzos.registrar(tarjeta)
+
+        assert not RegistroConsumoAlmuerzo.objects.exists()
+        assert not RegistradorAlmuerzos.ya_almorzo(tarjeta.id_hijo_id, timezone.localdate())
+
+    def test_descarta_dias_y_meses_anteriores(self, db):
+        """Test: Cargar un día o un mes nuevo libera los anteriores"""
+        hoy = timezone.localdate()
+        ayer = hoy - timedelta(days=1)
+        RegistradorAlmuerzos.servidos(ayer)
+        RegistradorAlmuerzos.cuentas(hoy.year - 1, 12)
+        RegistradorAlmuerzos.servidos(hoy)
+        RegistradorAlmuerzos.cuentas(hoy.year, hoy.month)
+
+        assert set(RegistradorAlmuerzos._almacen._datos) == {('servidos', hoy), ('cuentas', hoy.year, hoy.month)}
+
+    def test_pasada_en_caliente_dos_escrituras(
+        self, tarjeta, otra_tarjeta, tipo_almuerzo, django_capture_on_commit_callbacks
+    ):
+        """Test: Con la cuenta del mes conocida, una pasada es un INSERT y un UPDATE"""
+        hoy = timezone.localdate()
+        CuentaAlmuerzoMensual.objects.create(
+            id_hijo=otra_tarjeta.id_hijo, anio=hoy.year, mes=hoy.month,
+            forma_cobro='CREDITO_MENSUAL', cantidad_almuerzos=4, monto_total=Decimal('60000'),
+            fecha_generacion=hoy,
+        )
+        with django_capture_on_commit_callbacks(execute=True):
+            RegistradorAlmuerzos.registrar(tarjeta)
+
+        with CaptureQueriesContext(connection) as consultas:
+            resultado = RegistradorAlmuerzos.registrar(otra_tarjeta)
+
+        assert not resultado['cuenta_creada']
+        assert len(escrituras(consultas)) == 2
+        assert len(consultas) == 2 + 2  # + SAVEPOINT / RELEASE
+        cuenta = CuentaAlmuerzoMensual.objects.get(id_hijo=otra_tarjeta.id_hijo)
+        assert (cuenta.cantidad_almuerzos, cuenta.monto_total) == (5, Decimal('75000'))
+
+    def test_anular_descuenta_y_libera(self, tarjeta, tipo_almuerzo, django_capture_on_commit_callbacks):
+        """Test: Anular resta el almuerzo de la cuenta y permite volver a registrarlo"""
+        with django_capture_on_commit_callbacks(execute=True):
+            resultado = RegistradorAlmuerzos.registrar(tarjeta)
+        with django_capture_on_commit_callbacks(execute=True):
+            RegistradorAlmuerzos.anular(resultado['registro'])
+
+        cuenta = CuentaAlmuerzoMensual.objects.get(pk=resultado['id_cuenta'])
+        assert (cuenta.cantidad_almuerzos, cuenta.monto_total) == (0, Decimal('0'))
+
+        with django_capture_on_commit_callbacks(execute=True):
+            RegistradorAlmuerzos.registrar(tarjeta)
+        assert CuentaAlmuerzoMensual.objects.get(pk=resultado['id_cuenta']).cantidad_almuerzos == 1
+
+    def test_api_no_marca_en_cuenta(self, tarjeta, tipo_almuerzo):
+        """Test: Sin marcar en cuenta es una sola escritura y no crea cuenta"""
+        RegistradorAlmuerzos.servidos(timezone.localdate())
+        RegistradorAlmuerzos.tipo_default()
+
+        with CaptureQueriesContext(connection) as consultas:
+            resultado = RegistradorAlmuerzos.registrar(tarjeta, marcar_en_cuenta=False)
+
+        assert len(escrituras(consultas)) == 1
+        assert resultado['id_cuenta'] is None
+        assert not resultado['registro'].marcado_en_cuenta
+        assert not CuentaAlmuerzoMensual.objects.exists()
+
+    def test_tipo_predeterminado(self, tarjeta, django_capture_on_commit_callbacks):
+        """Test: Sin tipo activo falla; al crear uno se invalida el cache"""
+        TipoAlmuerzo.objects.create(nombre='Inactivo', precio_unitario=Decimal('1'), activo=False)
+        with pytest.raises(TipoAlmuerzoNoConfiguradoError):
+            RegistradorAlmuerzos.registrar(tarjeta)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            TipoAlmuerzo.objects.create(nombre='Menú', precio_unitario=Decimal('12000'))
+
+        resultado = RegistradorAlmuerzos.registrar(tarjeta)
+        assert resultado['tipo_almuerzo'].nombre == 'Menú'
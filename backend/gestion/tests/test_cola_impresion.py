@@ -0,0 +1,124 @@
+"""
+Tests de la cola de impresión de tickets (impresora_manager.ColaImpresion)
+"""
+
+import pytest
+from datetime import datetime
+from django.utils import timezone
+
+from gestion.models import TrabajoImpresion
+from gestion import impresora_manager
+from gestion.impresora_manager import ColaImpresion, WorkerImpresion
+
+
+class ImpresoraFalsa:
+    """Impresora de prueba: registra los tickets o falla a pedido"""
+
+    def __init__(self, falla=False):
+        self.falla = falla
+        self.tickets = []
+
+    def imprimir_ticket(self, ticket):
+        if self.falla:
+            return False
+        self.tickets.append(ticket)
+        return True
+
+    def obtener_estado(self):
+        return {'conectada': not self.falla}
+
+
+def _ticket(numero=1):
+    return {
+        'numero': numero,
+        'fecha': timezone.now(),
+        'cliente': 'CLIENTE GENERICO',
+        'detalles': [{'producto': 'Agua', 'cantidad': 1, 'precio': 5000, 'subtotal': 5000}],
+        'total': 5000,
+    }
+
+
+@pytest.mark.django_db
+class TestColaImpresion:
+    """Tests del spool persistente por terminal"""
+
+    def test_encolar_serializa_fecha(self):
+        """Test: El ticket encolado es JSON (fecha en ISO)"""
+        trabajo = ColaImpresion.encolar_ticket(_ticket(), venta_id=10, terminal='POS-01')
+
+        assert trabajo.estado == 'PENDIENTE'
+        assert isinstance(trabajo.payload['fecha'], str)
+
+    def test_procesar_imprime_en_orden(self):
+        """Test: El worker imprime los tickets de la terminal en orden de llegada"""
+        ColaImpresion.encolar_ticket(_ticket(1), venta_id=1, terminal='POS-01')
+        ColaImpresion.encolar_ticket(_ticket(2), venta_id=2, terminal='POS-01')
+        ColaImpresion.encolar_ticket(_ticket(3), venta_id=3, terminal='POS-02')
+        impresora = ImpresoraFalsa()
+
+        resultado = ColaImpresion.procesar_pendientes('POS-01', impresora=impresora)
+
+        assert resultado['impresos'] == 2
+        assert [t['numero'] for t in impresora.tickets] == [1, 2]
+        assert isinstance(impresora.tickets[0]['fecha'], datetime)
+        assert TrabajoImpresion.objects.filter(terminal='POS-02', estado='PENDIENTE').count() == 1
+
+    def test_falla_programa_reintento(self):
+        """Test: Si la impresora no responde el trabajo se reprograma con backoff"""
+        trabajo = ColaImpresion.encolar_ticket(_ticket(), venta_id=1, terminal='POS-01')
+
+        resultado = ColaImpresion.procesar_pendientes('POS-01', impresora=ImpresoraFalsa(falla=True))
+
+        trabajo.refresh_from_db()
+        assert resultado['reintentos'] == 1
+        assert trabajo.estado == 'PENDIENTE'
+        assert trabajo.intentos == 1
+        assert trabajo.fecha_proximo_intento > timezone.now()
+
+    def test_agotar_intentos_y_reintentar(self):
+        """Test: Al agotar intentos queda en ERROR y el endpoint de reintento lo reencola"""
+        trabajo = ColaImpresion.encolar_ticket(_ticket(), venta_id=1, terminal='POS-01')
+        TrabajoImpresion.objects.filter(pk=trabajo.pk).update(intentos=4)
+
+        ColaImpresion.procesar_pendientes('POS-01', impresora=ImpresoraFalsa(falla=True))
+        trabajo.refresh_from_db()
+        assert trabajo.estado == 'ERROR'
+
+        assert ColaImpresion.reintentar(trabajo.pk) is True
+        impresora = ImpresoraFalsa()
+        ColaImpresion.procesar_pendientes('POS-01', impresora=impresora)
+        trabajo.refresh_from_db()
+        assert trabajo.estado == 'IMPRESO'
+        assert len(impresora.tickets) == 1
+
+    def test_reimprimir_venta(self):
+        """Test: La reimpresión copia el último ticket de la venta"""
+        ColaImpresion.encolar_ticket(_ticket(7), venta_id=7, terminal='POS-01')
+
+        copia = ColaImpresion.reimprimir_venta(7)
+
+        assert copia.tipo == 'REIMPRESION'
+        assert copia.payload['numero'] == 7
+        assert ColaImpresion.reimprimir_venta(999) is None
+
+
+class _Detener(Exception):
+    pass
+
+
+def test_worker_drena_al_arrancar(monkeypatch):
+    """Test: El worker procesa la cola al arrancar, sin esperar un aviso"""
+    llamadas = []
+    monkeypatch.setattr(impresora_manager, 'close_old_connections', lambda: None)
+    monkeypatch.setattr(ColaImpresion, 'procesar_pendientes', lambda terminal: llamadas.append(terminal))
+    worker = WorkerImpresion('POS-01')
+
+    def esperar(timeout):
+        llamadas.append('espera')
+        raise _Detener
+
+    monkeypatch.setattr(worker.evento, 'wait', esperar)
+    with pytest.raises(_Detener):
+        worker.run()
+
+    assert llamadas == ['POS-01', 'espera']
@@ -0,0 +1,123 @@
+"""
+Tests de la facturación mensual de almuerzos (facturacion_almuerzos.FacturadorAlmuerzos)
+"""
+
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from gestion.facturacion_almuerzos import FacturadorAlmuerzos, FacturacionConcurrenteError
+from gestion.models import CuentaAlmuerzoMensual, Hijo, RegistroConsumoAlmuerzo
+
+
+@pytest.fixture
+def consumos(cliente):
+    """Crea `dias` consumos de un hijo en días seguidos del mes indicado (uno por día)"""
+    def crear(nombre, dias, costo=Decimal('15000'), anio=2026, mes=3, desde=1):
+        hijo = Hijo.objects.filter(nombre=nombre).first() or Hijo.objects.create(
+            id_cliente_responsable=cliente, nombre=nombre, apellido='Test'
+        )
+        for dia in range(desde, desde + dias):
+            # fecha_consumo es auto_now_add: se mueve al día pedido con un update
+            registro = RegistroConsumoAlmuerzo.objects.create(id_hijo=hijo, costo_almuerzo=costo)
+            RegistroConsumoAlmuerzo.objects.filter(pk=registro.pk).update(fecha_consumo=date(anio, mes, dia))
+        return hijo
+    return crear
+
+
+@pytest.mark.django_db
+class TestFacturadorAlmuerzos:
+    """Tests de agregado, upsert y marcado"""
+
+    def test_factura_y_marca_solo_lo_facturado(self, consumos):
+        """Test: Crea una cuenta por hijo y marca sólo los consumos del mes con costo"""
+        ana = consumos('Ana', 10)
+        luis = consumos('Luis', 4)
+        consumos('Ana', 1, costo=None, desde=11)
+        consumos('Luis', 2, mes=4)
+
+        resultado = FacturadorAlmuerzos.facturar(2026, 3)
+
+        assert resultado == {'cuentas_creadas': 2, 'cuentas_actualizadas': 0, 'consumos_facturados': 14}
+        cuenta = CuentaAlmuerzoMensual.objects.get(id_hijo=ana, anio=2026, mes=3)
+        assert (cuenta.cantidad_almuerzos, cuenta.monto_total) == (10, Decimal('150000'))
+        assert CuentaAlmuerzoMensual.objects.get(id_hijo=luis).estado == 'PENDIENTE'
+        sin_marcar = RegistroConsumoAlmuerzo.objects.filter(marcado_en_cuenta=False)
+        assert sin_marcar.count() == 3
+
+    def test_segunda_pasada_acumula(self, consumos):
+        """Test: Consumos nuevos se suman a la cuenta y el estado refleja lo pagado"""
+        ana = consumos('Ana', 10)
+        FacturadorAlmuerzos.facturar(2026, 3)
+        CuentaAlmuerzoMensual.objects.filter(id_hijo=ana).update(monto_pagado=Decimal('150000'), estado='PAGADO')
+        consumos('Ana', 2, desde=20)
+
+        resultado = FacturadorAlmuerzos.facturar(2026, 3, 'CONTADO_ANTICIPADO')
+
+        assert resultado == {'cuentas_creadas': 0, 'cuentas_actualizadas': 1, 'consumos_facturados': 2}
+        cuenta = CuentaAlmuerzoMensual.objects.get(id_hijo=ana)
+        assert (cuenta.cantidad_almuerzos, cuenta.monto_total) == (12, Decimal('180000'))
+        assert cuenta.estado == 'PARCIAL'
+        assert cuenta.forma_cobro == 'CONTADO_ANTICIPADO'
+
+    def test_cambio_concurrente_revierte(self, consumos, monkeypatch):
+        """Test: Si otro proceso marca consumos en el medio, no queda nada facturado"""
+        consumos('Ana', 5)
+        upsert = FacturadorAlmuerzos._upsert_orm
+
+        def con_otro_proceso(*args):
+            creadas = upsert(*args)
+            RegistroConsumoAlmuerzo.objects.filter(pk=RegistroConsumoAlmuerzo.objects.first().pk).update(
+                marcado_en_cuenta=True
+            )
+            return creadas
+        monkeypatch.setattr(FacturadorAlmuerzos, '_upsert_orm', staticmethod(con_otro_proceso))
+
+        with pytest.raises(FacturacionConcurrenteError):
+            FacturadorAlmuerzos.facturar(2026, 3)
+
+        assert not CuentaAlmuerzoMensual.objects.exists()
+        assert not RegistroConsumoAlmuerzo.objects.filter(marcado_en_cuenta=True).exists()
+
+    def test_consultas_no_dependen_de_los_hijos(self, consumos):
+        """Test: La cantidad de consultas es la misma con 2 o 30 hijos"""
+        def consultas_para(hijos, mes):
+            for i in range(hijos):
+                consumos(f'H{mes}-{i}', 2, mes=mes)
+            with CaptureQueriesContext(connection) as consultas:
+                FacturadorAlmuerzos.facturar(2026, mes)
+            return len(consultas)
+
+        assert consultas_para(2, 5) == consultas_para(30, 6)
+
+
+@pytest.mark.django_db
+class TestComandoFacturarAlmuerzos:
+    """Tests del comando facturar_almuerzos"""
+
+    def test_dry_run_no_escribe(self, consumos):
+        """Test: --dry-run muestra la vista previa sin crear cuentas ni marcar consumos"""
+        consumos('Ana', 3)
+        salida = StringIO()
+
+        call_command('facturar_almuerzos', anio=2026, mes=3, dry_run=True, stdout=salida)
+
+        assert 'Cuentas nuevas: 1' in salida.getvalue()
+        assert 'Almuerzos: 3' in salida.getvalue()
+        assert not CuentaAlmuerzoMensual.objects.exists()
+        assert not RegistroConsumoAlmuerzo.objects.filter(marcado_en_cuenta=True).exists()
+
+    def test_factura(self, consumos):
+        """Test: Sin --dry-run genera las cuentas"""
+        consumos('Ana', 3)
+        salida = StringIO()
+
+        call_command('facturar_almuerzos', anio=2026, mes=3, stdout=salida)
+
+        assert '1 cuentas nuevas' in salida.getvalue()
+        assert CuentaAlmuerzoMensual.objects.get().cantidad_almuerzos == 3
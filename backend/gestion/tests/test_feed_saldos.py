@@ -0,0 +1,222 @@
+"""
+Tests del feed incremental de saldos (feed_saldos.FeedSaldos, dashboard_saldos_views)
+Incluye benchmark de la consulta del tablero
+"""
+
+import json
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.db import connection
+from django.http import Http404
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from gestion import dashboard_saldos_views
+from gestion.dashboard_saldos_views import api_saldos_tiempo_real, datos_saldos, stream_saldos_tiempo_real
+from gestion.feed_saldos import FeedSaldos
+from gestion.models import CambioSaldoTarjeta, CargasSaldo, ConsumoTarjeta, Empleado, Hijo, Tarjeta, TipoRolGeneral
+from gestion.permisos import ROL_CAJERO
+
+
+@pytest.fixture
+def tarjetas(cliente, django_capture_on_commit_callbacks):
+    """Tres tarjetas activas: una negativa, una con saldo bajo y una con saldo OK"""
+    saldos = {'T001': Decimal('-5000'), 'T002': Decimal('8000'), 'T003': Decimal('60000')}
+    creadas = {}
+    with django_capture_on_commit_callbacks(execute=True):
+        for nro, saldo in saldos.items():
+            hijo = Hijo.objects.create(
+                id_cliente_responsable=cliente, nombre=f'Hijo {nro}', apellido='Pérez', grado='3ro', activo=True
+            )
+            creadas[nro] = Tarjeta.objects.create(nro_tarjeta=nro, id_hijo=hijo, saldo_actual=saldo, estado='Activa')
+    return creadas
+
+
+@pytest.fixture
+def cajero(db):
+    rol, _ = TipoRolGeneral.objects.get_or_create(nombre_rol=ROL_CAJERO)
+    Empleado.objects.create(
+        id_rol=rol, nombre='Carla', apellido='Gómez', usuario='cgomez', contrasena_hash='x', activo=True
+    )
+    return User.objects.create_user(username='cgomez')
+
+
+def _request(usuario, **extra):
+    request = RequestFactory().get('/pos/saldos/tiempo-real/api/', **extra)
+    request.user = usuario
+    request.session = {}
+    request._messages = FallbackStorage(request)
+    return request
+
+
+def _mover_saldo(tarjeta, saldo, capturar):
+    """Como la venta: el saldo cambia y se registra el consumo, en una transacción"""
+    with capturar(execute=True):
+        anterior = tarjeta.saldo_actual
+        tarjeta.saldo_actual = saldo
+        tarjeta.save()
+        ConsumoTarjeta.objects.create(
+            nro_tarjeta=tarjeta, fecha_consumo=timezone.now(), monto_consumido=anterior - saldo,
+            saldo_anterior=anterior, saldo_posterior=saldo
+        )
+
+
+@pytest.mark.django_db
+class TestFeedSaldos:
+    """Tests de registro, foto, cambios, contadores y stream"""
+
+    def test_registra_al_confirmar(self, tarjetas, django_capture_on_commit_callbacks):
+        """Test: Saldo y consumo de la misma transacción dejan un solo cambio, con el nivel resultante"""
+        cursor = FeedSaldos.cursor_actual()
+        _mover_saldo(tarjetas['T003'], Decimal('9000'), django_capture_on_commit_callbacks)
+
+        cambio = CambioSaldoTarjeta.objects.get(id_cambio__gt=cursor)
+        assert (cambio.nro_tarjeta_id, cambio.saldo, cambio.nivel) == ('T003', Decimal('9000'), 'bajo')
+
+    def test_recarga_marca_la_tarjeta(self, tarjetas, django_capture_on_commit_callbacks):
+        """Test: Una recarga registra la tarjeta aunque el saldo lo mueva el trigger"""
+        cursor = FeedSaldos.cursor_actual()
+        with django_capture_on_commit_callbacks(execute=True):
+            CargasSaldo.objects.create(
+                nro_tarjeta=tarjetas['T001'], fecha_carga=timezone.now(), monto_cargado=Decimal('20000')
+            )
+
+        assert list(CambioSaldoTarjeta.objects.filter(id_cambio__gt=cursor).values_list('nro_tarjeta', 'nivel')) == [
+            ('T001', 'negativo')
+        ]
+
+    def test_foto_y_cambios(self, tarjetas, django_capture_on_commit_callbacks):
+        """Test: Sin cursor llega la foto completa; con cursor sólo lo que cambió"""
+        foto = datos_saldos()
+        assert foto['completo']
+        assert [t['nro_tarjeta'] for t in foto['tarjetas']] == ['T001', 'T002', 'T003']
+        assert foto['estadisticas'] == {'total': 3, 'negativos': 1, 'bajos': 1, 'ok': 1}
+
+        _mover_saldo(tarjetas['T003'], Decimal('-1000'), django_capture_on_commit_callbacks)
+        delta = datos_saldos(foto['cursor'])
+
+        assert not delta['completo'] and not delta['hay_mas']
+        assert [(c['nro_tarjeta'], c['saldo'], c['estado']) for c in delta['cambios']] == [('T003', -1000.0, 'negativo')]
+        assert delta['cambios'][0]['estudiante'] == 'Hijo T003 Pérez'
+        assert delta['estadisticas'] == {'total': 3, 'negativos': 2, 'bajos': 1, 'ok': 0}
+
+        assert datos_saldos(delta['cursor'])['cambios'] == []
+
+    def test_tarjeta_bloqueada(self, tarjetas, django_capture_on_commit_callbacks):
+        """Test: Una tarjeta que deja de estar activa sale del tablero y de los contadores"""
+        cursor = datos_saldos()['cursor']
+
+        with django_capture_on_commit_callbacks(execute=True):
+            tarjetas['T002'].estado = 'Bloqueada'
+            tarjetas['T002'].save()
+        delta = datos_saldos(cursor)
+
+        assert delta['cambios'] == [{'nro_tarjeta': 'T002', 'estado': 'inactiva'}]
+        assert delta['estadisticas'] == {'total': 2, 'negativos': 1, 'bajos': 0, 'ok': 1}
+
+    def test_cursor_purgado(self, tarjetas, django_capture_on_commit_callbacks):
+        """Test: Un cursor anterior a los cambios conservados recibe la foto completa"""
+        _mover_saldo(tarjetas['T001'], Decimal('1000'), django_capture_on_commit_callbacks)
+        cursor = datos_saldos()['cursor']
+        _mover_saldo(tarjetas['T002'], Decimal('2000'), django_capture_on_commit_callbacks)
+        FeedSaldos.purgar(ahora=timezone.now() + FeedSaldos.RETENCION + timedelta(minutes=1))
+        _mover_saldo(tarjetas['T003'], Decimal('3000'), django_capture_on_commit_callbacks)
+
+        assert datos_saldos(cursor)['completo']
+
+    def test_hueco_reciente_detiene_el_cursor(self):
+        """Test: El cursor no pasa un id faltante reciente, pero sí uno viejo"""
+        ahora = timezone.now()
+        recientes = [(11, ahora), (13, ahora)]
+        viejas = [(11, ahora - timedelta(minutes=1)), (13, ahora - timedelta(minutes=1))]
+
+        assert FeedSaldos._cursor_seguro(recientes, 10, ahora) == 11
+        assert FeedSaldos._cursor_seguro(viejas, 10, ahora) == 13
+
+    def test_consulta_por_cambios(self, tarjetas, cliente, django_capture_on_commit_callbacks):
+        """Test: Una consulta incremental no depende de la cantidad de tarjetas"""
+        with django_capture_on_commit_callbacks(execute=True):
+            for i in range(50):
+                hijo = Hijo.objects.create(id_cliente_responsable=cliente, nombre=f'H{i}', apellido='X', activo=True)
+                Tarjeta.objects.create(nro_tarjeta=f'X{i:03d}', id_hijo=hijo, saldo_actual=Decimal('50000'))
+        cursor = datos_saldos()['cursor']
+        _mover_saldo(tarjetas['T002'], Decimal('100'), django_capture_on_commit_callbacks)
+
+        with CaptureQueriesContext(connection) as consultas:
+            delta = datos_saldos(cursor)
+
+        assert len(delta['cambios']) == 1
+        assert len(consultas) <= 3
+        assert not any('FROM "tarjetas"' in q['sql'] for q in consultas.captured_queries)
+
+    def test_api(self, tarjetas, cajero):
+        """Test: La API recibe el cursor por ?desde= y descarta valores inválidos"""
+        completa = json.loads(api_saldos_tiempo_real(_request(cajero)).content)
+        delta = json.loads(api_saldos_tiempo_real(_request(cajero, data={'desde': completa['cursor']})).content)
+        invalido = json.loads(api_saldos_tiempo_real(_request(cajero, data={'desde': 'abc'})).content)
+
+        assert completa['success'] and completa['completo'] and len(completa['tarjetas']) == 3
+        assert delta['success'] and delta['cambios'] == []
+        assert invalido['completo']
+
+    def test_stream_deshabilitado(self, cajero, settings):
+        """Test: Sin workers async el stream no se sirve"""
+        settings.SALDOS_STREAM_HABILITADO = False
+
+        with pytest.raises(Http404):
+            stream_saldos_tiempo_real(_request(cajero))
+
+    def test_stream(self, tarjetas, cajero, settings, monkeypatch, django_capture_on_commit_callbacks):
+        """Test: El stream sigue desde Last-Event-ID y cierra al cumplir su duración"""
+        settings.SALDOS_STREAM_HABILITADO = True
+        monkeypatch.setattr(dashboard_saldos_views, 'DURACION_STREAM', 0)
+        cursor = datos_saldos()['cursor']
+        _mover_saldo(tarjetas['T003'], Decimal('500'), django_capture_on_commit_callbacks)
+
+        respuesta = stream_saldos_tiempo_real(_request(cajero, HTTP_LAST_EVENT_ID=str(cursor)))
+        cuerpo = b''.join(respuesta.streaming_content).decode()
+
+        assert respuesta['Content-Type'] == 'text/event-stream'
+        evento = cuerpo.split('\n\n')[1].split('\n')
+        assert evento[0] == f'id: {FeedSaldos.cursor_actual()}' and evento[1] == 'event: saldos'
+        assert [c['nro_tarjeta'] for c in json.loads(evento[2][len('data: '):])['cambios']] == ['T003']
+
+    @pytest.mark.slow
+    def test_benchmark_consulta_tablero(self, cliente, django_capture_on_commit_callbacks):
+        """Benchmark: 3.000 tarjetas, foto completa vs. consulta incremental con 10 cambios"""
+        print("\n📊 BENCHMARK: Consulta del tablero de saldos (3.000 tarjetas)")
+        Hijo.objects.bulk_create([
+            Hijo(id_cliente_responsable=cliente, nombre=f'Hijo {i}', apellido='Bench', grado='1ro', activo=True)
+            for i in range(3000)
+        ])
+        Tarjeta.objects.bulk_create([
+            Tarjeta(nro_tarjeta=f'B{i:05d}', id_hijo_id=id_hijo, saldo_actual=Decimal((i % 7 - 1) * 5000))
+            for i, id_hijo in enumerate(Hijo.objects.filter(apellido='Bench').values_list('id_hijo', flat=True))
+        ])
+        cursor = datos_saldos()['cursor']
+
+        inicio = time.perf_counter()
+        for _ in range(10):
+            completa = datos_saldos()
+        foto = (time.perf_counter() - inicio) / 10
+
+        with django_capture_on_commit_callbacks(execute=True):
+            for tarjeta in Tarjeta.objects.order_by('nro_tarjeta')[:10]:
+                tarjeta.saldo_actual = Decimal('-100')
+                tarjeta.save()
+
+        inicio = time.perf_counter()
+        for _ in range(10):
+            delta = datos_saldos(cursor)
+        incremental = (time.perf_counter() - inicio) / 10
+
+        print(f"   Foto completa:       {foto * 1000:.1f} ms")
+        print(f"   Consulta incremental: {incremental * 1000:.1f} ms")
+        assert len(completa['tarjetas']) == 3000 and len(delta['cambios']) == 10
+        assert incremental < foto / 5
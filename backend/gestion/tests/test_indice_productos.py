@@ -0,0 +1,136 @@
+"""
+Tests del índice de búsqueda de productos del POS (indice_productos)
+Incluye benchmark de latencia de búsqueda
+"""
+
+import time
+import pytest
+from django.core.cache import cache
+
+from gestion.models import Producto
+from gestion.indice_productos import IndiceBusqueda, IndiceProductos, normalizar_texto
+
+
+FILAS = [
+    (1, 'Empanada de Carne', '7840001'),
+    (2, 'Empanada de Jamón y Queso', '7840002'),
+    (3, 'Jugo de Naranja', '7840003'),
+    (4, 'Café con Leche', None),
+    (5, 'Almuerzo por Kilo', '20001'),
+]
+
+
+class TestIndiceBusqueda:
+    """Tests del índice sin base de datos"""
+
+    def test_normalizar_quita_acentos(self):
+        """Test: El texto se normaliza a minúsculas sin acentos"""
+        assert normalizar_texto('  Jamón   y QUESO ') == 'jamon y queso'
+
+    def test_subcadena_sin_acentos(self):
+        """Test: Consultas de 3+ caracteres equivalen a icontains sin acentos"""
+        indice = IndiceBusqueda(FILAS)
+
+        assert indice.buscar('jamon') == [2]
+        assert indice.buscar('CAFÉ') == [4]
+        assert indice.buscar('mpanada') == [1, 2]
+        assert indice.buscar('naranja x') == []
+
+    def test_prefijo_consultas_cortas(self):
+        """Test: Consultas de 1-2 caracteres buscan por prefijo de palabra"""
+        indice = IndiceBusqueda(FILAS)
+
+        assert indice.buscar('em') == [1, 2]
+        assert indice.buscar('k') == [5]
+
+    def test_codigo_barras_exacto_primero(self):
+        """Test: Un código exacto aparece primero y se resuelve por hash"""
+        indice = IndiceBusqueda(FILAS + [(6, 'Agua 7840003 ml', None)])
+
+        assert indice.buscar('7840003') == [3, 6]
+        assert indice.por_codigo('7840002') == 2
+        assert indice.por_codigo('999') is None
+
+    def test_actualizacion_incremental(self):
+        """Test: Agregar y quitar productos actualiza todas las estructuras"""
+        indice = IndiceBusqueda(FILAS)
+
+        indice.agregar(1, 'Empanada de Pollo', '7840009')
+        indice.quitar(3)
+
+        assert indice.buscar('carne') == []
+        assert indice.buscar('pollo') == [1]
+        assert indice.por_codigo('7840001') is None
+        assert indice.por_codigo('7840009') == 1
+        assert indice.buscar('jugo') == []
+        assert indice.buscar('ju') == []
+
+    @pytest.mark.slow
+    def test_benchmark_busqueda(self):
+        """Benchmark: Búsquedas sub-milisegundo sobre 5000 productos"""
+        palabras = ['empanada', 'jugo', 'galleta', 'sandwich', 'agua', 'chipa',
+                    'alfajor', 'yogur', 'ensalada', 'pizza']
+        sabores = ['carne', 'pollo', 'jamon', 'queso', 'frutilla', 'naranja',
+                   'chocolate', 'vainilla', 'mixto', 'integral']
+        filas = [
+            (i, f'{palabras[i % 10].title()} de {sabores[(i // 10) % 10].title()} {i}', f'78{i:08d}')
+            for i in range(5000)
+        ]
+
+        inicio = time.perf_counter()
+        indice = IndiceBusqueda(filas)
+        construccion = (time.perf_counter() - inicio) * 1000
+
+        consultas = ['emp', 'empanada de pollo', 'jamo', 'ch', 'choco', '7800001234',
+                     'yogur de frutilla 45', 'xyz', 'a', 'integral 49']
+        repeticiones = 100
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            for consulta in consultas:
+                indice.buscar(consulta, limite=30)
+        promedio = (time.perf_counter() - inicio) * 1000 / (repeticiones * len(consultas))
+
+        print("\n📊 BENCHMARK: Índice de productos (5000 productos)")
+        print(f"   Construcción: {construccion:.1f} ms")
+        print(f"   Búsqueda promedio: {promedio:.3f} ms")
+
+        assert promedio < 1.0
+
+
+@pytest.mark.django_db
+class TestIndiceProductos:
+    """Tests del índice del proceso contra la base de datos"""
+
+    def test_busca_solo_activos_y_carga_en_orden(self, productos_con_stock, django_assert_num_queries):
+        """Test: Se indexan los productos activos y se cargan con una query"""
+        Producto.objects.filter(pk=productos_con_stock[1].pk).update(activo=False)
+
+        ids = IndiceProductos.buscar('producto test 1', limite=5)
+        assert productos_con_stock[1].pk not in ids
+
+        with django_assert_num_queries(1):
+            productos = IndiceProductos.cargar(ids, Producto.objects.select_related('stock'))
+        assert [p.pk for p in productos] == ids
+
+    def test_signal_actualiza_al_confirmar(self, productos_con_stock, django_capture_on_commit_callbacks):
+        """Test: Guardar un producto actualiza el índice sin reconstruirlo"""
+        IndiceProductos.buscar('x')
+        indice = IndiceProductos._indice
+        producto = productos_con_stock[0]
+        producto.descripcion = 'Chipá Guazú'
+
+        with django_capture_on_commit_callbacks(execute=True):
+            producto.save()
+
+        assert IndiceProductos.buscar('chipa') == [producto.pk]
+        assert IndiceProductos._indice is indice
+
+    def test_otro_proceso_fuerza_reconstruccion(self, productos_con_stock):
+        """Test: Un cambio de versión de otro proceso reconstruye el índice"""
+        IndiceProductos.buscar('x')
+        Producto.objects.filter(pk=productos_con_stock[0].pk).update(descripcion='Sopa Paraguaya')
+        assert IndiceProductos.buscar('sopa') == []
+
+        cache.incr(IndiceProductos.CLAVE_VERSION)
+
+        assert IndiceProductos.buscar('sopa') == [productos_con_stock[0].pk]
@@ -0,0 +1,91 @@
+"""
+Tests de la difusión de notificaciones en lote (notificaciones_difusion)
+"""
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from pos.models import Venta
+from gestion.models_notificaciones import NotificacionSistema, ConfiguracionNotificacionesSistema
+from gestion.notificaciones_difusion import DifusorNotificaciones, evento_notificacion
+
+User = get_user_model()
+
+
+def _crear_staff(cantidad, inicio=0):
+    return [
+        User.objects.create_user(username=f'staff{i}', is_staff=True)
+        for i in range(inicio, inicio + cantidad)
+    ]
+
+
+def _evento_venta(prioridad='baja'):
+    return evento_notificacion(
+        titulo='Nueva Venta Registrada',
+        mensaje='Se realizó una venta por ₲ 5.000',
+        tipo='venta',
+        prioridad=prioridad,
+        preferencia='notif_ventas',
+        respetar_solo_criticas=True,
+    )
+
+
+@pytest.mark.django_db
+class TestDifusorNotificaciones:
+    """Tests de la difusión en lote"""
+
+    def test_queries_constantes(self):
+        """Test: La difusión no hace queries por destinatario"""
+        _crear_staff(3)
+        with CaptureQueriesContext(connection) as pocos:
+            DifusorNotificaciones.difundir(_evento_venta())
+
+        _crear_staff(20, inicio=3)
+        with CaptureQueriesContext(connection) as muchos:
+            creadas = DifusorNotificaciones.difundir(_evento_venta())
+
+        assert creadas == 23
+        assert len(muchos.captured_queries) == len(pocos.captured_queries)
+        assert ConfiguracionNotificacionesSistema.objects.count() == 23
+
+    def test_respeta_preferencias(self):
+        """Test: Se omite a quien desactivó el tipo o sólo quiere críticas"""
+        sin_ventas, solo_criticas, normal = _crear_staff(3)
+        ConfiguracionNotificacionesSistema.objects.create(usuario=sin_ventas, notif_ventas=False)
+        ConfiguracionNotificacionesSistema.objects.create(usuario=solo_criticas, solo_criticas=True)
+
+        DifusorNotificaciones.difundir(_evento_venta(prioridad='baja'))
+        assert list(NotificacionSistema.objects.values_list('usuario', flat=True)) == [normal.pk]
+
+        DifusorNotificaciones.difundir(_evento_venta(prioridad='alta'))
+        assert NotificacionSistema.objects.filter(usuario=solo_criticas).count() == 1
+        assert NotificacionSistema.objects.filter(usuario=sin_ventas).count() == 0
+
+    def test_venta_difunde_despues_del_commit(self, cliente, empleado, tipo_pago,
+                                               django_capture_on_commit_callbacks):
+        """Test: Registrar una venta no escribe notificaciones dentro de la transacción"""
+        _crear_staff(5)
+
+        with django_capture_on_commit_callbacks(execute=False) as callbacks:
+            venta = Venta.objects.create(
+                id_cliente=cliente,
+                id_tipo_pago=tipo_pago,
+                id_empleado_cajero=empleado,
+                fecha=timezone.now(),
+                monto_total=150000,
+                estado_pago='PAGADA',
+                estado='PROCESADO',
+                tipo_venta='CONTADO',
+            )
+        assert NotificacionSistema.objects.count() == 0
+
+        for callback in callbacks:
+            callback()
+
+        notificaciones = NotificacionSistema.objects.filter(tipo='venta')
+        assert notificaciones.count() == 5
+        assert notificaciones.first().prioridad == 'media'
+        assert notificaciones.first().url == f'/pos/ventas/{venta.id_venta}/'
@@ -0,0 +1,108 @@
+"""
+Tests del asignador de numeración fiscal (numeracion_fiscal.AsignadorSecuencial)
+Incluye stress test de cajeros concurrentes sobre el mismo timbrado
+"""
+
+import threading
+import pytest
+from django.db import connection, transaction
+from django.utils import timezone
+
+from gestion.models import DocumentosTributarios, SecuenciaTimbrado
+from gestion.numeracion_fiscal import AsignadorSecuencial, TimbradoAgotadoError
+
+
+def _emitir(timbrado, monto=10000):
+    """Factura de una venta: reserva número y crea el documento en la misma transacción"""
+    with transaction.atomic():
+        nro = AsignadorSecuencial.siguiente(timbrado)
+        DocumentosTributarios.objects.create(
+            nro_timbrado=timbrado,
+            nro_secuencial=nro,
+            fecha_emision=timezone.now(),
+            monto_total=monto,
+        )
+    return nro
+
+
+@pytest.mark.django_db
+class TestAsignadorSecuencial:
+    """Tests de asignación secuencial por timbrado"""
+
+    def test_arranca_en_nro_inicial(self, timbrado):
+        """Test: Sin documentos previos se parte del nro_inicial"""
+        timbrado.nro_inicial = 501
+        timbrado.save()
+
+        assert _emitir(timbrado) == 501
+        assert _emitir(timbrado) == 502
+
+    def test_continua_documentos_existentes(self, timbrado):
+        """Test: El contador se inicializa desde el último documento emitido"""
+        DocumentosTributarios.objects.create(
+            nro_timbrado=timbrado, nro_secuencial=41,
+            fecha_emision=timezone.now(), monto_total=1000,
+        )
+
+        assert _emitir(timbrado) == 42
+        assert SecuenciaTimbrado.objects.get(nro_timbrado=timbrado).ultimo_secuencial == 42
+
+    def test_rollback_no_deja_huecos(self, timbrado):
+        """Test: Si la venta falla el número se reutiliza"""
+        _emitir(timbrado)
+
+        with pytest.raises(RuntimeError):
+            with transaction.atomic():
+                AsignadorSecuencial.siguiente(timbrado)
+                raise RuntimeError('venta cancelada')
+
+        assert _emitir(timbrado) == 2
+
+    def test_timbrado_agotado(self, timbrado):
+        """Test: No se asignan números más allá del nro_final"""
+        timbrado.nro_final = 2
+        timbrado.save()
+        _emitir(timbrado)
+        _emitir(timbrado)
+
+        with pytest.raises(TimbradoAgotadoError):
+            AsignadorSecuencial.siguiente(timbrado)
+
+
+@pytest.mark.slow
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.skipif(
+    not connection.features.has_select_for_update,
+    reason='Requiere bloqueo de filas (SELECT ... FOR UPDATE), p. ej. MySQL'
+)
+def test_stress_cajeros_concurrentes(timbrado):
+    """Stress: N ventas en paralelo obtienen números únicos y consecutivos"""
+    cajeros = 8
+    ventas_por_cajero = 10
+    numeros = []
+    errores = []
+    lock = threading.Lock()
+    inicio = threading.Barrier(cajeros)
+
+    def cajero():
+        try:
+            inicio.wait()
+            for _ in range(ventas_por_cajero):
+                nro = _emitir(timbrado)
+                with lock:
+                    numeros.append(nro)
+        except Exception as e:
+            errores.append(e)
+        finally:
+            connection.close()
+
+    hilos = [threading.Thread(target=cajero) for _ in range(cajeros)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    total = cajeros * ventas_por_cajero
+    assert errores == []
+    assert sorted(numeros) == list(range(1, total + 1))
+    assert DocumentosTributarios.objects.filter(nro_timbrado=timbrado).count() == total
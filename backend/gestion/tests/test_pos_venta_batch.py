@@ -0,0 +1,126 @@
+"""
+Tests del registro de ventas en lote (pos_venta_batch)
+Incluye benchmark de queries por venta según tamaño del carrito
+"""
+
+import time
+import pytest
+from decimal import Decimal
+from django.db import connection
+from django.core.exceptions import ValidationError
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from pos.models import Venta, DetalleVenta
+from gestion.models import StockUnico
+from gestion.pos_venta_batch import RegistradorVentaLote
+
+
+def _nueva_venta(cliente, empleado, tipo_pago):
+    return Venta.objects.create(
+        id_cliente=cliente,
+        id_tipo_pago=tipo_pago,
+        id_empleado_cajero=empleado,
+        fecha=timezone.now(),
+        monto_total=1,
+        estado_pago='PAGADA',
+        estado='PROCESADO',
+        tipo_venta='CONTADO',
+    )
+
+
+def _carrito(productos, cantidad=2, precio=5000):
+    return [
+        {'id': p.id_producto, 'name': p.descripcion, 'quantity': cantidad, 'price': precio}
+        for p in productos
+    ]
+
+
+class TestNormalizarItems:
+    """Tests de normalización del carrito (sin base de datos)"""
+
+    def test_agrupa_productos_repetidos(self):
+        """Test: Un producto repetido genera una sola línea"""
+        lineas = RegistradorVentaLote.normalizar_items([
+            {'id': 1, 'quantity': 2, 'price': 3000},
+            {'id': 1, 'quantity': 1, 'price': 3000},
+            {'id': 2, 'quantity': 1, 'price': 7000},
+        ])
+
+        assert [l.id_producto for l in lineas] == [1, 2]
+        assert lineas[0].cantidad == Decimal('3')
+        assert lineas[0].subtotal == Decimal('9000')
+
+    def test_producto_por_kilo_usa_peso(self):
+        """Test: Los productos por kilo toman el peso como cantidad"""
+        lineas = RegistradorVentaLote.normalizar_items([
+            {'id': 5, 'esPorKilo': True, 'peso': 0.35, 'quantity': 1, 'price': 40000},
+        ])
+
+        assert lineas[0].cantidad == Decimal('0.35')
+        assert lineas[0].subtotal == Decimal('14000.00')
+
+    def test_rechaza_cantidad_invalida(self):
+        """Test: Cantidad cero o negativa es rechazada"""
+        with pytest.raises(ValidationError):
+            RegistradorVentaLote.normalizar_items([{'id': 1, 'quantity': 0, 'price': 1000}])
+
+    def test_rechaza_repetido_con_otro_precio(self):
+        """Test: Un producto repetido con precios distintos es rechazado"""
+        with pytest.raises(ValidationError):
+            RegistradorVentaLote.normalizar_items([
+                {'id': 1, 'quantity': 1, 'price': 3000},
+                {'id': 1, 'quantity': 1, 'price': 2500},
+            ])
+
+    def test_acepta_precio_cero(self):
+        """Test: Un ítem sin cargo (promoción, regalo) es válido"""
+        lineas = RegistradorVentaLote.normalizar_items([{'id': 3, 'quantity': 2, 'price': 0}])
+
+        assert lineas[0].subtotal == Decimal('0')
+
+
+@pytest.mark.django_db
+class TestRegistrarVentaLote:
+    """Tests del registro en lote contra la base de datos"""
+
+    def test_crea_detalles_y_descuenta_stock(self, cliente, empleado, tipo_pago, productos_con_stock):
+        """Test: Se crean los detalles y se descuenta el stock de cada producto"""
+        venta = _nueva_venta(cliente, empleado, tipo_pago)
+        productos = productos_con_stock[:3]
+
+        RegistradorVentaLote.registrar(venta, _carrito(productos, cantidad=4))
+
+        assert DetalleVenta.objects.filter(id_venta=venta).count() == 3
+        for stock in StockUnico.objects.filter(id_producto__in=productos):
+            assert stock.cantidad == Decimal('96')
+
+    def test_omite_productos_inexistentes(self, cliente, empleado, tipo_pago, productos_con_stock):
+        """Test: Un id de producto inexistente no rompe la venta"""
+        venta = _nueva_venta(cliente, empleado, tipo_pago)
+        items = _carrito(productos_con_stock[:1]) + [{'id': 999999, 'quantity': 1, 'price': 1000}]
+
+        detalles = RegistradorVentaLote.registrar(venta, items)
+
+        assert len(detalles) == 1
+
+    @pytest.mark.slow
+    def test_benchmark_queries_por_venta(self, cliente, empleado, tipo_pago, productos_con_stock):
+        """Benchmark: Las queries por venta no crecen con el tamaño del carrito"""
+        print("\n📊 BENCHMARK: Queries por venta")
+        resultados = {}
+
+        for tamano in (1, 12, 40):
+            venta = _nueva_venta(cliente, empleado, tipo_pago)
+            items = _carrito(productos_con_stock[:tamano])
+
+            inicio = time.perf_counter()
+            with CaptureQueriesContext(connection) as ctx:
+                RegistradorVentaLote.registrar(venta, items)
+            duracion = (time.perf_counter() - inicio) * 1000
+
+            resultados[tamano] = len(ctx.captured_queries)
+            print(f"   Carrito de {tamano:>2} ítems: {resultados[tamano]} queries ({duracion:.1f} ms)")
+
+        # SELECT productos + INSERT detalles + UPDATE stock
+        assert set(resultados.values()) == {3}
@@ -0,0 +1,157 @@
+"""
+Tests del rate limiting con contadores atómicos (ratelimit_utils)
+"""
+
+import importlib
+import threading
+import pytest
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.test import RequestFactory
+
+from gestion import ratelimit_utils
+from gestion.ratelimit_utils import RateLimiter, ratelimit_politica
+
+
+class RelojFalso:
+    """Reemplazo del módulo time con hora controlada"""
+
+    def __init__(self, ahora=0.0):
+        self.ahora = ahora
+
+    def time(self):
+        return self.ahora
+
+
+@pytest.fixture(autouse=True)
+def cache_limpio():
+    cache.clear()
+    ratelimit_utils._limiters.clear()
+    yield
+    cache.clear()
+    ratelimit_utils._limiters.clear()
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = RelojFalso(ahora=1_000_000 * 3600.0)
+    monkeypatch.setattr(ratelimit_utils, 'time', reloj)
+    return reloj
+
+
+def _permitidos(limiter, cantidad, identifier='ip:1'):
+    return sum(1 for _ in range(cantidad) if limiter.is_allowed(identifier)[0])
+
+
+class TestRateLimiter:
+    """Tests de ventanas fija y deslizante"""
+
+    def test_ventana_fija(self, reloj):
+        """Test: Se permiten max_requests por ventana y se reinicia en la siguiente"""
+        limiter = RateLimiter(5, 60, bucket_local=False)
+
+        assert _permitidos(limiter, 8) == 5
+        assert limiter.is_allowed('ip:2')[0] is True
+
+        reloj.ahora += 60
+        assert _permitidos(limiter, 5) == 5
+
+    def test_ventana_deslizante_pondera_la_anterior(self, reloj):
+        """Test: Al empezar una ventana todavía pesan los requests de la anterior"""
+        limiter = RateLimiter(10, 60, modo=RateLimiter.MODO_DESLIZANTE, bucket_local=False)
+        reloj.ahora += 59
+        assert _permitidos(limiter, 10) == 10
+
+        reloj.ahora += 2   # 1 s de la ventana nueva: la anterior pesa 9
+        assert _permitidos(limiter, 10) == 1
+
+        reloj.ahora += 30  # mitad de la ventana: la anterior pesa 4
+        assert _permitidos(limiter, 10) == 5
+
+    def test_bucket_local_reduce_idas_al_cache(self, reloj, monkeypatch):
+        """Test: El bucket local reserva en lotes sin superar el límite"""
+        llamadas = []
+        incr_original = cache.incr
+        monkeypatch.setattr(cache, 'incr', lambda *a, **k: llamadas.append(a) or incr_original(*a, **k))
+        limiter = RateLimiter(100, 60)
+
+        assert _permitidos(limiter, 100) == 100
+        assert len(llamadas) < 40
+        assert limiter.is_allowed('ip:1')[0] is False
+
+    def test_varios_procesos_no_superan_el_limite(self, reloj):
+        """Test: Dos procesos con bucket local comparten el límite sin excederlo"""
+        proceso_a = RateLimiter(100, 60)
+        proceso_b = RateLimiter(100, 60)
+
+        total = 0
+        for _ in range(80):
+            total += proceso_a.is_allowed('user:7')[0]
+            total += proceso_b.is_allowed('user:7')[0]
+
+        assert total == 100
+
+    def test_concurrencia_exacta(self, reloj):
+        """Test: Requests concurrentes no se cuentan de menos"""
+        limiter = RateLimiter(50, 60, bucket_local=False)
+        permitidos = []
+
+        def cliente():
+            for _ in range(20):
+                if limiter.is_allowed('ip:9')[0]:
+                    permitidos.append(1)
+
+        hilos = [threading.Thread(target=cliente) for _ in range(8)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        assert len(permitidos) == 50
+
+
+class TestPoliticas:
+    """Tests de políticas por ruta"""
+
+    def test_politica_recarga_responde_429(self, reloj, settings):
+        """Test: La política de la ruta se aplica y se puede sobrescribir por settings"""
+        settings.RATELIMIT_POLITICAS = {'recarga': {'max_requests': 2}}
+
+        @ratelimit_politica('recarga')
+        def vista(request):
+            return JsonResponse({'success': True})
+
+        request = RequestFactory().post('/recarga/', REMOTE_ADDR='10.0.0.1')
+        respuestas = [vista(request) for _ in range(3)]
+
+        assert [r.status_code for r in respuestas] == [200, 200, 429]
+        assert respuestas[0]['X-RateLimit-Limit'] == '2'
+
+    @pytest.mark.parametrize('vista', [
+        'gestion.pos_views.procesar_venta',
+        'gestion.pos_general_views.procesar_venta_api',
+        'gestion.pos_facturacion_integracion.procesar_venta_con_factura_api',
+        'gestion.pos_views.procesar_recarga',
+    ])
+    def test_ventas_y_recargas_limitadas(self, vista, monkeypatch):
+        """Test: Las vistas de venta y recarga pasan por su política antes de procesar"""
+        modulo, nombre = vista.rsplit('.', 1)
+        vista = getattr(importlib.import_module(modulo), nombre)
+        monkeypatch.setattr(RateLimiter, 'is_allowed', lambda self, identifier: (False, 0, 0))
+
+        request = RequestFactory().post('/', data='{}', content_type='application/json', REMOTE_ADDR='10.0.0.1')
+        request.user = type('Usuario', (), {'is_authenticated': True, 'id': 1})()
+
+        assert vista(request).status_code == 429
+
+    def test_recarga_api_limitada(self, monkeypatch):
+        """Test: La acción recargar del API de tarjetas usa la política de recarga"""
+        from gestion.api_views import TarjetaViewSet
+        monkeypatch.setattr(RateLimiter, 'is_allowed', lambda self, identifier: (False, 0, 0))
+
+        vista = TarjetaViewSet.as_view({'post': 'recargar'})
+        request = RequestFactory().post('/', data={}, REMOTE_ADDR='10.0.0.1')
+        request.user = type('Usuario', (), {'is_authenticated': True, 'id': 1, 'is_active': True})()
+        request._force_auth_user = request.user
+
+        assert vista(request, nro_tarjeta='0001').status_code == 429
@@ -0,0 +1,146 @@
+"""
+Tests de los recordatorios de deuda por saldo negativo (recordatorios_deuda)
+"""
+
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from gestion import bandeja_salida
+from gestion.models import AutorizacionSaldoNegativo, Hijo, MensajeSaliente, NotificacionSaldo, Tarjeta, UsuarioPortal
+from gestion.recordatorios_deuda import ProgramadorRecordatoriosDeuda
+from pos.models import Venta
+
+HOY = date(2026, 3, 20)
+
+
+@pytest.fixture(autouse=True)
+def sin_worker(monkeypatch):
+    monkeypatch.setattr(bandeja_salida, 'despertar_worker', lambda: None)
+
+
+@pytest.fixture
+def venta(cliente, empleado, tipo_pago):
+    return Venta.objects.create(
+        id_cliente=cliente,
+        id_tipo_pago=tipo_pago,
+        id_empleado_cajero=empleado,
+        fecha=timezone.now(),
+        monto_total=1,
+        estado_pago='PAGADA',
+        estado='PROCESADO',
+        tipo_venta='CONTADO',
+    )
+
+
+@pytest.fixture
+def deuda(cliente, empleado, venta):
+    """Crea una tarjeta con saldo negativo y una autorización de hace `dias` días"""
+    def crear(nro, dias, regularizado=False, tarjeta=None, hora=10):
+        if tarjeta is None:
+            hijo = Hijo.objects.create(id_cliente_responsable=cliente, nombre=f'Hijo{nro}', apellido='Test')
+            tarjeta = Tarjeta.objects.create(nro_tarjeta=nro, id_hijo=hijo, saldo_actual=Decimal('-15000'))
+        AutorizacionSaldoNegativo.objects.create(
+            id_cliente=cliente,
+            id_venta=venta,
+            id_empleado_autoriza=empleado,
+            nro_tarjeta=tarjeta,
+            monto_autorizado=15000,
+            saldo_anterior=0,
+            saldo_resultante=-15000,
+            motivo='Olvidó recargar',
+            fecha_autorizacion=timezone.make_aware(
+                datetime.combine(HOY - timedelta(days=dias), time(hora))
+            ),
+            regularizado=regularizado,
+        )
+        return tarjeta
+    return crear
+
+
+@pytest.mark.django_db
+class TestProgramadorRecordatoriosDeuda:
+    """Tests de escalones, contactos y bloqueo"""
+
+    def test_solo_dias_escalon(self, deuda, cliente):
+        """Test: Recordatorio sólo en los días 3, 7 y 15, y nunca para deudas regularizadas"""
+        UsuarioPortal.objects.create(cliente=cliente, email='padre@test.com', password_hash='x')
+        for nro, dias in [('D2', 2), ('D3', 3), ('D4', 4), ('D7', 7), ('D15', 15)]:
+            deuda(nro, dias)
+        deuda('D3_PAGADA', 3, regularizado=True)
+        # Día 3 aunque la hora sea 23:59 (días calendario, no horas)
+        deuda('D3_NOCHE', 3, hora=23)
+
+        filas = ProgramadorRecordatoriosDeuda.deudas_en_escalon(HOY)
+
+        assert {(f['nro_tarjeta'], f['tipo']) for f in filas} == {
+            ('D3', 'amable'), ('D3_NOCHE', 'amable'), ('D7', 'urgente'), ('D15', 'critico'),
+        }
+
+    def test_una_tarjeta_un_recordatorio(self, deuda, cliente):
+        """Test: Varias autorizaciones en escalones distintos generan sólo el más alto"""
+        UsuarioPortal.objects.create(cliente=cliente, email='padre@test.com', password_hash='x')
+        tarjeta = deuda('T1', 3)
+        deuda('T1', 7, tarjeta=tarjeta)
+
+        resultado = ProgramadorRecordatoriosDeuda.encolar_recordatorios(
+            ProgramadorRecordatoriosDeuda.deudas_en_escalon(HOY)
+        )
+
+        assert resultado == {'3_dias': 0, '7_dias': 1, '15_dias': 0, 'sin_email': 0}
+        mensaje = MensajeSaliente.objects.get()
+        assert mensaje.destinatario == 'padre@test.com'
+        assert mensaje.asunto.startswith('⚠️ URGENTE')
+        assert mensaje.id_notificacion_saldo == NotificacionSaldo.objects.get(nro_tarjeta='T1')
+
+    def test_sin_email_no_encola(self, deuda):
+        """Test: Sin email del portal ni del cliente se cuenta como sin_email"""
+        deuda('T1', 3)
+
+        resultado = ProgramadorRecordatoriosDeuda.ejecutar(HOY)
+
+        assert resultado['sin_email'] == 1 and resultado['3_dias'] == 0
+        assert not MensajeSaliente.objects.exists()
+
+    def test_bloqueo_en_un_update(self, deuda, cliente):
+        """Test: Bloquea las tarjetas con deuda de 15+ días y avisa una sola vez"""
+        cliente.email = 'ficha@test.com'
+        cliente.save()
+        vieja = deuda('VIEJA', 40)
+        deuda('VIEJA', 20, tarjeta=vieja)
+        deuda('QUINCE', 15)
+        deuda('RECIENTE', 14)
+        deuda('PAGADA', 30, regularizado=True)
+
+        with CaptureQueriesContext(connection) as consultas:
+            bloqueadas = ProgramadorRecordatoriosDeuda.bloquear_morosos(HOY)
+
+        assert bloqueadas == 2
+        assert set(Tarjeta.objects.filter(estado='Bloqueada').values_list('nro_tarjeta', flat=True)) == {
+            'VIEJA', 'QUINCE'
+        }
+        assert sum(q['sql'].startswith('UPDATE') for q in consultas.captured_queries) == 1
+        avisos = MensajeSaliente.objects.filter(asunto__contains='BLOQUEADA')
+        assert avisos.count() == 2
+        assert 'morosidad de 40 días' in avisos.get(asunto__contains='VIEJA').cuerpo
+        # Ya bloqueadas: la pasada siguiente no repite
+        assert ProgramadorRecordatoriosDeuda.bloquear_morosos(HOY) == 0
+
+    def test_historial_no_aumenta_consultas(self, deuda, cliente):
+        """Test: Las deudas fuera de los escalones no agregan consultas ni filas"""
+        cliente.email = 'ficha@test.com'
+        cliente.save()
+        deuda('T3', 3)
+        for i in range(20):
+            deuda(f'PAGADA{i}', 100 + i, regularizado=True)
+            deuda(f'OTRO{i}', 5)
+
+        with CaptureQueriesContext(connection) as consultas:
+            filas = ProgramadorRecordatoriosDeuda.deudas_en_escalon(HOY)
+
+        assert [f['nro_tarjeta'] for f in filas] == ['T3']
+        assert len(consultas) == 1
@@ -0,0 +1,224 @@
+"""
+Tests de la cola persistente de reenvíos a SIFEN (reintentos_set.ColaReintentosSET)
+Usa un SIFEN simulado local (/recepcion) con demora y respuestas 429 configurables
+Incluye benchmark secuencial vs. pool de hilos
+"""
+
+import json
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from django.utils import timezone
+
+from gestion.models import AlertasSistema, DatosFacturacionElect, DocumentosTributarios, ReintentoEnvioSET
+from gestion.rechazo_set_handler import SETAPIClient
+from gestion.reintentos_set import ColaReintentosSET, LimitadorSET
+
+
+class SifenSimulado:
+    """Estado compartido del SIFEN simulado"""
+
+    def __init__(self):
+        self.demora = 0
+        self.limitar_primeros = 0
+        self.retry_after = None
+        self.rechazos = {}
+        self.recibidos = []
+        self.en_curso = 0
+        self.max_en_curso = 0
+        self.lock = threading.Lock()
+
+
+@pytest.fixture
+def sifen():
+    estado = SifenSimulado()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _responder(self, codigo, datos, encabezados=None):
+            cuerpo = json.dumps(datos).encode()
+            self.send_response(codigo)
+            for clave, valor in (encabezados or {}).items():
+                self.send_header(clave, valor)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def do_POST(self):
+            cdc = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['cdc']
+            with estado.lock:
+                estado.recibidos.append(cdc)
+                limitado = len(estado.recibidos) <= estado.limitar_primeros
+                estado.en_curso += 1
+                estado.max_en_curso = max(estado.max_en_curso, estado.en_curso)
+            time.sleep(estado.demora)
+            with estado.lock:
+                estado.en_curso -= 1
+
+            if limitado:
+                encabezados = {'Retry-After': str(estado.retry_after)} if estado.retry_after is not None else {}
+                self._responder(429, {'mensaje': 'Demasiadas solicitudes'}, encabezados)
+            elif cdc in estado.rechazos:
+                self._responder(200, {'estado': 'rechazado', 'codigo': estado.rechazos[cdc], 'mensaje': 'Rechazado'})
+            else:
+                self._responder(200, {'estado': 'aceptado', 'cdc': cdc})
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    estado.url = f'http://127.0.0.1:{servidor.server_address[1]}'
+    yield estado
+    servidor.shutdown()
+    servidor.server_close()
+
+
+@pytest.fixture
+def cliente_set(sifen):
+    def crear(hilos=4):
+        cliente = SETAPIClient(max_retries=0, pool_size=hilos)
+        cliente.base_url = sifen.url
+        return cliente
+    return crear
+
+
+@pytest.fixture
+def rechazados(timbrado):
+    """Crea `cantidad` documentos rechazados con su reintento vencido"""
+    def crear(cantidad, xml='<DE/>'):
+        cdcs = []
+        for i in range(cantidad):
+            documento = DocumentosTributarios.objects.create(
+                nro_timbrado=timbrado, nro_secuencial=i + 1, fecha_emision=timezone.now(), monto_total=1000
+            )
+            cdc = f'{i:044d}'
+            DatosFacturacionElect.objects.create(
+                id_documento=documento, cdc=cdc, xml_transmitido=xml, estado_sifen='Rechazado'
+            )
+            ColaReintentosSET.programar(documento.id_documento, '1001', 'Error de comunicación', 0)
+            cdcs.append(cdc)
+        ReintentoEnvioSET.objects.update(fecha_proximo_intento=timezone.now() - timedelta(seconds=1))
+        return cdcs
+    return crear
+
+
+@pytest.mark.django_db
+class TestColaReintentosSET:
+    """Tests de persistencia, clasificación de respuestas y ritmo adaptativo"""
+
+    def test_acepta_en_paralelo(self, sifen, cliente_set, rechazados):
+        """Test: Los documentos se envían con varios hilos y quedan aprobados"""
+        sifen.demora = 0.05
+        rechazados(8)
+
+        resultados = ColaReintentosSET.procesar_pendientes(cliente=cliente_set(4), limitador=LimitadorSET(), hilos=4)
+
+        assert [r['accion'] for r in resultados] == ['aceptado'] * 8
+        assert sifen.max_en_curso > 1
+        assert ColaReintentosSET.estado_cola() == {'ACEPTADO': 8}
+        assert set(DatosFacturacionElect.objects.values_list('estado_sifen', flat=True)) == {'Aprobado'}
+
+    def test_clasifica_rechazos(self, sifen, cliente_set, rechazados):
+        """Test: Error de validación va a revisión; error recuperable se reprograma con backoff"""
+        validacion, recuperable, _ = rechazados(3)
+        sifen.rechazos = {validacion: '2001', recuperable: '1003'}
+
+        ColaReintentosSET.procesar_pendientes(cliente=cliente_set(), limitador=LimitadorSET())
+
+        revision = ReintentoEnvioSET.objects.get(id_documento__cdc=validacion)
+        assert (revision.estado, revision.intentos) == ('REVISION', 1)
+        assert AlertasSistema.objects.filter(mensaje__contains=validacion).exists()
+        assert DatosFacturacionElect.objects.get(cdc=validacion).estado_sifen == 'Rechazado'
+
+        reprogramado = ReintentoEnvioSET.objects.get(id_documento__cdc=recuperable)
+        assert (reprogramado.estado, reprogramado.intentos, reprogramado.codigo_error) == ('PENDIENTE', 1, '1003')
+        assert reprogramado.fecha_proximo_intento > timezone.now() + timedelta(seconds=100)
+
+    def test_agota_intentos(self, sifen, cliente_set, rechazados):
+        """Test: Al llegar a max_intentos el documento pasa a revisión manual"""
+        cdc, = rechazados(1)
+        sifen.rechazos = {cdc: '1001'}
+        ReintentoEnvioSET.objects.update(intentos=2)
+
+        resultados = ColaReintentosSET.procesar_pendientes(cliente=cliente_set(), limitador=LimitadorSET())
+
+        assert resultados[0]['accion'] == 'revision_manual'
+        assert ReintentoEnvioSET.objects.get().estado == 'REVISION'
+
+    def test_429_frena_sin_gastar_intento(self, sifen, cliente_set, rechazados):
+        """Test: Un 429 con Retry-After duplica el intervalo y difiere el resto sin contar intentos"""
+        rechazados(6)
+        sifen.limitar_primeros = 1
+        sifen.retry_after = 120
+        limitador = LimitadorSET()
+
+        resultados = ColaReintentosSET.procesar_pendientes(cliente=cliente_set(1), limitador=limitador, hilos=1)
+
+        # El primero recibe 429; los demás no se envían (la pausa supera PAUSA_MAX)
+        assert len(sifen.recibidos) == 1
+        assert [r['accion'] for r in resultados] == ['limitado'] + ['diferido'] * 5
+        assert limitador.frenadas == 1 and limitador.intervalo > 0
+        assert set(ReintentoEnvioSET.objects.values_list('estado', 'intentos')) == {('PENDIENTE', 0)}
+        assert ReintentoEnvioSET.objects.filter(
+            fecha_proximo_intento__gt=timezone.now() + timedelta(seconds=100)
+        ).count() == 6
+
+    def test_limitador_adaptativo(self):
+        """Test: El intervalo crece con cada 429 y se recupera con las aceptaciones"""
+        reloj = [0.0]
+        esperas = []
+        limitador = LimitadorSET(reloj=lambda: reloj[0], dormir=esperas.append)
+
+        limitador.frenar()
+        limitador.frenar()
+        assert limitador.intervalo == 1.0
+        assert limitador.esperar_turno() and esperas == [1.0]
+        assert limitador.esperar_turno() and esperas == [1.0, 2.0]
+
+        for _ in range(30):
+            limitador.acelerar()
+        assert limitador.intervalo == 0.0
+
+    def test_sobrevive_reinicio(self, rechazados):
+        """Test: Los reintentos programados están en la base, no en el cache"""
+        from django.core.cache import cache
+
+        rechazados(2)
+        cache.clear()
+
+        assert ColaReintentosSET.estado_cola() == {'PENDIENTE': 2}
+
+    def test_recupera_colgados(self, rechazados):
+        """Test: Un lote que quedó ENVIANDO tras una caída vuelve a PENDIENTE"""
+        rechazados(1)
+        ReintentoEnvioSET.objects.update(
+            estado='ENVIANDO', lote='x', fecha_proximo_intento=timezone.now() - timedelta(minutes=30)
+        )
+
+        assert ColaReintentosSET.recuperar_colgados() == 1
+        assert ReintentoEnvioSET.objects.get().estado == 'PENDIENTE'
+
+    @pytest.mark.slow
+    def test_benchmark_secuencial_vs_pool(self, sifen, cliente_set, rechazados):
+        """Benchmark: Reenvío de 24 documentos con SIFEN simulado de 50 ms por request"""
+        print("\n📊 BENCHMARK: Reenvíos a SIFEN simulado (50 ms por documento)")
+        sifen.demora = 0.05
+        tiempos = {}
+
+        for hilos in (1, 4, 8):
+            ReintentoEnvioSET.objects.all().delete()
+            DocumentosTributarios.objects.all().delete()
+            rechazados(24)
+            inicio = time.perf_counter()
+            total = ColaReintentosSET.vaciar(cliente=cliente_set(hilos), limitador=LimitadorSET(), hilos=hilos)
+            tiempos[hilos] = time.perf_counter() - inicio
+            assert total == {'aceptado': 24}
+            print(f"   {hilos} hilo(s): {tiempos[hilos] * 1000:.0f} ms")
+
+        assert tiempos[4] < tiempos[1] / 2
@@ -0,0 +1,232 @@
+"""
+Tests de backups en streaming (respaldos.RespaldoMySQL y backup_database)
+Usa scripts falsos de mysqldump y mysql; incluye benchmark contra el dump + gzip en dos pasadas
+"""
+
+import gzip
+import json
+import shutil
+import stat
+import subprocess
+import sys
+import time
+from datetime import date
+from io import BytesIO, StringIO
+from pathlib import Path
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from gestion.respaldos import (
+    MARCA_FIN_DUMP, TABLAS_PESADAS, BackupError, CompresorGzipParalelo, RespaldoMySQL
+)
+
+MYSQLDUMP_FALSO = '''#!{python}
+import json, os, sys
+args = sys.argv[1:]
+with open(os.environ['FAKE_DUMP_LOG'], 'a') as log:
+    log.write(json.dumps({{'args': args, 'pwd': os.environ.get('MYSQL_PWD')}}) + '\\n')
+if os.environ.get('FAKE_DUMP_FALLA'):
+    sys.stdout.write('-- parcial\\n')
+    sys.stderr.write('mysqldump: Got error: 1045: Access denied\\n')
+    sys.exit(2)
+nombres = [a for a in args if not a.startswith('-')]
+tabla = nombres[1] if len(nombres) > 1 else 'todas'
+salida = sys.stdout.buffer
+salida.write(b'-- MySQL dump 10.13\\n')
+for i in range(int(os.environ.get('FAKE_DUMP_FILAS', '2000'))):
+    salida.write(f"INSERT INTO `{{tabla}}` VALUES ({{i}},'fila {{i}} de {{tabla}}',{{i * 37 % 1000}}.00,'2026-03-{{i % 28 + 1:02d}}');\\n".encode())
+if not os.environ.get('FAKE_DUMP_CORTADO'):
+    salida.write(b'-- Dump completed on 2026-03-15 23:00:00\\n')
+'''
+
+MYSQL_FALSO = '''#!{python}
+import os, sys
+datos = sys.stdin.buffer.read()
+with open(os.environ['FAKE_MYSQL_SALIDA'], 'ab') as salida:
+    salida.write(datos)
+if os.environ.get('FAKE_MYSQL_FALLA'):
+    sys.stderr.write('ERROR 1064 (42000): You have an error in your SQL syntax\\n')
+    sys.exit(1)
+'''
+
+DB_CONFIG = {'NAME': 'cantina', 'HOST': 'db', 'PORT': '3306', 'USER': 'backup', 'PASSWORD': 'secreto'}
+
+
+def _script(ruta: Path, contenido: str) -> Path:
+    ruta.write_text(contenido.format(python=sys.executable))
+    ruta.chmod(ruta.stat().st_mode | stat.S_IEXEC)
+    return ruta
+
+
+@pytest.fixture
+def mysql_falso(tmp_path, settings, monkeypatch):
+    """mysqldump y mysql falsos; devuelve las rutas de sus registros"""
+    settings.BACKUP_MYSQLDUMP_BIN = str(_script(tmp_path / 'mysqldump', MYSQLDUMP_FALSO))
+    settings.BACKUP_MYSQL_BIN = str(_script(tmp_path / 'mysql', MYSQL_FALSO))
+    registros = {'dump': tmp_path / 'dump.log', 'restaurado': tmp_path / 'restaurado.sql'}
+    monkeypatch.setenv('FAKE_DUMP_LOG', str(registros['dump']))
+    monkeypatch.setenv('FAKE_MYSQL_SALIDA', str(registros['restaurado']))
+    return registros
+
+
+def llamadas(registro: Path):
+    return [json.loads(linea) for linea in registro.read_text().splitlines()]
+
+
+class TestCompresorGzipParalelo:
+    """Tests del gzip multi-miembro (sin base de datos)"""
+
+    def test_gzip_estandar_y_ordenado(self):
+        """Test: Los bloques comprimidos en paralelo se leen como un solo .gz en orden"""
+        datos = b''.join(f'linea {i}\n'.encode() for i in range(50000))
+        salida = BytesIO()
+        compresor = CompresorGzipParalelo(salida, hilos=4, tamano_bloque=16 * 1024)
+        for i in range(0, len(datos), 5000):
+            compresor.escribir(datos[i:i + 5000])
+        resumen = compresor.cerrar()
+
+        assert gzip.decompress(salida.getvalue()) == datos
+        assert resumen['bytes_sql'] == len(datos)
+        assert resumen['bytes_gz'] == len(salida.getvalue())
+        # Compatible con gunzip
+        assert subprocess.run(['gzip', '-t'], input=salida.getvalue()).returncode == 0
+
+    def test_vacio(self):
+        """Test: Un stream vacío produce un gzip válido vacío"""
+        salida = BytesIO()
+        CompresorGzipParalelo(salida, hilos=2).cerrar()
+        assert gzip.decompress(salida.getvalue()) == b''
+
+
+class TestRespaldoMySQL:
+    """Tests del volcado en streaming, por tabla e incremental, y de la verificación"""
+
+    def test_completo_streaming(self, mysql_falso, tmp_path):
+        """Test: El dump se comprime sin .sql intermedio y queda un manifiesto con checksums"""
+        manifiesto = RespaldoMySQL(DB_CONFIG, tmp_path / 'b', hilos=2, tamano_bloque=8 * 1024).completo()
+
+        archivo, = manifiesto['archivos']
+        ruta = tmp_path / 'b' / archivo['archivo']
+        assert ruta.name.endswith('.sql.gz')
+        assert sorted(p.name for p in (tmp_path / 'b').iterdir()) == sorted([ruta.name, manifiesto['manifiesto']])
+        sql = gzip.decompress(ruta.read_bytes())
+        assert sql.rstrip().endswith(b'23:00:00') and MARCA_FIN_DUMP in sql
+        assert archivo['bytes_sql'] == len(sql)
+
+        llamada, = llamadas(mysql_falso['dump'])
+        assert '--single-transaction' in llamada['args'] and llamada['args'][-1] == 'cantina'
+        # La contraseña no va en la línea de comandos
+        assert llamada['pwd'] == 'secreto'
+        assert not any('secreto' in arg for arg in llamada['args'])
+
+    def test_incremental_por_tabla(self, mysql_falso, tmp_path):
+        """Test: Un archivo por tabla pesada con --where desde la fecha"""
+        manifiesto = RespaldoMySQL(DB_CONFIG, tmp_path).por_tablas(TABLAS_PESADAS, date(2026, 3, 1))
+
+        assert manifiesto['tipo'] == 'incremental' and manifiesto['desde'] == '2026-03-01'
+        assert [a['archivo'].split('_', 4)[-1] for a in manifiesto['archivos']] == [
+            f'{tabla}_desde20260301.sql.gz' for tabla in TABLAS_PESADAS
+        ]
+        ventas = llamadas(mysql_falso['dump'])[1]['args']
+        assert ventas[-2:] == ['cantina', 'ventas']
+        assert "--where=fecha >= '2026-03-01'" in ventas
+        assert '--no-create-info' in ventas and '--replace' in ventas
+
+    def test_incremental_tabla_desconocida(self, mysql_falso, tmp_path):
+        """Test: Sólo las tablas pesadas tienen condición incremental"""
+        with pytest.raises(BackupError, match='clientes'):
+            RespaldoMySQL(DB_CONFIG, tmp_path).por_tablas(['ventas', 'clientes'], date(2026, 3, 1))
+
+    def test_falla_no_deja_archivo(self, mysql_falso, tmp_path, monkeypatch):
+        """Test: Si mysqldump falla no queda ni el .parcial ni el backup"""
+        monkeypatch.setenv('FAKE_DUMP_FALLA', '1')
+
+        with pytest.raises(BackupError, match='Access denied'):
+            RespaldoMySQL(DB_CONFIG, tmp_path / 'b').completo()
+
+        assert list((tmp_path / 'b').iterdir()) == []
+
+    def test_dump_cortado(self, mysql_falso, tmp_path, monkeypatch):
+        """Test: Un dump sin la marca de fin se descarta aunque mysqldump salga con 0"""
+        monkeypatch.setenv('FAKE_DUMP_CORTADO', '1')
+
+        with pytest.raises(BackupError, match='incompleto'):
+            RespaldoMySQL(DB_CONFIG, tmp_path).completo()
+
+        assert not list(tmp_path.glob('backup_*.sql*'))
+
+    def test_verificar_y_restaurar(self, mysql_falso, tmp_path):
+        """Test: La verificación recorre los checksums y restaura el SQL original en la base de prueba"""
+        manifiesto = RespaldoMySQL(DB_CONFIG, tmp_path, tamano_bloque=4096).por_tablas(['ventas', 'detalle_venta'])
+        ruta = tmp_path / manifiesto['manifiesto']
+
+        resultados = RespaldoMySQL.verificar(ruta, restaurar_en='cantina_prueba', db_config=DB_CONFIG)
+
+        assert [r['ok'] for r in resultados] == [True, True]
+        originales = b''.join(gzip.decompress((tmp_path / a['archivo']).read_bytes()) for a in manifiesto['archivos'])
+        assert mysql_falso['restaurado'].read_bytes() == originales
+
+    def test_verificar_detecta_danio(self, mysql_falso, tmp_path, monkeypatch):
+        """Test: Un byte alterado en el .gz o una restauración fallida se informan"""
+        manifiesto = RespaldoMySQL(DB_CONFIG, tmp_path).completo()
+        ruta = tmp_path / manifiesto['manifiesto']
+        archivo = tmp_path / manifiesto['archivos'][0]['archivo']
+
+        monkeypatch.setenv('FAKE_MYSQL_FALLA', '1')
+        resultado, = RespaldoMySQL.verificar(ruta, restaurar_en='cantina_prueba', db_config=DB_CONFIG)
+        assert not resultado['ok'] and 'syntax' in resultado['errores'][0]
+
+        contenido = bytearray(archivo.read_bytes())
+        contenido[len(contenido) // 2] ^= 0xFF
+        archivo.write_bytes(bytes(contenido))
+        resultado, = RespaldoMySQL.verificar(ruta)
+        assert resultado['errores'] == ['SHA-256 del archivo comprimido no coincide']
+
+
+class TestComandoBackup:
+    """Tests del comando backup_database"""
+
+    def test_backup_y_verificacion(self, mysql_falso, tmp_path, settings):
+        """Test: --compress crea el .sql.gz y --verificar lo valida"""
+        settings.DATABASES = {'default': dict(DB_CONFIG)}
+        salida = StringIO()
+        call_command('backup_database', compress=True, directorio=str(tmp_path), hilos=2, stdout=salida)
+
+        manifiesto, = tmp_path.glob('*.manifest.json')
+        assert 'BACKUP COMPLETADO' in salida.getvalue()
+        assert len(list(tmp_path.glob('backup_cantina_*.sql.gz'))) == 1
+
+        salida = StringIO()
+        call_command('backup_database', verificar=str(manifiesto), stdout=salida)
+        assert 'Backup íntegro' in salida.getvalue()
+
+    def test_desde_requiere_tablas(self, mysql_falso, tmp_path):
+        """Test: --desde sin --tablas es un error"""
+        with pytest.raises(CommandError, match='--tablas'):
+            call_command('backup_database', desde=date(2026, 3, 1), directorio=str(tmp_path), stdout=StringIO())
+
+    @pytest.mark.slow
+    def test_benchmark_streaming_vs_dos_pasadas(self, mysql_falso, tmp_path, monkeypatch):
+        """Benchmark: Dump de ~40 MB, archivo + gzip 9 en un hilo vs. streaming paralelo"""
+        print("\n📊 BENCHMARK: Backup de ~40 MB de SQL")
+        monkeypatch.setenv('FAKE_DUMP_FILAS', '600000')
+
+        # Antes: volcado a archivo y compresión en una segunda pasada
+        inicio = time.perf_counter()
+        plano = RespaldoMySQL(DB_CONFIG, tmp_path / 'antes', comprimir=False)
+        archivo = tmp_path / 'antes' / plano.completo()['archivos'][0]['archivo']
+        with open(archivo, 'rb') as f_in, gzip.open(str(archivo) + '.gz', 'wb', compresslevel=9) as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        archivo.unlink()
+        antes = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        manifiesto = RespaldoMySQL(DB_CONFIG, tmp_path / 'despues', hilos=4).completo()
+        despues = time.perf_counter() - inicio
+
+        tamano = manifiesto['archivos'][0]['bytes_sql'] / (1024 * 1024)
+        print(f"   Archivo + gzip -9 (1 hilo): {antes * 1000:.0f} ms")
+        print(f"   Streaming gzip -6 (4 hilos): {despues * 1000:.0f} ms ({tamano:.0f} MB SQL)")
+        assert despues < antes
@@ -0,0 +1,295 @@
+"""
+Tests del matching compilado de restricciones alimentarias (restricciones_matcher)
+Compara contra el análisis palabra por palabra; incluye benchmark del carrito y de productos seguros
+"""
+
+import itertools
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from gestion.models import Categoria, MatrizRestriccionProducto, Producto, RestriccionesHijos
+from gestion.pos_general_views import verificar_restricciones_carrito_api
+from gestion.pos_utils import VerificadorRestricciones
+from gestion.restricciones_matcher import (
+    AutomataPalabras, MatrizConflictos, ProductoRestriccionMatcher, verificar_restricciones_venta
+)
+
+KEYWORDS = ProductoRestriccionMatcher.KEYWORDS_RESTRICCIONES
+CATEGORIAS = ProductoRestriccionMatcher.CATEGORIAS_RIESGO
+
+DESCRIPCIONES = [
+    'Alfajor de dulce de leche', 'Pan con manteca', 'Mantequilla de maní crocante',
+    'Empanada de jamón y queso', 'Agua mineral', 'Ensalada de frutas', 'Chipá',
+    'Milanesa de pollo con papas fritas', 'Galleta dulce de chocolate', 'Salmón grillado',
+    'Helado de nuez', 'Tortilla de huevo', 'Jugo de naranja sin azúcar', 'Yogur con miel',
+]
+OBSERVACIONES = [None, '', 'Evitar leche y queso', 'Nada de harina, trigo ni avena', 'sin mani ni peanut']
+
+
+def analizar_palabra_por_palabra(descripcion, categoria, tipo, observaciones):
+    """Análisis original: un `in` por palabra clave, restricción y producto"""
+    confianza, razones = 0, []
+    for keyword in KEYWORDS.get(tipo, []):
+        if keyword in descripcion.lower():
+            confianza += 30
+            razones.append(f"Contiene '{keyword}' en descripción")
+    if categoria and categoria in CATEGORIAS.get(tipo, []):
+        confianza += 20
+        razones.append(f"Pertenece a categoría de riesgo: {categoria}")
+    if observaciones:
+        for keyword in KEYWORDS.get(tipo, []):
+            if keyword in observaciones.lower():
+                confianza += 15
+                razones.append(f"Observaciones mencionan '{keyword}'")
+    confianza = min(confianza, 100)
+    return confianza >= 50, "; ".join(razones) if razones else "Sin coincidencias detectadas", confianza
+
+
+def _restriccion(hijo, tipo, observaciones=None):
+    return RestriccionesHijos.objects.create(id_hijo=hijo, tipo_restriccion=tipo, observaciones=observaciones)
+
+
+@pytest.fixture
+def productos_restriccion(categoria, unidad_medida, impuesto):
+    """Un producto por descripción de DESCRIPCIONES, en la categoría Bebidas"""
+    Producto.objects.bulk_create([
+        Producto(
+            codigo_barra=f'R{i:03d}', descripcion=descripcion, id_categoria=categoria,
+            id_unidad_medida=unidad_medida, id_impuesto=impuesto, activo=True
+        )
+        for i, descripcion in enumerate(DESCRIPCIONES)
+    ])
+    return {p.descripcion: p for p in Producto.objects.filter(codigo_barra__startswith='R')}
+
+
+class TestAutomataPalabras:
+    """Tests del autómata Aho-Corasick (sin base de datos)"""
+
+    def test_equivale_a_subcadena(self):
+        """Test: Encuentra exactamente las palabras que `in` encuentra, incluidas las superpuestas"""
+        palabras = set(itertools.chain.from_iterable(KEYWORDS.values()))
+        automata = AutomataPalabras(palabras)
+
+        for texto in DESCRIPCIONES + ['mantequilla de mani', 'salsalado', 'aaa', '']:
+            texto = texto.lower()
+            assert automata.buscar(texto) == {p for p in palabras if p in texto}
+
+    def test_superpuestas(self):
+        """Test: 'dulce de leche' incluye 'dulce', 'leche' y la frase completa"""
+        automata = AutomataPalabras(['dulce', 'leche', 'dulce de leche', 'de l'])
+        assert automata.buscar('alfajor de dulce de leche') == {'dulce', 'leche', 'dulce de leche', 'de l'}
+
+
+class TestAnalizarProducto:
+    """Tests de equivalencia con el análisis palabra por palabra"""
+
+    def test_mismo_resultado(self):
+        """Test: Conflicto, razón y confianza idénticos para toda combinación"""
+        tipos = list(KEYWORDS) + ['Otra restricción']
+        for descripcion, categoria, tipo, observaciones in itertools.product(
+            DESCRIPCIONES, [None, 'Snacks', 'Lácteos', 'Bebidas'], tipos, OBSERVACIONES
+        ):
+            producto = SimpleNamespace(
+                descripcion=descripcion,
+                id_categoria=SimpleNamespace(nombre=categoria) if categoria else None
+            )
+            restriccion = SimpleNamespace(tipo_restriccion=tipo, observaciones=observaciones)
+
+            assert ProductoRestriccionMatcher.analizar_producto(producto, restriccion) == \
+                analizar_palabra_por_palabra(descripcion, categoria, tipo, observaciones)
+
+
+@pytest.mark.django_db
+class TestMatrizConflictos:
+    """Tests de la matriz persistida, su mantenimiento y las consultas"""
+
+    def test_fila_al_guardar(self, productos_restriccion):
+        """Test: Guardar un producto recalcula su fila"""
+        producto = productos_restriccion['Agua mineral']
+        MatrizConflictos.recalcular()
+        assert MatrizRestriccionProducto.objects.get(id_producto=producto).mascara == 0
+
+        producto.descripcion = 'Agua con leche y queso'
+        producto.save()
+
+        fila = MatrizRestriccionProducto.objects.get(id_producto=producto)
+        bit = MatrizConflictos._motor()['bits']['Intolerancia a la lactosa']
+        assert fila.mascara & bit and fila.confianzas['Intolerancia a la lactosa'] == 60
+        assert fila.version == MatrizConflictos.version()
+
+    def test_categoria_guardada(self, productos_restriccion, categoria):
+        """Test: Renombrar la categoría a una de riesgo recalcula sus productos"""
+        MatrizConflictos.recalcular()
+        chipa = productos_restriccion['Chipá']
+        assert MatrizRestriccionProducto.objects.get(id_producto=chipa).confianzas['Hipertensión'] == 30
+
+        categoria.nombre = 'Snacks'
+        categoria.save()
+
+        fila = MatrizRestriccionProducto.objects.get(id_producto=chipa)
+        assert fila.confianzas['Hipertensión'] == 50 and fila.confianzas['Diabetes'] == 20
+        assert fila.mascara & MatrizConflictos._motor()['bits']['Hipertensión']
+        assert not fila.mascara & MatrizConflictos._motor()['bits']['Diabetes']
+        assert MatrizRestriccionProducto.objects.filter(mascara_riesgo=0).count() == 0
+
+    def test_version_desactualizada(self, productos_restriccion):
+        """Test: Filas de otra versión de palabras clave se recalculan al consultarlas"""
+        MatrizConflictos.recalcular()
+        MatrizRestriccionProducto.objects.update(version='vieja', mascara=0, mascara_riesgo=0, confianzas={})
+
+        assert MatrizConflictos.asegurar() == len(DESCRIPCIONES)
+        assert MatrizRestriccionProducto.objects.filter(version=MatrizConflictos.version()).count() == len(DESCRIPCIONES)
+
+    def test_carrito(self, tarjeta, hijo, productos_restriccion):
+        """Test: analizar_carrito da las mismas alertas que producto x restricción"""
+        restricciones = [_restriccion(hijo, 'Intolerancia a la lactosa'), _restriccion(hijo, 'Celíaco', 'sin harina')]
+        items = [{'producto': p, 'cantidad': 1} for p in productos_restriccion.values()]
+
+        resultado = ProductoRestriccionMatcher.analizar_carrito(items, tarjeta)
+
+        esperadas = [
+            (item['producto'].id_producto, r.tipo_restriccion, analizar_palabra_por_palabra(
+                item['producto'].descripcion, 'Bebidas', r.tipo_restriccion, r.observaciones
+            ))
+            for item in items for r in restricciones
+        ]
+        esperadas = [(pid, tipo, razon, confianza) for pid, tipo, (conflicto, razon, confianza) in esperadas if conflicto]
+        assert [
+            (a['producto'].id_producto, a['restriccion'].tipo_restriccion, a['razon'], a['nivel_confianza'])
+            for a in resultado['alertas']
+        ] == esperadas
+        assert resultado['tiene_alertas'] and resultado['requiere_autorizacion']
+
+    def test_carrito_consultas_constantes(self, tarjeta, hijo, productos_restriccion):
+        """Test: Las consultas no crecen con la cantidad de productos del carrito"""
+        _restriccion(hijo, 'Vegano')
+        _restriccion(hijo, 'Diabetes')
+        MatrizConflictos.recalcular()
+        items = [{'producto_id': p.id_producto, 'cantidad': 1} for p in productos_restriccion.values()]
+
+        with CaptureQueriesContext(connection) as pocos:
+            verificar_restricciones_venta(tarjeta, items[:2])
+        with CaptureQueriesContext(connection) as todos:
+            resultado = verificar_restricciones_venta(tarjeta, items)
+
+        assert len(todos) == len(pocos) == 3
+        assert resultado['tiene_alertas']
+
+    def test_productos_seguros(self, hijo, productos_restriccion):
+        """Test: filtrar_seguros devuelve los productos sin conflicto, también con observaciones"""
+        restricciones = [_restriccion(hijo, 'Intolerancia a la lactosa'), _restriccion(hijo, 'Alergia al maní', 'sin mani')]
+
+        seguros = set(MatrizConflictos.filtrar_seguros(Producto.objects.all(), restricciones).values_list('descripcion', flat=True))
+
+        esperados = {
+            d for d in DESCRIPCIONES
+            if not any(analizar_palabra_por_palabra(d, 'Bebidas', r.tipo_restriccion, r.observaciones)[0] for r in restricciones)
+        }
+        assert seguros == esperados
+        assert 'Mantequilla de maní crocante' not in seguros and 'Agua mineral' in seguros
+
+    def test_seguros_asegura_una_vez(self, hijo, productos_restriccion, django_capture_on_commit_callbacks):
+        """Test: Con la versión ya completada, filtrar_seguros no vuelve a buscar desactualizados"""
+        restricciones = [_restriccion(hijo, 'Intolerancia a la lactosa')]
+        with django_capture_on_commit_callbacks(execute=True):
+            MatrizConflictos.filtrar_seguros(Producto.objects.all(), restricciones)
+
+        with CaptureQueriesContext(connection) as consultas:
+            MatrizConflictos.filtrar_seguros(Producto.objects.all(), restricciones)
+
+        assert len(consultas) == 0
+        assert MatrizConflictos._version_asegurada == MatrizConflictos.version()
+
+    def test_observaciones_alcanzan_el_umbral(self, hijo, productos_restriccion):
+        """Test: Si las observaciones solas suman 50 ningún producto es seguro"""
+        restriccion = _restriccion(hijo, 'Intolerancia a la lactosa', 'leche, queso, crema, yogur')
+
+        assert not MatrizConflictos.filtrar_seguros(Producto.objects.all(), [restriccion]).exists()
+
+    def test_tipo_sin_palabras_clave(self, hijo, productos_restriccion):
+        """Test: Una restricción de tipo desconocido no filtra productos"""
+        restriccion = _restriccion(hijo, 'Kosher')
+
+        assert MatrizConflictos.filtrar_seguros(Producto.objects.all(), [restriccion]).count() == len(DESCRIPCIONES)
+
+    def test_verificador_pos(self, hijo, productos_restriccion):
+        """Test: VerificadorRestricciones usa la matriz con la severidad del POS"""
+        _restriccion(hijo, 'Vegetariano')
+        producto = productos_restriccion['Milanesa de pollo con papas fritas']
+
+        resultado = VerificadorRestricciones.verificar_carrito(hijo, [{'id_producto': producto.id_producto}, {'id_producto': 999999}])
+
+        alerta, = resultado['alertas']
+        assert (alerta['confianza'], alerta['severidad']) == (60, 'BAJA')
+        assert producto not in VerificadorRestricciones.obtener_productos_seguros(hijo, limite=50)
+
+    def test_ids_del_json_como_texto(self, hijo, productos_restriccion):
+        """Test: Un id_producto que llega como texto en el JSON se verifica igual que el numérico"""
+        _restriccion(hijo, 'Vegetariano')
+        producto = productos_restriccion['Milanesa de pollo con papas fritas']
+
+        resultado = VerificadorRestricciones.verificar_carrito(hijo, [{'id_producto': str(producto.id_producto)}])
+        respuesta = json.loads(verificar_restricciones_carrito_api(RequestFactory().post(
+            '/', data=json.dumps({'id_hijo': hijo.id_hijo, 'productos': [{'id_producto': str(producto.id_producto)}]}),
+            content_type='application/json'
+        )).content)
+
+        assert [a['id_producto'] for a in resultado['alertas']] == [producto.id_producto]
+        assert [a['id_producto'] for a in respuesta['alertas']] == [producto.id_producto]
+
+    def test_id_invalido_rechazado(self, hijo, productos_restriccion):
+        """Test: Un id_producto no numérico se rechaza en vez de romper la consulta"""
+        _restriccion(hijo, 'Vegetariano')
+
+        with pytest.raises(ValueError, match='ID de producto'):
+            VerificadorRestricciones.verificar_carrito(hijo, [{'id_producto': 'abc'}])
+        respuesta = verificar_restricciones_carrito_api(RequestFactory().post(
+            '/', data=json.dumps({'id_hijo': hijo.id_hijo, 'productos': [{'id_producto': 'abc'}]}),
+            content_type='application/json'
+        ))
+        assert respuesta.status_code == 400
+
+    @pytest.mark.slow
+    def test_benchmark_carrito_y_seguros(self, hijo, categoria, unidad_medida, impuesto):
+        """Benchmark: 2.000 productos x 3 restricciones, análisis en Python vs. matriz"""
+        print("\n📊 BENCHMARK: Productos seguros y carrito de 20 ítems (2.000 productos, 3 restricciones)")
+        Producto.objects.bulk_create([
+            Producto(
+                codigo_barra=f'B{i:05d}', descripcion=f'{DESCRIPCIONES[i % len(DESCRIPCIONES)]} {i}',
+                id_categoria=categoria, id_unidad_medida=unidad_medida, id_impuesto=impuesto, activo=True
+            )
+            for i in range(2000)
+        ])
+        restricciones = [
+            _restriccion(hijo, 'Intolerancia a la lactosa'), _restriccion(hijo, 'Celíaco', 'sin harina'),
+            _restriccion(hijo, 'Diabetes'),
+        ]
+        productos = list(Producto.objects.select_related('id_categoria'))
+        MatrizConflictos.recalcular()
+
+        inicio = time.perf_counter()
+        seguros_antes = [
+            p.id_producto for p in productos
+            if not any(ProductoRestriccionMatcher.analizar_producto(p, r)[0] for r in restricciones)
+        ]
+        antes = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        seguros = list(MatrizConflictos.filtrar_seguros(Producto.objects.all(), restricciones).values_list('id_producto', flat=True))
+        despues = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        MatrizConflictos.conflictos([p.id_producto for p in productos[:20]], restricciones)
+        carrito = time.perf_counter() - inicio
+
+        print(f"   Productos seguros, analizar_producto: {antes * 1000:.0f} ms")
+        print(f"   Productos seguros, máscara en SQL:    {despues * 1000:.0f} ms")
+        print(f"   Carrito de 20 ítems con la matriz:   {carrito * 1000:.1f} ms")
+        assert sorted(seguros) == sorted(seguros_antes)
+        assert despues < antes
@@ -0,0 +1,164 @@
+"""
+Tests del resumen cacheado del portal de padres (resumen_familia.ResumenFamilia)
+Incluye benchmark de portal_dashboard_view
+"""
+
+import time
+from decimal import Decimal
+
+import pytest
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from gestion import cliente_views
+from gestion.cliente_views import portal_dashboard_view
+from gestion.models import CargasSaldo, Cliente, Hijo, RegistroConsumoAlmuerzo, Tarjeta
+from gestion.resumen_familia import ResumenFamilia
+from pos.models import Venta
+
+
+@pytest.fixture
+def familia(cliente, tarjeta, django_capture_on_commit_callbacks):
+    """Cliente con dos hijos (uno sin tarjeta), un almuerzo y una recarga confirmada"""
+    with django_capture_on_commit_callbacks(execute=True):
+        Hijo.objects.create(id_cliente_responsable=cliente, nombre='Beto', apellido='Pérez', activo=True)
+        RegistroConsumoAlmuerzo.objects.create(id_hijo=tarjeta.id_hijo, costo_almuerzo=Decimal('15000'))
+        CargasSaldo.objects.create(
+            nro_tarjeta=tarjeta, id_cliente_origen=cliente, fecha_carga=timezone.now(),
+            monto_cargado=Decimal('30000'), estado='CONFIRMADO'
+        )
+        CargasSaldo.objects.create(
+            nro_tarjeta=tarjeta, id_cliente_origen=cliente, fecha_carga=timezone.now(),
+            monto_cargado=Decimal('99000'), estado='PENDIENTE'
+        )
+    return cliente
+
+
+def _venta(cliente, hijo, tipo_pago, empleado, monto):
+    return Venta.objects.create(
+        id_cliente=cliente, id_hijo=hijo, id_tipo_pago=tipo_pago, id_empleado_cajero=empleado,
+        fecha=timezone.now(), monto_total=monto, estado_pago='PAGADA', estado='PROCESADO', tipo_venta='CONTADO',
+    )
+
+
+@pytest.mark.django_db
+class TestResumenFamilia:
+    """Tests de cálculo, cache e invalidación"""
+
+    def test_resumen(self, familia, tarjeta, tipo_pago, empleado):
+        """Test: Totales y movimientos del cliente en cuatro consultas"""
+        _venta(familia, tarjeta.id_hijo, tipo_pago, empleado, 7000)
+
+        with CaptureQueriesContext(connection) as consultas:
+            resumen = ResumenFamilia.calcular(familia.id_cliente)
+
+        assert len(consultas) == 4
+        assert resumen['cliente']['nombres'] == familia.nombres
+        assert (resumen['total_hijos'], resumen['saldo_total'], resumen['almuerzos_mes'], resumen['recargas_mes']) == (
+            2, Decimal('50000'), 1, Decimal('30000')
+        )
+        assert [(h['nombres'], h['saldo']) for h in resumen['hijos']] == [('Ana', Decimal('50000')), ('Beto', None)]
+        assert [(t['tipo'], t['monto'], t['hijo']) for t in resumen['ultimas_transacciones']] == [
+            ('consumo', -7000, 'Ana'), ('recarga', Decimal('30000'), 'Ana')
+        ]
+
+    def test_cliente_inexistente(self, db):
+        """Test: Un cliente que no existe no tiene resumen"""
+        assert ResumenFamilia.obtener(999999) is None
+
+    def test_sirve_desde_el_cache(self, familia):
+        """Test: La segunda visita no consulta la base"""
+        primera = ResumenFamilia.obtener(familia.id_cliente)
+
+        with CaptureQueriesContext(connection) as consultas:
+            segunda = ResumenFamilia.obtener(familia.id_cliente)
+
+        assert len(consultas) == 0 and segunda == primera
+
+    def test_venta_invalida(self, familia, tarjeta, tipo_pago, empleado, django_capture_on_commit_callbacks):
+        """Test: Una venta a un hijo invalida el resumen de su responsable"""
+        ResumenFamilia.obtener(familia.id_cliente)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            _venta(familia, tarjeta.id_hijo, tipo_pago, empleado, 4000)
+            tarjeta.saldo_actual = Decimal('46000')
+            tarjeta.save()
+
+        resumen = ResumenFamilia.obtener(familia.id_cliente)
+        assert resumen['saldo_total'] == Decimal('46000')
+        assert resumen['ultimas_transacciones'][0]['monto'] == -4000
+
+    def test_almuerzo_y_recarga_invalidan(self, familia, tarjeta, django_capture_on_commit_callbacks):
+        """Test: Almuerzos y recargas resuelven el cliente por hijo o tarjeta al confirmar"""
+        ResumenFamilia.obtener(familia.id_cliente)
+        beto = Hijo.objects.get(nombre='Beto')
+
+        with django_capture_on_commit_callbacks(execute=True):
+            RegistroConsumoAlmuerzo.objects.create(id_hijo=beto, costo_almuerzo=Decimal('15000'))
+        assert ResumenFamilia.obtener(familia.id_cliente)['almuerzos_mes'] == 2
+
+        with django_capture_on_commit_callbacks(execute=True):
+            # Recarga registrada por el POS: sin cliente de origen, se resuelve por la tarjeta.
+            # El saldo lo mueve el trigger de MySQL, sin signal de Tarjeta
+            Tarjeta.objects.filter(pk=tarjeta.pk).update(saldo_actual=Decimal('55000'))
+            CargasSaldo.objects.create(
+                nro_tarjeta=tarjeta, fecha_carga=timezone.now(), monto_cargado=Decimal('5000'), estado='CONFIRMADO'
+            )
+        assert ResumenFamilia.obtener(familia.id_cliente)['saldo_total'] == Decimal('55000')
+
+    def test_no_invalida_otras_familias(self, familia, tipo_cliente, lista_precios, django_capture_on_commit_callbacks):
+        """Test: Los movimientos de otro cliente no borran este resumen"""
+        ResumenFamilia.obtener(familia.id_cliente)
+        otro = Cliente.objects.create(
+            id_tipo_cliente=tipo_cliente, id_lista=lista_precios, nombres='Marta', apellidos='Gómez',
+            ruc_ci='7654321', telefono='0981000000', activo=True
+        )
+
+        with django_capture_on_commit_callbacks(execute=True):
+            Hijo.objects.create(id_cliente_responsable=otro, nombre='Lía', apellido='Gómez', activo=True)
+
+        with CaptureQueriesContext(connection) as consultas:
+            ResumenFamilia.obtener(familia.id_cliente)
+        assert len(consultas) == 0
+
+    def test_vista(self, familia, monkeypatch):
+        """Test: El dashboard del portal se arma desde el resumen"""
+        contextos = []
+        monkeypatch.setattr(cliente_views, 'render', lambda request, plantilla, contexto: contextos.append(contexto))
+        ResumenFamilia.obtener(familia.id_cliente)
+
+        request = RequestFactory().get('/clientes/', HTTP_USER_AGENT='Firefox')
+        request.session = {'cliente_id': familia.id_cliente, 'cliente_usuario': 'jperez'}
+        request._messages = FallbackStorage(request)
+        with CaptureQueriesContext(connection) as consultas:
+            portal_dashboard_view(request)
+
+        assert len(consultas) == 0
+        assert contextos[0]['total_hijos'] == 2 and contextos[0]['recargas_mes'] == Decimal('30000')
+
+    @pytest.mark.slow
+    def test_benchmark_dashboard(self, familia, tarjeta, tipo_pago, empleado):
+        """Benchmark: 300 visitas al dashboard del portal, calculando vs. desde el cache"""
+        print("\n📊 BENCHMARK: Resumen del portal de padres (300 visitas)")
+        for monto in range(1000, 21000, 1000):
+            _venta(familia, tarjeta.id_hijo, tipo_pago, empleado, monto)
+
+        inicio = time.perf_counter()
+        with CaptureQueriesContext(connection) as sin_cache:
+            for _ in range(300):
+                ResumenFamilia.calcular(familia.id_cliente)
+        calculado = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        with CaptureQueriesContext(connection) as con_cache:
+            for _ in range(300):
+                ResumenFamilia.obtener(familia.id_cliente)
+        cacheado = time.perf_counter() - inicio
+
+        print(f"   Calculando cada vez: {calculado * 1000:.0f} ms, {len(sin_cache)} consultas")
+        print(f"   Desde el cache:      {cacheado * 1000:.0f} ms, {len(con_cache)} consultas")
+        assert len(con_cache) == 4
+        assert cacheado < calculado
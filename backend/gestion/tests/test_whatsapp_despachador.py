@@ -0,0 +1,186 @@
+"""
+Tests del despacho masivo de WhatsApp (whatsapp_client.DespachadorWhatsApp)
+Usa un stub HTTP local de /status y /send-bulk del whatsapp-server
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from gestion.bandeja_salida import BandejaSalida, RemitenteWhatsApp, WHATSAPP
+from gestion.models import MensajeSaliente
+from gestion.whatsapp_client import ENTREGA_INCIERTA, DespachadorWhatsApp, WhatsAppWebClient
+
+
+class ServidorStub:
+    """Estado compartido del stub: requests recibidos y concurrencia máxima"""
+
+    def __init__(self):
+        self.listo = True
+        self.fallar_lote_con = None
+        self.rechazar = set()
+        self.demora = 0
+        self.consultas_estado = 0
+        self.lotes = []
+        self.en_curso = 0
+        self.max_en_curso = 0
+        self.lock = threading.Lock()
+
+
+@pytest.fixture
+def stub():
+    estado = ServidorStub()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _responder(self, codigo, datos):
+            cuerpo = json.dumps(datos).encode()
+            try:
+                self.send_response(codigo)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # El cliente ya cortó por timeout
+
+        def do_GET(self):
+            with estado.lock:
+                estado.consultas_estado += 1
+            self._responder(200, {'ready': estado.listo})
+
+        def do_POST(self):
+            recipients = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['recipients']
+            telefonos = [r['phone'] for r in recipients]
+            with estado.lock:
+                estado.lotes.append(telefonos)
+                estado.en_curso += 1
+                estado.max_en_curso = max(estado.max_en_curso, estado.en_curso)
+            time.sleep(estado.demora)
+            with estado.lock:
+                estado.en_curso -= 1
+
+            if estado.fallar_lote_con in telefonos:
+                self._responder(500, {'success': False, 'error': 'Error interno'})
+                return
+            results = [
+                {'phone': t, 'success': False, 'error': 'Número inválido'} if t in estado.rechazar
+                else {'phone': t, 'success': True, 'messageId': f'id-{t}'}
+                for t in telefonos
+            ]
+            self._responder(200, {'success': True, 'total': len(results), 'results': results})
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    estado.url = f'http://127.0.0.1:{servidor.server_address[1]}'
+    yield estado
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def _destinatarios(cantidad):
+    return [{'phone': f'+595 981-{i:06d}', 'message': f'Hola {i}'} for i in range(cantidad)]
+
+
+class TestDespachadorWhatsApp:
+    """Tests de lotes, concurrencia y resultados por destinatario"""
+
+    def test_lotes_concurrentes_y_resultados_en_orden(self, stub):
+        """Test: Parte en lotes acotados, los envía en paralelo y responde por destinatario"""
+        stub.demora = 0.1
+        stub.rechazar = {'595981000007'}
+        despachador = DespachadorWhatsApp(WhatsAppWebClient(stub.url), tamano_lote=10, concurrencia=3)
+
+        resultados = despachador.enviar(_destinatarios(45))
+
+        assert sorted(len(lote) for lote in stub.lotes) == [5, 10, 10, 10, 10]
+        assert stub.max_en_curso == 3
+        assert stub.consultas_estado == 1
+        assert [r['phone'] for r in resultados] == [d['phone'] for d in _destinatarios(45)]
+        assert [r for r in resultados if not r['success']] == [
+            {'phone': '+595 981-000007', 'success': False, 'error': 'Número inválido'}
+        ]
+
+    def test_estado_cacheado_entre_envios(self, stub):
+        """Test: Envíos seguidos no vuelven a consultar /status"""
+        client = WhatsAppWebClient(stub.url)
+        despachador = DespachadorWhatsApp(client, tamano_lote=5, concurrencia=1)
+
+        despachador.enviar(_destinatarios(3))
+        despachador.enviar(_destinatarios(3))
+        client.send_message('+595981000001', 'hola')
+
+        assert stub.consultas_estado == 1
+
+    def test_fallo_de_lote_no_afecta_a_los_demas(self, stub):
+        """Test: Un lote con error HTTP marca sólo a sus destinatarios y fuerza revisar /status"""
+        stub.fallar_lote_con = '595981000012'
+        client = WhatsAppWebClient(stub.url)
+
+        resultados = DespachadorWhatsApp(client, tamano_lote=10, concurrencia=2).enviar(_destinatarios(25))
+
+        fallidos = [i for i, r in enumerate(resultados) if not r['success']]
+        assert fallidos == list(range(10, 20))
+        assert client._estado is None
+
+    def test_servidor_no_listo(self, stub):
+        """Test: Sin sesión de WhatsApp no se llama a /send-bulk"""
+        stub.listo = False
+
+        resultados = DespachadorWhatsApp(WhatsAppWebClient(stub.url)).enviar(_destinatarios(4))
+
+        assert stub.lotes == []
+        assert all(r['error'] == 'WhatsApp no conectado' for r in resultados)
+
+    def test_send_bulk_agrega_resultados(self, stub):
+        """Test: send_bulk conserva el formato de respuesta del servidor"""
+        stub.rechazar = {'595981000001'}
+
+        resultado = WhatsAppWebClient(stub.url).send_bulk(_destinatarios(3))
+
+        assert resultado['total'] == 3
+        assert resultado['successCount'] == 2 and resultado['errorCount'] == 1
+        assert len(resultado['results']) == 3
+
+
+@pytest.mark.django_db
+class TestRemitenteWhatsApp:
+    """Tests de la bandeja de salida entregando por /send-bulk"""
+
+    def test_bandeja_entrega_por_send_bulk(self, stub, monkeypatch):
+        """Test: La bandeja marca ENVIADO o reintento según el resultado de cada destinatario"""
+        monkeypatch.setattr('gestion.bandeja_salida.despertar_worker', lambda: None)
+        stub.rechazar = {'0981000002'}
+        for i in range(4):
+            BandejaSalida.encolar(WHATSAPP, f'098100000{i}', 'Saldo bajo')
+        remitente = RemitenteWhatsApp(DespachadorWhatsApp(WhatsAppWebClient(stub.url), concurrencia=1))
+
+        resultado = BandejaSalida.procesar_pendientes(canales=[WHATSAPP], remitentes={WHATSAPP: remitente})
+
+        assert resultado == {'enviados': 3, 'reintentos': 1, 'errores': 0}
+        assert MensajeSaliente.objects.get(destinatario='0981000002').ultimo_error == 'Número inválido'
+
+    def test_timeout_no_reintenta(self, stub, monkeypatch):
+        """Test: Un lote sin respuesta a tiempo pasa a ERROR sin reintento (pudo haberse enviado)"""
+        monkeypatch.setattr('gestion.bandeja_salida.despertar_worker', lambda: None)
+        monkeypatch.setattr('gestion.whatsapp_client.SEGUNDOS_POR_MENSAJE', 0.05)
+        monkeypatch.setattr('gestion.whatsapp_client.MARGEN_TIMEOUT_BULK', 0)
+        stub.demora = 0.5
+        for i in range(2):
+            BandejaSalida.encolar(WHATSAPP, f'098100000{i}', 'Saldo bajo')
+        client = WhatsAppWebClient(stub.url)
+        remitente = RemitenteWhatsApp(DespachadorWhatsApp(client, concurrencia=1))
+
+        resultado = BandejaSalida.procesar_pendientes(canales=[WHATSAPP], remitentes={WHATSAPP: remitente})
+
+        assert resultado == {'enviados': 0, 'reintentos': 0, 'errores': 2}
+        assert set(MensajeSaliente.objects.values_list('estado', 'ultimo_error')) == {('ERROR', ENTREGA_INCIERTA)}
+        assert client._estado is None
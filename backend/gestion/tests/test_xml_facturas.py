@@ -0,0 +1,227 @@
+"""
+Tests de la generación de XML SET y CDC (facturacion_electronica)
+Incluye benchmark de generación en lote
+"""
+
+import hashlib
+import time
+from decimal import Decimal
+from xml.etree import ElementTree as ET
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from gestion.facturacion_electronica import (
+    NS_SET, GeneradorLoteFacturas, GeneradorXMLFactura, calcular_cdc
+)
+from gestion.models import DatosEmpresa, DocumentosTributarios, PuntosExpedicion, Timbrados
+from pos.models import DetalleVenta, Venta
+
+NS = {'s': NS_SET}
+
+
+@pytest.fixture
+def empresa():
+    return DatosEmpresa.objects.create(
+        id_empresa=1, ruc='80012345-6', razon_social='Cantina Escolar & Cía',
+        direccion='Mcal. López 123, Asunción', telefono='021555000', email='cantina@colegio.edu.py',
+    )
+
+
+@pytest.fixture
+def crear_ventas(cliente, empleado, tipo_pago, productos_con_stock, timbrado):
+    """
+    Crea `cantidad` ventas con factura legal de `lineas` ítems cada una
+
+    Como procesar_venta, nro_factura_venta guarda el id_documento; los
+    nro_secuencial empiezan en 101 para no coincidir con el id.
+    """
+    def crear(cantidad, lineas=3, timbrado_venta=None):
+        monto = 5000 * 2 * lineas
+        timbrado_venta = timbrado_venta or timbrado
+        ultimo = DocumentosTributarios.objects.filter(nro_timbrado=timbrado_venta).count()
+        documentos = [
+            DocumentosTributarios.objects.create(
+                nro_timbrado=timbrado_venta, nro_secuencial=101 + ultimo + i,
+                fecha_emision=timezone.now(), monto_total=monto,
+            )
+            for i in range(cantidad)
+        ]
+        Venta.objects.bulk_create([
+            Venta(
+                id_cliente=cliente, id_tipo_pago=tipo_pago, id_empleado_cajero=empleado,
+                nro_factura_venta=documento.id_documento, fecha=timezone.now(), monto_total=monto,
+                estado_pago='PAGADA', estado='PROCESADO', tipo_venta='CONTADO', genera_factura_legal=True,
+            )
+            for documento in documentos
+        ])
+        ventas = list(Venta.objects.order_by('-id_venta')[:cantidad])[::-1]
+        DetalleVenta.objects.bulk_create([
+            DetalleVenta(
+                id_venta=venta, id_producto=producto, cantidad=Decimal('2'),
+                precio_unitario=5000, subtotal_total=10000,
+            )
+            for venta in ventas
+            for producto in productos_con_stock[:lineas]
+        ])
+        return ventas
+    return crear
+
+
+@pytest.mark.django_db
+class TestGeneradorXMLFactura:
+    """Tests de estructura del XML, CDC y consultas"""
+
+    def test_xml_y_cdc(self, empresa, timbrado, crear_ventas):
+        """Test: El XML tiene los valores de la venta y el CDC sale de los mismos valores"""
+        venta, = crear_ventas(1)
+        generador = GeneradorXMLFactura(venta)
+
+        raiz = ET.fromstring(generador.generar_xml())
+        ide = raiz.find('s:dEmisin/s:Ide', NS)
+        assert ide.findtext('s:RUC', namespaces=NS) == '80012345-6'
+        assert ide.findtext('s:NroTimbrado', namespaces=NS) == '12345678'
+        assert ide.findtext('s:Establecimiento', namespaces=NS) == '001'
+        assert ide.findtext('s:PuntoExpedicion', namespaces=NS) == '001'
+        assert ide.findtext('s:NroSecuencial', namespaces=NS) == '0000101'
+        assert ide.findtext('s:CantLinItem', namespaces=NS) == '3'
+        assert raiz.findtext('s:dEmisin/s:Receptor/s:IdRec/s:RUC', namespaces=NS) == '1234567'
+        assert raiz.findtext('s:dEmisin/s:Totales/s:dTotMnt', namespaces=NS) == '30000'
+        assert len(raiz.findall('s:dEmisin/s:Items/s:Item', NS)) == 3
+
+        fecha = timezone.localtime(venta.fecha).strftime('%Y-%m-%d')
+        esperado = hashlib.sha256(
+            f'80012345-61123456780000101330000{fecha}'.encode()
+        ).hexdigest()[:44].upper()
+        assert generador.generar_cdc() == esperado
+        assert len(esperado) == 44
+        assert calcular_cdc('80012345-6', '1', 12345678, '0000101', 3, 30000, fecha) == esperado
+
+    def test_escapa_texto(self, empresa, timbrado, crear_ventas):
+        """Test: Caracteres especiales en razón social y descripciones quedan escapados"""
+        venta, = crear_ventas(1, lineas=1)
+        producto = venta.detalles.get().id_producto
+        producto.descripcion = 'Jugo <Naranja> & Pera'
+        producto.save()
+
+        xml = GeneradorXMLFactura(venta).generar_xml()
+
+        assert 'Cantina Escolar &amp; Cía' in xml
+        raiz = ET.fromstring(xml)
+        assert raiz.findtext('s:dEmisin/s:Items/s:Item/s:dSc', namespaces=NS) == 'Jugo <Naranja> & Pera'
+
+    def test_emisor_cacheado(self, empresa, timbrado, crear_ventas):
+        """Test: La empresa se consulta una vez; el documento con su timbrado, en una consulta por factura"""
+        ventas = crear_ventas(3, lineas=1)
+        GeneradorXMLFactura(ventas[0])
+
+        with CaptureQueriesContext(connection) as consultas:
+            for venta in ventas[1:]:
+                GeneradorXMLFactura(venta).generar_xml()
+
+        sql = [q['sql'] for q in consultas.captured_queries]
+        assert not any('datos_empresa' in q for q in sql)
+        assert sum('documentos_tributarios' in q for q in sql) == 2
+
+    def test_timbrado_del_documento(self, empresa, timbrado, crear_ventas):
+        """Test: Una venta vieja conserva el timbrado y el número con que se emitió"""
+        venta_vieja, = crear_ventas(1)
+        timbrado.activo = False
+        timbrado.save()
+        punto = PuntosExpedicion.objects.create(codigo_establecimiento='002', codigo_punto_expedicion='003')
+        nuevo = Timbrados.objects.create(
+            nro_timbrado=87654321, id_punto=punto, tipo_documento='Factura', fecha_inicio=timezone.now().date(),
+            fecha_fin=timezone.now().date(), nro_inicial=1, nro_final=999999, activo=True,
+        )
+        venta_nueva, = crear_ventas(1, timbrado_venta=nuevo)
+
+        lote = {id_venta: xml for id_venta, _, xml in GeneradorLoteFacturas.generar(Venta.objects.all())}
+
+        ide_vieja = ET.fromstring(lote[venta_vieja.id_venta]).find('s:dEmisin/s:Ide', NS)
+        ide_nueva = ET.fromstring(lote[venta_nueva.id_venta]).find('s:dEmisin/s:Ide', NS)
+        assert (ide_vieja.findtext('s:NroTimbrado', namespaces=NS), ide_vieja.findtext('s:NroSecuencial', namespaces=NS)) == (
+            '12345678', '0000101'
+        )
+        assert [ide_nueva.findtext(f's:{campo}', namespaces=NS) for campo in (
+            'NroTimbrado', 'Establecimiento', 'PuntoExpedicion', 'NroSecuencial'
+        )] == ['87654321', '002', '003', '0000101']
+
+    def test_sin_documento_tributario(self, empresa, timbrado, crear_ventas):
+        """Test: Una venta sin documento tributario no se factura con un número inventado"""
+        venta, = crear_ventas(1)
+        Venta.objects.filter(pk=venta.pk).update(nro_factura_venta=None)
+        venta.refresh_from_db()
+
+        with pytest.raises(ValueError, match='documento tributario'):
+            GeneradorXMLFactura(venta)
+
+    def test_sin_empresa(self, timbrado, crear_ventas):
+        """Test: Sin datos de la empresa no se genera el documento"""
+        venta, = crear_ventas(1)
+        with pytest.raises(ValueError, match='empresa'):
+            GeneradorXMLFactura(venta)
+
+
+@pytest.mark.django_db
+class TestGeneradorLoteFacturas:
+    """Tests de generación en lote"""
+
+    def test_lote_coincide_con_individual(self, empresa, timbrado, crear_ventas):
+        """Test: El lote produce el mismo XML y CDC que el generador por venta"""
+        ventas = crear_ventas(4)
+
+        lote = list(GeneradorLoteFacturas.generar(Venta.objects.all(), tamano_lote=3))
+
+        assert [id_venta for id_venta, _, _ in lote] == [v.id_venta for v in ventas]
+        for venta, (_, cdc, xml) in zip(ventas, lote):
+            generador = GeneradorXMLFactura(venta)
+            assert cdc == generador.generar_cdc()
+            assert xml.decode('utf-8') == generador.generar_xml()
+
+    def test_consultas_por_bloque(self, empresa, timbrado, crear_ventas):
+        """Test: Las consultas dependen de la cantidad de bloques, no de ventas"""
+        crear_ventas(10)
+
+        with CaptureQueriesContext(connection) as consultas:
+            cantidad = sum(1 for _ in GeneradorLoteFacturas.generar(Venta.objects.all(), tamano_lote=5))
+
+        assert cantidad == 10
+        # empresa + ventas + (detalles + documentos) de 2 bloques
+        assert len(consultas) == 6
+
+    def test_escribe_directorio(self, empresa, timbrado, crear_ventas, tmp_path):
+        """Test: Un archivo <cdc>.xml válido por venta"""
+        crear_ventas(3)
+
+        resumen = GeneradorLoteFacturas.escribir_directorio(Venta.objects.all(), tmp_path / 'xml')
+
+        archivos = sorted((tmp_path / 'xml').glob('*.xml'))
+        assert resumen['documentos'] == 3 and len(archivos) == 3
+        assert sorted(f'{cdc}.xml' for cdc in resumen['cdcs'].values()) == [a.name for a in archivos]
+        assert resumen['bytes'] == sum(a.stat().st_size for a in archivos)
+        ET.parse(archivos[0])
+
+    @pytest.mark.slow
+    def test_benchmark_lote(self, empresa, timbrado, crear_ventas, tmp_path):
+        """Benchmark: 1000 facturas de 3 ítems, por venta vs. en lote"""
+        print("\n📊 BENCHMARK: Generación de XML SET (1000 facturas)")
+        ventas = crear_ventas(1000)
+
+        inicio = time.perf_counter()
+        with CaptureQueriesContext(connection) as consultas_individual:
+            for venta in ventas:
+                generador = GeneradorXMLFactura(venta)
+                generador.generar_cdc(generador.generar_xml())
+        individual = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        with CaptureQueriesContext(connection) as consultas_lote:
+            resumen = GeneradorLoteFacturas.escribir_directorio(Venta.objects.all(), tmp_path)
+        lote = time.perf_counter() - inicio
+
+        print(f"   Por venta: {individual * 1000:.0f} ms, {len(consultas_individual)} consultas")
+        print(f"   En lote:   {lote * 1000:.0f} ms, {len(consultas_lote)} consultas")
+        assert resumen['documentos'] == 1000
+        assert len(consultas_lote) < 10
@@ -529,8 +529,9 @@ def dashboard_stock_detalle(request):
 @login_required
 def invalidar_cache_dashboard(request):
     """Invalidar cache del dashboard"""
-    from django.core.cache import cache
-    cache.clear()
+    from .cache_reportes import invalidar_cache_dashboard as invalidar_espacio_dashboard
+    # Sólo el espacio del dashboard: cache.clear() borraba también rate limits y contadores
+    invalidar_espacio_dashboard()
     messages.success(request, 'Cache del dashboard invalidado exitosamente')
     return redirect('dashboard_unificado')
 
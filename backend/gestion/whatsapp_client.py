@@ -13,11 +13,29 @@ Fecha: 2026-01-10
 
 import requests
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
+from requests.adapters import HTTPAdapter
 from typing import Dict, List, Optional, Any
 
 logger = logging.getLogger(__name__)
 
+# Segundos que se reutiliza el resultado de /status
+TTL_ESTADO_SEGUNDOS = 15
+# Destinatarios por request a /send-bulk
+TAMANO_LOTE_BULK = 25
+# Peor caso por destinatario de /send-bulk: el servidor envía de a uno
+# (sendMessage) y espera 2-3 s después de cada mensaje
+SEGUNDOS_POR_MENSAJE = 5
+# Margen fijo del timeout de /send-bulk
+MARGEN_TIMEOUT_BULK = 10
+# Error de un lote sin respuesta a tiempo: los mensajes pudieron haberse
+# enviado, así que no se reintentan (evita duplicados a los padres)
+ENTREGA_INCIERTA = 'Sin respuesta a tiempo del servidor: entrega desconocida'
+# Conexiones HTTP que mantiene abiertas cada cliente
+CONEXIONES_POOL = 10
+
 
 class WhatsAppWebClient:
     """
@@ -43,13 +61,23 @@ class WhatsAppWebClient:
             'http://localhost:3000'
         )
         self.timeout = 30  # Timeout para requests
+
+        # Sesión con conexiones keep-alive reutilizadas entre requests
+        self.session = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=CONEXIONES_POOL)
+        self.session.mount('http://', adaptador)
+        self.session.mount('https://', adaptador)
+
+        # Último resultado de /status: (listo, momento)
+        self._estado: Optional[tuple] = None
     
     def _make_request(
         self, 
         method: str, 
         endpoint: str, 
         data: Optional[Dict] = None,
-        timeout: Optional[int] = None
+        timeout: Optional[int] = None,
+        propagar_timeout: bool = False
     ) -> Optional[Dict[str, Any]]:
         """
         Realizar request HTTP al servidor WhatsApp
@@ -59,6 +87,7 @@ class WhatsAppWebClient:
             endpoint: Endpoint a llamar (ej: '/send')
             data: Datos a enviar (para POST)
             timeout: Timeout personalizado
+            propagar_timeout: Relanzar requests.exceptions.Timeout en lugar de devolver None
             
         Returns:
             Respuesta JSON del servidor o None si error
@@ -68,9 +97,9 @@ class WhatsAppWebClient:
             timeout = timeout or self.timeout
             
             if method.upper() == 'GET':
-                response = requests.get(url, timeout=timeout)
+                response = self.session.get(url, timeout=timeout)
             else:
-                response = requests.post(url, json=data, timeout=timeout)
+                response = self.session.post(url, json=data, timeout=timeout)
             
             if response.status_code in [200, 201]:
                 return response.json()
@@ -80,6 +109,8 @@ class WhatsAppWebClient:
                 
         except requests.exceptions.Timeout:
             logger.error(f"Timeout al conectar con servidor WhatsApp en {url}")
+            if propagar_timeout:
+                raise
             return None
         except requests.exceptions.ConnectionError:
             logger.error(f"No se pudo conectar con servidor WhatsApp en {url}")
@@ -88,26 +119,40 @@ class WhatsAppWebClient:
             logger.error(f"Error en request a {endpoint}: {str(e)}")
             return None
     
-    def check_status(self) -> bool:
+    def check_status(self, usar_cache: bool = True) -> bool:
         """
         Verificar si WhatsApp está conectado y listo
         
+        El resultado se reutiliza durante TTL_ESTADO_SEGUNDOS, así los envíos
+        seguidos no consultan /status antes de cada mensaje.
+        
+        Args:
+            usar_cache: False para consultar el servidor siempre
+        
         Returns:
             True si está conectado, False si no
         """
+        estado = self._estado
+        if usar_cache and estado and time.monotonic() - estado[1] < TTL_ESTADO_SEGUNDOS:
+            return estado[0]
+
         try:
             response = self._make_request('GET', '/status', timeout=5)
-            if response:
-                is_ready = response.get('ready', False)
-                if is_ready:
-                    logger.info("✅ WhatsApp conectado y listo")
-                else:
-                    logger.warning("⚠️ WhatsApp no está listo")
-                return is_ready
-            return False
+            is_ready = bool(response and response.get('ready', False))
+            if is_ready:
+                logger.info("✅ WhatsApp conectado y listo")
+            else:
+                logger.warning("⚠️ WhatsApp no está listo")
         except Exception as e:
             logger.error(f"Error verificando estado WhatsApp: {e}")
-            return False
+            is_ready = False
+
+        self._estado = (is_ready, time.monotonic())
+        return is_ready
+
+    def invalidar_estado(self):
+        """Olvida el estado cacheado (p.ej. tras un error de conexión)"""
+        self._estado = None
     
     def get_qr(self) -> Optional[str]:
         """
@@ -282,6 +327,9 @@ class WhatsAppWebClient:
         """
         Enviar múltiples mensajes
         
+        Los destinatarios se reparten en lotes de /send-bulk enviados en
+        paralelo (ver DespachadorWhatsApp).
+        
         Args:
             recipients: Lista de dicts con 'phone' y 'message'
                        Ejemplo: [
@@ -300,51 +348,16 @@ class WhatsAppWebClient:
             >>> result = client.send_bulk(recipients)
             >>> print(f"Enviados: {result['successCount']}/{result['total']}")
         """
-        try:
-            if not self.check_status():
-                logger.error("❌ WhatsApp no está conectado")
-                return {
-                    'success': False, 
-                    'error': 'WhatsApp no conectado',
-                    'total': len(recipients),
-                    'successCount': 0,
-                    'errorCount': len(recipients)
-                }
-            
-            # Timeout largo para envío masivo (5 seg por mensaje)
-            timeout = len(recipients) * 5 + 10
-            
-            response = self._make_request(
-                'POST',
-                '/send-bulk',
-                data={'recipients': recipients},
-                timeout=timeout
-            )
-            
-            if response:
-                logger.info(
-                    f"📊 Envío masivo completado: {response.get('successCount', 0)}"
-                    f"/{response.get('total', 0)} exitosos"
-                )
-                return response
-            else:
-                return {
-                    'success': False, 
-                    'error': 'Sin respuesta del servidor',
-                    'total': len(recipients),
-                    'successCount': 0,
-                    'errorCount': len(recipients)
-                }
-            
-        except Exception as e:
-            logger.error(f"❌ Error en envío masivo: {str(e)}")
-            return {
-                'success': False, 
-                'error': str(e),
-                'total': len(recipients),
-                'successCount': 0,
-                'errorCount': len(recipients)
-            }
+        results = DespachadorWhatsApp(self).enviar(recipients)
+        success_count = sum(1 for r in results if r['success'])
+        logger.info(f"📊 Envío masivo completado: {success_count}/{len(results)} exitosos")
+        return {
+            'success': success_count > 0 or not results,
+            'total': len(results),
+            'successCount': success_count,
+            'errorCount': len(results) - success_count,
+            'results': results,
+        }
     
     def get_available_templates(self) -> List[str]:
         """
@@ -363,11 +376,115 @@ class WhatsAppWebClient:
             return []
 
 
+# ============================================================================
+# DESPACHO MASIVO
+# ============================================================================
+
+class DespachadorWhatsApp:
+    """
+    Envío masivo por lotes concurrentes sobre un WhatsAppWebClient
+    
+    - Parte los destinatarios en lotes de `tamano_lote` para /send-bulk, cada
+      uno con un timeout acorde a su tamaño (no al total de la campaña)
+    - Envía hasta `concurrencia` lotes a la vez por la sesión del cliente
+    - Consulta /status una vez (cacheado) en lugar de antes de cada envío
+    - Devuelve un resultado por destinatario, en el orden recibido
+    """
+
+    def __init__(
+        self,
+        client: Optional[WhatsAppWebClient] = None,
+        tamano_lote: Optional[int] = None,
+        concurrencia: Optional[int] = None
+    ):
+        self.client = client or whatsapp_client
+        self.tamano_lote = max(1, tamano_lote or getattr(settings, 'WHATSAPP_TAMANO_LOTE', TAMANO_LOTE_BULK))
+        if concurrencia is None:
+            concurrencia = getattr(settings, 'MENSAJERIA_CONCURRENCIA', {}).get('WHATSAPP', 1)
+        self.concurrencia = max(1, int(concurrencia))
+
+    def enviar(self, destinatarios: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        """
+        Enviar mensajes a muchos destinatarios
+        
+        Args:
+            destinatarios: Lista de dicts con 'phone' y 'message'
+        
+        Returns:
+            Lista de dicts {'phone', 'success', 'error'} alineada con destinatarios
+        """
+        if not destinatarios:
+            return []
+
+        if not self.client.check_status():
+            logger.error("❌ WhatsApp no está conectado")
+            return [self._resultado(d, 'WhatsApp no conectado') for d in destinatarios]
+
+        lotes = [
+            destinatarios[i:i + self.tamano_lote]
+            for i in range(0, len(destinatarios), self.tamano_lote)
+        ]
+        if len(lotes) == 1 or self.concurrencia == 1:
+            parciales = [self._enviar_lote(lote) for lote in lotes]
+        else:
+            with ThreadPoolExecutor(
+                max_workers=min(self.concurrencia, len(lotes)),
+                thread_name_prefix='whatsapp-bulk'
+            ) as pool:
+                parciales = list(pool.map(self._enviar_lote, lotes))
+
+        return [resultado for parcial in parciales for resultado in parcial]
+
+    def _enviar_lote(self, lote: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        """
+        POST /send-bulk de un lote; un fallo del request marca todo el lote
+
+        Si vence el timeout el servidor pudo haber enviado parte del lote:
+        los destinatarios quedan con ENTREGA_INCIERTA en lugar de un error.
+        """
+        try:
+            response = self.client._make_request(
+                'POST',
+                '/send-bulk',
+                data={'recipients': [
+                    {'phone': self._limpiar(d['phone']), 'message': d['message']} for d in lote
+                ]},
+                timeout=len(lote) * SEGUNDOS_POR_MENSAJE + MARGEN_TIMEOUT_BULK,
+                propagar_timeout=True
+            )
+        except requests.exceptions.Timeout:
+            self.client.invalidar_estado()
+            return [self._resultado(d, ENTREGA_INCIERTA) for d in lote]
+        if not response:
+            # Puede haberse desconectado: la próxima campaña vuelve a consultar /status
+            self.client.invalidar_estado()
+            return [self._resultado(d, 'Sin respuesta del servidor') for d in lote]
+
+        # El servidor responde un resultado por destinatario, en el mismo orden
+        results = response.get('results') or []
+        resultados = []
+        for i, destinatario in enumerate(lote):
+            r = results[i] if i < len(results) else {}
+            resultados.append(self._resultado(
+                destinatario,
+                None if r.get('success') else r.get('error') or response.get('error') or 'Sin confirmación'
+            ))
+        return resultados
+
+    @staticmethod
+    def _limpiar(phone: str) -> str:
+        return phone.replace('+', '').replace(' ', '').replace('-', '')
+
+    @staticmethod
+    def _resultado(destinatario: Dict[str, str], error: Optional[str]) -> Dict[str, Any]:
+        return {'phone': destinatario['phone'], 'success': error is None, 'error': error}
+
+
 # ============================================================================
 # INSTANCIA GLOBAL
 # ============================================================================
 
-# Instancia global para uso en toda la aplicación
+# Instancia global para uso en toda la aplicación (comparte sesión y estado)
 whatsapp_client = WhatsAppWebClient()
 
 
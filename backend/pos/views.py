@@ -14,6 +14,7 @@ from drf_spectacular.types import OpenApiTypes
 
 from .models import Venta, DetalleVenta, PagoVenta
 from gestion.models import Producto
+from gestion.indice_productos import IndiceProductos
 from .serializers import (
     VentaSerializer, VentaCreateSerializer, VentaResumenSerializer,
     DetalleVentaSerializer, PagoVentaSerializer, ProductoPOSSerializer
@@ -369,23 +370,26 @@ class ProductoPOSViewSet(viewsets.ReadOnlyModelViewSet):
     
     @extend_schema(
         summary="Buscar producto por código",
-        description="Busca un producto específico por código de barras o código interno",
+        description="Busca un producto específico por código de barras",
         tags=['POS - Productos'],
         parameters=[
-            OpenApiParameter('codigo', OpenApiTypes.STR, description='Código de barras o código interno')
+            OpenApiParameter('codigo', OpenApiTypes.STR, description='Código de barras')
         ]
     )
     @action(detail=False, methods=['get'])
     def buscar_codigo(self, request):
-        """Buscar producto por código de barras o código interno"""
+        """Buscar producto por código de barras"""
         codigo = request.query_params.get('codigo')
         if not codigo:
             return Response({'error': 'Parámetro código es requerido'}, status=400)
         
+        # Código de barras exacto desde el índice en memoria
+        id_producto = IndiceProductos.por_codigo(codigo)
+        if id_producto is None:
+            return Response({'error': 'Producto no encontrado'}, status=404)
+        
         try:
-            producto = self.get_queryset().get(
-                Q(codigo_barras=codigo) | Q(codigo_producto=codigo)
-            )
+            producto = self.get_queryset().get(id_producto=id_producto)
             serializer = self.get_serializer(producto)
             return Response(serializer.data)
         except Producto.DoesNotExist:
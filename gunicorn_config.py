@@ -87,6 +87,26 @@ def pre_fork(server, worker):
 def post_fork(server, worker):
     """Ejecutado después de fork cada worker"""
     print(f"👷 Worker {worker.pid} iniciado")
+    precargar_datos_pos()
+
+def precargar_datos_pos():
+    """
+    Precarga los datos de referencia y el índice de productos del POS en el worker
+
+    Se hace después del fork: con preload_app el master no debe abrir una
+    conexión a MySQL, porque todos los workers la heredarían y la usarían
+    a la vez. La conexión que abre la precarga se cierra al terminar; cada
+    hilo de request abre la suya.
+    """
+    try:
+        from django.db import connections
+        from gestion.cache_referencia import CacheReferencia
+        from gestion.indice_productos import IndiceProductos
+        CacheReferencia.precargar()
+        IndiceProductos.construir()
+        connections.close_all()
+    except Exception as e:
+        print(f"⚠️ No se pudieron precargar los datos de referencia del POS: {e}")
 
 def pre_request(worker, req):
     """Ejecutado antes de cada request"""